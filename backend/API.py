@@ -2,7 +2,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import asyncio
-from utils import shopify, vectordb, yt_search
+import os
+import secrets
+from utils import images, shopify, vectordb, yt_search
 from blacksheep import Request, Application, delete, get, post, patch, json, redirect
 from blacksheep.server.cors import CORSPolicy
 from utils.supabase import SupabaseClient
@@ -25,20 +27,38 @@ from utils.shopify_api import ShopifyAPIClient
 # Redis caching and rate limiting
 from utils.redis_client import (
     redis_client,
-    cache_response,
-    invalidate_cache,
     youtube_limiter,
     gemini_limiter,
     cohere_limiter,
     DistributedLock,
 )
 
+from utils.cache import (
+    cache_key,
+    cached_response,
+    company_tag,
+    invalidate_company,
+    invalidate_tags,
+    product_tag,
+)
+
 # Job queue for background tasks
-from jobs.worker import enqueue_job, close_pool as close_job_pool
+from jobs.instrumentation import update_queue_metrics
+from jobs.worker import (
+    DEFAULT_LANE,
+    EMBEDDED_WORKER,
+    LANE_QUEUES,
+    close_pool as close_job_pool,
+    enqueue_job,
+    share_pool_with_redis_client,
+    start_embedded_workers,
+    stop_embedded_workers,
+)
 from jobs.tasks import (
     discover_creators_job,
     sync_shopify_products_job,
     send_email_job,
+    profile_job,
 )
 
 # Prometheus metrics
@@ -46,8 +66,11 @@ from utils.metrics import (
     get_metrics,
     get_metrics_content_type,
     update_quota_metrics,
-    track_request,
+    request_metrics_middleware,
 )
+from utils.loop_monitor import get_loop_monitor, start_loop_monitor, stop_loop_monitor
+from utils.usage import tenant_middleware, usage_recorder, usage_summary
+from utils.profiler import FORMATS as PROFILE_FORMATS, clamp_seconds, run_profile
 
 app = Application()
 
@@ -60,9 +83,14 @@ app.use_cors(
     max_age=86400  # Cache preflight for 24 hours
 )
 
+# api_* metrics per route template, plus Server-Timing headers
+app.middlewares.append(request_metrics_middleware(app.router))
 # Global SupabaseClient instance
 supabase_client: SupabaseClient | None = None
 
+# Bearer token for the /debug endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 
 def _qint(request: Request, key: str, default: int) -> int:
     """Parse an integer query param, falling back to default on missing/invalid
@@ -75,6 +103,47 @@ def _qint(request: Request, key: str, default: int) -> int:
     except (ValueError, TypeError):
         return default
 
+
+def _qstr(request: Request, key: str) -> str | None:
+    """Read a single-valued query param (BlackSheep may hand back a list)."""
+    raw = request.query.get(key)
+    if isinstance(raw, list):
+        raw = raw[0] if raw else None
+    return raw or None
+
+
+def _is_admin(request: Request) -> bool:
+    """True if the request carries ADMIN_TOKEN (Authorization: Bearer or X-Admin-Token)"""
+    if not ADMIN_TOKEN:
+        return False
+    header = request.get_first_header(b"Authorization") or b""
+    token = header[len(b"Bearer "):] if header.startswith(b"Bearer ") else None
+    token = token or request.get_first_header(b"X-Admin-Token") or b""
+    # Compared as bytes: compare_digest rejects non-ASCII str
+    return secrets.compare_digest(token, ADMIN_TOKEN.encode())
+
+
+# External API usage of ?company_id= requests is charged to that company, but
+# only for admin requests: company_id is caller-supplied and unauthenticated
+app.middlewares.append(tenant_middleware(authorize=_is_admin))
+
+
+def _company_cached(endpoint: str, kinds: list[str], params: tuple = (), ttl: int = 60, stale_ttl: int = 0):
+    """Cache a company-scoped GET, keyed on company_id plus `params` and
+    tagged with company:{id}:{kind} for each kind it reads. Requests without
+    a company_id go straight to the handler (which answers 400)."""
+    def key(request: Request):
+        company_id = _qstr(request, "company_id")
+        if not company_id:
+            return None
+        return cache_key(endpoint, company_id=company_id, **{p: _qstr(request, p) for p in params})
+
+    def tags(request: Request):
+        company_id = _qstr(request, "company_id")
+        return [company_tag(company_id, kind) for kind in kinds]
+
+    return cached_response(key=key, tags=tags, ttl=ttl, stale_ttl=stale_ttl)
+
 @app.on_start
 async def on_start(application: Application):
     """Initialize global resources when the application starts"""
@@ -83,6 +152,19 @@ async def on_start(application: Application):
     await supabase_client.initialize()
     print("✅ SupabaseClient initialized")
 
+    # With REDIS_TRANSPORT=native the Redis client rides on the job queue pool
+    await share_pool_with_redis_client()
+
+    # Loop lag gauge, plus blocking-call logging when LOOP_SLOW_CALLBACK_MS is set
+    start_loop_monitor("api")
+
+    # Per-company API usage counters, flushed to Redis in the background
+    usage_recorder.start()
+
+    # Single-deployment mode: process jobs in this process too
+    if EMBEDDED_WORKER:
+        await start_embedded_workers()
+
 @app.after_start
 async def after_start(application: Application):
     """Called after the application has started"""
@@ -99,16 +181,25 @@ async def health_check():
 
 
 @get("/rate-limits")
-async def get_rate_limits():
+async def get_rate_limits(request: Request):
     """
     Get current rate limit status for all external APIs.
     Useful for monitoring quota usage.
+
+    With ?company_id= also returns that company's hourly and daily usage
+    per service and its remaining daily budgets (admin only, ADMIN_TOKEN).
     """
-    return json({
+    limits = {
         "youtube": await youtube_limiter.get_usage(),
         "gemini": await gemini_limiter.get_usage(),
         "cohere": await cohere_limiter.get_usage(),
-    })
+    }
+    company_id = _qstr(request, "company_id")
+    if company_id:
+        if not _is_admin(request):
+            return json({"error": "Per-company usage requires ADMIN_TOKEN"}, status=403)
+        limits["usage"] = await usage_summary(company_id)
+    return json(limits)
 
 
 @get("/metrics")
@@ -121,8 +212,9 @@ async def metrics_endpoint():
     """
     from blacksheep import Response, Content
 
-    # Update quota metrics before generating output
+    # Update quota and queue metrics before generating output
     await update_quota_metrics()
+    await update_queue_metrics()
 
     return Response(
         status=200,
@@ -130,10 +222,91 @@ async def metrics_endpoint():
         content=Content(get_metrics_content_type().encode(), get_metrics())
     )
 
+@get("/debug/loop")
+async def debug_loop(request: Request):
+    """
+    Event loop lag and the blocking call sites seen so far, worst first.
+
+    Admin only (ADMIN_TOKEN). Hot spots are collected when the API runs
+    with LOOP_SLOW_CALLBACK_MS set.
+    """
+    if not _is_admin(request):
+        return json({"error": "Not found"}, status=404)
+    monitor = get_loop_monitor()
+    if monitor is None:
+        return json({"error": "Loop monitor not running"}, status=503)
+    return json(monitor.snapshot())
+
+async def _debug_profile(request: Request, mode: str):
+    """Run a CPU or memory profile here or, with target=worker, in a lane's worker"""
+    from blacksheep import Response, Content
+
+    if not _is_admin(request):
+        return json({"error": "Not found"}, status=404)
+
+    seconds = clamp_seconds(_qint(request, "seconds", 10))
+    fmt = _qstr(request, "format") or "collapsed"
+    limit = _qint(request, "limit", 30)
+    if fmt not in PROFILE_FORMATS:
+        return json({"error": f"format must be one of {', '.join(PROFILE_FORMATS)}"}, status=400)
+
+    if _qstr(request, "target") == "worker":
+        lane = _qstr(request, "lane") or DEFAULT_LANE
+        if lane not in LANE_QUEUES:
+            return json({"error": f"Unknown lane: {lane}"}, status=400)
+        job = await enqueue_job(profile_job, _lane=lane, mode=mode, seconds=seconds, fmt=fmt, limit=limit)
+        try:
+            # Waits for a free worker slot too, so allow some slack
+            result = await job.result(timeout=seconds + 30)
+        except asyncio.TimeoutError:
+            return json({"error": f"No {lane} worker finished the profile in time"}, status=504)
+        if result.get("status") == "busy":
+            result = None
+    else:
+        result = await run_profile(mode, seconds, fmt=fmt, limit=limit)
+
+    if result is None:
+        return json({"error": "A profile is already running"}, status=409)
+    if mode == "memory":
+        return json(result)
+
+    if fmt == "speedscope":
+        content_type, filename = b"application/json", "profile.speedscope.json"
+    else:
+        content_type, filename = b"text/plain; charset=utf-8", "profile.collapsed.txt"
+    return Response(
+        status=200,
+        headers=[(b"Content-Disposition", f'attachment; filename="{filename}"'.encode())],
+        content=Content(content_type, result["content"].encode())
+    )
+
+@get("/debug/profile")
+async def debug_profile(request: Request):
+    """
+    Sample CPU stacks for ?seconds=N and return collapsed stacks or a
+    speedscope file (?format=speedscope).
+
+    Admin only (ADMIN_TOKEN). ?target=worker&lane=bulk profiles a worker
+    instead of this API process.
+    """
+    return await _debug_profile(request, "cpu")
+
+@get("/debug/allocations")
+async def debug_allocations(request: Request):
+    """
+    tracemalloc for ?seconds=N: the ?limit=N source lines whose allocations
+    grew most. Admin only; ?target=worker&lane=... as for /debug/profile.
+    """
+    return await _debug_profile(request, "memory")
+
 @app.on_stop
 async def on_stop(application: Application):
     """Clean up global resources when the application shuts down"""
     global supabase_client
+    await stop_embedded_workers()
+    await stop_loop_monitor()
+    await usage_recorder.stop()
+
     if supabase_client:
         await supabase_client.close()
         print("✅ SupabaseClient closed")
@@ -146,6 +319,9 @@ async def on_stop(application: Application):
     await close_job_pool()
     print("✅ Job queue pool closed")
 
+    # Close image download client
+    await images.close_http_client()
+
 # Shopify App landing page
 @get("/")
 async def app_home():
@@ -243,7 +419,7 @@ async def ingest_products(request: Request):
             return json({"error": "No products with images found"}, status=404)
 
         # Create embeddings and upsert to vector DB
-        embeddings = vectordb.embed_products(products_with_images)
+        embeddings = await vectordb.embed_products(products_with_images)
         vectordb.upsert_embeddings(embeddings)
 
         return json({
@@ -268,8 +444,11 @@ async def search_by_image(request: Request):
         if not image_url:
             return json({"error": "image_url is required"}, status=400)
 
-        # Get embedding for the query image
-        embedding_response = vectordb.imageurl_to_embedding(image_url)
+        # Get embedding for the query image (downloaded and downscaled first)
+        image_data = await images.prepare_image(image_url)
+        if not image_data:
+            return json({"error": "Could not download image"}, status=400)
+        embedding_response = await asyncio.to_thread(vectordb.image_to_embedding, image_data.data_uri)
         query_vector = embedding_response.embeddings.float_[0]
 
         # Search in vector database
@@ -294,31 +473,33 @@ async def search_by_image(request: Request):
     except Exception as e:
         return json({"error": str(e)}, status=500)
 
-# Search products by text query (using metadata)
+# Search products by text query (BM25 + vector hybrid)
 @post("/search/text")
 async def search_by_text(request: Request):
     try:
         data = await request.json()
         query_text = data.get("query")
         top_k = data.get("top_k", 10)
+        mode = data.get("mode", "auto")
 
         if not query_text:
             return json({"error": "query is required"}, status=400)
 
-        # Search using metadata filter (simple text search in body_html)
-        results = vectordb.index.query(
-            vector=vectordb.text_to_embedding(query_text).embeddings.float_[0],
-            top_k=top_k,
-            include_values=False,
-            include_metadata=True
-        )
+        if mode not in vectordb.SEARCH_MODES:
+            return json({"error": f"mode must be one of: {', '.join(vectordb.SEARCH_MODES)}"}, status=400)
+
+        # Exact lookups (SKU, brand) are answered lexically without an embedding call
+        results = await asyncio.to_thread(vectordb.hybrid_query, query_text, top_k=top_k, mode=mode)
 
         return json({
             "query": query_text,
+            "mode": results.mode,
             "results": [
                 {
                     "id": match.id,
                     "score": match.score,
+                    "vector_score": match.vector_score,
+                    "lexical_score": match.lexical_score,
                     "metadata": match.metadata
                 }
                 for match in results.matches
@@ -332,32 +513,27 @@ async def search_by_text(request: Request):
 @get("/products/vector-search")
 async def get_products_vector(request: Request):
     """
-    Legacy endpoint: Query products from Pinecone vector database
+    Legacy endpoint: List products stored in the Pinecone vector database
     Note: Use GET /products instead for company products from Supabase
+
+    Query params:
+        - limit: Page size (default 20, max 100)
+        - cursor: next_cursor from the previous page (omit for the first page)
     """
     try:
         # Get query parameters
-        limit = _qint(request, "limit", 20)
-        offset = _qint(request, "offset", 0)
+        limit = max(1, min(_qint(request, "limit", 20), vectordb.MAX_PAGE_SIZE))
+        cursor = request.query.get("cursor")
+        if isinstance(cursor, list):
+            cursor = cursor[0] if cursor else None
 
-        # Query vector database to get products
-        results = vectordb.index.query(
-            vector=[0.0] * 1024,  # Dummy vector to get all results
-            top_k=min(limit, 100),  # Pinecone has limits
-            include_metadata=True
-        )
+        page = vectordb.list_catalog_page(limit=limit, cursor=cursor or None)
 
         return json({
-            "products": [
-                {
-                    "id": match.id,
-                    "metadata": match.metadata
-                }
-                for match in results.matches[offset:offset+limit]
-            ],
-            "total_returned": len(results.matches),
+            "products": page["items"],
+            "total_returned": len(page["items"]),
             "limit": limit,
-            "offset": offset
+            "next_cursor": page["next_cursor"]
         })
 
     except Exception as e:
@@ -388,7 +564,7 @@ async def get_product(product_id: str):
 @delete("/products/{product_id}")
 async def delete_product(product_id: str):
     try:
-        vectordb.index.delete(ids=[product_id])
+        vectordb.delete_embeddings([product_id])
         return json({"message": f"Product {product_id} deleted successfully"})
 
     except Exception as e:
@@ -780,14 +956,16 @@ async def sync_products_background(shop: str, access_token: str, company_id: str
     """
     try:
         from utils.shopify import get_products
-        from utils.vectordb import embed_products, upsert_embeddings
+        from utils.vectordb import embed_products, image_hashes_by_id, upsert_embeddings
 
         print(f"🔄 [Background] Syncing products for {shop}...")
         products = get_products(shop, access_token=access_token)
         print(f"✅ [Background] Found {len(products)} products")
 
-        # Create embeddings
-        product_embeddings = embed_products(products)
+        # Create embeddings (unchanged images reuse their stored vectors)
+        known_images = await supabase_client.get_known_product_images(company_id, shop)
+        product_embeddings = await embed_products(products, known_images=known_images)
+        image_hashes = image_hashes_by_id(product_embeddings)
 
         # Store in Pinecone
         upsert_embeddings(product_embeddings)
@@ -803,6 +981,7 @@ async def sync_products_background(shop: str, access_token: str, company_id: str
                 "image": product.get("image", ""),
                 "price": product.get("price", 0),
                 "pinecone_id": str(i),
+                "image_hash": image_hashes.get(str(i)),
                 "synced_at": "now()"
             }).execute()
 
@@ -812,6 +991,7 @@ async def sync_products_background(shop: str, access_token: str, company_id: str
             "last_product_sync": "now()",
             "product_count": len(products)
         }).eq("company_id", company_id).eq("shop_domain", shop).execute()
+        await invalidate_company(company_id, "products", "shopify")
 
         print(f"✅ [Background] Product sync complete for {shop}")
 
@@ -964,6 +1144,7 @@ async def shopify_callback(request: Request):
             shop_insert,
             on_conflict="shop_domain"
         ).execute()
+        await invalidate_company(company_id, "shopify")
 
         # Create uninstall webhook
         try:
@@ -1021,9 +1202,11 @@ async def shopify_webhook_uninstall(request: Request):
             return json({"error": "Missing shop domain"}, status=400)
 
         # Deactivate the OAuth token
-        await supabase_client.client.table("shopify_oauth_tokens").update({
+        result = await supabase_client.client.table("shopify_oauth_tokens").update({
             "is_active": False
         }).eq("shop_domain", shop_domain).execute()
+        for token in result.data or []:
+            await invalidate_company(token.get("company_id"), "shopify")
 
         print(f"App uninstalled from shop: {shop_domain}")
 
@@ -1034,6 +1217,7 @@ async def shopify_webhook_uninstall(request: Request):
         return json({"error": str(e)}, status=500)
 
 @get("/shopify/status")
+@_company_cached("shopify_status", ["shopify", "products"])
 async def shopify_status(request: Request):
     """
     Check Shopify connection status for a company
@@ -1105,6 +1289,7 @@ async def shopify_disconnect(request: Request):
         await supabase_client.client.table("shopify_oauth_tokens").update({
             "is_active": False
         }).eq("company_id", company_id).execute()
+        await invalidate_company(company_id, "shopify")
 
         return json({"message": "Shopify store disconnected successfully"})
 
@@ -1158,6 +1343,7 @@ async def get_shop_info_endpoint(request: Request):
 # ============================================================================
 
 @get("/products")
+@_company_cached("products", ["products"])
 async def get_company_products(request: Request):
     """
     Get all synced products for a company
@@ -1193,6 +1379,14 @@ async def get_company_products(request: Request):
         return json({"error": str(e)}, status=500)
 
 @get("/products/{product_id}/creators")
+@cached_response(
+    key=lambda product_id, request: cache_key(
+        "product_creators", product_id=product_id, limit=_qint(request, "limit", 50)
+    ),
+    tags=lambda product_id, request: [product_tag(product_id, "creators")],
+    ttl=120,
+    stale_ttl=600,
+)
 async def get_product_creators(product_id: str, request: Request):
     """
     Get matched creators for a specific product
@@ -1285,20 +1479,24 @@ async def resync_products(request: Request):
 
         # Use existing utilities
         from utils.shopify import get_products
-        from utils.vectordb import embed_products, upsert_embeddings
+        from utils.vectordb import embed_products, image_hashes_by_id, upsert_embeddings
 
         print(f"🔄 Resyncing products for {shop}...")
         products = get_products(shop)
 
+        # Remember already-embedded images before the old rows are deleted
+        known_images = await supabase_client.get_known_product_images(company_id)
+
         # Delete old products for this company
         await supabase_client.client.table("company_products")\
             .delete()\
             .eq("company_id", company_id)\
             .execute()
 
-        # Create new embeddings
-        product_embeddings = embed_products(products)
+        # Create new embeddings (unchanged images reuse their stored vectors)
+        product_embeddings = await embed_products(products, known_images=known_images)
         upsert_embeddings(product_embeddings)
+        image_hashes = image_hashes_by_id(product_embeddings)
 
         # Store in Supabase
         for i, product in enumerate(products):
@@ -1310,6 +1508,7 @@ async def resync_products(request: Request):
                 "image": product.get("image", ""),
                 "price": product.get("price", 0),
                 "pinecone_id": str(i),
+                "image_hash": image_hashes.get(str(i)),
                 "synced_at": "now()"
             }).execute()
 
@@ -1319,6 +1518,7 @@ async def resync_products(request: Request):
             "last_product_sync": "now()",
             "product_count": len(products)
         }).eq("company_id", company_id).execute()
+        await invalidate_company(company_id, "products", "shopify")
 
         return json({
             "message": "Products resynced successfully",
@@ -1377,6 +1577,7 @@ async def trigger_discovery(request: Request):
 # ============================================================================
 
 @get("/partnerships")
+@_company_cached("partnerships", ["partnerships"], params=("status",))
 async def get_partnerships(request: Request):
     """
     Get all partnerships for a company
@@ -1552,6 +1753,7 @@ async def create_partnership(request: Request):
         result = await supabase_client.client.table("partnerships")\
             .insert(partnership_data)\
             .execute()
+        await invalidate_company(partnership_data["company_id"], "partnerships")
 
         partnership = result.data[0] if result.data else None
 
@@ -1679,6 +1881,7 @@ async def update_partnership(partnership_id: str, request: Request):
 
         if not result.data:
             return json({"error": "Partnership not found"}, status=404)
+        await invalidate_company(result.data[0].get("company_id"), "partnerships")
 
         return json({
             "message": "Partnership updated successfully",
@@ -1850,6 +2053,7 @@ async def send_partnership_email_endpoint(partnership_id: str, request: Request)
                 .update(update_data)\
                 .eq("id", partnership_id)\
                 .execute()
+            await invalidate_company(partnership.get("company_id"), "partnerships")
 
         return json({
             "message": "Email sent successfully",
@@ -1955,6 +2159,8 @@ async def generate_affiliate_link_endpoint(partnership_id: str, request: Request
             .update(update_data)\
             .eq("id", partnership_id)\
             .execute()
+        if result.data:
+            await invalidate_company(result.data[0].get("company_id"), "partnerships")
 
         return json({
             "message": "Affiliate link generated successfully",
@@ -2011,6 +2217,7 @@ async def record_reel_interaction(request: Request):
         result = await supabase_client.client.table("reel_interactions")\
             .upsert(interaction_data, on_conflict="company_id,video_id")\
             .execute()
+        await invalidate_company(data["company_id"], "interactions")
 
         return json({
             "message": "Interaction recorded successfully",
@@ -2024,6 +2231,7 @@ async def record_reel_interaction(request: Request):
 
 
 @get("/reels/interactions")
+@_company_cached("reel_interactions", ["interactions"], params=("interaction_type",))
 async def get_reel_interactions(request: Request):
     """
     Get all reel interactions for a company
@@ -2070,6 +2278,7 @@ async def get_reel_interactions(request: Request):
 
 
 @get("/dashboard/stats")
+@_company_cached("dashboard_stats", ["partnerships", "products", "shopify"], ttl=30, stale_ttl=300)
 async def get_dashboard_stats(request: Request):
     """
     Get comprehensive dashboard statistics for a company
@@ -2239,6 +2448,7 @@ def format_time_ago(timestamp):
 
 
 @get("/notifications")
+@_company_cached("notifications", ["partnerships", "products", "shopify"], params=("limit",), ttl=30)
 async def get_notifications(request: Request):
     """
     Get notifications for a company based on recent activity
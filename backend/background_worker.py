@@ -4,16 +4,26 @@ Creator Discovery Background Worker
 
 Continuously discovers creators relevant to products in database.
 Runs 24/7, discovering new creator content and linking to products.
+
+The ARQ worker schedules discovery itself (jobs/scheduler.py), with
+per-shop adaptive intervals. This standalone loop is kept for deployments
+that don't run the job queue.
 """
 
 import asyncio
 import json
 import os
+from typing import Optional
 from dotenv import load_dotenv
 from utils.yt_search import fetch_top_shorts
 from utils.video import parse_video
 from utils.vectordb import text_to_embedding, upsert_embeddings
 from utils.supabase import SupabaseClient
+from utils.cache import invalidate_tags, product_tag
+from utils.redis_client import DistributedLock
+from utils.sharding import ShardCoordinator
+from utils.tracing import start_span
+from utils.usage import tenant_scope
 
 # Load environment variables
 load_dotenv()
@@ -37,11 +47,17 @@ async def creator_discovery_worker():
     5. Create embeddings and store
     6. Link creators to products
     7. Sleep and repeat
+
+    Replicas split the work: companies hash into shards and each replica
+    only processes companies whose shard it leases (see utils.sharding).
+    While the ARQ cron scheduler is running, the loop idles.
     """
 
     supabase = SupabaseClient()
     await supabase.initialize()
-    cycle_count = 0
+
+    shards = ShardCoordinator("discovery")
+    await shards.start()
 
     print("=" * 60)
     print("🚀 CREATOR DISCOVERY WORKER STARTED")
@@ -51,9 +67,28 @@ async def creator_discovery_worker():
     print(f"   • Products per Cycle: {PRODUCTS_PER_CYCLE}")
     print(f"   • Keywords per Product: {KEYWORDS_PER_PRODUCT}")
     print(f"   • Videos per Keyword: {VIDEOS_PER_KEYWORD}")
+    print(f"   • Shards owned: {len(shards.owned_shards)}/{shards.shards}")
     print("=" * 60)
 
+    try:
+        await _discovery_loop(supabase, shards)
+    finally:
+        await shards.stop()
+
+
+async def _discovery_loop(supabase, shards: ShardCoordinator):
+    """Discovery cycles over the companies in this worker's shards"""
+    from jobs.scheduler import scheduler_active
+
+    cycle_count = 0
     while True:
+        # The ARQ cron scheduler (jobs.scheduler) plans discovery when a bulk
+        # worker runs; running this loop as well would search everything twice
+        if await scheduler_active():
+            print(f"⏭️  Discovery is scheduled by the ARQ cron; checking again in {CYCLE_INTERVAL_MINUTES} minutes")
+            await asyncio.sleep(CYCLE_INTERVAL_MINUTES * 60)
+            continue
+
         cycle_count += 1
         print(f"\n{'='*60}")
         print(f"🔄 CYCLE #{cycle_count} - {asyncio.get_event_loop().time()}")
@@ -62,43 +97,30 @@ async def creator_discovery_worker():
         try:
             # 1. Get all products that need creator matching
             products_result = await supabase.client.table("company_products")\
-                .select("id, title, description, shop_domain, search_keywords")\
+                .select("id, company_id, title, description, shop_domain, search_keywords")\
                 .execute()
 
-            if not products_result.data:
-                print("⚠️  No products found in database")
+            # Only companies in shards this replica leases
+            owned_products = [
+                product for product in products_result.data or []
+                if shards.owns(product.get("company_id"))
+            ]
+
+            if not owned_products:
+                print("⚠️  No products found in this worker's shards")
                 print("💡 Waiting for companies to connect Shopify stores...")
-                await asyncio.sleep(30 * 60)  # 30 minutes
+                # Up to 30 minutes, but start over as soon as shards are handed to us
+                await shards.wait_for_change(30 * 60)
                 continue
 
-            print(f"📊 Found {len(products_result.data)} products to process\n")
+            print(f"📊 Found {len(owned_products)} products to process\n")
 
             # Process limited products per cycle to avoid overwhelming APIs
-            products_to_process = products_result.data[:PRODUCTS_PER_CYCLE]
+            products_to_process = owned_products[:PRODUCTS_PER_CYCLE]
 
-            # NEW: Round-robin approach - alternate between products
-            # Build a queue of (product, keyword) tuples with proper interleaving
+            # Round-robin approach - alternate between products
             print("🔄 Building round-robin search queue...\n")
-            search_queue = []
-
-            # Interleave by iterating keywords first, then products
-            # This gives: P1_KW1, P2_KW1, P3_KW1, ..., P1_KW2, P2_KW2, P3_KW2, ...
-            for keyword_idx in range(KEYWORDS_PER_PRODUCT):
-                for product in products_to_process:
-                    # Use pre-generated keywords from database
-                    keywords = product.get('search_keywords', [])
-
-                    # Fallback to old method if no keywords (shouldn't happen after migration)
-                    if not keywords:
-                        print(f"⚠️  No keywords for {product['title']}, using fallback...")
-                        keywords = generate_keywords_for_product(product)
-
-                    # Only add if this product has a keyword at this index
-                    if keyword_idx < len(keywords):
-                        search_queue.append({
-                            "product": product,
-                            "keyword": keywords[keyword_idx]
-                        })
+            search_queue = build_search_queue(products_to_process)
 
             print(f"📋 Queue built: {len(search_queue)} searches across {len(products_to_process)} products\n")
 
@@ -107,35 +129,51 @@ async def creator_discovery_worker():
                 product = search_item["product"]
                 keyword = search_item["keyword"]
 
+                # The shard may have moved to another replica mid-cycle
+                if not shards.owns(product.get("company_id")):
+                    continue
+
                 print(f"🎯 [{idx+1}/{len(search_queue)}] {product['title'][:40]}... | '{keyword}'")
 
                 try:
-                    videos = await fetch_top_shorts(
-                        keyword=keyword,
-                        max_results=VIDEOS_PER_KEYWORD
-                        # Uses default: published_after_days=365 (1 year)
-                    )
-
-                    if not videos:
-                        print(f"   ❌ No videos found")
-                        continue
-
-                    print(f"   ✅ Found {len(videos)} videos")
-
-                    # Process videos for this product-keyword combo
-                    for video in videos:
-                        await process_creator_video(
-                            video=video,
-                            product=product,
-                            source_keyword=keyword,
-                            supabase=supabase
+                    with tenant_scope(product.get("company_id")), start_span("discovery.search", attributes={
+                        "discovery.cycle": cycle_count,
+                        "company_id": product.get("company_id"),
+                        "product_id": product.get("id"),
+                        "keyword": keyword,
+                    }):
+                        videos = await fetch_top_shorts(
+                            keyword=keyword,
+                            max_results=VIDEOS_PER_KEYWORD
+                            # Uses default: published_after_days=365 (1 year)
                         )
-                        # Rate limit: 4s per video = 15 videos/min (Gemini free tier limit)
-                        await asyncio.sleep(4)
 
-                    # Delay between searches to avoid rate limiting
-                    print(f"   ⏸️  Sleeping 20s before next search...")
-                    await asyncio.sleep(20)
+                        if not videos:
+                            print(f"   ❌ No videos found")
+                            continue
+
+                        print(f"   ✅ Found {len(videos)} videos")
+
+                        # Process videos for this product-keyword combo
+                        for video in videos:
+                            # Other shards (or process_video_job) may find the same
+                            # video; the shared lock keeps it to one Gemini call
+                            async with DistributedLock(f"video:{video['id']}") as acquired:
+                                if not acquired:
+                                    print(f"   ⏭️  {video['id']} is being processed elsewhere")
+                                    continue
+                                await process_creator_video(
+                                    video=video,
+                                    product=product,
+                                    source_keyword=keyword,
+                                    supabase=supabase
+                                )
+                            # Rate limit: 4s per video = 15 videos/min (Gemini free tier limit)
+                            await asyncio.sleep(4)
+
+                        # Delay between searches to avoid rate limiting
+                        print(f"   ⏸️  Sleeping 20s before next search...")
+                        await asyncio.sleep(20)
 
                 except Exception as search_error:
                     print(f"   ❌ Error: {search_error}")
@@ -191,25 +229,7 @@ async def trigger_immediate_discovery(company_id: str, shop_domain: str | None =
 
         # Round-robin approach for immediate discovery too
         print("🔄 Building round-robin search queue...\n")
-        search_queue = []
-
-        # Interleave by iterating keywords first, then products
-        for keyword_idx in range(KEYWORDS_PER_PRODUCT):
-            for product in products_to_process:
-                # Use pre-generated keywords from database
-                keywords = product.get('search_keywords', [])
-
-                # Fallback to old method if no keywords
-                if not keywords:
-                    print(f"⚠️  No keywords for {product['title']}, using fallback...")
-                    keywords = generate_keywords_for_product(product)
-
-                # Only add if this product has a keyword at this index
-                if keyword_idx < len(keywords):
-                    search_queue.append({
-                        "product": product,
-                        "keyword": keywords[keyword_idx]
-                    })
+        search_queue = build_search_queue(products_to_process)
 
         print(f"📋 Queue built: {len(search_queue)} searches\n")
 
@@ -259,6 +279,37 @@ async def trigger_immediate_discovery(company_id: str, shop_domain: str | None =
         await supabase.close()
 
 
+def build_search_queue(products: list[dict], keywords_per_product: int = KEYWORDS_PER_PRODUCT) -> list[dict]:
+    """
+    Build the round-robin list of {"product", "keyword"} searches.
+
+    Iterates keywords first, then products, so the order is
+    P1_KW1, P2_KW1, P3_KW1, ..., P1_KW2, P2_KW2, P3_KW2, ...
+    and every product gets a search before any gets its second.
+    """
+    keywords_by_product = []
+    for product in products:
+        # Use pre-generated keywords from database
+        keywords = product.get('search_keywords', [])
+
+        # Fallback to old method if no keywords (shouldn't happen after migration)
+        if not keywords:
+            print(f"⚠️  No keywords for {product['title']}, using fallback...")
+            keywords = generate_keywords_for_product(product)
+        keywords_by_product.append((product, keywords))
+
+    search_queue = []
+    for keyword_idx in range(keywords_per_product):
+        for product, keywords in keywords_by_product:
+            # Only add if this product has a keyword at this index
+            if keyword_idx < len(keywords):
+                search_queue.append({
+                    "product": product,
+                    "keyword": keywords[keyword_idx]
+                })
+    return search_queue
+
+
 def generate_keywords_for_product(product: dict) -> list[str]:
     """
     Generate YouTube search keywords for a product
@@ -281,12 +332,74 @@ def generate_keywords_for_product(product: dict) -> list[str]:
     return patterns
 
 
-async def process_creator_video(video: dict, product: dict, source_keyword: str, supabase):
+async def analyze_video(video: dict) -> Optional[dict]:
+    """
+    Analyze a video with Gemini (one call).
+
+    Returns:
+        The parsed analysis ({} if Gemini's output wasn't JSON), or None if
+        the call was rate limited or failed
+    """
+    print(f"         🎥 Analyzing: {video['title'][:50]}...")
+
+    analysis_result = await parse_video(video["url"])
+
+    if isinstance(analysis_result, tuple):
+        analysis, status = analysis_result
+        if status == 429:
+            # Rate limited - skip this video for now
+            print(f"         ⏸️  Rate limited, skipping for now")
+            return None
+        elif status != 200:
+            print(f"         ❌ Analysis failed: {analysis}")
+            return None
+    else:
+        analysis = analysis_result
+
+    # Parse analysis JSON
+    try:
+        output = analysis.get("output") if isinstance(analysis, dict) else "{}"
+
+        # Strip markdown code blocks if present (Gemini sometimes wraps JSON in ```json ... ```)
+        if output:
+            output = output.strip()
+
+            # Find JSON code block (handle text before the code block)
+            if "```json" in output:
+                # Extract content between ```json and ```
+                start = output.find("```json") + 7
+                end = output.find("```", start)
+                if end != -1:
+                    output = output[start:end].strip()
+            elif "```" in output and "{" in output:
+                # Generic code block - find the JSON part
+                start = output.find("```") + 3
+                end = output.find("```", start)
+                if end != -1:
+                    output = output[start:end].strip()
+
+            # Remove any remaining newlines at start/end
+            output = output.strip()
+
+        analysis_data = json.loads(output if output else "{}")
+    except (json.JSONDecodeError, TypeError) as e:
+        print(f"         ⚠️  Could not parse analysis JSON: {e}")
+        print(f"         Raw output: {output[:200] if output else 'None'}...")
+        analysis_data = {}
+
+    return analysis_data
+
+
+async def process_creator_video(video: dict, product: dict, source_keyword: str, supabase,
+                                analysis: Optional[dict] = None):
     """
     Process a single creator video: analyze, embed, store, link to product
+
+    Pass `analysis` (from analyze_video) to skip the Gemini call.
     """
 
     video_id = video["id"]
+    analysis_data = analysis
 
     try:
         # Check if already indexed - retrieve full record including analysis
@@ -333,59 +446,18 @@ async def process_creator_video(video: dict, product: dict, source_keyword: str,
                     "relevance_reasoning": reasoning,
                     "created_at": "now()"
                 }).execute()
+                await invalidate_tags(product_tag(product["id"], "creators"))
                 print(f"         🔗 Linked existing video (score: {score:.1f})")
             else:
                 print(f"         ⏭️  Skipped (low relevance: {score:.1f})")
 
             return
 
-        # 1. Analyze video with Gemini
-        print(f"         🎥 Analyzing: {video['title'][:50]}...")
-
-        analysis_result = await parse_video(video["url"])
-
-        if isinstance(analysis_result, tuple):
-            analysis, status = analysis_result
-            if status == 429:
-                # Rate limited - skip this video for now
-                print(f"         ⏸️  Rate limited, skipping for now")
+        # 1. Analyze video with Gemini, unless the caller already did
+        if analysis_data is None:
+            analysis_data = await analyze_video(video)
+            if analysis_data is None:
                 return
-            elif status != 200:
-                print(f"         ❌ Analysis failed: {analysis}")
-                return
-        else:
-            analysis = analysis_result
-
-        # Parse analysis JSON
-        try:
-            output = analysis.get("output") if isinstance(analysis, dict) else "{}"
-
-            # Strip markdown code blocks if present (Gemini sometimes wraps JSON in ```json ... ```)
-            if output:
-                output = output.strip()
-
-                # Find JSON code block (handle text before the code block)
-                if "```json" in output:
-                    # Extract content between ```json and ```
-                    start = output.find("```json") + 7
-                    end = output.find("```", start)
-                    if end != -1:
-                        output = output[start:end].strip()
-                elif "```" in output and "{" in output:
-                    # Generic code block - find the JSON part
-                    start = output.find("```") + 3
-                    end = output.find("```", start)
-                    if end != -1:
-                        output = output[start:end].strip()
-
-                # Remove any remaining newlines at start/end
-                output = output.strip()
-
-            analysis_data = json.loads(output if output else "{}")
-        except (json.JSONDecodeError, TypeError) as e:
-            print(f"         ⚠️  Could not parse analysis JSON: {e}")
-            print(f"         Raw output: {output[:200] if output else 'None'}...")
-            analysis_data = {}
 
         # 1.5 Calculate relevance score
         from utils.relevance import calculate_relevance_score, is_video_relevant
@@ -464,6 +536,7 @@ async def process_creator_video(video: dict, product: dict, source_keyword: str,
             "relevance_reasoning": reasoning,
             "created_at": "now()"
         }).execute()
+        await invalidate_tags(product_tag(product["id"], "creators"))
 
         print(f"         ✅ Indexed: {video['title'][:40]}... (score: {score:.1f}, views: {video.get('views', 0):,})")
 
@@ -0,0 +1,29 @@
+"""
+Offline benchmarks
+
+Measures throughput and latency of the discovery loop, the Shopify sync job
+and the API routes without touching a live service. Cohere, Pinecone,
+YouTube, Gemini, Shopify, the image CDN, Supabase and Upstash are replaced
+by in-process stand-ins with configurable latency and error injection
+(benchmarks.fakes), so a run is repeatable and free.
+
+Modules:
+    - fakes: the stand-ins and StandIns.install(), which wires them in
+    - harness: load generation (run_load) and report tables
+    - scenarios: seed data plus bench_discovery, bench_sync and bench_api
+    - loadtest: HTTP load tests of the API under uvicorn, with route mixes,
+      latency histograms, saturation curves and SLO checks
+
+Usage:
+    python -m benchmarks all
+    python -m benchmarks api --requests 500 --concurrency 32 --latency supabase=40
+    python -m benchmarks load --mix dashboard --steps 1,4,16,64 --fail-on-slo
+
+The Upstash stand-in needs fakeredis (and lupa for Lua scripts); without
+it the run proceeds with Redis unconfigured, like a deployment without
+Upstash.
+"""
+
+from benchmarks.fakes import ServiceProfile, StandIns
+
+__all__ = ["ServiceProfile", "StandIns"]
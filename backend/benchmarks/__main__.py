@@ -0,0 +1,188 @@
+"""
+Run the offline benchmarks.
+
+Usage:
+    python -m benchmarks all
+    python -m benchmarks api --requests 500 --concurrency 32
+    python -m benchmarks sync --jobs 16 --concurrency 8 --catalog-size 50
+    python -m benchmarks discovery --cycles 2 --replicas 2
+
+    # HTTP load test of the API under uvicorn, with saturation curve and SLOs
+    python -m benchmarks load --mix dashboard --steps 1,4,16,64 --duration 10
+    python -m benchmarks load --mix-file mixes/launch.json --fail-on-slo
+
+    # Slow Gemini, flaky Shopify, everything else instant
+    python -m benchmarks all --latency all=0 --latency gemini=2500 \\
+        --error-rate shopify=0.1
+
+--latency and --jitter take SERVICE=MS, --error-rate SERVICE=FRACTION;
+"all" sets every service. Without them each service gets its typical
+latency (benchmarks.fakes.DEFAULT_LATENCY_MS) times --latency-scale.
+
+"all" runs the component scenarios; "load" is separate since it takes
+--duration seconds per step. Mixes are in benchmarks.loadtest.MIXES, and
+--mix-file takes the same as JSON. --fail-on-slo exits 1 if any step
+missed an SLO, for use as a pre-deploy check.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import SERVICES, ServiceProfile, StandIns, configure_env, default_profiles
+from benchmarks.harness import LoadResult, format_calls, format_results
+
+SCENARIOS = ("discovery", "sync", "api")
+
+
+def _parse_overrides(values: List[str], scale: float) -> Dict[str, float]:
+    overrides: Dict[str, float] = {}
+    for value in values or []:
+        service, _, amount = value.partition("=")
+        if service != "all" and service not in SERVICES:
+            raise SystemExit(f"Unknown service '{service}' (one of: all, {', '.join(SERVICES)})")
+        for name in (SERVICES if service == "all" else [service]):
+            overrides[name] = float(amount) * scale
+    return overrides
+
+
+def build_profiles(args) -> Dict[str, ServiceProfile]:
+    profiles = default_profiles(args.latency_scale)
+    for service, ms in _parse_overrides(args.latency, 1 / 1000).items():
+        profiles[service].latency = ms
+    for service, ms in _parse_overrides(args.jitter, 1 / 1000).items():
+        profiles[service].jitter = ms
+    for service, rate in _parse_overrides(args.error_rate, 1).items():
+        profiles[service].error_rate = rate
+    return profiles
+
+
+async def run_scenario(name: str, standins: StandIns, dataset, args) -> List[LoadResult]:
+    from benchmarks import scenarios
+
+    if name == "discovery":
+        return await scenarios.bench_discovery(
+            standins, cycles=args.cycles, replicas=args.replicas, pacing=args.pacing,
+            products_per_cycle=args.products_per_cycle,
+        )
+    if name == "sync":
+        return await scenarios.bench_sync(standins, jobs=args.jobs, concurrency=args.concurrency, dataset=dataset)
+    return await scenarios.bench_api(
+        standins, dataset, requests=args.requests, concurrency=args.concurrency, routes=args.routes, seed=args.seed,
+    )
+
+
+def load_mix(args):
+    from benchmarks.loadtest import MIXES, Mix
+
+    if args.mix_file:
+        with open(args.mix_file) as f:
+            return Mix.from_dict(json.load(f))
+    if args.mix not in MIXES:
+        raise SystemExit(f"Unknown mix '{args.mix}' (one of: {', '.join(MIXES)})")
+    return MIXES[args.mix]
+
+
+async def run_load_test(standins: StandIns, dataset, args) -> bool:
+    """Run and print a load test; False if an SLO was missed"""
+    from benchmarks import loadtest
+
+    mix = load_mix(args)
+    steps = [int(n) for n in args.steps.split(",")]
+    with contextlib.ExitStack() as quiet:
+        if not args.verbose:
+            quiet.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            quiet.enter_context(contextlib.redirect_stderr(io.StringIO()))
+        results = await loadtest.run_mix(standins, dataset, mix, steps, duration=args.duration, seed=args.seed)
+
+    print(f"\n📈 load\n")
+    print(loadtest.format_report(mix, results))
+    print(f"\n🔌 External calls at concurrency {results[-1].concurrency}\n")
+    print(format_calls(standins, results[-1].wall))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "mix": {"name": mix.name, "weights": mix.weights, "slo": mix.slo},
+                "steps": [step.summary() for step in results],
+                "saturated_at": loadtest.saturation_point(results),
+                "max_concurrency_within_slo": loadtest.max_within_slo(results),
+                "external_calls": standins.counts(),
+            }, f, indent=2)
+        print(f"\n💾 Wrote {args.json}")
+    return not any(step.breaches for step in results)
+
+
+async def main(args):
+    from benchmarks import scenarios
+
+    standins = StandIns(build_profiles(args), seed=args.seed, catalog_size=args.catalog_size)
+    report = {}
+    with standins.install():
+        dataset = scenarios.seed(standins, companies=args.companies, seed=args.seed)
+        if args.scenario == "load":
+            return await run_load_test(standins, dataset, args)
+        for name in SCENARIOS if args.scenario == "all" else [args.scenario]:
+            standins.reset_counts()
+            start = time.perf_counter()
+            with contextlib.ExitStack() as quiet:
+                if not args.verbose:
+                    quiet.enter_context(contextlib.redirect_stdout(io.StringIO()))
+                    quiet.enter_context(contextlib.redirect_stderr(io.StringIO()))
+                results = await run_scenario(name, standins, dataset, args)
+            wall = time.perf_counter() - start
+
+            print(f"\n📊 {name} ({wall:.1f}s)\n")
+            print(format_results(results))
+            print(f"\n🔌 External calls\n")
+            print(format_calls(standins, wall))
+            report[name] = {
+                "wall_seconds": round(wall, 3),
+                "results": [r.summary() for r in results],
+                "external_calls": standins.counts(),
+            }
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Wrote {args.json}")
+    return True
+
+
+if __name__ == "__main__":
+    configure_env()
+    parser = argparse.ArgumentParser(description="Offline benchmarks against in-process service stand-ins")
+    parser.add_argument("scenario", choices=SCENARIOS + ("all", "load"), help="What to benchmark")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier on the default latencies (0 = none)")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=MS", help="Latency of a service")
+    parser.add_argument("--jitter", action="append", metavar="SERVICE=MS", help="+/- jitter of a service")
+    parser.add_argument("--error-rate", action="append", metavar="SERVICE=FRACTION", help="Injected error rate")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for data, jitter and errors")
+    parser.add_argument("--companies", type=int, default=20, help="Seeded companies")
+    parser.add_argument("--catalog-size", type=int, default=25, help="Products per Shopify store")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests or jobs in flight")
+    parser.add_argument("--requests", type=int, default=200, help="API requests per route")
+    parser.add_argument("--routes", nargs="*", help="API routes to drive (default: all in scenarios.ROUTES)")
+    parser.add_argument("--jobs", type=int, default=8, help="Shopify sync jobs")
+    parser.add_argument("--cycles", type=int, default=1, help="Discovery cycles per replica")
+    parser.add_argument("--replicas", type=int, default=1, help="Concurrent discovery loops")
+    parser.add_argument("--products-per-cycle", type=int, default=10, help="Products searched per discovery cycle")
+    parser.add_argument("--pacing", type=float, default=0.0, help="Scale of the discovery loop's rate-limit sleeps")
+    parser.add_argument("--mix", default="mixed", help="Load test route mix (see benchmarks.loadtest.MIXES)")
+    parser.add_argument("--mix-file", help="Load test mix as JSON (name, weights, slo)")
+    parser.add_argument("--steps", default="1,4,16,64", help="Load test concurrency steps, comma separated")
+    parser.add_argument("--duration", type=float, default=10.0, help="Load test seconds per step")
+    parser.add_argument("--fail-on-slo", action="store_true", help="Exit 1 if the load test missed an SLO")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the backend's own output")
+    args = parser.parse_args()
+    within_slo = asyncio.run(main(args))
+    if args.fail_on_slo and not within_slo:
+        sys.exit(1)
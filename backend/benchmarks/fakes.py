@@ -0,0 +1,878 @@
+"""
+In-process stand-ins for every external service the backend calls.
+
+Each stand-in imitates the slice of the real API that our code uses, with a
+per-service ServiceProfile (latency, jitter, error rate) so a benchmark can
+model a slow Gemini or a flaky Shopify:
+
+- cohere    co.embed (deterministic vectors per input)
+- pinecone  index fetch/upsert/delete/query/list_paginated/describe_index_stats
+- youtube   search.list, videos.list, channels.list (googleapiclient shape)
+- gemini    models.generate_content (video analysis JSON)
+- shopify   Admin REST over `requests` (products, count, shop)
+- cdn       product images over httpx and `requests` (seeded noise JPEGs)
+- supabase  PostgREST over httpx (filters, order, limit, count, single,
+            insert/upsert/update/delete, one level of embedding)
+- upstash   Upstash REST over httpx, backed by fakeredis (optional)
+
+The SDK stand-ins replace the module-level clients (utils.vectordb.co/index,
+utils.video.client, utils.yt_search._youtube). HTTP traffic is intercepted
+at the transport: httpx.AsyncHTTPTransport and requests' HTTPAdapter are
+patched, so every request from the backend reaches a stand-in. A host
+without a stand-in fails with a connection error, which means nothing ever
+leaves the machine.
+
+Sync stand-ins sleep with time.sleep. That matches the real SDKs, which block
+whichever thread calls them, so the benchmarks show what blocking the event
+loop costs. Async stand-ins use asyncio.sleep.
+
+Usage:
+    standins = StandIns({"gemini": ServiceProfile(latency=1.5, error_rate=0.02)})
+    with standins.install():
+        ...
+    print(standins.counts())
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from unittest.mock import patch
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+import requests
+
+SERVICES = ("cohere", "pinecone", "youtube", "gemini", "shopify", "cdn", "supabase", "upstash")
+
+# Typical latencies we see from each provider, in ms
+DEFAULT_LATENCY_MS = {
+    "cohere": 80,
+    "pinecone": 40,
+    "youtube": 120,
+    "gemini": 1800,
+    "shopify": 150,
+    "cdn": 40,
+    "supabase": 25,
+    "upstash": 8,
+}
+
+UPSTASH_HOST = "upstash.bench.local"
+CDN_HOSTS = ("cdn.shopify.com", "cdn.bench.local")
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost")
+
+# Environment the backend modules need at import time
+BENCH_ENV = {
+    "SUPABASE_URL": "https://bench.supabase.co",
+    "SUPABASE_SERVICE_ROLE_KEY": "bench-service-role-key",
+    "COHERE_KEY": "bench-cohere-key",
+    "PINECONE_KEY": "bench-pinecone-key",
+    "INDEX_NAME": "bench-index",
+    "GEMINI_KEY": "bench-gemini-key",
+    "YOUTUBE_API_KEY": "bench-youtube-key",
+    "SHOPIFY_API_KEY": "bench-shopify-key",
+    "SHOPIFY_API_SECRET": "bench-shopify-secret",
+    "SHOPIFY_REDIRECT_URI": "http://localhost:8000/shopify/callback",
+    "APP_URL": "http://localhost:3000",
+    "DEFAULT_EMAIL": "creator@bench.local",
+}
+
+
+def configure_env() -> None:
+    """Fill in the settings the backend reads at import (real values win)"""
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+
+
+class StandInError(RuntimeError):
+    """An error injected by a stand-in"""
+
+
+@dataclass
+class ServiceProfile:
+    """How a stand-in behaves: seconds of latency (+/- jitter) and an error rate"""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+
+
+def default_profiles(scale: float = 1.0) -> Dict[str, ServiceProfile]:
+    """DEFAULT_LATENCY_MS as profiles, scaled (0 = no latency at all)"""
+    return {
+        service: ServiceProfile(latency=ms * scale / 1000, jitter=ms * scale / 4000)
+        for service, ms in DEFAULT_LATENCY_MS.items()
+    }
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _seeded(*parts: Any) -> random.Random:
+    return random.Random(hashlib.sha256(":".join(map(str, parts)).encode()).digest())
+
+
+# ============================================================================
+# COHERE
+# ============================================================================
+
+class FakeCohere:
+    """cohere.ClientV2 stand-in: embed() returns a stable vector per input"""
+
+    def __init__(self, standins: "StandIns", dimension: int = 1024):
+        self._standins = standins
+        self.dimension = dimension
+
+    def vector(self, text: str) -> List[float]:
+        rng = _seeded("embed", text)
+        return [rng.uniform(-1, 1) for _ in range(self.dimension)]
+
+    def embed(self, model: str = None, input_type: str = None, embedding_types=None,
+              inputs=None, texts=None, images=None, **kwargs):
+        self._standins.call("cohere", "embed")
+        keys = [json.dumps(item, sort_keys=True) for item in (inputs or texts or images or [])]
+        return SimpleNamespace(
+            embeddings=SimpleNamespace(float_=[self.vector(key) for key in keys]),
+            meta=SimpleNamespace(billed_units=SimpleNamespace(input_tokens=len(keys))),
+        )
+
+
+# ============================================================================
+# PINECONE
+# ============================================================================
+
+class FakeIndex:
+    """Pinecone Index stand-in holding vectors in memory"""
+
+    def __init__(self, standins: "StandIns"):
+        self._standins = standins
+        self.vectors: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors=None, namespace=None, **kwargs):
+        self._standins.call("pinecone", "upsert")
+        with self._lock:
+            for item in vectors or []:
+                self.vectors[item["id"]] = {"values": list(item["values"]), "metadata": dict(item.get("metadata") or {})}
+        return SimpleNamespace(upserted_count=len(vectors or []))
+
+    def fetch(self, ids=None, namespace=None, **kwargs):
+        self._standins.call("pinecone", "fetch")
+        with self._lock:
+            found = {i: self.vectors[i] for i in ids or [] if i in self.vectors}
+        return SimpleNamespace(vectors={
+            i: SimpleNamespace(id=i, values=v["values"], metadata=v["metadata"]) for i, v in found.items()
+        })
+
+    def delete(self, ids=None, namespace=None, delete_all=False, **kwargs):
+        self._standins.call("pinecone", "delete")
+        with self._lock:
+            if delete_all:
+                self.vectors.clear()
+            for i in ids or []:
+                self.vectors.pop(i, None)
+        return {}
+
+    def query(self, vector=None, top_k: int = 10, include_metadata: bool = False,
+              filter: Optional[Dict[str, Any]] = None, **kwargs):
+        self._standins.call("pinecone", "query")
+        import numpy as np
+
+        with self._lock:
+            items = [
+                (i, v) for i, v in self.vectors.items()
+                if not filter or all(v["metadata"].get(k) == (c.get("$eq") if isinstance(c, dict) else c)
+                                     for k, c in filter.items())
+            ]
+        if not items or vector is None:
+            return SimpleNamespace(matches=[])
+        matrix = np.asarray([v["values"] for _, v in items], dtype=np.float32)
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-9)
+        best = np.argsort(-scores)[:top_k]
+        return SimpleNamespace(matches=[
+            SimpleNamespace(
+                id=items[n][0],
+                score=float(scores[n]),
+                values=[],
+                metadata=items[n][1]["metadata"] if include_metadata else None,
+            )
+            for n in best
+        ])
+
+    def list_paginated(self, prefix: Optional[str] = None, limit: int = 100,
+                       pagination_token: Optional[str] = None, **kwargs):
+        self._standins.call("pinecone", "list")
+        with self._lock:
+            ids = sorted(i for i in self.vectors if not prefix or i.startswith(prefix))
+        start = int(pagination_token or 0)
+        page = ids[start:start + limit]
+        more = start + limit < len(ids)
+        return SimpleNamespace(
+            vectors=[SimpleNamespace(id=i) for i in page],
+            pagination=SimpleNamespace(next=str(start + limit)) if more else None,
+        )
+
+    def describe_index_stats(self, **kwargs):
+        self._standins.call("pinecone", "describe_index_stats")
+        return SimpleNamespace(
+            total_vector_count=len(self.vectors),
+            dimension=self._standins.cohere.dimension,
+            namespaces={"": SimpleNamespace(vector_count=len(self.vectors))},
+        )
+
+
+# ============================================================================
+# YOUTUBE
+# ============================================================================
+
+class _YouTubeRequest:
+    def __init__(self, standins: "StandIns", operation: str, response: Dict[str, Any]):
+        self._standins = standins
+        self.operation = operation
+        self._response = response
+
+    def execute(self, http=None, num_retries: int = 0):
+        self._standins.call("youtube", self.operation)
+        return self._response
+
+
+class _YouTubeCollection:
+    def __init__(self, standins: "StandIns", operation: str, build: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        self._standins = standins
+        self._operation = operation
+        self._build = build
+
+    def list(self, **params):
+        return _YouTubeRequest(self._standins, self._operation, self._build(params))
+
+
+class FakeYouTube:
+    """
+    googleapiclient "youtube v3" resource stand-in.
+
+    Results are deterministic per keyword, so repeated searches find the same
+    videos, like the real API does between index updates.
+    """
+
+    def __init__(self, standins: "StandIns"):
+        self._standins = standins
+
+    @staticmethod
+    def video_id(keyword: str, n: int) -> str:
+        return hashlib.md5(f"{keyword}:{n}".encode()).hexdigest()[:11]
+
+    def search(self):
+        return _YouTubeCollection(self._standins, "search.list", self._search)
+
+    def videos(self):
+        return _YouTubeCollection(self._standins, "videos.list", self._videos)
+
+    def channels(self):
+        return _YouTubeCollection(self._standins, "channels.list", self._channels)
+
+    def _search(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        keyword = params.get("q", "")
+        items = []
+        for n in range(int(params.get("maxResults", 5))):
+            video_id = self.video_id(keyword, n)
+            channel_id = "UC" + hashlib.md5(f"channel:{keyword}:{n % 3}".encode()).hexdigest()[:22]
+            items.append({
+                "id": {"kind": "youtube#video", "videoId": video_id},
+                "snippet": {
+                    "title": f"{keyword} review #{n + 1}",
+                    "description": f"Honest {keyword} review and first impressions",
+                    "channelId": channel_id,
+                    "channelTitle": f"Bench Creator {n % 3}",
+                    "publishedAt": "2025-01-01T00:00:00Z",
+                    "thumbnails": {"high": {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}},
+                },
+            })
+        return {"kind": "youtube#searchListResponse", "items": items}
+
+    def _videos(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        items = []
+        for video_id in str(params.get("id", "")).split(","):
+            rng = _seeded("stats", video_id)
+            views = rng.randint(5_000, 2_000_000)
+            items.append({
+                "id": video_id,
+                "statistics": {
+                    "viewCount": str(views),
+                    "likeCount": str(views // rng.randint(20, 60)),
+                    "commentCount": str(views // rng.randint(200, 900)),
+                },
+                "contentDetails": {"duration": f"PT{rng.randint(15, 59)}S"},
+            })
+        return {"kind": "youtube#videoListResponse", "items": items}
+
+    def _channels(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"items": [{
+            "id": params.get("id"),
+            "snippet": {"title": "Bench Creator", "description": "Business: creator@bench.local"},
+        }]}
+
+
+# ============================================================================
+# GEMINI
+# ============================================================================
+
+class _GeminiModels:
+    def __init__(self, standins: "StandIns"):
+        self._standins = standins
+
+    def generate_content(self, model: str = None, contents=None, config=None, **kwargs):
+        self._standins.call("gemini", "generate_content")
+        text = json.dumps({
+            "title_summary": "Product review and unboxing",
+            "objects_actions": [["product", "packaging"], ["unboxing", "hands-on review"]],
+            "aesthetic": "bright, clean, modern",
+            "tone_vibe": "enthusiastic, informative",
+            "potential_categories": ["sports", "outdoors", "lifestyle", "tech"],
+        })
+        part = SimpleNamespace(text=text, inline_data=None)
+        return SimpleNamespace(
+            text=text,
+            candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+            usage_metadata=SimpleNamespace(total_token_count=1200 + len(text) // 4),
+        )
+
+
+class FakeGemini:
+    """google.genai.Client stand-in"""
+
+    def __init__(self, standins: "StandIns"):
+        self.models = _GeminiModels(standins)
+
+
+# ============================================================================
+# SHOPIFY ADMIN (requests) AND IMAGE CDN
+# ============================================================================
+
+class FakeShopify:
+    """Shopify Admin REST stand-in with a generated catalog per shop"""
+
+    def __init__(self, standins: "StandIns", catalog_size: int = 25, distinct_images: Optional[int] = None):
+        self._standins = standins
+        self.catalog_size = catalog_size
+        self.distinct_images = distinct_images
+
+    def catalog(self, shop: str) -> List[Dict[str, Any]]:
+        kinds = ("Snowboard", "Ski Jacket", "Gift Card", "Tech Gadget", "Beanie")
+        images = self.distinct_images or self.catalog_size
+        return [
+            {
+                "id": 1000 + n,
+                "title": f"Bench {kinds[n % len(kinds)]} {n}",
+                "body_html": f"<p>{kinds[n % len(kinds)]} number {n} from {shop}</p>",
+                "vendor": shop,
+                "variants": [{"id": 5000 + n, "price": f"{19.99 + n:.2f}"}],
+                "images": [{"src": f"https://{CDN_HOSTS[0]}/s/files/bench/{shop}/{n % images}.jpg"}],
+            }
+            for n in range(self.catalog_size)
+        ]
+
+    def handle(self, method: str, url: str) -> Tuple[int, Dict[str, str], bytes]:
+        parts = urlsplit(url)
+        shop = parts.hostname
+        path = re.sub(r"^/admin/api/[^/]+", "", parts.path)
+        operation = f"{method} {re.sub(r'/[0-9]+', '/{id}', path)}"
+        if self._standins.call("shopify", operation, raise_error=False):
+            return 503, {}, b'{"errors": "Service unavailable (injected)"}'
+
+        headers = {"Content-Type": "application/json", "X-Shopify-Shop-Api-Call-Limit": "1/40"}
+        if path == "/products.json":
+            body = {"products": self.catalog(shop)}
+        elif path == "/products/count.json":
+            body = {"count": self.catalog_size}
+        elif path == "/shop.json":
+            body = {"shop": {"name": shop, "domain": shop, "myshopify_domain": shop, "currency": "USD"}}
+        elif path in ("/orders.json", "/webhooks.json", "/price_rules.json"):
+            body = {path.strip("/").split(".")[0]: []}
+        else:
+            return 404, headers, b'{"errors": "Not Found"}'
+        return 200, headers, json.dumps(body).encode()
+
+
+class FakeCdn:
+    """Image CDN stand-in: a small noise JPEG per URL (distinct perceptual hashes)"""
+
+    def __init__(self, standins: "StandIns", size: int = 96):
+        self._standins = standins
+        self.size = size
+        self._images: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def image(self, url: str) -> bytes:
+        with self._lock:
+            cached = self._images.get(url)
+        if cached is None:
+            import numpy as np
+            from PIL import Image
+
+            seed = int.from_bytes(hashlib.sha256(url.encode()).digest()[:4], "big")
+            pixels = np.random.default_rng(seed).integers(0, 255, (self.size, self.size, 3), dtype=np.uint8)
+            buffer = BytesIO()
+            Image.fromarray(pixels).save(buffer, format="JPEG", quality=80)
+            cached = buffer.getvalue()
+            with self._lock:
+                self._images[url] = cached
+        return cached
+
+    def handle(self, url: str, failed: bool) -> Tuple[int, Dict[str, str], bytes]:
+        if failed:
+            return 503, {}, b""
+        return 200, {"Content-Type": "image/jpeg"}, self.image(url)
+
+
+# ============================================================================
+# SUPABASE POSTGREST (httpx)
+# ============================================================================
+
+# (table, embedded table) -> (local column, foreign column, one row or many)
+RELATIONS = {
+    ("product_creator_matches", "creator_videos"): ("video_id", "video_id", False),
+    ("company_products", "product_creator_matches"): ("id", "product_id", True),
+}
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split on commas outside parentheses and double quotes"""
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif char == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _as_text(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _compare(value: Any, arg: str) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        a, b = float(value), float(arg)
+    except (TypeError, ValueError):
+        a, b = str(value), arg
+    return (a > b) - (a < b)
+
+
+def _matches(value: Any, op: str, arg: str) -> bool:
+    if op.startswith("not."):
+        return not _matches(value, op[4:], arg)
+    if op == "eq":
+        return _as_text(value) == arg
+    if op == "neq":
+        return _as_text(value) != arg
+    if op in ("gt", "gte", "lt", "lte"):
+        cmp = _compare(value, arg)
+        return cmp is not None and {"gt": cmp > 0, "gte": cmp >= 0, "lt": cmp < 0, "lte": cmp <= 0}[op]
+    if op == "in":
+        options = [o.strip('"') for o in _split_top_level(arg.strip("()"))]
+        return _as_text(value) in options
+    if op == "is":
+        return _as_text(value) == arg.lower()
+    if op in ("like", "ilike"):
+        pattern = "^" + re.escape(arg).replace(r"\*", ".*").replace("%", ".*") + "$"
+        return re.match(pattern, _as_text(value), re.IGNORECASE if op == "ilike" else 0) is not None
+    if op == "cs":
+        return isinstance(value, list) and all(o.strip('"') in map(str, value) for o in _split_top_level(arg.strip("{}")))
+    return True  # operators we don't model don't filter
+
+
+class FakePostgrest:
+    """
+    An in-memory PostgREST: enough of the protocol for postgrest-py's
+    select/insert/upsert/update/delete builders, with tables as lists of dicts.
+    """
+
+    def __init__(self, standins: "StandIns"):
+        self._standins = standins
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.rpc_handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+
+    def insert(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        stored = []
+        for row in rows:
+            row = {k: (_now() if v == "now()" else v) for k, v in row.items()}
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("created_at", _now())
+            self.tables.setdefault(table, []).append(row)
+            stored.append(row)
+        return stored
+
+    def _filter(self, rows: List[Dict[str, Any]], filters: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        for column, expression in filters:
+            op, _, arg = expression.partition(".")
+            if op == "not":
+                inner, _, arg = arg.partition(".")
+                op = f"not.{inner}"
+            rows = [row for row in rows if _matches(row.get(column), op, arg)]
+        return rows
+
+    def _order(self, rows: List[Dict[str, Any]], order: str) -> List[Dict[str, Any]]:
+        for term in reversed(_split_top_level(order)):
+            column, *modifiers = term.split(".")
+            desc = "desc" in modifiers
+            present = [r for r in rows if r.get(column) is not None]
+            missing = [r for r in rows if r.get(column) is None]
+            present.sort(key=lambda r: (str(type(r[column])), r[column]), reverse=desc)
+            nulls_first = "nullsfirst" in modifiers or (desc and "nullslast" not in modifiers)
+            rows = missing + present if nulls_first else present + missing
+        return rows
+
+    def _project(self, table: str, rows: List[Dict[str, Any]], select: str) -> List[Dict[str, Any]]:
+        columns = _split_top_level(select or "*")
+        projected = []
+        for row in rows:
+            out: Dict[str, Any] = {}
+            for column in columns:
+                name = column.split(":")[-1] if "(" not in column else column
+                if name == "*":
+                    out.update(row)
+                elif "(" in name:
+                    rel, inner = name.split("(", 1)
+                    rel = rel.split("!")[0].split(":")[-1]
+                    out[rel] = self._embed(table, rel, row, inner[:-1])
+                else:
+                    out[column.split(":")[0]] = row.get(name.split("::")[0])
+            projected.append(out)
+        return projected
+
+    def _embed(self, table: str, rel: str, row: Dict[str, Any], select: str):
+        relation = RELATIONS.get((table, rel))
+        if relation is None:
+            return None
+        local, foreign, many = relation
+        related = [r for r in self.tables.get(rel, []) if r.get(foreign) == row.get(local)]
+        related = self._project(rel, related, select)
+        return related if many else (related[0] if related else None)
+
+    def _respond(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        return httpx.Response(status, json=body, headers=headers or {})
+
+    def _error(self, status: int, code: str, message: str) -> httpx.Response:
+        return self._respond(status, {"code": code, "message": message, "details": None, "hint": None})
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        table = path.rsplit("/", 1)[-1]
+        operation = f"{request.method} {'rpc/' + table if '/rpc/' in path else table}"
+        if await self._standins.acall("supabase", operation):
+            return self._error(500, "BENCH", "Injected error")
+
+        await request.aread()
+        body = json.loads(request.content) if request.content else None
+        params = parse_qsl(request.url.query.decode(), keep_blank_values=True)
+        reserved = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+        options = {k: v for k, v in params if k in reserved}
+        filters = [(k, v) for k, v in params if k not in reserved]
+        prefer = request.headers.get("prefer", "")
+        single = "vnd.pgrst.object" in request.headers.get("accept", "")
+
+        if "/rpc/" in path:
+            handler = self.rpc_handlers.get(table)
+            return self._respond(200, handler(body or {}) if handler else None)
+
+        rows = self.tables.setdefault(table, [])
+        if request.method == "POST":
+            incoming = body if isinstance(body, list) else [body]
+            if "resolution=" in prefer:
+                keys = (options.get("on_conflict") or "id").split(",")
+                result = []
+                for item in incoming:
+                    existing = next((r for r in rows if all(_as_text(r.get(k)) == _as_text(item.get(k)) for k in keys)), None)
+                    if existing is None:
+                        result.extend(self.insert(table, [item]))
+                    elif "merge-duplicates" in prefer:
+                        existing.update({k: (_now() if v == "now()" else v) for k, v in item.items()})
+                        result.append(existing)
+            else:
+                result = self.insert(table, incoming)
+            return self._respond(201, result if "return=representation" in prefer else [])
+
+        matched = self._filter(rows, filters)
+        if request.method == "PATCH":
+            for row in matched:
+                row.update({k: (_now() if v == "now()" else v) for k, v in (body or {}).items()})
+            return self._respond(200, matched if "return=representation" in prefer else [])
+        if request.method == "DELETE":
+            ids = {id(row) for row in matched}
+            self.tables[table] = [row for row in rows if id(row) not in ids]
+            return self._respond(200, matched if "return=representation" in prefer else [])
+
+        total = len(matched)
+        if options.get("order"):
+            matched = self._order(matched, options["order"])
+        offset = int(options.get("offset") or 0)
+        if options.get("limit"):
+            matched = matched[offset:offset + int(options["limit"])]
+        elif offset:
+            matched = matched[offset:]
+        result = self._project(table, matched, options.get("select", "*"))
+
+        headers = {}
+        if "count=" in prefer:
+            headers["Content-Range"] = f"{offset}-{offset + len(result) - 1}/{total}" if result else f"*/{total}"
+        if single:
+            if len(result) != 1:
+                return self._error(406, "PGRST116", f"JSON object requested, {len(result)} rows returned")
+            return self._respond(200, result[0], headers)
+        if request.method == "HEAD":
+            return httpx.Response(200, headers=headers)
+        return self._respond(200, result, headers)
+
+
+# ============================================================================
+# UPSTASH REST (httpx, backed by fakeredis)
+# ============================================================================
+
+class FakeUpstash:
+    """Upstash REST stand-in: "/", "/pipeline" and "/multi-exec" over fakeredis"""
+
+    def __init__(self, standins: "StandIns"):
+        import fakeredis
+
+        self._standins = standins
+        self.redis = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        # Raw replies ("OK", not True), as the REST API returns them
+        self.redis.response_callbacks.clear()
+        self._transaction = asyncio.Lock()
+
+    async def _run(self, command: List[Any]) -> Dict[str, Any]:
+        from redis.exceptions import NoScriptError
+
+        try:
+            return {"result": await self.redis.execute_command(*command)}
+        except NoScriptError as e:
+            return {"error": f"NOSCRIPT {e}"}
+        except Exception as e:
+            return {"error": f"ERR {e}"}
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        body = json.loads(request.content or b"[]")
+        path = request.url.path
+        operation = path.strip("/") or (str(body[0]).upper() if body else "/")
+        if await self._standins.acall("upstash", operation):
+            return httpx.Response(500, json={"error": "ERR injected error"})
+
+        if path == "/pipeline":
+            return httpx.Response(200, json=[await self._run(c) for c in body])
+        if path == "/multi-exec":
+            async with self._transaction:
+                return httpx.Response(200, json=[await self._run(c) for c in body])
+        return httpx.Response(200, json=await self._run(body))
+
+
+# ============================================================================
+# THE HUB
+# ============================================================================
+
+class StandIns:
+    """All stand-ins, their call counters, and the patches that wire them in"""
+
+    def __init__(self, profiles: Optional[Dict[str, ServiceProfile]] = None, seed: int = 0,
+                 catalog_size: int = 25, dimension: int = 1024):
+        self.profiles = {service: ServiceProfile() for service in SERVICES}
+        self.profiles.update(profiles or {})
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Counter = Counter()   # (service, operation) -> calls
+        self.errors: Counter = Counter()  # (service, operation) -> injected errors
+
+        self.cohere = FakeCohere(self, dimension)
+        self.pinecone = FakeIndex(self)
+        self.youtube = FakeYouTube(self)
+        self.gemini = FakeGemini(self)
+        self.shopify = FakeShopify(self, catalog_size)
+        self.cdn = FakeCdn(self)
+        self.postgrest = FakePostgrest(self)
+        try:
+            self.upstash: Optional[FakeUpstash] = FakeUpstash(self)
+        except ImportError:
+            print("⚠️  fakeredis not installed: running without Redis (pip install fakeredis lupa)")
+            self.upstash = None
+
+    # ---- latency and errors ----
+
+    def _begin(self, service: str, operation: str) -> Tuple[float, bool]:
+        profile = self.profiles[service]
+        with self._lock:
+            self.calls[(service, operation)] += 1
+            delay = max(profile.latency + self._rng.uniform(-profile.jitter, profile.jitter), 0.0)
+            failed = self._rng.random() < profile.error_rate
+            if failed:
+                self.errors[(service, operation)] += 1
+        return delay, failed
+
+    def call(self, service: str, operation: str, raise_error: bool = True) -> bool:
+        """Count a blocking call, sleep its latency; returns (or raises) an injected failure"""
+        delay, failed = self._begin(service, operation)
+        if delay:
+            time.sleep(delay)
+        if failed and raise_error:
+            raise StandInError(f"{service} {operation}: injected error")
+        return failed
+
+    async def acall(self, service: str, operation: str) -> bool:
+        """Count a non-blocking call, await its latency; returns whether it fails"""
+        delay, failed = self._begin(service, operation)
+        await asyncio.sleep(delay)
+        return failed
+
+    # ---- results ----
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """{service: {operation: calls}}"""
+        with self._lock:
+            calls = dict(self.calls)
+        out: Dict[str, Dict[str, int]] = {}
+        for (service, operation), n in sorted(calls.items()):
+            out.setdefault(service, {})[operation] = n
+        return out
+
+    def totals(self) -> Dict[str, Tuple[int, int]]:
+        """{service: (calls, injected errors)}"""
+        with self._lock:
+            calls, errors = dict(self.calls), dict(self.errors)
+        out: Dict[str, Tuple[int, int]] = {}
+        for (service, operation), n in calls.items():
+            total, failed = out.get(service, (0, 0))
+            out[service] = (total + n, failed + errors.get((service, operation), 0))
+        return out
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    # ---- transports ----
+
+    def _requests_send(self, adapter, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        host = urlsplit(request.url).hostname or ""
+        if host.endswith(".myshopify.com"):
+            status, headers, body = self.shopify.handle(request.method, request.url)
+        elif host in CDN_HOSTS:
+            status, headers, body = self.cdn.handle(request.url, self.call("cdn", "GET", raise_error=False))
+        else:
+            raise requests.ConnectionError(f"No stand-in for {host} (benchmarks run offline)", request=request)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response.reason = "OK" if status < 400 else "Error"
+        return response
+
+    async def _httpx_send(self, transport, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if host == self.supabase_host:
+            response = await self.postgrest.handle(request)
+        elif host == UPSTASH_HOST and self.upstash is not None:
+            response = await self.upstash.handle(request)
+        elif host in CDN_HOSTS:
+            status, headers, body = self.cdn.handle(str(request.url), await self.acall("cdn", "GET"))
+            response = httpx.Response(status, headers=headers, content=body)
+        elif host in LOOPBACK_HOSTS:
+            # The load tests' own client talking to the API under test
+            return await self._loopback(transport, request)
+        else:
+            raise httpx.ConnectError(f"No stand-in for {host} (benchmarks run offline)", request=request)
+        response.request = request
+        return response
+
+    @contextmanager
+    def install(self) -> Iterator["StandIns"]:
+        """Point every external client of the backend at these stand-ins"""
+        preloaded = set(sys.modules)
+        with ExitStack() as stack:
+            # Settings and clients made for the benchmark don't outlive it
+            stack.callback(self._unload, preloaded)
+            stack.enter_context(patch.dict(os.environ, {k: v for k, v in BENCH_ENV.items() if k not in os.environ}))
+            self.supabase_host = urlsplit(os.environ["SUPABASE_URL"]).hostname
+
+            # The SDK clients are created at import time
+            with patch("pinecone.Pinecone"), patch("cohere.ClientV2"), patch("google.genai.Client"):
+                import product_showcase
+                import utils.vectordb as vectordb
+                import utils.video as video
+                import utils.yt_search as yt_search
+                import utils.images as images
+                from utils.redis_client import RestTransport, redis_client
+
+            stack.enter_context(patch.object(vectordb, "co", self.cohere))
+            stack.enter_context(patch.object(vectordb, "index", self.pinecone))
+            stack.enter_context(patch.object(video, "client", self.gemini))
+            stack.enter_context(patch.object(product_showcase, "client", self.gemini))
+            stack.enter_context(patch.object(yt_search, "_youtube", self.youtube))
+            stack.enter_context(patch.dict(os.environ, {"USE_MOCK_YOUTUBE": "false"}))
+
+            cache_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="maatchaa-bench-"))
+            stack.enter_context(patch.object(images, "IMAGE_CACHE_DIR", cache_dir))
+
+            self._loopback = httpx.AsyncHTTPTransport.handle_async_request
+            sender = self._httpx_send
+            stack.enter_context(patch.object(
+                httpx.AsyncHTTPTransport, "handle_async_request",
+                lambda transport, request: sender(transport, request),
+            ))
+            stack.enter_context(patch.object(
+                requests.adapters.HTTPAdapter, "send",
+                lambda adapter, request, **kwargs: self._requests_send(adapter, request, **kwargs),
+            ))
+
+            transport = (RestTransport(url=f"https://{UPSTASH_HOST}", token="bench")
+                         if self.upstash is not None else RestTransport())
+            stack.enter_context(patch.object(redis_client, "transport", transport))
+            stack.callback(self._close_transport, transport)
+            yield self
+
+    @staticmethod
+    def _unload(preloaded) -> None:
+        for name in ("utils.vectordb", "utils.video", "product_showcase"):
+            if name not in preloaded:
+                sys.modules.pop(name, None)
+
+    @staticmethod
+    def _close_transport(transport) -> None:
+        client = transport._client
+        if client is not None and not client.is_closed:
+            try:
+                asyncio.get_running_loop().create_task(client.aclose())
+            except RuntimeError:
+                pass  # no loop left; the client is garbage collected with it
@@ -0,0 +1,146 @@
+"""
+Load generation and reporting for the benchmarks.
+
+run_load() keeps `concurrency` operations in flight until `total` have run,
+like scripts/benchmark_redis_transport.py does for Redis commands, and
+returns a LoadResult with every latency. The format_* helpers print the
+tables the CLI shows: throughput and p50/p99 latency per operation,
+latency histograms, and external calls per service as counted by the
+stand-ins.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from benchmarks.fakes import StandIns
+
+
+# Upper bounds of the latency histogram buckets, plus one for anything slower
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+@dataclass
+class LoadResult:
+    """Latencies of one kind of operation over a run"""
+
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    wall: float = 0.0
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def throughput(self) -> float:
+        """Operations per second of wall time"""
+        return self.count / self.wall if self.wall else 0.0
+
+    def percentile(self, fraction: float) -> float:
+        return percentile(self.latencies, fraction)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "errors": self.errors,
+            "throughput": round(self.throughput, 2),
+            "p50_ms": round(self.percentile(0.50) * 1000, 2),
+            "p95_ms": round(self.percentile(0.95) * 1000, 2),
+            "p99_ms": round(self.percentile(0.99) * 1000, 2),
+            "max_ms": round(max(self.latencies, default=0.0) * 1000, 2),
+        }
+
+
+async def timed_call(result: LoadResult, factory: Callable[[], Awaitable[Any]],
+                     ok: Optional[Callable[[Any], bool]] = None) -> Any:
+    """Await one operation, adding its latency (and any failure) to `result`"""
+    start = time.perf_counter()
+    try:
+        value = await factory()
+    except Exception:
+        result.errors += 1
+        raise
+    finally:
+        result.latencies.append(time.perf_counter() - start)
+    if ok is not None and not ok(value):
+        result.errors += 1
+    return value
+
+
+async def run_load(name: str, factory: Callable[[], Awaitable[Any]], total: int, concurrency: int,
+                   ok: Optional[Callable[[Any], bool]] = None) -> LoadResult:
+    """
+    Run `total` operations with `concurrency` in flight.
+
+    An operation fails if it raises or if `ok(result)` is False; failures
+    still count towards the latencies.
+    """
+    result = LoadResult(name)
+    remaining = total
+
+    async def runner():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            try:
+                await timed_call(result, factory, ok)
+            except Exception:
+                pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*(runner() for _ in range(max(concurrency, 1))))
+    result.wall = time.perf_counter() - start
+    return result
+
+
+def format_results(results: List[LoadResult]) -> str:
+    lines = [f"{'operation':<44}{'count':>7}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for result in results:
+        row = result.summary()
+        lines.append(
+            f"{row['name']:<44}{row['count']:>7}{row['errors']:>8}{row['throughput']:>10.1f}"
+            f"{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def format_calls(standins: StandIns, wall: float, detail: bool = True) -> str:
+    """External calls per service (and per operation) with injected errors"""
+    lines = [f"{'service':<44}{'calls':>7}{'errors':>8}{'calls/s':>10}"]
+    counts = standins.counts()
+    for service, (calls, errors) in sorted(standins.totals().items()):
+        lines.append(f"{service:<44}{calls:>7}{errors:>8}{calls / wall if wall else 0.0:>10.1f}")
+        if detail:
+            for operation, n in counts.get(service, {}).items():
+                lines.append(f"  {operation[:42]:<42}{n:>7}")
+    return "\n".join(lines)
+
+
+def histogram(latencies: List[float], bounds=HISTOGRAM_BUCKETS_MS) -> Dict[str, int]:
+    """Count latencies per bucket, keyed "<=Nms" with a final ">Nms" overflow"""
+    counts = {f"<={bound}ms": 0 for bound in bounds}
+    counts[f">{bounds[-1]}ms"] = 0
+    for latency in latencies:
+        ms = latency * 1000
+        bucket = next((f"<={bound}ms" for bound in bounds if ms <= bound), f">{bounds[-1]}ms")
+        counts[bucket] += 1
+    return counts
+
+
+def format_histogram(latencies: List[float], bounds=HISTOGRAM_BUCKETS_MS, width: int = 40) -> str:
+    counts = histogram(latencies, bounds)
+    peak = max(counts.values(), default=0) or 1
+    return "\n".join(
+        f"  {bucket:>9}{n:>8}  {'█' * round(n / peak * width)}"
+        for bucket, n in counts.items()
+    )
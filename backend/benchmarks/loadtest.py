@@ -0,0 +1,305 @@
+"""
+HTTP load tests against API.py served by uvicorn.
+
+serve() runs the app under uvicorn on a loopback port (in its own thread
+and event loop, like a deployment where clients are elsewhere), with the
+stand-ins from StandIns.install() behind it. run_mix() then drives a Mix,
+a weighted blend of scenarios.ROUTES, with a closed-loop client at each
+concurrency step for `duration` seconds, giving:
+
+- per-endpoint latency histograms (harness.HISTOGRAM_BUCKETS_MS)
+- a saturation curve: throughput and p50/p95/p99 per concurrency step,
+  with the step where throughput stops growing marked
+- SLO checks per step against the mix's thresholds
+
+Mixes are scriptable as JSON (Mix.from_dict), e.g.:
+
+    {
+        "name": "checkout-week",
+        "weights": {"GET /partnerships": 4, "GET /dashboard/stats": 2, "POST /search/text": 1},
+        "slo": {"*": {"p99_ms": 500}, "POST /search/text": {"p99_ms": 1200, "error_rate": 0.05}}
+    }
+
+An SLO keyed "*" applies to every route; a route's own entry overrides it
+key by key. Thresholds are p50_ms, p95_ms, p99_ms and error_rate.
+"""
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+from unittest.mock import patch
+
+import httpx
+
+from benchmarks.harness import LoadResult, format_histogram, histogram, timed_call
+from benchmarks.scenarios import ROUTES, Dataset
+
+SLO_KEYS = ("p50_ms", "p95_ms", "p99_ms", "error_rate")
+
+# Throughput growing less than this between steps means the API saturated
+SATURATION_GAIN = 1.1
+
+
+@dataclass
+class Mix:
+    """A load scenario: how often each route is hit, and its latency SLOs"""
+
+    name: str
+    weights: Dict[str, float]
+    slo: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    description: str = ""
+
+    def __post_init__(self):
+        unknown = [route for route in list(self.weights) + list(self.slo) if route != "*" and route not in ROUTES]
+        if unknown:
+            raise ValueError(f"Unknown routes in mix '{self.name}': {', '.join(unknown)}")
+        for route, thresholds in self.slo.items():
+            bad = [key for key in thresholds if key not in SLO_KEYS]
+            if bad:
+                raise ValueError(f"Unknown SLO keys for '{route}': {', '.join(bad)} (one of: {', '.join(SLO_KEYS)})")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Mix":
+        return cls(
+            name=data.get("name", "custom"),
+            weights={route: float(weight) for route, weight in data["weights"].items()},
+            slo=data.get("slo", {}),
+            description=data.get("description", ""),
+        )
+
+    def thresholds(self, route: str) -> Dict[str, float]:
+        return {**self.slo.get("*", {}), **self.slo.get(route, {})}
+
+
+# Reads go through Supabase (25ms default) and the response cache; search
+# adds a Cohere embed and a Pinecone query
+DEFAULT_SLO = {
+    "*": {"p99_ms": 500, "error_rate": 0.01},
+    "POST /search/text": {"p99_ms": 1000},
+}
+
+MIXES: Dict[str, Mix] = {
+    "dashboard": Mix(
+        "dashboard",
+        {
+            "GET /dashboard/stats": 3,
+            "GET /partnerships": 4,
+            "GET /products": 2,
+            "GET /products/{id}/creators": 1,
+            "GET /notifications": 3,
+            "GET /health": 1,
+        },
+        DEFAULT_SLO,
+        "Brand teams working the dashboard: stats, pipeline and notifications",
+    ),
+    "reels": Mix(
+        "reels",
+        {
+            "POST /reels/interactions": 4,
+            "GET /reels/interactions": 2,
+            "GET /partnerships": 2,
+            "GET /notifications": 1,
+            "POST /search/text": 1,
+        },
+        DEFAULT_SLO,
+        "Swiping through creator reels, recording dismissals and partnerships",
+    ),
+    "search": Mix(
+        "search",
+        {
+            "POST /search/text": 5,
+            "GET /products": 2,
+            "GET /products/{id}/creators": 2,
+            "GET /dashboard/stats": 1,
+        },
+        DEFAULT_SLO,
+        "Product search and matching, heavy on Cohere and Pinecone",
+    ),
+    "mixed": Mix(
+        "mixed",
+        {
+            "GET /dashboard/stats": 2,
+            "GET /partnerships": 3,
+            "GET /products": 2,
+            "GET /products/{id}/creators": 1,
+            "GET /reels/interactions": 1,
+            "POST /reels/interactions": 2,
+            "GET /notifications": 2,
+            "POST /search/text": 1,
+        },
+        DEFAULT_SLO,
+        "All of the above in roughly production proportions",
+    ),
+}
+
+
+@dataclass
+class Step:
+    """One concurrency level of a run"""
+
+    concurrency: int
+    routes: Dict[str, LoadResult]
+    wall: float = 0.0
+    breaches: List[str] = field(default_factory=list)
+
+    @property
+    def overall(self) -> LoadResult:
+        combined = LoadResult("all routes", wall=self.wall)
+        for result in self.routes.values():
+            combined.latencies.extend(result.latencies)
+            combined.errors += result.errors
+        return combined
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "wall_seconds": round(self.wall, 3),
+            "overall": self.overall.summary(),
+            "routes": {
+                name: {**result.summary(), "histogram": histogram(result.latencies)}
+                for name, result in self.routes.items()
+            },
+            "slo_breaches": self.breaches,
+        }
+
+
+def check_slo(mix: Mix, step: Step) -> List[str]:
+    """Thresholds the step's routes missed, as readable lines"""
+    breaches = []
+    for name, result in step.routes.items():
+        if not result.count:
+            continue
+        summary = result.summary()
+        summary["error_rate"] = result.errors / result.count
+        for key, limit in mix.thresholds(name).items():
+            if summary[key] > limit:
+                shown = f"{summary[key]:.1%} > {limit:.1%}" if key == "error_rate" else f"{summary[key]:.0f} > {limit:g}"
+                breaches.append(f"{name}: {key} {shown}")
+    return breaches
+
+
+@asynccontextmanager
+async def serve(app, host: str = "127.0.0.1", port: int = 0) -> AsyncIterator[str]:
+    """Run `app` under uvicorn in a background thread; yields its base URL"""
+    import uvicorn
+
+    config = uvicorn.Config(app, host=host, port=port, lifespan="on", log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="loadtest-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn exited before it started serving")
+        await asyncio.sleep(0.02)
+
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        await asyncio.to_thread(thread.join, 15)
+
+
+async def drive(base_url: str, mix: Mix, dataset: Dataset, concurrency: int, duration: float,
+                rng: random.Random) -> Step:
+    """Keep `concurrency` clients sending requests from the mix for `duration` seconds"""
+    routes, weights = zip(*mix.weights.items())
+    step = Step(concurrency, {route: LoadResult(route) for route in routes})
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0, limits=limits) as client:
+        async def user():
+            while time.perf_counter() < deadline:
+                route = rng.choices(routes, weights)[0]
+                method, path, query, body = ROUTES[route](rng, dataset)
+                try:
+                    await timed_call(
+                        step.routes[route],
+                        lambda: client.request(method, path, params=query, json=body),
+                        ok=lambda response: response.status_code < 500,
+                    )
+                except Exception:
+                    pass
+
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        step.wall = time.perf_counter() - start
+
+    for result in step.routes.values():
+        result.wall = step.wall
+    step.breaches = check_slo(mix, step)
+    return step
+
+
+async def run_mix(standins, dataset: Dataset, mix: Mix, steps: List[int], duration: float = 10.0,
+                  seed: int = 0) -> List[Step]:
+    """Serve the API with `standins` installed and drive `mix` at each concurrency in `steps`"""
+    import API
+
+    rng = random.Random(seed)
+    results = []
+    with patch.object(API, "EMBEDDED_WORKER", False):
+        async with serve(API.app) as base_url:
+            for concurrency in steps:
+                standins.reset_counts()
+                results.append(await drive(base_url, mix, dataset, concurrency, duration, rng))
+    return results
+
+
+def saturation_point(steps: List[Step]) -> Optional[int]:
+    """First concurrency at which throughput grew less than SATURATION_GAIN over the previous step"""
+    for previous, step in zip(steps, steps[1:]):
+        if step.overall.throughput < previous.overall.throughput * SATURATION_GAIN:
+            return step.concurrency
+    return None
+
+
+def max_within_slo(steps: List[Step]) -> Optional[int]:
+    """Highest concurrency before the first step that missed an SLO"""
+    best = None
+    for step in steps:
+        if step.breaches:
+            break
+        best = step.concurrency
+    return best
+
+
+def format_curve(steps: List[Step], route: Optional[str] = None) -> str:
+    """Throughput and latency per concurrency step, for one route or overall"""
+    saturated = saturation_point(steps)
+    lines = [f"{'concurrency':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}  slo"]
+    for step in steps:
+        result = step.routes[route] if route else step.overall
+        row = result.summary()
+        mark = "ok" if not step.breaches else f"{len(step.breaches)} breached"
+        if step.concurrency == saturated and route is None:
+            mark += "  ← saturated"
+        lines.append(
+            f"{step.concurrency:<14}{row['throughput']:>10.1f}{row['p50_ms']:>10.1f}"
+            f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['errors']:>8}  {mark}"
+        )
+    return "\n".join(lines)
+
+
+def format_report(mix: Mix, steps: List[Step]) -> str:
+    """The saturation curve, per-route histograms at the highest step, and SLO breaches"""
+    lines = [f"Mix '{mix.name}'" + (f": {mix.description}" if mix.description else ""), "", format_curve(steps)]
+
+    top = steps[-1]
+    lines += ["", f"Latency histograms at concurrency {top.concurrency}"]
+    for name, result in top.routes.items():
+        row = result.summary()
+        lines += ["", f"{name}  (n={row['count']}, p50 {row['p50_ms']:.1f}ms, p99 {row['p99_ms']:.1f}ms)",
+                  format_histogram(result.latencies)]
+
+    lines += ["", "SLOs"]
+    for step in steps:
+        for breach in step.breaches:
+            lines.append(f"  ❌ c={step.concurrency} {breach}")
+    best = max_within_slo(steps)
+    lines.append(f"  ✅ within SLO up to concurrency {best}" if best is not None else "  ❌ no step met the SLOs")
+    return "\n".join(lines)
@@ -0,0 +1,281 @@
+"""
+Benchmark scenarios: the discovery loop, the Shopify sync job and the API.
+
+Every scenario runs inside StandIns.install() against data from seed(), and
+returns LoadResults for harness.format_results(). External calls are counted
+by the stand-ins themselves.
+
+- bench_discovery: runs creator_discovery_worker (one task per replica) for
+  a number of cycles. The loop's pacing sleeps (4s per video, 20s per
+  search) are scaled by `pacing` (0 skips them). Each replica stops at the
+  sleep that ends a cycle. Reports per-search and per-video latency.
+- bench_sync: runs sync_shopify_products_job for `jobs` shops, `concurrency`
+  at a time, sharing one Supabase client like a worker does.
+- bench_api: starts API.app in-process and drives each route in ROUTES
+  with BlackSheep's TestClient.
+"""
+import asyncio
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest.mock import patch
+
+from benchmarks.fakes import StandIns
+from benchmarks.harness import LoadResult, run_load, timed_call
+
+KINDS = ("Snowboard", "Ski Jacket", "Gift Card", "Tech Gadget", "Beanie")
+PARTNERSHIP_STATUSES = ("to_contact", "contacted", "active", "active", "declined")
+
+
+@dataclass
+class Dataset:
+    """What seed() put into the stand-ins"""
+
+    companies: List[str]
+    products: Dict[str, List[str]] = field(default_factory=dict)  # company_id -> product ids
+    titles: List[str] = field(default_factory=list)
+    video_ids: List[str] = field(default_factory=list)
+
+
+def _ago(rng: random.Random, days: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=rng.uniform(0, days * 86400))).isoformat()
+
+
+def seed(standins: StandIns, companies: int = 20, products_per_company: int = 20,
+         partnerships_per_company: int = 40, interactions_per_company: int = 60, seed: int = 0) -> Dataset:
+    """Fill the Supabase and Pinecone stand-ins with a plausible tenant base"""
+    rng = random.Random(seed)
+    dataset = Dataset(companies=[str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(companies)])
+    db = standins.postgrest
+
+    vector_id = 0
+    vectors = []
+    for n, company_id in enumerate(dataset.companies):
+        shop = f"bench-{n}.myshopify.com"
+        db.insert("shopify_shops", [{"company_id": company_id, "shop_domain": shop, "last_synced_at": _ago(rng, 2)}])
+        db.insert("shopify_oauth_tokens", [{"company_id": company_id, "shop_domain": shop, "products_synced": True}])
+
+        for p in range(products_per_company):
+            kind = KINDS[p % len(KINDS)]
+            title = f"{rng.choice(('Bench', 'Alpine', 'Studio', 'Nova'))} {kind} {p}"
+            row = db.insert("company_products", [{
+                "company_id": company_id,
+                "shop_domain": shop,
+                "title": title,
+                "description": f"{kind} from {shop}",
+                "image": f"https://cdn.shopify.com/s/files/bench/{shop}/{p}.jpg",
+                "price": round(rng.uniform(10, 300), 2),
+                "pinecone_id": str(vector_id),
+                "search_keywords": [f"{title} review", f"{kind.lower()} haul"],
+                "synced_at": _ago(rng, 30),
+            }])[0]
+            dataset.products.setdefault(company_id, []).append(row["id"])
+            dataset.titles.append(title)
+            vectors.append({
+                "id": str(vector_id),
+                "values": standins.cohere.vector(title),
+                "metadata": {"title": title, "vendor": shop, "price": row["price"], "imageURL": row["image"]},
+            })
+            vector_id += 1
+
+        for p in range(partnerships_per_company):
+            video_id = standins.youtube.video_id(f"{company_id}:{p}", 0)
+            dataset.video_ids.append(video_id)
+            db.insert("partnerships", [{
+                "company_id": company_id,
+                "video_id": video_id,
+                "status": rng.choice(PARTNERSHIP_STATUSES),
+                "creator_name": f"Creator {p}",
+                "creator_handle": f"@creator{p}",
+                "video_title": f"Review &amp; haul #{p}",
+                "views": rng.randint(1_000, 500_000),
+                "email_sent": rng.random() < 0.5,
+                "created_at": _ago(rng, 14),
+                "updated_at": _ago(rng, 7),
+            }])
+
+        db.insert("reel_interactions", [
+            {
+                "company_id": company_id,
+                "video_id": rng.choice(dataset.video_ids),
+                "interaction_type": rng.choice(("dismissed", "partnered")),
+                "created_at": _ago(rng, 30),
+            }
+            for _ in range(interactions_per_company)
+        ])
+
+    standins.pinecone.vectors.update({v["id"]: {"values": v["values"], "metadata": v["metadata"]} for v in vectors})
+    return dataset
+
+
+# ============================================================================
+# DISCOVERY
+# ============================================================================
+
+class _CyclesDone(BaseException):
+    """Ends a replica's run (a BaseException so the loop's handlers let it through)"""
+
+
+class _FastForward:
+    """
+    Stands in for the asyncio module inside background_worker.
+
+    Sleeps under a minute are the loop's API pacing and are scaled by
+    `pacing`. Longer ones end a cycle (or back off after an error) and count
+    towards `cycles`.
+    """
+
+    def __init__(self, cycles: int, pacing: float):
+        self.cycles = cycles
+        self.pacing = pacing
+        self.completed: Dict[Any, int] = {}
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    async def sleep(self, seconds: float, result=None):
+        if seconds >= 60:
+            task = asyncio.current_task()
+            self.completed[task] = self.completed.get(task, 0) + 1
+            if self.completed[task] >= self.cycles:
+                raise _CyclesDone()
+            seconds = 0
+        await asyncio.sleep(seconds * self.pacing)
+        return result
+
+
+async def bench_discovery(standins: StandIns, cycles: int = 1, replicas: int = 1, pacing: float = 0.0,
+                          products_per_cycle: int = 10, videos_per_keyword: int = 5,
+                          keywords_per_product: int = 2) -> List[LoadResult]:
+    import background_worker
+
+    searches = LoadResult("discovery: search (fetch_top_shorts)")
+    videos = LoadResult("discovery: video (process_creator_video)")
+    fetch_top_shorts = background_worker.fetch_top_shorts
+    process_creator_video = background_worker.process_creator_video
+    build_search_queue = background_worker.build_search_queue
+
+    async def search(*args, **kwargs):
+        return await timed_call(searches, lambda: fetch_top_shorts(*args, **kwargs))
+
+    async def process(*args, **kwargs):
+        return await timed_call(videos, lambda: process_creator_video(*args, **kwargs))
+
+    async def replica():
+        try:
+            await background_worker.creator_discovery_worker()
+        except _CyclesDone:
+            pass
+
+    with patch.object(background_worker, "asyncio", _FastForward(cycles, pacing)), \
+            patch.object(background_worker, "fetch_top_shorts", search), \
+            patch.object(background_worker, "process_creator_video", process), \
+            patch.object(background_worker, "PRODUCTS_PER_CYCLE", products_per_cycle), \
+            patch.object(background_worker, "VIDEOS_PER_KEYWORD", videos_per_keyword), \
+            patch.object(background_worker, "build_search_queue",
+                         lambda products: build_search_queue(products, keywords_per_product)):
+        start = time.perf_counter()
+        await asyncio.gather(*(replica() for _ in range(replicas)))
+        wall = time.perf_counter() - start
+
+    searches.wall = videos.wall = wall
+    return [searches, videos]
+
+
+# ============================================================================
+# SHOPIFY SYNC
+# ============================================================================
+
+async def bench_sync(standins: StandIns, jobs: int = 8, concurrency: int = 4,
+                     dataset: Optional[Dataset] = None) -> List[LoadResult]:
+    from jobs.tasks import sync_shopify_products_job
+    from utils.supabase import SupabaseClient
+
+    supabase = SupabaseClient()
+    await supabase.initialize()
+    companies = dataset.companies if dataset else []
+    counter = iter(range(jobs))
+
+    def sync():
+        n = next(counter)
+        company_id = companies[n % len(companies)] if companies else str(uuid.UUID(int=n))
+        ctx = {"supabase": supabase, "job_id": f"bench-sync-{n}"}
+        return sync_shopify_products_job(ctx, shop=f"bench-{n}.myshopify.com",
+                                         access_token="bench-token", company_id=company_id)
+
+    try:
+        result = await run_load("sync_shopify_products_job", sync, jobs, concurrency,
+                                ok=lambda r: r.get("status") == "success")
+    finally:
+        await supabase.close()
+    return [result]
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+# (method, path, query, JSON body) for one request
+Request = Tuple[str, str, Optional[Dict[str, str]], Optional[Dict[str, Any]]]
+
+
+def _company(rng: random.Random, data: Dataset) -> str:
+    return rng.choice(data.companies)
+
+
+ROUTES: Dict[str, Callable[[random.Random, Dataset], Request]] = {
+    "GET /health": lambda rng, data: ("GET", "/health", None, None),
+    "GET /dashboard/stats": lambda rng, data: ("GET", "/dashboard/stats", {"company_id": _company(rng, data)}, None),
+    "GET /partnerships": lambda rng, data: ("GET", "/partnerships", {"company_id": _company(rng, data)}, None),
+    "GET /products": lambda rng, data: ("GET", "/products", {"company_id": _company(rng, data)}, None),
+    "GET /products/{id}/creators": lambda rng, data: (
+        "GET", f"/products/{rng.choice(data.products[_company(rng, data)])}/creators", None, None),
+    "GET /reels/interactions": lambda rng, data: ("GET", "/reels/interactions", {"company_id": _company(rng, data)}, None),
+    "GET /notifications": lambda rng, data: ("GET", "/notifications", {"company_id": _company(rng, data)}, None),
+    "POST /search/text": lambda rng, data: (
+        "POST", "/search/text", None, {"query": f"{rng.choice(data.titles).split()[1].lower()} gear", "top_k": 10}),
+    "POST /reels/interactions": lambda rng, data: ("POST", "/reels/interactions", None, {
+        "company_id": _company(rng, data),
+        "video_id": rng.choice(data.video_ids),
+        "interaction_type": rng.choice(("dismissed", "partnered")),
+    }),
+}
+
+
+async def send(client, request: Request):
+    """Issue one ROUTES request through a BlackSheep TestClient"""
+    from blacksheep.contents import JSONContent
+
+    method, path, query, body = request
+    if method == "GET":
+        return await client.get(path, query=query)
+    return await client.post(path, query=query, content=JSONContent(body) if body is not None else None)
+
+
+async def bench_api(standins: StandIns, dataset: Dataset, requests: int = 200, concurrency: int = 16,
+                    routes: Optional[List[str]] = None, seed: int = 0) -> List[LoadResult]:
+    from blacksheep.testing import TestClient
+
+    import API
+
+    rng = random.Random(seed)
+    results = []
+    with patch.object(API, "EMBEDDED_WORKER", False):
+        await API.app.start()
+        try:
+            client = TestClient(API.app)
+            for name in routes or list(ROUTES):
+                build = ROUTES[name]
+                results.append(await run_load(
+                    name,
+                    lambda: send(client, build(rng, dataset)),
+                    requests,
+                    concurrency,
+                    ok=lambda response: response.status < 500,
+                ))
+        finally:
+            await API.app.stop()
+    return results
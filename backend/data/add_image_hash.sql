@@ -0,0 +1,9 @@
+-- Add image_hash column to company_products table
+-- Stores the perceptual hash (pHash, 16 hex chars) of the product image so
+-- re-syncs can reuse the existing embedding when the image URL is unchanged
+
+ALTER TABLE company_products
+ADD COLUMN IF NOT EXISTS image_hash TEXT;
+
+-- Add comment
+COMMENT ON COLUMN company_products.image_hash IS 'Perceptual hash of the product image used for its embedding';
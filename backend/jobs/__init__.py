@@ -23,7 +23,10 @@ Usage:
     )
 
 Worker:
-    Run the worker with: arq jobs.worker.WorkerSettings
+    Run one worker per priority lane:
+        arq jobs.worker.InteractiveWorkerSettings
+        arq jobs.worker.OutreachWorkerSettings
+        arq jobs.worker.WorkerSettings
 """
 
 from jobs.worker import enqueue_job
@@ -0,0 +1,71 @@
+"""
+Worker-scoped API clients.
+
+The worker opens its Supabase, HTTP, YouTube, Cohere and Pinecone clients
+once in startup and hands them to every job through ctx. Jobs no longer set
+up and tear down a connection per run. shutdown closes them.
+
+Jobs get their Supabase client with:
+
+    async with job_supabase(ctx) as supabase:
+        ...
+
+This falls back to a short-lived client when the job runs outside a worker,
+for example when a test calls the job function directly.
+"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+
+async def open_clients(ctx: Dict[str, Any]) -> None:
+    """Create the shared clients and store them on the worker ctx"""
+    from utils.supabase import SupabaseClient
+    from utils.images import get_http_client
+
+    supabase = SupabaseClient()
+    await supabase.initialize()
+    ctx["supabase"] = supabase
+    ctx["http"] = get_http_client()
+
+    try:
+        from utils.yt_search import get_youtube_client
+        ctx["youtube"] = get_youtube_client()
+    except Exception as e:
+        # Mock mode or no key: searches fail or mock on their own
+        print(f"⚠️  YouTube client unavailable: {e}")
+
+    try:
+        # Importing vectordb builds the Cohere and Pinecone clients
+        from utils import vectordb
+        ctx["cohere"] = vectordb.co
+        ctx["index"] = vectordb.index
+    except Exception as e:
+        print(f"⚠️  Vector store clients unavailable: {e}")
+
+
+async def close_clients(ctx: Dict[str, Any]) -> None:
+    """Close everything open_clients created"""
+    from utils.images import close_http_client
+
+    supabase = ctx.pop("supabase", None)
+    if supabase is not None:
+        await supabase.close()
+    ctx.pop("http", None)
+    await close_http_client()
+
+
+@asynccontextmanager
+async def job_supabase(ctx: Dict[str, Any]) -> AsyncIterator[Any]:
+    """The worker's Supabase client, or a temporary one outside a worker"""
+    if ctx.get("supabase") is not None:
+        yield ctx["supabase"]
+        return
+
+    from utils.supabase import SupabaseClient
+
+    supabase = SupabaseClient()
+    await supabase.initialize()
+    try:
+        yield supabase
+    finally:
+        await supabase.close()
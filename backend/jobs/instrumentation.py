@@ -0,0 +1,157 @@
+"""
+Job queue instrumentation.
+
+Two parts:
+
+- instrument(func) wraps every registered ARQ function. It records
+  runnable-to-start latency per queue, run time, the outcome
+  (success, failure, retry, deferred) and attempts beyond the first.
+  Each run is a "job.<name>" span, the parent of the external calls the
+  job makes. A traceparent kwarg (set by enqueue_job and the discovery
+  planner) joins the span to the enqueuing trace. External calls are
+  charged to the job's tenant: a tenant kwarg, else its company_id.
+- sample_queues(pool) reads each lane's queue zset and ARQ's
+  in-progress keys. It sets job_queue_depth{queue_name, status} for
+  pending, deferred and active jobs, plus the age of the oldest runnable
+  job. The API samples on every /metrics scrape, and workers sample every
+  QUEUE_SAMPLE_SECONDS.
+
+Queue depth and oldest-pending age are the signals to autoscale worker
+replicas on.
+"""
+import asyncio
+import os
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from arq import Retry
+from arq.constants import in_progress_key_prefix
+
+from utils.tracing import CONSUMER, start_span
+from utils.usage import tenant_scope
+from utils.metrics import (
+    job_processing_duration_seconds,
+    job_queue_depth,
+    job_queue_oldest_pending_seconds,
+    job_retries_total,
+    job_start_latency_seconds,
+    jobs_total,
+)
+
+QUEUE_SAMPLE_SECONDS = float(os.getenv("QUEUE_SAMPLE_SECONDS", "15"))
+
+# Runnable jobs checked against in-progress keys per sample
+SAMPLE_LIMIT = 1000
+
+
+def _outcome(result: Any) -> str:
+    if isinstance(result, dict) and result.get("status") == "deferred":
+        return "deferred"
+    return "success"
+
+
+def instrument(func: Callable) -> Callable:
+    """Wrap an ARQ job function with start latency, run time and outcome metrics"""
+    job_type = func.__name__
+
+    @wraps(func)
+    async def wrapper(ctx: Dict[str, Any], *args, traceparent: Optional[str] = None,
+                      tenant: Optional[str] = None, **kwargs):
+        redis = ctx.get("redis")
+        queue_name = getattr(redis, "default_queue_name", None) or "unknown"
+        # From when the job became runnable (the queue score, after any
+        # _defer_by), like job_wait_seconds: quota deferrals aren't backlog
+        score = ctx.get("score")
+        if score is not None:
+            latency = max(time.time() - score / 1000, 0.0)
+            job_start_latency_seconds.labels(queue_name=queue_name, job_type=job_type).observe(latency)
+        if ctx.get("job_try", 1) > 1:
+            job_retries_total.labels(job_type=job_type).inc()
+
+        start = time.perf_counter()
+        status = "failure"
+        attributes = {"job.id": ctx.get("job_id"), "job.try": ctx.get("job_try"), "queue.name": queue_name}
+        try:
+            with tenant_scope(tenant or kwargs.get("company_id")), \
+                    start_span(f"job.{job_type}", kind=CONSUMER, attributes=attributes,
+                               traceparent=traceparent) as span:
+                result = await func(ctx, *args, **kwargs)
+                status = _outcome(result)
+                span.set_attribute("job.outcome", status)
+            return result
+        except Retry:
+            status = "retry"
+            raise
+        finally:
+            job_processing_duration_seconds.labels(job_type=job_type).observe(time.perf_counter() - start)
+            jobs_total.labels(job_type=job_type, status=status).inc()
+
+    return wrapper
+
+
+async def sample_queue(pool, queue_name: str) -> Dict[str, float]:
+    """Pending / deferred / active counts and oldest-pending age for one queue"""
+    now_ms = int(time.time() * 1000)
+    async with pool.pipeline(transaction=False) as pipe:
+        pipe.zcount(queue_name, "-inf", now_ms)
+        pipe.zcount(queue_name, f"({now_ms}", "+inf")
+        # Only the oldest runnable jobs are checked for in-progress keys
+        pipe.zrangebyscore(queue_name, "-inf", now_ms, start=0, num=SAMPLE_LIMIT, withscores=True)
+        runnable_count, deferred, runnable = await pipe.execute()
+
+    # ARQ keeps running jobs in the queue zset; the in-progress key tells them apart
+    async with pool.pipeline(transaction=False) as pipe:
+        for job_id, _ in runnable:
+            job_id = job_id.decode() if isinstance(job_id, bytes) else job_id
+            pipe.exists(in_progress_key_prefix + job_id)
+        running = await pipe.execute() if runnable else []
+
+    waiting = [score for (_, score), active in zip(runnable, running) if not active]
+    active = len(runnable) - len(waiting)
+    return {
+        "pending": max(runnable_count - active, 0),
+        "active": active,
+        "deferred": deferred,
+        "oldest_pending_seconds": (now_ms - min(waiting)) / 1000 if waiting else 0.0,
+    }
+
+
+async def sample_queues(pool) -> Dict[str, Dict[str, float]]:
+    """Sample every lane's queue into the job_queue_* gauges"""
+    from jobs.worker import LANE_QUEUES
+
+    samples = {}
+    for queue_name in LANE_QUEUES.values():
+        try:
+            sample = await sample_queue(pool, queue_name)
+        except Exception as e:
+            print(f"Queue sample error for {queue_name}: {e}")
+            continue
+        for status in ("pending", "active", "deferred"):
+            job_queue_depth.labels(queue_name=queue_name, status=status).set(sample[status])
+        job_queue_oldest_pending_seconds.labels(queue_name=queue_name).set(sample["oldest_pending_seconds"])
+        samples[queue_name] = sample
+    return samples
+
+
+async def _sample_enqueue_pool(get_pool):
+    await sample_queues(await get_pool())
+
+
+async def update_queue_metrics():
+    """Refresh the queue gauges from the enqueue pool (call before exporting)"""
+    from jobs.worker import get_redis_pool
+
+    try:
+        # Don't let an unreachable queue stall the scrape
+        await asyncio.wait_for(_sample_enqueue_pool(get_redis_pool), timeout=2)
+    except Exception as e:
+        print(f"Error updating queue metrics: {e}")
+
+
+async def queue_sampler(pool, interval: float = QUEUE_SAMPLE_SECONDS):
+    """Background loop that keeps the queue gauges current in a worker"""
+    while True:
+        await sample_queues(pool)
+        await asyncio.sleep(interval)
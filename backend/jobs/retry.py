@@ -0,0 +1,132 @@
+"""
+Retry policy for ARQ jobs.
+
+Two kinds of failure get different treatment:
+
+- Rate limits (RateLimited): the job is re-enqueued on its own lane,
+  deferred until the limiter's next free slot plus jitter. This is not a
+  failure and doesn't use up one of the job's max_tries.
+- Real errors: retried with exponential backoff and jitter until max_tries,
+  then the original exception is raised so ARQ records the failure.
+
+Usage:
+    @with_retries
+    async def process_video_job(ctx, video_id, ...):
+        allowed, retry_after = await gemini_limiter.acquire()
+        if not allowed:
+            raise RateLimited("gemini", retry_after)
+"""
+import os
+import random
+from datetime import timedelta
+from functools import wraps
+from typing import Any, Callable, Dict
+
+from arq import Retry
+
+from utils.tracing import current_traceparent
+from utils.usage import current_tenant
+
+# Backoff for real errors: BASE * 2^(try-1), capped at MAX
+RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "900"))
+
+# How many times a job may be pushed back for quota before it counts as failing
+MAX_QUOTA_DEFERRALS = int(os.getenv("JOB_MAX_QUOTA_DEFERRALS", "20"))
+
+# Deferred jobs spread over an extra fraction of the wait so they don't all
+# hit the limiter again in the same instant
+QUOTA_JITTER_FRACTION = 0.25
+
+
+class RateLimited(Exception):
+    """Raised by a job when an external API limiter refuses the call"""
+
+    def __init__(self, service: str, retry_after: float):
+        super().__init__(f"{service} rate limit exceeded, retry in {retry_after:.1f}s")
+        self.service = service
+        self.retry_after = retry_after
+
+
+def quota_delay(retry_after: float) -> float:
+    """Seconds to defer a rate-limited job: the limiter's wait plus jitter"""
+    wait = max(retry_after, 1.0)
+    return wait + random.uniform(0, wait * QUOTA_JITTER_FRACTION + 1.0)
+
+
+def backoff_delay(job_try: int) -> float:
+    """Seconds before retrying a failed job ("full jitter" exponential backoff)"""
+    ceiling = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(job_try - 1, 0))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def _max_tries() -> int:
+    from jobs.worker import WorkerSettings
+    return WorkerSettings.max_tries
+
+
+async def _defer(ctx: Dict[str, Any], job_name: str, args: tuple, kwargs: Dict[str, Any],
+                 error: RateLimited, deferrals: int) -> Dict[str, Any]:
+    """Re-enqueue the job on the same lane after the limiter's wait"""
+    pool = ctx["redis"]
+    delay = quota_delay(error.retry_after)
+    # A running job's id is still taken, so each deferral gets its own
+    base_id = str(ctx.get("job_id", job_name)).split(":quota")[0]
+    # instrument() took these out of kwargs; carry them over like enqueue_job does
+    traceparent = current_traceparent()
+    if traceparent:
+        kwargs.setdefault("traceparent", traceparent)
+    if current_tenant() and "company_id" not in kwargs:
+        kwargs.setdefault("tenant", current_tenant())
+    job = await pool.enqueue_job(
+        job_name,
+        *args,
+        _job_id=f"{base_id}:quota{deferrals}",
+        _queue_name=pool.default_queue_name,
+        _defer_by=timedelta(seconds=delay),
+        quota_deferrals=deferrals,
+        **kwargs
+    )
+    print(f"[Job] {error}; {job_name} deferred {delay:.0f}s (deferral {deferrals})")
+    return {
+        "status": "deferred",
+        "reason": "rate_limited",
+        "service": error.service,
+        "retry_in": round(delay, 1),
+        "job_id": job.job_id if job else None,
+    }
+
+
+def with_retries(func: Callable) -> Callable:
+    """
+    Apply the quota-aware retry policy to an ARQ job function.
+
+    The wrapper accepts a `quota_deferrals` kwarg that it manages itself;
+    the job function never sees it.
+    """
+    @wraps(func)
+    async def wrapper(ctx: Dict[str, Any], *args, quota_deferrals: int = 0, **kwargs):
+        try:
+            return await func(ctx, *args, **kwargs)
+        except RateLimited as e:
+            if quota_deferrals >= MAX_QUOTA_DEFERRALS or "redis" not in ctx:
+                _retry_or_raise(ctx, func.__name__, e)
+            return await _defer(ctx, func.__name__, args, kwargs, e, quota_deferrals + 1)
+        except Retry:
+            raise
+        except Exception as e:
+            _retry_or_raise(ctx, func.__name__, e)
+
+    return wrapper
+
+
+def _retry_or_raise(ctx: Dict[str, Any], job_name: str, error: Exception):
+    """Raise Retry with backoff, or the error itself on the last try"""
+    # No job_try means the job was called directly, not by a worker
+    job_try = ctx.get("job_try")
+    if job_try is None or job_try >= _max_tries():
+        raise error
+
+    delay = backoff_delay(job_try)
+    print(f"[Job] {job_name} failed (try {job_try}): {error}; retrying in {delay:.0f}s")
+    raise Retry(defer=timedelta(seconds=delay)) from error
@@ -0,0 +1,206 @@
+"""
+Adaptive discovery scheduling.
+
+An ARQ cron job (schedule_discovery_job) runs every
+DISCOVERY_SCHEDULER_MINUTES on the bulk worker. It enqueues
+discover_creators_job for every connected shop whose next run is due.
+
+Each shop's interval adapts to two signals:
+
+- Catalog freshness: shops synced in the last DISCOVERY_FRESH_CATALOG_HOURS
+  run FRESH_CATALOG_FACTOR times as often, so new products find creators
+  quickly.
+- Yield: the share of videos in the last planning run that were new
+  (recorded by the planner). Shops that keep turning up new videos run
+  sooner. Shops whose searches only find videos already seen back off.
+
+Companies that have spent their daily YouTube budget (TENANT_DAILY_BUDGETS,
+see utils.usage) are skipped until the next UTC day.
+
+Next-run times and yields live in Redis, so every replica and restart sees
+the same schedule. ARQ cron already makes each tick run once across workers.
+
+Each tick also refreshes SCHEDULER_ALIVE_KEY. The standalone discovery loop
+(background_worker.py) idles while it is set, so the two never both run
+discovery and double the YouTube and Gemini spend.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from arq import cron
+
+from jobs.clients import job_supabase
+from utils.redis_client import redis_client
+from utils.tracing import current_traceparent
+from utils.usage import over_budget
+
+DISCOVERY_SCHEDULER_MINUTES = int(os.getenv("DISCOVERY_SCHEDULER_MINUTES", "5"))
+DISCOVERY_BASE_INTERVAL_MINUTES = float(os.getenv("DISCOVERY_BASE_INTERVAL_MINUTES", "360"))
+DISCOVERY_MIN_INTERVAL_MINUTES = float(os.getenv("DISCOVERY_MIN_INTERVAL_MINUTES", "30"))
+DISCOVERY_MAX_INTERVAL_MINUTES = float(os.getenv("DISCOVERY_MAX_INTERVAL_MINUTES", "1440"))
+DISCOVERY_FRESH_CATALOG_HOURS = float(os.getenv("DISCOVERY_FRESH_CATALOG_HOURS", "24"))
+FRESH_CATALOG_FACTOR = 0.25
+
+NEXT_RUN_KEY = "discovery:next_run"  # zset: schedule key -> next run (epoch s)
+YIELD_KEY = "discovery:yield"        # hash: schedule key -> new-video share of last run
+YIELD_FENCE_KEY = "discovery:yield:fence"  # hash: schedule key -> fencing token of that write
+SCHEDULER_ALIVE_KEY = "discovery:scheduler:alive"  # set each tick, expires after two missed ticks
+
+# Write a yield unless a planner with a newer fencing token already has.
+# KEYS: yields, fences  ARGV: field, share, fencing token
+FENCED_YIELD_SCRIPT = """
+local seen = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+if tonumber(ARGV[3]) < seen then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+
+def schedule_key(company_id: str, shop_domain: Optional[str]) -> str:
+    return f"{company_id}:{shop_domain or ''}"
+
+
+def discovery_interval(catalog_age_hours: Optional[float], new_video_share: Optional[float]) -> float:
+    """
+    Seconds until a shop's next discovery run.
+
+    Yield scales the base interval from 1.5x (nothing new) down to 0.5x
+    (everything new). A fresh catalog multiplies it by FRESH_CATALOG_FACTOR.
+    """
+    interval = DISCOVERY_BASE_INTERVAL_MINUTES
+    if new_video_share is not None:
+        interval *= 1.5 - min(max(new_video_share, 0.0), 1.0)
+    if catalog_age_hours is not None and catalog_age_hours < DISCOVERY_FRESH_CATALOG_HOURS:
+        interval *= FRESH_CATALOG_FACTOR
+    interval = min(max(interval, DISCOVERY_MIN_INTERVAL_MINUTES), DISCOVERY_MAX_INTERVAL_MINUTES)
+    return interval * 60
+
+
+def _age_hours(timestamp: Optional[str], now: float) -> Optional[float]:
+    if not timestamp:
+        return None
+    try:
+        synced = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if synced.tzinfo is None:
+        synced = synced.replace(tzinfo=timezone.utc)
+    return max(now - synced.timestamp(), 0.0) / 3600
+
+
+def _pairs(flat) -> Dict[str, float]:
+    """[k1, v1, k2, v2, ...] reply -> {k: float(v)}"""
+    flat = flat or []
+    return {flat[i]: float(flat[i + 1]) for i in range(0, len(flat) - 1, 2)}
+
+
+async def record_discovery_yield(company_id: str, shop_domain: Optional[str], videos: int, new_videos: int,
+                                 fencing_token: Optional[int] = None) -> bool:
+    """
+    Store the new-video share of a planning run for the scheduler.
+
+    With the planner lock's fencing_token, a stale planner (one whose lease
+    lapsed and was taken over) can't overwrite a newer run's yield.
+    Returns False if the write was rejected or failed.
+    """
+    if not redis_client.is_configured:
+        return False
+    field = schedule_key(company_id, shop_domain)
+    share = round(new_videos / videos if videos else 0.0, 3)
+    try:
+        if fencing_token is None:
+            await redis_client._execute("HSET", YIELD_KEY, field, share)
+            return True
+        written = await redis_client.eval(FENCED_YIELD_SCRIPT, [YIELD_KEY, YIELD_FENCE_KEY],
+                                          [field, share, fencing_token])
+        if written is not None and not int(written):
+            print(f"Discovery yield for {field} rejected: fencing token {fencing_token} is stale")
+        return bool(written and int(written))
+    except Exception as e:
+        print(f"Discovery yield record error: {e}")
+        return False
+
+
+async def scheduler_active() -> bool:
+    """True if the cron scheduler has ticked recently (see SCHEDULER_ALIVE_KEY)"""
+    if not redis_client.is_configured:
+        return False
+    try:
+        return bool(await redis_client.get(SCHEDULER_ALIVE_KEY))
+    except Exception as e:
+        print(f"Scheduler heartbeat check error: {e}")
+        return False
+
+
+async def schedule_discovery_job(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Cron tick: enqueue discovery for every shop that is due"""
+    from jobs.worker import queue_for
+
+    now = time.time()
+    if redis_client.is_configured:
+        await redis_client.set(SCHEDULER_ALIVE_KEY, str(int(now)), ex=max(DISCOVERY_SCHEDULER_MINUTES * 120, 120))
+    async with job_supabase(ctx) as supabase:
+        result = await supabase.client.table("shopify_oauth_tokens")\
+            .select("company_id, shop_domain, last_product_sync")\
+            .eq("products_synced", True)\
+            .execute()
+    shops = result.data or []
+
+    next_runs, yields = {}, {}
+    if redis_client.is_configured:
+        async with redis_client.pipeline() as pipe:
+            pipe.command("ZRANGE", NEXT_RUN_KEY, 0, -1, "WITHSCORES")
+            pipe.command("HGETALL", YIELD_KEY)
+        next_runs, yields = _pairs(pipe.results[0]), _pairs(pipe.results[1])
+
+    # Shops whose company spent today's YouTube budget wait for tomorrow
+    exhausted = await over_budget((shop["company_id"] for shop in shops), "youtube")
+
+    pool = ctx["redis"]
+    enqueued = 0
+    schedule = []
+    for shop in shops:
+        key = schedule_key(shop["company_id"], shop.get("shop_domain"))
+        if next_runs.get(key, 0) > now or shop["company_id"] in exhausted:
+            continue
+
+        interval = discovery_interval(_age_hours(shop.get("last_product_sync"), now), yields.get(key))
+        # One job per shop per interval window, even if ticks overlap
+        job = await pool.enqueue_job(
+            "discover_creators_job",
+            company_id=shop["company_id"],
+            shop_domain=shop.get("shop_domain"),
+            traceparent=current_traceparent(),
+            _job_id=f"discover:{key}:{int(now // interval)}",
+            _queue_name=queue_for("discover_creators_job"),
+        )
+        if job is not None:
+            enqueued += 1
+        schedule += [now + interval, key]
+
+    if schedule and redis_client.is_configured:
+        await redis_client._execute("ZADD", NEXT_RUN_KEY, *schedule)
+
+    print(f"[Scheduler] {len(shops)} shops, {enqueued} discovery jobs enqueued, "
+          f"{len(exhausted)} companies over budget")
+    return {"status": "scheduled", "shops": len(shops), "enqueued": enqueued, "over_budget": len(exhausted)}
+
+
+def discovery_cron_jobs():
+    """Cron entries for the bulk worker (empty when disabled)"""
+    if DISCOVERY_SCHEDULER_MINUTES <= 0:
+        return []
+    from jobs.instrumentation import instrument
+
+    return [
+        cron(
+            instrument(schedule_discovery_job),
+            minute=set(range(0, 60, DISCOVERY_SCHEDULER_MINUTES)),
+            run_at_startup=True,
+        )
+    ]
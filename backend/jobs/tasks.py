@@ -4,28 +4,97 @@ Background job tasks using ARQ.
 All long-running operations moved from asyncio.create_task() to persistent jobs.
 Jobs survive server restarts and include automatic retries with exponential backoff.
 """
+import hashlib
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 from dotenv import load_dotenv
 
+from jobs.clients import job_supabase
+from jobs.retry import RateLimited, with_retries
+from utils.tracing import current_traceparent
+
 load_dotenv()
 
 
 # ============================================================================
-# CREATOR DISCOVERY JOB
+# CREATOR DISCOVERY JOB (PLANNER)
 # ============================================================================
 
+# YouTube Data API cost of one search.list call, in quota units
+YOUTUBE_SEARCH_COST = 100
+
+
+def group_videos(search_results: List[Tuple[dict, str, List[dict]]]) -> Dict[str, dict]:
+    """
+    Merge search results into one work item per video.
+
+    Args:
+        search_results: (product, keyword, videos) for each search made
+
+    Returns:
+        video_id -> {"video", "product_ids" (sorted), "source_keywords"
+        (product_id -> first keyword that found the video for it)}
+    """
+    grouped: Dict[str, dict] = {}
+    for product, keyword, videos in search_results:
+        for video in videos:
+            item = grouped.setdefault(video["id"], {"video": video, "source_keywords": {}})
+            item["source_keywords"].setdefault(str(product["id"]), keyword)
+
+    for item in grouped.values():
+        item["product_ids"] = sorted(item["source_keywords"])
+    return grouped
+
+
+def video_job_id(video_id: str, product_ids: List[str]) -> str:
+    """
+    Deterministic ARQ job id for one (video, product set).
+
+    ARQ refuses to enqueue a job id that is queued, running, or still has a
+    stored result, so re-planning the same work within keep_result is a no-op.
+    """
+    digest = hashlib.sha1(",".join(sorted(product_ids)).encode()).hexdigest()[:16]
+    return f"process_video:{video_id}:{digest}"
+
+
+async def _count_new_videos(supabase, video_ids: List[str]) -> int:
+    """How many of these videos have never been analyzed"""
+    if not video_ids:
+        return 0
+    try:
+        known = await supabase.client.table("creator_videos")\
+            .select("video_id")\
+            .in_("video_id", video_ids)\
+            .execute()
+        return len(video_ids) - len(known.data or [])
+    except Exception as e:
+        print(f"[Job] Could not count new videos: {e}")
+        return len(video_ids)
+
+
+async def _job_pool(ctx: Dict[str, Any]):
+    """The worker's own ARQ connection, or the shared enqueue pool outside a worker"""
+    if ctx.get("redis") is not None:
+        return ctx["redis"]
+    from jobs.worker import get_redis_pool
+    return await get_redis_pool()
+
+
+@with_retries
 async def discover_creators_job(
     ctx: Dict[str, Any],
     company_id: str,
     shop_domain: str = None
 ) -> Dict[str, Any]:
     """
-    Background job for creator discovery.
+    Plan creator discovery for a company and fan it out.
 
-    Replaces the fire-and-forget asyncio.create_task() pattern.
-    Uses distributed locking to prevent duplicate processing.
+    Runs the YouTube searches for the company's products, groups the videos
+    found, and enqueues one process_video_job per unique (video, product set).
+    Analysis then spreads across max_jobs and worker replicas, retries are
+    scoped to a single video, and no single job has to fit the whole cycle
+    into job_timeout.
 
     Args:
         ctx: ARQ context (includes Redis connection)
@@ -33,43 +102,126 @@ async def discover_creators_job(
         shop_domain: Optional shop domain to filter products
 
     Returns:
-        Job result with status and metadata
+        Job result with status and planning counts
     """
-    from utils.supabase import SupabaseClient
-    from utils.redis_client import DistributedLock
+    from utils.redis_client import DistributedLock, youtube_limiter
+    from jobs.worker import queue_for
+    from jobs.scheduler import record_discovery_yield
+    from utils.usage import within_budget
 
-    print(f"[Job] Starting creator discovery for company: {company_id}")
+    print(f"[Job] Planning creator discovery for company: {company_id}")
 
-    # Use distributed lock to prevent duplicate processing
-    async with DistributedLock(f"discovery:{company_id}", timeout_seconds=3600) as acquired:
+    # Only one planner per company at a time. Searching can take a while, so
+    # hold a short lease and keep renewing it.
+    lock = DistributedLock(f"discovery:{company_id}", timeout_seconds=300, auto_renew=True)
+    async with lock as acquired:
         if not acquired:
             print(f"[Job] Discovery already running for {company_id}")
             return {"status": "skipped", "reason": "already_running"}
 
-        supabase = SupabaseClient()
-        await supabase.initialize()
-
-        try:
-            # Import the actual discovery function
-            from background_worker import trigger_immediate_discovery
-            await trigger_immediate_discovery(company_id, shop_domain)
-
-            return {
-                "status": "success",
-                "company_id": company_id,
-                "shop_domain": shop_domain
-            }
-        except Exception as e:
-            print(f"[Job] Discovery failed: {e}")
-            raise  # ARQ will retry based on retry config
-        finally:
-            await supabase.close()
+        # background_worker loads the embedding clients on import
+        from utils.yt_search import fetch_top_shorts
+        from background_worker import PRODUCTS_PER_CYCLE, VIDEOS_PER_KEYWORD, build_search_queue
+
+        async with job_supabase(ctx) as supabase:
+            try:
+                query = supabase.client.table("company_products")\
+                    .select("id, title, description, shop_domain, search_keywords")\
+                    .eq("company_id", company_id)
+                if shop_domain:
+                    query = query.eq("shop_domain", shop_domain)
+                products_result = await query.execute()
+                products = (products_result.data or [])[:PRODUCTS_PER_CYCLE]
+
+                search_results = []
+                quota_exhausted = False
+                for search in build_search_queue(products):
+                    # Lease lapsed: another planner may own this company now
+                    if lock.lost:
+                        break
+                    if not await within_budget(company_id, "youtube", YOUTUBE_SEARCH_COST):
+                        print(f"[Job] {company_id} is out of today's YouTube budget, planning with the searches made so far")
+                        quota_exhausted = True
+                        break
+                    allowed, _ = await youtube_limiter.acquire(cost=YOUTUBE_SEARCH_COST)
+                    if not allowed:
+                        print("[Job] YouTube quota exhausted, planning with the searches made so far")
+                        quota_exhausted = True
+                        break
+                    try:
+                        videos = await fetch_top_shorts(
+                            keyword=search["keyword"],
+                            max_results=VIDEOS_PER_KEYWORD,
+                            youtube=ctx.get("youtube")
+                        )
+                    except Exception as search_error:
+                        print(f"[Job] Search failed for '{search['keyword']}': {search_error}")
+                        continue
+                    search_results.append((search["product"], search["keyword"], videos or []))
+
+                pool = await _job_pool(ctx)
+                enqueued = 0
+                grouped = group_videos(search_results)
+                for video_id, item in grouped.items():
+                    if lock.lost:
+                        break
+                    job = await pool.enqueue_job(
+                        "process_video_job",
+                        video_id=video_id,
+                        video_data=item["video"],
+                        product_ids=item["product_ids"],
+                        source_keywords=item["source_keywords"],
+                        traceparent=current_traceparent(),
+                        tenant=company_id,
+                        _job_id=video_job_id(video_id, item["product_ids"]),
+                        _queue_name=queue_for("process_video_job"),
+                    )
+                    # None means the same (video, product set) is already queued or done
+                    if job is not None:
+                        enqueued += 1
+
+                if lock.lost:
+                    print(f"[Job] Lost the discovery lock for {company_id} after {enqueued} video jobs, stopping")
+                    return {
+                        "status": "aborted",
+                        "reason": "lock_lost",
+                        "company_id": company_id,
+                        "searches": len(search_results),
+                        "enqueued": enqueued,
+                        "fencing_token": lock.fencing_token,
+                    }
+
+                # Share of never-seen videos drives the adaptive schedule
+                new_videos = await _count_new_videos(supabase, list(grouped))
+                await record_discovery_yield(company_id, shop_domain, len(grouped), new_videos,
+                                            fencing_token=lock.fencing_token)
+
+                print(
+                    f"[Job] Planned {len(search_results)} searches, {len(grouped)} videos "
+                    f"({new_videos} new), {enqueued} new video jobs for {company_id}"
+                )
+                return {
+                    "status": "planned",
+                    "company_id": company_id,
+                    "shop_domain": shop_domain,
+                    "searches": len(search_results),
+                    "videos": len(grouped),
+                    "enqueued": enqueued,
+                    "duplicates": len(grouped) - enqueued,
+                    "new_videos": new_videos,
+                    "quota_exhausted": quota_exhausted,
+                    "fencing_token": lock.fencing_token
+                }
+            except Exception as e:
+                print(f"[Job] Discovery planning failed: {e}")
+                raise  # Retried with backoff (see jobs.retry)
 
 
 # ============================================================================
 # EMAIL SENDING JOB
 # ============================================================================
 
+@with_retries
 async def send_email_job(
     ctx: Dict[str, Any],
     to_email: str,
@@ -97,7 +249,7 @@ async def send_email_job(
     Returns:
         Job result with status and delivery info
     """
-    from utils.supabase import SupabaseClient
+    from utils.cache import invalidate_company
 
     print(f"[Job] Sending email to {to_email} for partnership {partnership_id}")
 
@@ -121,26 +273,24 @@ async def send_email_job(
         raise Exception(f"Email failed: {message}")
 
     # Update partnership record
-    supabase = SupabaseClient()
-    await supabase.initialize()
-
-    try:
-        await supabase.client.table("partnerships").update({
+    async with job_supabase(ctx) as supabase:
+        result = await supabase.client.table("partnerships").update({
             "email_sent": True,
             "last_contact_date": "now()",
             "status": "contacted",
             "contacted_at": "now()"
         }).eq("id", partnership_id).execute()
+        if result.data:
+            await invalidate_company(result.data[0].get("company_id"), "partnerships")
 
         return {"status": "sent", "to": to_email, "partnership_id": partnership_id}
-    finally:
-        await supabase.close()
 
 
 # ============================================================================
 # EMBEDDING GENERATION JOB
 # ============================================================================
 
+@with_retries
 async def generate_embeddings_job(
     ctx: Dict[str, Any],
     video_id: str,
@@ -167,10 +317,10 @@ async def generate_embeddings_job(
 
     print(f"[Job] Generating embedding for video: {video_id}")
 
-    # Check rate limit
-    if not await cohere_limiter.is_allowed():
-        print(f"[Job] Cohere rate limit exceeded, will retry")
-        raise Exception("Cohere rate limit exceeded, will retry")
+    # Over quota: defer to the limiter's next slot instead of failing
+    allowed, retry_after = await cohere_limiter.acquire()
+    if not allowed:
+        raise RateLimited("cohere", retry_after)
 
     async with DistributedLock(f"embedding:{video_id}") as acquired:
         if not acquired:
@@ -200,6 +350,7 @@ async def generate_embeddings_job(
 # SHOPIFY SYNC JOB
 # ============================================================================
 
+@with_retries
 async def sync_shopify_products_job(
     ctx: Dict[str, Any],
     shop: str,
@@ -221,136 +372,151 @@ async def sync_shopify_products_job(
     Returns:
         Job result with sync status and product count
     """
-    from utils.supabase import SupabaseClient
     from utils.shopify import get_products
-    from utils.vectordb import embed_products, upsert_embeddings
+    from utils.vectordb import embed_products, image_hashes_by_id, upsert_embeddings
     from utils.redis_client import DistributedLock
+    from utils.cache import invalidate_company
 
     print(f"[Job] Syncing products for shop: {shop}")
 
-    async with DistributedLock(f"shopify_sync:{shop}", timeout_seconds=1800) as acquired:
+    async with DistributedLock(f"shopify_sync:{shop}", timeout_seconds=300, auto_renew=True) as acquired:
         if not acquired:
             return {"status": "skipped", "reason": "sync_already_running"}
 
-        supabase = SupabaseClient()
-        await supabase.initialize()
-
-        try:
-            # Fetch products from Shopify
-            products = get_products(shop, access_token=access_token)
-            print(f"[Job] Found {len(products)} products in shop")
-
-            if not products:
-                return {"status": "success", "count": 0}
-
-            # Create embeddings
-            product_embeddings = embed_products(products)
-            upsert_embeddings(product_embeddings)
-            print(f"[Job] Stored {len(product_embeddings)} embeddings in Pinecone")
-
-            # Store in Supabase
-            for i, product in enumerate(products):
-                await supabase.client.table("company_products").upsert({
-                    "company_id": company_id,
-                    "shop_domain": shop,
-                    "title": product["name"],
-                    "description": product.get("body_html", ""),
-                    "image": product.get("image", ""),
-                    "price": product.get("price", 0),
-                    "pinecone_id": str(i),
-                    "synced_at": "now()"
-                }, on_conflict="company_id,shop_domain,title").execute()
-
-            # Update sync status
-            await supabase.client.table("shopify_oauth_tokens").update({
-                "products_synced": True,
-                "last_product_sync": "now()",
-                "product_count": len(products)
-            }).eq("company_id", company_id).eq("shop_domain", shop).execute()
-
-            print(f"[Job] Product sync complete for {shop}")
-
-            return {"status": "success", "count": len(products), "shop": shop}
-
-        except Exception as e:
-            print(f"[Job] Product sync failed: {e}")
-            raise
-        finally:
-            await supabase.close()
+        async with job_supabase(ctx) as supabase:
+            try:
+                # Fetch products from Shopify
+                products = get_products(shop, access_token=access_token)
+                print(f"[Job] Found {len(products)} products in shop")
+
+                if not products:
+                    return {"status": "success", "count": 0}
+
+                # Create embeddings (unchanged images reuse their stored vectors)
+                known_images = await supabase.get_known_product_images(company_id, shop)
+                product_embeddings = await embed_products(products, known_images=known_images)
+                upsert_embeddings(product_embeddings)
+                image_hashes = image_hashes_by_id(product_embeddings)
+                print(f"[Job] Stored {len(product_embeddings)} embeddings in Pinecone")
+
+                # Store in Supabase
+                for i, product in enumerate(products):
+                    await supabase.client.table("company_products").upsert({
+                        "company_id": company_id,
+                        "shop_domain": shop,
+                        "title": product["name"],
+                        "description": product.get("body_html", ""),
+                        "image": product.get("image", ""),
+                        "price": product.get("price", 0),
+                        "pinecone_id": str(i),
+                        "image_hash": image_hashes.get(str(i)),
+                        "synced_at": "now()"
+                    }, on_conflict="company_id,shop_domain,title").execute()
+
+                # Update sync status
+                await supabase.client.table("shopify_oauth_tokens").update({
+                    "products_synced": True,
+                    "last_product_sync": "now()",
+                    "product_count": len(products)
+                }).eq("company_id", company_id).eq("shop_domain", shop).execute()
+                await invalidate_company(company_id, "products", "shopify")
+
+                print(f"[Job] Product sync complete for {shop}")
+
+                return {"status": "success", "count": len(products), "shop": shop}
+
+            except Exception as e:
+                print(f"[Job] Product sync failed: {e}")
+                raise
 
 
 # ============================================================================
 # VIDEO PROCESSING JOB
 # ============================================================================
 
+@with_retries
 async def process_video_job(
     ctx: Dict[str, Any],
     video_id: str,
     video_data: dict,
-    product_id: str,
-    source_keyword: str
+    product_ids: List[str] = None,
+    source_keywords: Dict[str, str] = None,
+    product_id: str = None,
+    source_keyword: str = ""
 ) -> Dict[str, Any]:
     """
     Background job for processing a single creator video.
 
-    Includes Gemini analysis, embedding, and database storage.
-    Uses rate limiting for external API calls.
+    Analyzes the video once (Gemini), embeds and stores it, then links it
+    to every product in the set. Enqueued by discover_creators_job.
 
     Args:
         ctx: ARQ context
         video_id: YouTube video ID
         video_data: Video metadata dict
-        product_id: Product ID to link
-        source_keyword: Search keyword that found this video
+        product_ids: Products whose searches found this video
+        source_keywords: product_id -> search keyword that found the video
+        product_id: Single product to link (older single-product jobs)
+        source_keyword: Keyword for product_id
 
     Returns:
         Job result with processing status
     """
-    from utils.supabase import SupabaseClient
     from utils.redis_client import DistributedLock, gemini_limiter
 
-    print(f"[Job] Processing video: {video_id}")
+    product_ids = list(product_ids or ([product_id] if product_id else []))
+    source_keywords = source_keywords or {}
+    print(f"[Job] Processing video: {video_id} for {len(product_ids)} products")
 
     async with DistributedLock(f"video:{video_id}") as acquired:
         if not acquired:
             return {"status": "skipped", "reason": "already_processing"}
 
-        # Check Gemini rate limit
-        if not await gemini_limiter.is_allowed():
-            print(f"[Job] Gemini rate limit exceeded, will retry")
-            raise Exception("Gemini rate limit exceeded, will retry")
-
-        supabase = SupabaseClient()
-        await supabase.initialize()
-
-        try:
-            # Get product data
-            product_result = await supabase.client.table("company_products")\
-                .select("id, title, description")\
-                .eq("id", product_id)\
-                .single()\
+        async with job_supabase(ctx) as supabase:
+            # Indexed videos reuse their stored analysis; only new ones call Gemini
+            existing = await supabase.client.table("creator_videos")\
+                .select("video_id")\
+                .eq("video_id", video_id)\
                 .execute()
 
-            if not product_result.data:
-                return {"status": "failed", "reason": "product_not_found"}
-
-            product = product_result.data
-
-            # Import and call the video processor
-            from background_worker import process_creator_video
-            await process_creator_video(
-                video=video_data,
-                product=product,
-                source_keyword=source_keyword,
-                supabase=supabase
-            )
-
-            return {"status": "success", "video_id": video_id}
-        except Exception as e:
-            print(f"[Job] Video processing failed: {e}")
-            raise
-        finally:
-            await supabase.close()
+            if not existing.data:
+                # Over quota: defer to the limiter's next slot instead of failing
+                allowed, retry_after = await gemini_limiter.acquire()
+                if not allowed:
+                    raise RateLimited("gemini", retry_after)
+
+            try:
+                # Get product data
+                product_result = await supabase.client.table("company_products")\
+                    .select("id, title, description")\
+                    .in_("id", product_ids)\
+                    .execute()
+
+                if not product_result.data:
+                    return {"status": "failed", "reason": "product_not_found"}
+
+                # One Gemini call per job: every product is matched against
+                # the same analysis, whether or not it was relevant to the first
+                from background_worker import analyze_video, process_creator_video
+                analysis = None
+                if not existing.data:
+                    analysis = await analyze_video(video_data)
+                    if analysis is None:
+                        return {"status": "failed", "reason": "analysis_failed", "video_id": video_id}
+
+                for product in product_result.data:
+                    await process_creator_video(
+                        video=video_data,
+                        product=product,
+                        source_keyword=source_keywords.get(str(product["id"]), source_keyword),
+                        supabase=supabase,
+                        analysis=analysis
+                    )
+
+                return {"status": "success", "video_id": video_id, "products": len(product_result.data)}
+            except Exception as e:
+                print(f"[Job] Video processing failed: {e}")
+                raise
 
 
 # ============================================================================
@@ -380,3 +546,29 @@ async def trigger_discovery_with_queue_job(
         await trigger_immediate_discovery(company_id, shop_domain)
 
         return {"status": "triggered", "company_id": company_id}
+
+
+# ============================================================================
+# DIAGNOSTICS
+# ============================================================================
+
+async def profile_job(
+    ctx: Dict[str, Any],
+    mode: str = "cpu",
+    seconds: float = 10,
+    fmt: str = "collapsed",
+    limit: int = 30
+) -> Dict[str, Any]:
+    """
+    Profile the worker process that picks this job up (see utils.profiler).
+
+    Enqueued onto a lane by /debug/profile?target=worker; the result comes
+    back as the job result. Sampling sees every job running in the worker
+    at the same time.
+    """
+    from utils.profiler import run_profile
+
+    result = await run_profile(mode, seconds, fmt=fmt, limit=limit)
+    if result is None:
+        return {"status": "busy"}
+    return {"status": "ok", "lane": ctx.get("lane"), **result}
@@ -8,7 +8,9 @@ load_dotenv()
 
 from utils.supabase import SupabaseClient
 
-from utils.vectordb import query_text
+from utils.vectordb import hybrid_query
+from utils.video import generate_content
+from utils.tracing import external_call
 import os
 
 client = genai.Client(api_key=os.getenv("GEMINI_KEY"))
@@ -23,7 +25,9 @@ def create_product_grid(image_urls: list[str]) -> list[Image.Image]:
     images = []
     for url in image_urls:
         try:
-            response = requests.get(url)
+            with external_call("shopify", "cdn.image") as span:
+                response = requests.get(url)
+                span.set_attribute("payload.response_bytes", len(response.content))
             image_data = BytesIO(response.content)
             img = Image.open(image_data)
             # Convert to RGB if necessary
@@ -67,7 +71,8 @@ def gen_showcase_image(prompt, ref_images: list[str]) -> BytesIO | None: # list
         print("Failed to create composite images")
         return None
 
-    response = client.models.generate_content(
+    response = generate_content(
+        client,
         model="gemini-2.5-flash-image-preview",
         contents=[prompt, *composite_images] 
     )
@@ -84,16 +89,22 @@ def gen_showcase_image_from_products(prompt, products: list[dict]) -> BytesIO |
     # No limit needed since we're creating a composite image
     return gen_showcase_image(prompt, image_urls)
 
-def choose_best_products(query: str, threshold: float = 0.3, top_k=10): 
-    res = query_text(query, top_k)
-    # Check if top scoring result is below threshold
-    if not res.matches or res.matches[0].score < threshold:
-        print(f"Top scoring result ({res.matches[0].score if res.matches else 'N/A'}) is below {threshold} threshold")
+def choose_best_products(query: str, threshold: float = 0.3, top_k=10, lexical_floor: float = 1.0): 
+    res = hybrid_query(query, top_k=top_k)
+    # Fused scores aren't cosine similarities, so the threshold applies to the best vector score.
+    # Products only BM25 found have no vector score; they must contain lexical_floor of the query's terms
+    matches = [
+        m for m in res.matches
+        if m.vector_score is not None or (m.lexical_coverage or 0.0) >= lexical_floor
+    ]
+    best_vector_score = max((m.vector_score for m in matches if m.vector_score is not None), default=None)
+    if not matches or (best_vector_score is not None and best_vector_score < threshold):
+        print(f"Top scoring result ({best_vector_score if matches else 'N/A'}) is below {threshold} threshold")
         return None
     
-    # Extract product metadata from vector search results
+    # Extract product metadata from search results
     candidate_products = []
-    for match in res.matches:
+    for match in matches:
         candidate_products.append({
             "title": match.metadata.get("title", ""),
             "vendor": match.metadata.get("vendor", ""),
@@ -125,7 +136,8 @@ def choose_best_products(query: str, threshold: float = 0.3, top_k=10):
     Ans; 1, 3, 5
     """
     
-    genai_response = client.models.generate_content(
+    genai_response = generate_content(
+        client,
         model="gemini-2.0-flash",
         contents=[prompt]
     )
@@ -174,7 +186,8 @@ async def create_showcase(query: str, supabase_client: SupabaseClient):
     Example: "Ultimate Tech Workspace Bundle;;; A complete collection of premium devices and accessories designed to elevate your productivity and workspace aesthetics."
     """
     
-    title_response = client.models.generate_content(
+    title_response = generate_content(
+        client,
         model="gemini-2.0-flash",
         contents=[combined_title_prompt]
     )
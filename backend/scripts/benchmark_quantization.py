@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Recall vs memory benchmark for QuantizedVectorStore.
+
+Builds clustered synthetic unit vectors (roughly how product and creator
+embeddings group by niche), answers every query exactly with float32, then
+reports recall@k, resident bytes per vector and query latency for each
+storage mode. The first row is the Python list-of-floats layout used by
+EmbeddingItem today.
+
+Usage:
+    python scripts/benchmark_quantization.py --vectors 100000 --queries 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.quantized import QuantizedVectorStore
+
+parser = argparse.ArgumentParser(description="Benchmark quantized vector storage")
+parser.add_argument("--vectors", type=int, default=50000, help="Number of stored vectors")
+parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+parser.add_argument("--dim", type=int, default=1024, help="Vector dimension")
+parser.add_argument("--clusters", type=int, default=200, help="Number of synthetic clusters")
+parser.add_argument("--top-k", type=int, default=10, help="k for recall@k")
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+rng = np.random.default_rng(args.seed)
+
+
+def unit(matrix):
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+centers = unit(rng.standard_normal((args.clusters, args.dim)).astype(np.float32))
+assignment = rng.integers(0, args.clusters, args.vectors)
+vectors = unit(centers[assignment] + 0.6 * unit(rng.standard_normal((args.vectors, args.dim)).astype(np.float32)))
+query_assignment = rng.integers(0, args.clusters, args.queries)
+queries = unit(centers[query_assignment] + 0.6 * unit(rng.standard_normal((args.queries, args.dim)).astype(np.float32)))
+ids = [str(i) for i in range(args.vectors)]
+
+truth = [set(np.argsort(-(vectors @ q))[:args.top_k].astype(str)) for q in queries]
+
+# A list of boxed floats: 8-byte pointer + 24-byte float object per value
+list_bytes = sys.getsizeof([0.0] * args.dim) + args.dim * sys.getsizeof(0.0)
+
+configs = [
+    ("float32", {"quantization": "float32"}, {}),
+    ("int8", {"quantization": "int8"}, {"rescore": False}),
+    ("int8 + rescore x4", {"quantization": "int8", "keep_float": True}, {"rescore_factor": 4}),
+    ("binary", {"quantization": "binary"}, {"rescore": False}),
+    ("binary + rescore x4", {"quantization": "binary", "keep_float": True}, {"rescore_factor": 4}),
+    ("binary + rescore x10", {"quantization": "binary", "keep_float": True}, {"rescore_factor": 10}),
+    ("binary + mmap rescore x10", {"quantization": "binary", "mmap": True}, {"rescore_factor": 10}),
+]
+
+print(f"📊 {args.vectors} vectors × {args.dim} dims, {args.queries} queries, recall@{args.top_k}\n")
+print(f"{'mode':<28}{'recall':>8}{'resident B/vec':>16}{'on-disk B/vec':>15}{'ms/query':>10}")
+print(f"{'python list (EmbeddingItem)':<28}{1.0:>8.3f}{list_bytes:>16}{0:>15}{'-':>10}")
+
+with tempfile.TemporaryDirectory() as tmp:
+    for name, options, search_options in configs:
+        options = dict(options)
+        if options.pop("mmap", False):
+            options["rescore_path"] = os.path.join(tmp, f"{name.replace(' ', '_')}.f32")
+        store = QuantizedVectorStore(dim=args.dim, initial_capacity=args.vectors, **options)
+        store.add(ids, vectors)
+
+        hits = 0
+        start = time.perf_counter()
+        for query, expected in zip(queries, truth):
+            results = store.search(query, top_k=args.top_k, **search_options)
+            hits += len(expected & {vector_id for vector_id, _ in results})
+        elapsed_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        memory = store.memory_bytes()
+        recall = hits / (args.queries * args.top_k)
+        print(
+            f"{name:<28}{recall:>8.3f}"
+            f"{memory['resident'] // args.vectors:>16}"
+            f"{memory['float_on_disk'] // args.vectors:>15}"
+            f"{elapsed_ms:>10.2f}"
+        )
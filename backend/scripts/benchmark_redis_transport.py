@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Per-operation latency of the Redis transports.
+
+Runs the same command mix through RedisClient over the native protocol
+(redis-py pool) and over the Upstash REST API, and prints p50/p95/p99
+latency and throughput per operation. Against a local Redis, the REST side
+needs an Upstash-compatible HTTP proxy in front of it, e.g.:
+
+    docker run -d -p 6379:6379 redis:7
+    docker run -d -p 8079:80 -e SRH_MODE=env -e SRH_TOKEN=local \\
+        -e SRH_CONNECTION_STRING=redis://host.docker.internal:6379 \\
+        hiett/serverless-redis-http:latest
+
+Usage:
+    python scripts/benchmark_redis_transport.py \\
+        --redis-url redis://localhost:6379 \\
+        --rest-url http://localhost:8079 --rest-token local \\
+        --ops 2000 --concurrency 1
+
+Leave out --rest-url to measure the native transport alone.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.redis_client import GCRA_SCRIPT, NativeTransport, RedisClient, RestTransport
+
+KEY_PREFIX = "bench:transport"
+
+
+def _operations(client: RedisClient):
+    """(name, coroutine factory) for each measured operation"""
+    value = "x" * 256
+    limiter_keys = [f"{KEY_PREFIX}:gcra:tat"]
+
+    async def pipeline():
+        async with client.pipeline() as pipe:
+            pipe.get(f"{KEY_PREFIX}:get").ttl(f"{KEY_PREFIX}:get").incrby(f"{KEY_PREFIX}:incr", 1)
+
+    return [
+        ("GET", lambda: client.get(f"{KEY_PREFIX}:get")),
+        ("SET EX", lambda: client.set(f"{KEY_PREFIX}:set", value, ex=60)),
+        ("INCRBY", lambda: client.incrby(f"{KEY_PREFIX}:incr", 1)),
+        ("pipeline x3", pipeline),
+        ("EVALSHA gcra", lambda: client.eval(GCRA_SCRIPT, limiter_keys, [1_000_000, 60_000, 1])),
+    ]
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _measure(factory, ops: int, concurrency: int):
+    """Run `ops` calls with `concurrency` in flight; returns (latencies_s, wall_s)"""
+    latencies = []
+    remaining = ops
+
+    async def runner():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await factory()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(runner() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def benchmark(name: str, client: RedisClient, ops: int, concurrency: int, warmup: int):
+    await client.set(f"{KEY_PREFIX}:get", "x" * 256, ex=600)
+    rows = []
+    for op_name, factory in _operations(client):
+        for _ in range(warmup):
+            await factory()
+        latencies, wall = await _measure(factory, ops, concurrency)
+        rows.append((
+            name,
+            op_name,
+            _percentile(latencies, 0.50) * 1e6,
+            _percentile(latencies, 0.95) * 1e6,
+            _percentile(latencies, 0.99) * 1e6,
+            len(latencies) / wall,
+        ))
+    await client.close()
+    return rows
+
+
+async def main(args):
+    clients = [("native", RedisClient(NativeTransport(url=args.redis_url)))]
+    if args.rest_url:
+        clients.append(("rest", RedisClient(RestTransport(url=args.rest_url, token=args.rest_token))))
+
+    print(f"📊 {args.ops} ops per operation, concurrency {args.concurrency}\n")
+    print(f"{'transport':<11}{'operation':<15}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}{'ops/s':>10}")
+    for name, client in clients:
+        if not (await client._execute_with_error("PING"))[0]:
+            print(f"{name:<11}unreachable, skipped")
+            continue
+        for row in await benchmark(name, client, args.ops, args.concurrency, args.warmup):
+            print(f"{row[0]:<11}{row[1]:<15}{row[2]:>10.0f}{row[3]:>10.0f}{row[4]:>10.0f}{row[5]:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Redis transports")
+    parser.add_argument("--redis-url", default="redis://localhost:6379", help="Native Redis URL")
+    parser.add_argument("--rest-url", default=None, help="Upstash-compatible REST URL")
+    parser.add_argument("--rest-token", default="local", help="REST bearer token")
+    parser.add_argument("--ops", type=int, default=2000, help="Measured calls per operation")
+    parser.add_argument("--concurrency", type=int, default=1, help="Calls in flight at once")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured calls per operation")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Export the Pinecone product catalog to a JSONL file.
+
+Walks the index with cursor-based id listing, so the cost is one list call
+plus one fetch call per page. Each line holds one product (id, metadata and,
+with --values, the embedding) and can be fed back into upsert_embeddings()
+for a re-index.
+
+Usage:
+    python scripts/export_catalog.py catalog.jsonl --values
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import json
+
+from utils.vectordb import iter_catalog
+
+parser = argparse.ArgumentParser(description="Export the product catalog to JSONL")
+parser.add_argument("output", help="Path of the JSONL file to write")
+parser.add_argument("--values", action="store_true", help="Include embedding values")
+parser.add_argument("--videos", action="store_true", help="Include creator video vectors")
+parser.add_argument("--prefix", default=None, help="Only export ids with this prefix")
+args = parser.parse_args()
+
+count = 0
+with open(args.output, "w") as f:
+    for item in iter_catalog(
+        prefix=args.prefix,
+        include_values=args.values,
+        include_videos=args.videos,
+    ):
+        f.write(json.dumps(item) + "\n")
+        count += 1
+        if count % 1000 == 0:
+            print(f"   ...exported {count} vectors")
+
+print(f"✅ Exported {count} vectors to {args.output}")
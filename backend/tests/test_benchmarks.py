@@ -0,0 +1,212 @@
+"""Tests for the offline benchmark stand-ins and scenarios."""
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import ServiceProfile, StandInError, StandIns
+from benchmarks.harness import LoadResult, histogram, percentile, run_load
+from benchmarks import loadtest, scenarios
+
+
+@pytest.fixture
+def standins():
+    fresh = StandIns(catalog_size=3)
+    with fresh.install():
+        yield fresh
+
+
+async def _supabase():
+    """A SupabaseClient talking to the PostgREST stand-in"""
+    from utils.supabase import SupabaseClient
+
+    client = SupabaseClient()
+    await client.initialize()
+    return client
+
+
+class TestServiceProfile:
+    def test_injected_errors_raise_and_are_counted(self):
+        standins = StandIns({"cohere": ServiceProfile(error_rate=1.0)})
+        with pytest.raises(StandInError):
+            standins.cohere.embed(inputs=[{"content": [{"type": "text", "text": "hi"}]}])
+        assert standins.totals()["cohere"] == (1, 1)
+
+    def test_latency_is_applied(self):
+        standins = StandIns({"pinecone": ServiceProfile(latency=0.05)})
+        loop = asyncio.new_event_loop()
+        try:
+            start = loop.time()
+            loop.run_until_complete(standins.acall("pinecone", "query"))
+            assert loop.time() - start >= 0.045
+        finally:
+            loop.close()
+
+    def test_embeddings_are_deterministic(self):
+        cohere = StandIns(dimension=8).cohere
+        assert cohere.vector("snowboard") == cohere.vector("snowboard")
+        assert cohere.vector("snowboard") != cohere.vector("beanie")
+
+
+class TestPostgrestStandIn:
+    @pytest.mark.asyncio
+    async def test_filters_order_count_and_single(self, standins):
+        supabase = await _supabase()
+        standins.postgrest.insert("company_products", [
+            {"company_id": "c1", "title": "A", "synced_at": "2025-01-01"},
+            {"company_id": "c1", "title": "B", "synced_at": "2025-01-03"},
+            {"company_id": "c2", "title": "C", "synced_at": "2025-01-02"},
+        ])
+
+        result = await supabase.client.table("company_products")\
+            .select("title", count="exact")\
+            .eq("company_id", "c1")\
+            .order("synced_at", desc=True)\
+            .execute()
+        assert [row["title"] for row in result.data] == ["B", "A"]
+        assert result.count == 2
+
+        single = await supabase.client.table("company_products").select("*").eq("title", "C").single().execute()
+        assert single.data["company_id"] == "c2"
+
+    @pytest.mark.asyncio
+    async def test_upsert_merges_on_conflict_columns(self, standins):
+        supabase = await _supabase()
+        table = supabase.client.table("company_products")
+        await table.upsert({"company_id": "c1", "title": "A", "price": 1}, on_conflict="company_id,title").execute()
+        await table.upsert({"company_id": "c1", "title": "A", "price": 2}, on_conflict="company_id,title").execute()
+
+        rows = standins.postgrest.tables["company_products"]
+        assert len(rows) == 1
+        assert rows[0]["price"] == 2
+
+    @pytest.mark.asyncio
+    async def test_embeds_related_rows(self, standins):
+        supabase = await _supabase()
+        standins.postgrest.insert("creator_videos", [{"video_id": "v1", "title": "Video"}])
+        standins.postgrest.insert("product_creator_matches", [{"product_id": "p1", "video_id": "v1"}])
+
+        result = await supabase.client.table("product_creator_matches")\
+            .select("*, creator_videos(*)").eq("product_id", "p1").execute()
+        assert result.data[0]["creator_videos"]["title"] == "Video"
+
+
+class TestUpstashStandIn:
+    @pytest.mark.asyncio
+    async def test_redis_client_round_trips(self, standins):
+        pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        from utils.redis_client import DistributedLock, redis_client
+
+        assert await redis_client.set("bench:key", "v", ex=60) is True
+        assert await redis_client.get("bench:key") == "v"
+        async with DistributedLock("bench") as acquired:
+            assert acquired
+        assert standins.counts()["upstash"]["SET"] == 1
+
+
+class TestHarness:
+    def test_percentile(self):
+        samples = [i / 100 for i in range(1, 101)]
+        assert percentile(samples, 0.5) == 0.51
+        assert percentile(samples, 0.99) == 1.0
+        assert percentile([], 0.5) == 0.0
+
+    def test_histogram_buckets(self):
+        counts = histogram([0.001, 0.004, 0.03, 9.0], bounds=(5, 50))
+        assert counts == {"<=5ms": 2, "<=50ms": 1, ">50ms": 1}
+
+    @pytest.mark.asyncio
+    async def test_run_load_counts_failures(self):
+        calls = []
+
+        async def operation():
+            calls.append(1)
+            if len(calls) % 2:
+                raise RuntimeError("boom")
+            return len(calls)
+
+        result = await run_load("op", operation, total=10, concurrency=3)
+        assert isinstance(result, LoadResult)
+        assert result.count == 10
+        assert result.errors == 5
+        assert result.throughput > 0
+
+
+class TestScenarios:
+    @pytest.mark.asyncio
+    async def test_sync_job_calls_every_service_it_needs(self, standins):
+        pytest.importorskip("fakeredis")
+        [result] = await scenarios.bench_sync(standins, jobs=2, concurrency=2)
+
+        assert result.count == 2
+        assert result.errors == 0
+        calls = standins.counts()
+        assert calls["shopify"]["GET /products.json"] == 2
+        assert calls["cdn"]["GET"] == 6
+        assert calls["cohere"]["embed"] == 6
+        assert calls["pinecone"]["upsert"] == 2
+        assert calls["supabase"]["POST company_products"] == 6
+
+    @pytest.mark.asyncio
+    async def test_discovery_runs_one_cycle(self, standins):
+        pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        scenarios.seed(standins, companies=1, products_per_company=2, partnerships_per_company=1,
+                       interactions_per_company=1)
+
+        searches, videos = await scenarios.bench_discovery(
+            standins, products_per_cycle=2, videos_per_keyword=2, keywords_per_product=1,
+        )
+
+        assert searches.count == 2
+        assert videos.count == 4
+        calls = standins.counts()
+        assert calls["youtube"]["search.list"] == 2
+        assert calls["gemini"]["generate_content"] == 4
+        assert len(standins.postgrest.tables["creator_videos"]) == 4
+
+
+def _step(concurrency, latency, count=10, errors=0, route="GET /health"):
+    result = LoadResult(route, latencies=[latency] * count, errors=errors, wall=1.0)
+    return loadtest.Step(concurrency, {route: result}, wall=1.0)
+
+
+class TestLoadTest:
+    def test_mix_rejects_unknown_routes_and_slo_keys(self):
+        with pytest.raises(ValueError, match="GET /nope"):
+            loadtest.Mix("bad", {"GET /nope": 1})
+        with pytest.raises(ValueError, match="p42_ms"):
+            loadtest.Mix("bad", {"GET /health": 1}, {"*": {"p42_ms": 1}})
+
+    def test_route_slo_overrides_wildcard(self):
+        mix = loadtest.Mix.from_dict({
+            "weights": {"GET /health": 1},
+            "slo": {"*": {"p99_ms": 100, "error_rate": 0.01}, "GET /health": {"p99_ms": 10}},
+        })
+        assert mix.thresholds("GET /health") == {"p99_ms": 10, "error_rate": 0.01}
+
+        assert loadtest.check_slo(mix, _step(1, 0.005)) == []
+        assert loadtest.check_slo(mix, _step(1, 0.020)) == ["GET /health: p99_ms 20 > 10"]
+        assert loadtest.check_slo(mix, _step(1, 0.005, errors=1)) == ["GET /health: error_rate 10.0% > 1.0%"]
+
+    def test_saturation_and_max_within_slo(self):
+        steps = [_step(1, 0.01, count=10), _step(4, 0.01, count=40), _step(16, 0.05, count=42)]
+        steps[2].breaches = ["GET /health: p99_ms 50 > 20"]
+
+        assert loadtest.saturation_point(steps) == 16
+        assert loadtest.max_within_slo(steps) == 4
+
+    @pytest.mark.asyncio
+    async def test_run_mix_serves_the_api_over_http(self, standins):
+        pytest.importorskip("uvicorn")
+        pytest.importorskip("fakeredis")
+        dataset = scenarios.seed(standins, companies=2, products_per_company=2, partnerships_per_company=3,
+                                 interactions_per_company=2)
+        mix = loadtest.Mix("smoke", {"GET /health": 1, "GET /partnerships": 1})
+
+        steps = await loadtest.run_mix(standins, dataset, mix, steps=[1, 2], duration=0.3)
+
+        assert [step.concurrency for step in steps] == [1, 2]
+        for step in steps:
+            assert step.routes["GET /partnerships"].count > 0
+            assert step.overall.errors == 0
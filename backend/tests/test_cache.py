@@ -0,0 +1,340 @@
+"""Tests for the two-tier response cache, tag invalidation and stale-while-revalidate."""
+import asyncio
+import json as jsonlib
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from blacksheep import Application, Request, json
+from blacksheep.server.routing import Router
+from blacksheep.testing import TestClient
+
+from utils import cache
+from utils.cache import (
+    CacheEntry,
+    LocalCache,
+    cache_key,
+    cached_response,
+    company_tag,
+    invalidate_company,
+    invalidate_tags,
+    single_flight,
+)
+from utils.redis_client import Pipeline
+
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    cache.local_cache.clear()
+    yield
+    cache.local_cache.clear()
+
+
+@pytest.fixture
+def mock_redis():
+    with patch("utils.cache.redis_client") as mock_redis:
+        mock_redis.is_configured = True
+        mock_redis.get = AsyncMock(return_value=None)
+        mock_redis.pipeline = lambda transaction=False: Pipeline(mock_redis, transaction=transaction)
+        mock_redis.execute_pipeline = AsyncMock(return_value=[])
+        mock_redis.eval = AsyncMock(return_value=0)
+        yield mock_redis
+
+
+def _company_key(request):
+    company_id = request.query.get("company_id", [None])[0]
+    return cache_key("partnerships", company_id=company_id) if company_id else None
+
+
+def _company_tags(request):
+    return [company_tag(request.query["company_id"][0], "partnerships")]
+
+
+class TestCacheKey:
+    def test_sorted_params_and_dropped_none(self):
+        assert cache_key("partnerships", status="active", company_id="c1", limit=None) == (
+            "cache:partnerships:company_id=c1&status=active"
+        )
+
+    def test_different_params_give_different_keys(self):
+        assert cache_key("products", company_id="c1") != cache_key("products", company_id="c2")
+
+
+def _entry(body, fresh_for=60):
+    return CacheEntry(body, time.time() + fresh_for)
+
+
+class TestLocalCache:
+    def test_evicts_least_recently_used(self):
+        local = LocalCache(max_entries=2)
+        local.set("a", _entry(b"1"), ttl=60)
+        local.set("b", _entry(b"2"), ttl=60)
+        local.get("a")
+        local.set("c", _entry(b"3"), ttl=60)
+
+        assert local.get("b") is None
+        assert local.get("a").body == b"1"
+        assert local.get("c").body == b"3"
+
+    def test_expired_entries_are_misses(self, monkeypatch):
+        local = LocalCache()
+        local.set("a", _entry(b"1"), ttl=5)
+        monkeypatch.setattr(cache.time, "monotonic", lambda: 10**12)
+        assert local.get("a") is None
+        assert len(local) == 0
+
+    def test_invalidate_by_tag(self):
+        local = LocalCache()
+        local.set("a", _entry(b"1"), ttl=60, tags=["company:c1:partnerships"])
+        local.set("b", _entry(b"2"), ttl=60, tags=["company:c1:products"])
+
+        assert local.invalidate_tags(["company:c1:partnerships"]) == 1
+        assert local.get("a") is None
+        assert local.get("b").body == b"2"
+
+
+class TestEntryEncoding:
+    def test_round_trip(self):
+        entry = cache._decode_entry(cache._encode_entry(b'{"a":1}', 1700000000.5))
+        assert entry == CacheEntry(b'{"a":1}', 1700000000.5)
+
+    def test_entries_without_header_are_stale(self):
+        entry = cache._decode_entry('{"a": 1}')
+        assert entry.body == b'{"a": 1}'
+        assert entry.is_fresh is False
+
+
+class TestCachedResponse:
+    def _app(self, calls):
+        app = Application(router=Router())
+
+        @app.router.get("/partnerships")
+        @cached_response(key=_company_key, tags=_company_tags, ttl=60)
+        async def get_partnerships(request: Request):
+            calls.append(request.query.get("company_id"))
+            if not request.query.get("company_id"):
+                return json({"error": "Missing company_id parameter"}, status=400)
+            return json({"partnerships": [], "count": len(calls)})
+
+        return app
+
+    @pytest.mark.asyncio
+    async def test_miss_stores_then_local_hit(self, mock_redis):
+        calls = []
+        app = self._app(calls)
+        await app.start()
+        client = TestClient(app)
+
+        first = await client.get("/partnerships", query={"company_id": "c1"})
+        second = await client.get("/partnerships", query={"company_id": "c1"})
+
+        assert await first.json() == await second.json() == {"partnerships": [], "count": 1}
+        assert second.headers.get_first(b"X-Cache") == b"LOCAL_HIT"
+        assert len(calls) == 1
+
+        commands = mock_redis.execute_pipeline.call_args.args[0]
+        key = "cache:partnerships:company_id=c1"
+        assert commands[0][:2] == ["SET", key] and commands[0][3:] == ["EX", 60]
+        assert cache._decode_entry(commands[0][2]).body == b'{"partnerships":[],"count":1}'
+        assert commands[1] == ["SADD", "cache:tag:company:c1:partnerships", key]
+        assert commands[2][0] == "EXPIRE"
+
+    @pytest.mark.asyncio
+    async def test_redis_hit_skips_handler(self, mock_redis):
+        calls = []
+        app = self._app(calls)
+        await app.start()
+        mock_redis.get = AsyncMock(
+            return_value=cache._encode_entry(b'{"partnerships": [], "count": 9}', time.time() + 30)
+        )
+
+        response = await TestClient(app).get("/partnerships", query={"company_id": "c1"})
+
+        assert await response.json() == {"partnerships": [], "count": 9}
+        assert calls == []
+        assert cache.local_cache.get("cache:partnerships:company_id=c1") is not None
+
+    @pytest.mark.asyncio
+    async def test_bypass_and_errors_are_not_cached(self, mock_redis):
+        calls = []
+        app = self._app(calls)
+        await app.start()
+        client = TestClient(app)
+
+        for _ in range(2):
+            response = await client.get("/partnerships")
+            assert response.status == 400
+
+        assert len(calls) == 2
+        mock_redis.get.assert_not_called()
+        mock_redis.execute_pipeline.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_runs_uncached_without_redis(self):
+        calls = []
+        app = self._app(calls)
+        await app.start()
+
+        with patch("utils.cache.redis_client") as mock_redis:
+            mock_redis.is_configured = False
+            response = await TestClient(app).get("/partnerships", query={"company_id": "c1"})
+
+        assert response.status == 200
+        assert len(calls) == 1
+
+
+class TestStaleWhileRevalidate:
+    def _app(self, calls, release=None):
+        app = Application(router=Router())
+
+        @app.router.get("/stats")
+        @cached_response(key=_company_key, tags=_company_tags, ttl=30, stale_ttl=300)
+        async def get_stats(request: Request):
+            calls.append(1)
+            if release is not None:
+                await release.wait()
+            return json({"count": len(calls)})
+
+        return app
+
+    @pytest.mark.asyncio
+    async def test_stale_entry_served_while_one_refresh_runs(self, mock_redis):
+        calls = []
+        app = self._app(calls)
+        await app.start()
+        mock_redis.get = AsyncMock(
+            return_value=cache._encode_entry(b'{"count": 0}', time.time() - 1)
+        )
+        client = TestClient(app)
+
+        responses = await asyncio.gather(*(
+            client.get("/stats", query={"company_id": "c1"}) for _ in range(5)
+        ))
+        for response in responses:
+            assert await response.json() == {"count": 0}
+        assert responses[0].headers.get_first(b"X-Cache") == b"STALE_HIT"
+
+        while cache._in_flight:
+            await asyncio.sleep(0)
+        assert calls == [1]
+
+        stored = mock_redis.execute_pipeline.call_args.args[0][0]
+        assert stored[-2:] == ["EX", 330]
+        assert cache._decode_entry(stored[2]).is_fresh
+
+        fresh = await client.get("/stats", query={"company_id": "c1"})
+        assert await fresh.json() == {"count": 1}
+
+    @pytest.mark.asyncio
+    async def test_stale_entries_without_stale_ttl_are_misses(self, mock_redis):
+        calls = []
+        app = TestCachedResponse()._app(calls)
+        await app.start()
+        mock_redis.get = AsyncMock(return_value=cache._encode_entry(b'{"old": true}', time.time() - 1))
+
+        response = await TestClient(app).get("/partnerships", query={"company_id": "c1"})
+        assert await response.json() == {"partnerships": [], "count": 1}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_call(self, mock_redis):
+        calls = []
+        release = asyncio.Event()
+        app = self._app(calls, release)
+        await app.start()
+        client = TestClient(app)
+
+        pending = [
+            asyncio.ensure_future(client.get("/stats", query={"company_id": "c1"}))
+            for _ in range(4)
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        responses = await asyncio.gather(*pending)
+
+        assert calls == [1]
+        assert [await r.json() for r in responses] == [{"count": 1}] * 4
+        assert sorted(r.headers.get_first(b"X-Cache") or b"" for r in responses) == [
+            b"", b"COALESCED", b"COALESCED", b"COALESCED"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_refresh_skipped_when_another_instance_holds_lock(self, mock_redis):
+        calls = []
+        app = self._app(calls)
+        await app.start()
+        mock_redis.get = AsyncMock(return_value=cache._encode_entry(b'{"count": 0}', time.time() - 1))
+
+        with patch("utils.cache.DistributedLock") as MockLock:
+            MockLock.return_value.acquire = AsyncMock(return_value=False)
+            MockLock.return_value.release = AsyncMock()
+            await TestClient(app).get("/stats", query={"company_id": "c1"})
+            while cache._in_flight:
+                await asyncio.sleep(0)
+
+        assert calls == []
+        MockLock.assert_called_once_with(
+            "cache_refresh:cache:partnerships:company_id=c1", timeout_seconds=cache.CACHE_REFRESH_LOCK_SECONDS
+        )
+
+    @pytest.mark.asyncio
+    async def test_single_flight_reports_shared_callers(self):
+        release = asyncio.Event()
+        runs = []
+
+        async def compute():
+            runs.append(1)
+            await release.wait()
+            return "value"
+
+        leader = asyncio.ensure_future(single_flight("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight("k", compute))
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await leader == ("value", False)
+        assert await follower == ("value", True)
+        assert runs == [1]
+        assert "k" not in cache._in_flight
+
+
+class TestInvalidateTags:
+    @pytest.mark.asyncio
+    async def test_runs_one_script_for_all_tags(self, mock_redis):
+        mock_redis.eval = AsyncMock(return_value=3)
+        cache.local_cache.set("k", _entry(b"{}"), ttl=60, tags=["company:c1:products"])
+
+        removed = await invalidate_company("c1", "partnerships", "products")
+
+        assert removed == 3
+        script, keys, args = mock_redis.eval.call_args.args
+        assert script == cache.INVALIDATE_TAGS_SCRIPT
+        assert keys == ["cache:tag:company:c1:partnerships", "cache:tag:company:c1:products"]
+        assert cache.local_cache.get("k") is None
+
+    @pytest.mark.asyncio
+    async def test_ignores_missing_company(self, mock_redis):
+        assert await invalidate_company(None, "partnerships") == 0
+        assert await invalidate_tags() == 0
+        mock_redis.eval.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_redis_errors_do_not_raise(self, mock_redis):
+        mock_redis.eval = AsyncMock(side_effect=RuntimeError("down"))
+        assert await invalidate_tags("company:c1:partnerships") == 0
+
+    def test_script_removes_tagged_entries(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+
+        server = fakeredis.FakeStrictRedis(decode_responses=True)
+        server.set("cache:a", "1")
+        server.set("cache:b", "2")
+        server.set("cache:other", "3")
+        server.sadd("cache:tag:company:c1:partnerships", "cache:a", "cache:b")
+
+        removed = server.eval(cache.INVALIDATE_TAGS_SCRIPT, 1, "cache:tag:company:c1:partnerships")
+
+        assert removed == 2
+        assert sorted(server.keys()) == ["cache:other"]
+        assert jsonlib.loads(server.get("cache:other")) == 3
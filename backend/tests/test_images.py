@@ -0,0 +1,135 @@
+"""Tests for the product image preparation pipeline."""
+import base64
+import io
+
+import httpx
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils import images
+
+
+def _jpeg(width, height, color=(200, 30, 30)):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def _pattern(width, height, seed, quality=90):
+    """A photo-like image (smooth gradients plus blobs) that hashes distinctly"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width] / max(width, height)
+    pixels = np.zeros((height, width))
+    for _ in range(6):
+        cx, cy, r = rng.random(3)
+        pixels += np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (0.02 + 0.1 * r))
+    pixels = (255 * pixels / pixels.max()).astype("uint8")
+    output = io.BytesIO()
+    Image.fromarray(pixels).convert("RGB").save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def _decode_data_uri(data_uri):
+    assert data_uri.startswith("data:image/jpeg;base64,")
+    return Image.open(io.BytesIO(base64.b64decode(data_uri.split(",", 1)[1])))
+
+
+@pytest.fixture
+def cdn(monkeypatch, tmp_path):
+    """Route downloads to an in-memory CDN and use a temporary cache"""
+    requests_seen = []
+    files = {}
+
+    def handler(request):
+        requests_seen.append(str(request.url))
+        body = files.get(str(request.url))
+        if body is None:
+            return httpx.Response(404)
+        return httpx.Response(200, content=body, headers={"Content-Type": "image/jpeg"})
+
+    monkeypatch.setattr(images, "IMAGE_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(images, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return files, requests_seen
+
+
+class TestDownscaleImage:
+    def test_bounds_longest_edge(self):
+        result = Image.open(io.BytesIO(images.downscale_image(_jpeg(3000, 1500), max_dimension=512)))
+        assert result.format == "JPEG"
+        assert max(result.size) == 512
+        assert result.size[0] / result.size[1] == pytest.approx(2, rel=0.01)
+
+    def test_keeps_small_images_and_flattens_alpha(self):
+        output = io.BytesIO()
+        Image.new("RGBA", (100, 80), (0, 0, 0, 0)).save(output, format="PNG")
+
+        result = Image.open(io.BytesIO(images.downscale_image(output.getvalue(), max_dimension=512)))
+        assert result.size == (100, 80)
+        assert result.mode == "RGB"
+        assert result.getpixel((50, 40))[0] > 240  # transparent -> white
+
+
+class TestPrepareImages:
+    @pytest.mark.asyncio
+    async def test_downloads_once_per_url_and_caches(self, cdn):
+        files, requests_seen = cdn
+        files["https://cdn.test/a.jpg"] = _jpeg(2048, 2048)
+
+        results = await images.prepare_images(["https://cdn.test/a.jpg", "https://cdn.test/a.jpg", ""])
+        assert list(results) == ["https://cdn.test/a.jpg"]
+        prepared = results["https://cdn.test/a.jpg"]
+        assert max(_decode_data_uri(prepared.data_uri).size) == images.IMAGE_MAX_DIMENSION
+        assert len(prepared.image_hash) == 16
+
+        again = await images.prepare_image("https://cdn.test/a.jpg")
+        assert again == results["https://cdn.test/a.jpg"]
+        assert requests_seen == ["https://cdn.test/a.jpg"]
+
+    @pytest.mark.asyncio
+    async def test_failures_return_none(self, cdn):
+        results = await images.prepare_images(["https://cdn.test/missing.jpg"])
+        assert results == {"https://cdn.test/missing.jpg": None}
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_downloads(self, cdn):
+        files, _ = cdn
+        files["https://cdn.test/huge.jpg"] = _jpeg(64, 64)
+
+        with pytest.raises(images.ImageTooLargeError):
+            await images.download_image("https://cdn.test/huge.jpg", max_bytes=100)
+
+
+class TestPruneCache:
+    def test_removes_least_recently_used(self, monkeypatch, tmp_path):
+        import os
+
+        monkeypatch.setattr(images, "IMAGE_CACHE_DIR", str(tmp_path))
+        for i, name in enumerate(["old", "mid", "new"]):
+            path = tmp_path / f"{name}.jpg"
+            path.write_bytes(b"x" * 100)
+            os.utime(path, (1000 + i, 1000 + i))
+
+        assert images.prune_cache(max_bytes=150) == 2
+        assert [p.name for p in tmp_path.iterdir()] == ["new.jpg"]
+
+
+class TestPerceptualHash:
+    def test_resized_and_reencoded_copies_are_near_duplicates(self):
+        original = images.phash(_pattern(800, 800, seed=1))
+        copy = images.phash(images.downscale_image(_pattern(1600, 1600, seed=1, quality=60), max_dimension=300))
+        other = images.phash(_pattern(800, 800, seed=2))
+
+        assert images.hamming_distance(original, copy) <= images.IMAGE_HASH_MAX_DISTANCE
+        assert images.hamming_distance(original, other) > 10
+
+    def test_index_finds_closest_hash_within_distance(self):
+        index = images.ImageHashIndex(max_distance=4)
+        index.add("ffff0000ffff0000", "hero")
+        index.add("0000ffff0000ffff", "detail")
+
+        assert index.find("ffff0000ffff0000") == "hero"
+        assert index.find("ffff0000ffff000f") == "hero"    # 4 bits apart
+        assert index.find("ffff0000ffff001f") is None      # 5 bits apart
+        assert index.find("0000ffff0000fffe") == "detail"
+        assert len(index) == 2
@@ -2,7 +2,16 @@
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
 
-from jobs.worker import WorkerSettings, get_redis_settings, enqueue_job
+from jobs.worker import (
+    InteractiveWorkerSettings,
+    OutreachWorkerSettings,
+    WorkerSettings,
+    enqueue_job,
+    get_redis_settings,
+    lane_for_queue,
+    on_job_start,
+    queue_for,
+)
 from jobs.tasks import (
     discover_creators_job,
     send_email_job,
@@ -83,10 +92,52 @@ class TestEnqueueJob:
             )
             mock_pool.enqueue_job.assert_called_once_with(
                 "discover_creators_job",
+                _queue_name="maatchaa:jobs",
                 company_id="test-uuid",
                 shop_domain="store.myshopify.com",
             )
 
+    @pytest.mark.asyncio
+    async def test_routes_jobs_to_their_lane(self):
+        mock_pool = AsyncMock()
+        mock_pool.enqueue_job = AsyncMock(return_value=MagicMock(job_id="job-123"))
+
+        with patch("jobs.worker.get_redis_pool", return_value=mock_pool):
+            await enqueue_job(sync_shopify_products_job, shop="s", access_token="t", company_id="c")
+            await enqueue_job(send_email_job, to_email="a@b.c")
+            await enqueue_job(discover_creators_job, _lane="interactive", company_id="c")
+
+        queues = [call.kwargs["_queue_name"] for call in mock_pool.enqueue_job.call_args_list]
+        assert queues == ["maatchaa:jobs:interactive", "maatchaa:jobs:outreach", "maatchaa:jobs:interactive"]
+
+
+class TestPriorityLanes:
+    def test_each_lane_has_its_own_queue(self):
+        queues = {
+            WorkerSettings.queue_name,
+            InteractiveWorkerSettings.queue_name,
+            OutreachWorkerSettings.queue_name,
+        }
+        assert len(queues) == 3
+        assert InteractiveWorkerSettings.functions == WorkerSettings.functions
+
+    def test_queue_lookup_round_trips(self):
+        assert queue_for("process_video_job") == "maatchaa:jobs"
+        assert lane_for_queue(queue_for("send_email_job")) == "outreach"
+        assert lane_for_queue("unknown") == "bulk"
+
+    @pytest.mark.asyncio
+    async def test_records_wait_from_runnable_time(self):
+        import time
+
+        with patch("utils.metrics.record_job_wait") as record:
+            await on_job_start({"lane": "interactive", "score": (time.time() - 2) * 1000})
+            await on_job_start({"lane": "bulk", "score": (time.time() + 60) * 1000})
+
+        (lane, waited), _ = record.call_args_list[0]
+        assert lane == "interactive" and 1.5 < waited < 5
+        assert record.call_args_list[1].args == ("bulk", 0.0)
+
 
 class TestDiscoverCreatorsJob:
     @pytest.mark.asyncio
@@ -151,3 +202,542 @@ class TestTaskDefinitions:
         assert "shop" in sig.parameters
         assert "access_token" in sig.parameters
         assert "company_id" in sig.parameters
+
+
+@pytest.fixture
+def background_worker(monkeypatch):
+    import sys
+
+    for name, value in [("COHERE_KEY", "k"), ("PINECONE_KEY", "k"), ("INDEX_NAME", "i"), ("GEMINI_KEY", "k")]:
+        monkeypatch.setenv(name, value)
+    for module in ("background_worker", "utils.vectordb"):
+        sys.modules.pop(module, None)
+    with patch("pinecone.Pinecone"), patch("cohere.ClientV2"):
+        import background_worker as module
+    yield module
+    for name in ("background_worker", "utils.vectordb"):
+        sys.modules.pop(name, None)
+
+
+def _supabase_with_products(products):
+    from types import SimpleNamespace
+
+    supabase = MagicMock()
+    supabase.initialize = AsyncMock()
+    supabase.close = AsyncMock()
+    query = MagicMock()
+    query.select.return_value = query
+    query.eq.return_value = query
+    query.in_.return_value = query
+    query.execute = AsyncMock(return_value=SimpleNamespace(data=products))
+    supabase.client.table.return_value = query
+    return supabase, query
+
+
+PRODUCTS = [
+    {"id": "p1", "title": "Board", "search_keywords": ["board review", "board haul"]},
+    {"id": "p2", "title": "Wax", "search_keywords": ["wax review"]},
+]
+
+
+class TestBuildSearchQueue:
+    def test_round_robin_across_products(self, background_worker):
+        queue = background_worker.build_search_queue(PRODUCTS, keywords_per_product=2)
+        assert [(s["product"]["id"], s["keyword"]) for s in queue] == [
+            ("p1", "board review"), ("p2", "wax review"), ("p1", "board haul"),
+        ]
+
+    def test_falls_back_to_generated_keywords(self, background_worker):
+        queue = background_worker.build_search_queue([{"id": "p3", "title": "Tent"}], keywords_per_product=1)
+        assert queue[0]["keyword"] == "Tent review"
+
+
+class TestDiscoveryPlanner:
+    def test_groups_videos_by_product_set(self):
+        from jobs.tasks import group_videos
+
+        grouped = group_videos([
+            ({"id": "p1"}, "board review", [{"id": "v1"}, {"id": "v2"}]),
+            ({"id": "p2"}, "wax review", [{"id": "v1"}]),
+            ({"id": "p1"}, "board haul", [{"id": "v1"}]),
+        ])
+        assert grouped["v1"]["product_ids"] == ["p1", "p2"]
+        assert grouped["v1"]["source_keywords"] == {"p1": "board review", "p2": "wax review"}
+        assert grouped["v2"]["product_ids"] == ["p1"]
+
+    def test_job_id_is_deterministic(self):
+        from jobs.tasks import video_job_id
+
+        assert video_job_id("v1", ["p2", "p1"]) == video_job_id("v1", ["p1", "p2"])
+        assert video_job_id("v1", ["p1"]) != video_job_id("v1", ["p1", "p2"])
+        assert video_job_id("v1", ["p1"]).startswith("process_video:v1:")
+
+    @pytest.mark.asyncio
+    async def test_enqueues_one_job_per_video(self, background_worker):
+        from jobs.tasks import video_job_id
+
+        supabase, _ = _supabase_with_products(PRODUCTS)
+        videos = {
+            "board review": [{"id": "v1"}, {"id": "v2"}],
+            "board haul": [{"id": "v1"}],
+            "wax review": [{"id": "v1"}],
+        }
+        pool = MagicMock()
+        # v2 was already planned earlier, so ARQ refuses the duplicate id
+        pool.enqueue_job = AsyncMock(side_effect=lambda *a, **kw: None if kw["video_id"] == "v2" else MagicMock())
+
+        with patch("utils.supabase.SupabaseClient", return_value=supabase), \
+             patch("utils.yt_search.fetch_top_shorts", AsyncMock(side_effect=lambda keyword, **_: videos[keyword])), \
+             patch("utils.redis_client.youtube_limiter.acquire", AsyncMock(return_value=(True, 0.0))):
+            result = await discover_creators_job({"redis": pool}, company_id="c1")
+
+        assert result["status"] == "planned"
+        assert (result["searches"], result["videos"], result["enqueued"], result["duplicates"]) == (3, 2, 1, 1)
+
+        calls = {call.kwargs["video_id"]: call.kwargs for call in pool.enqueue_job.call_args_list}
+        assert all(call.args == ("process_video_job",) for call in pool.enqueue_job.call_args_list)
+        assert calls["v1"]["product_ids"] == ["p1", "p2"]
+        assert calls["v1"]["_job_id"] == video_job_id("v1", ["p1", "p2"])
+
+    @pytest.mark.asyncio
+    async def test_stops_searching_when_quota_is_exhausted(self, background_worker):
+        supabase, _ = _supabase_with_products(PRODUCTS)
+        pool = MagicMock()
+        pool.enqueue_job = AsyncMock(return_value=MagicMock())
+        search = AsyncMock(return_value=[{"id": "v1"}])
+
+        with patch("utils.supabase.SupabaseClient", return_value=supabase), \
+             patch("utils.yt_search.fetch_top_shorts", search), \
+             patch("utils.redis_client.youtube_limiter.acquire", AsyncMock(side_effect=[(True, 0.0), (False, 60.0)])):
+            result = await discover_creators_job({"redis": pool}, company_id="c1")
+
+        assert result["quota_exhausted"] is True
+        assert search.await_count == 1
+        assert result["enqueued"] == 1
+
+
+    @pytest.mark.asyncio
+    async def test_stops_enqueueing_once_the_lock_is_lost(self, background_worker):
+        from utils import redis_client as redis_module
+
+        supabase, _ = _supabase_with_products(PRODUCTS)
+        pool = MagicMock()
+        pool.enqueue_job = AsyncMock(return_value=MagicMock())
+        locks = []
+
+        class TrackedLock(redis_module.DistributedLock):
+            async def acquire(self):
+                locks.append(self)
+                return await super().acquire()
+
+        async def search(keyword, **_):
+            locks[0].lost = True  # the lease lapsed during the first search
+            return [{"id": "v1"}]
+
+        with patch("utils.supabase.SupabaseClient", return_value=supabase), \
+             patch.object(redis_module, "DistributedLock", TrackedLock), \
+             patch("utils.yt_search.fetch_top_shorts", AsyncMock(side_effect=search)), \
+             patch("utils.redis_client.youtube_limiter.acquire", AsyncMock(return_value=(True, 0.0))):
+            result = await discover_creators_job({"redis": pool}, company_id="c1")
+
+        assert result["status"] == "aborted" and result["reason"] == "lock_lost"
+        assert result["searches"] == 1
+        pool.enqueue_job.assert_not_called()
+
+
+class TestProcessVideoJob:
+    @pytest.mark.asyncio
+    async def test_links_every_product_in_the_set(self, background_worker):
+        supabase, query = _supabase_with_products([{"id": "p1"}, {"id": "p2"}])
+
+        with patch("utils.supabase.SupabaseClient", return_value=supabase), \
+             patch("utils.redis_client.gemini_limiter.is_allowed", AsyncMock(return_value=True)), \
+             patch.object(background_worker, "process_creator_video", AsyncMock()) as process:
+            result = await process_video_job(
+                {}, video_id="v1", video_data={"id": "v1"},
+                product_ids=["p1", "p2"], source_keywords={"p1": "board review", "p2": "wax review"},
+            )
+
+        assert result == {"status": "success", "video_id": "v1", "products": 2}
+        query.in_.assert_called_once_with("id", ["p1", "p2"])
+        assert [c.kwargs["source_keyword"] for c in process.call_args_list] == ["board review", "wax review"]
+
+
+class TestRetryPolicy:
+    @staticmethod
+    def _job(error):
+        from jobs.retry import with_retries
+
+        @with_retries
+        async def flaky_job(ctx, video_id):
+            raise error
+
+        return flaky_job
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_defers_on_same_lane(self):
+        from jobs.retry import RateLimited
+
+        pool = MagicMock(default_queue_name="maatchaa:jobs")
+        pool.enqueue_job = AsyncMock(return_value=MagicMock(job_id="process_video:v1:abc:quota1"))
+        ctx = {"redis": pool, "job_id": "process_video:v1:abc", "job_try": 3}
+
+        result = await self._job(RateLimited("gemini", 12.0))(ctx, video_id="v1")
+
+        assert result["status"] == "deferred"
+        assert 12.0 <= result["retry_in"] <= 12.0 * 1.25 + 1.0
+        kwargs = pool.enqueue_job.call_args.kwargs
+        assert pool.enqueue_job.call_args.args == ("flaky_job",)
+        assert kwargs["_job_id"] == "process_video:v1:abc:quota1"
+        assert kwargs["_queue_name"] == "maatchaa:jobs"
+        assert kwargs["quota_deferrals"] == 1 and kwargs["video_id"] == "v1"
+
+    @pytest.mark.asyncio
+    async def test_deferral_keeps_trace_and_tenant(self):
+        from jobs.instrumentation import instrument
+        from jobs.retry import RateLimited
+
+        pool = MagicMock(default_queue_name="maatchaa:jobs")
+        pool.enqueue_job = AsyncMock(return_value=MagicMock(job_id="j:quota1"))
+        traceparent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+        job = instrument(self._job(RateLimited("gemini", 5.0)))
+
+        await job({"redis": pool, "job_id": "j"}, video_id="v1", traceparent=traceparent, tenant="c1")
+
+        kwargs = pool.enqueue_job.call_args.kwargs
+        assert kwargs["tenant"] == "c1"
+        assert kwargs["traceparent"].split("-")[1] == "0af7651916cd43dd8448eb211c80319c"
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_falls_back_to_backoff_after_max_deferrals(self):
+        from arq import Retry
+        from jobs.retry import MAX_QUOTA_DEFERRALS, RateLimited
+
+        pool = MagicMock()
+        pool.enqueue_job = AsyncMock()
+        ctx = {"redis": pool, "job_id": "j:quota20", "job_try": 1}
+
+        with pytest.raises(Retry):
+            await self._job(RateLimited("gemini", 5.0))(ctx, video_id="v1", quota_deferrals=MAX_QUOTA_DEFERRALS)
+        pool.enqueue_job.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_real_errors_back_off_exponentially(self):
+        from arq import Retry
+        from jobs.retry import RETRY_BASE_SECONDS
+
+        job = self._job(RuntimeError("boom"))
+        for job_try in (1, 2):
+            with pytest.raises(Retry) as raised:
+                await job({"job_try": job_try}, video_id="v1")
+            ceiling = RETRY_BASE_SECONDS * 2 ** (job_try - 1)
+            assert ceiling / 2 * 1000 <= raised.value.defer_score <= ceiling * 1000
+
+    @pytest.mark.asyncio
+    async def test_last_try_raises_original_error(self):
+        job = self._job(RuntimeError("boom"))
+        with pytest.raises(RuntimeError):
+            await job({"job_try": WorkerSettings.max_tries}, video_id="v1")
+        with pytest.raises(RuntimeError):
+            await job({}, video_id="v1")
+
+    @pytest.mark.asyncio
+    async def test_process_video_job_defers_when_gemini_is_limited(self, background_worker):
+        pool = MagicMock(default_queue_name="maatchaa:jobs")
+        pool.enqueue_job = AsyncMock(return_value=MagicMock(job_id="x"))
+        supabase, _ = _supabase_with_products([])
+
+        with patch("utils.redis_client.gemini_limiter.acquire", AsyncMock(return_value=(False, 30.0))):
+            result = await process_video_job(
+                {"redis": pool, "supabase": supabase, "job_id": "process_video:v1:abc", "job_try": 1},
+                video_id="v1", video_data={"id": "v1"}, product_ids=["p1"],
+            )
+
+        assert result["status"] == "deferred" and result["service"] == "gemini"
+        assert pool.enqueue_job.call_args.kwargs["product_ids"] == ["p1"]
+
+    @pytest.mark.asyncio
+    async def test_indexed_videos_skip_the_gemini_limiter(self, background_worker):
+        supabase, _ = _supabase_with_products([{"id": "p1", "video_id": "v1"}])
+        acquire = AsyncMock(return_value=(False, 30.0))
+
+        with patch("utils.redis_client.gemini_limiter.acquire", acquire), \
+             patch.object(background_worker, "process_creator_video", AsyncMock()):
+            result = await process_video_job({"supabase": supabase}, video_id="v1", video_data={"id": "v1"},
+                                             product_ids=["p1"])
+
+        assert result["status"] == "success"
+        acquire.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_one_gemini_call_per_job_even_when_irrelevant(self, background_worker):
+        from types import SimpleNamespace
+
+        products = [{"id": f"p{i}", "title": "Board"} for i in range(3)]
+        supabase, query = _supabase_with_products([])
+        # creator_videos (job), company_products, then creator_videos per product
+        query.execute.side_effect = [SimpleNamespace(data=data) for data in ([], products, [], [], [])]
+        parse = AsyncMock(return_value={"output": "{}"})
+
+        with patch("utils.redis_client.gemini_limiter.acquire", AsyncMock(return_value=(True, 0.0))), \
+             patch.object(background_worker, "parse_video", parse), \
+             patch("utils.relevance.calculate_relevance_score", return_value=(1.0, "off topic")), \
+             patch("utils.relevance.is_video_relevant", return_value=(False, "low relevance")):
+            result = await process_video_job({"supabase": supabase}, video_id="v1",
+                                             video_data={"id": "v1", "url": "u", "title": "t"},
+                                             product_ids=[p["id"] for p in products])
+
+        assert result["status"] == "success" and result["products"] == 3
+        parse.assert_awaited_once_with("u")
+
+    @pytest.mark.asyncio
+    async def test_failed_analysis_stops_the_job(self, background_worker):
+        from types import SimpleNamespace
+
+        supabase, query = _supabase_with_products([])
+        query.execute.side_effect = [SimpleNamespace(data=[]), SimpleNamespace(data=[{"id": "p1"}, {"id": "p2"}])]
+        parse = AsyncMock(return_value=({"error": "quota"}, 429))
+
+        with patch("utils.redis_client.gemini_limiter.acquire", AsyncMock(return_value=(True, 0.0))), \
+             patch.object(background_worker, "parse_video", parse), \
+             patch.object(background_worker, "process_creator_video", AsyncMock()) as process:
+            result = await process_video_job({"supabase": supabase}, video_id="v1",
+                                             video_data={"id": "v1", "url": "u", "title": "t"},
+                                             product_ids=["p1", "p2"])
+
+        assert result["status"] == "failed" and result["reason"] == "analysis_failed"
+        parse.assert_awaited_once()
+        process.assert_not_awaited()
+
+
+class TestWorkerClients:
+    @pytest.mark.asyncio
+    async def test_startup_clients_are_shared_and_closed(self):
+        import utils.images  # noqa: F401 - loaded outside patch.dict, which would unload it
+        from jobs.clients import close_clients, open_clients
+
+        supabase, _ = _supabase_with_products([])
+        vectordb = MagicMock(co="cohere", index="index")
+        ctx = {}
+        with patch("utils.supabase.SupabaseClient", return_value=supabase), \
+             patch("utils.yt_search.get_youtube_client", return_value="youtube"), \
+             patch.dict("sys.modules", {"utils.vectordb": vectordb}), \
+             patch("utils.vectordb", vectordb, create=True):
+            await open_clients(ctx)
+
+        assert ctx["supabase"] is supabase
+        assert (ctx["youtube"], ctx["cohere"], ctx["index"]) == ("youtube", "cohere", "index")
+        supabase.initialize.assert_awaited_once()
+
+        await close_clients(ctx)
+        supabase.close.assert_awaited_once()
+        assert "supabase" not in ctx and "http" not in ctx
+
+    @pytest.mark.asyncio
+    async def test_jobs_reuse_the_worker_client(self, background_worker):
+        supabase, _ = _supabase_with_products([{"id": "p1"}])
+
+        with patch("utils.supabase.SupabaseClient") as MockClient, \
+             patch("utils.redis_client.gemini_limiter.acquire", AsyncMock(return_value=(True, 0.0))), \
+             patch.object(background_worker, "process_creator_video", AsyncMock()) as process:
+            await process_video_job({"supabase": supabase}, video_id="v1", video_data={}, product_ids=["p1"])
+
+        MockClient.assert_not_called()
+        supabase.close.assert_not_awaited()
+        assert process.call_args.kwargs["supabase"] is supabase
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_a_temporary_client(self):
+        from jobs.clients import job_supabase
+
+        supabase, _ = _supabase_with_products([])
+        with patch("utils.supabase.SupabaseClient", return_value=supabase):
+            async with job_supabase({}) as client:
+                assert client is supabase
+        supabase.close.assert_awaited_once()
+
+
+class TestDiscoveryScheduler:
+    @pytest.mark.asyncio
+    async def test_stale_planner_cannot_overwrite_the_yield(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        from jobs.scheduler import YIELD_KEY, record_discovery_yield
+        from utils.redis_client import NativeTransport, RedisClient
+
+        client = RedisClient(NativeTransport(connection_pool=fakeredis.FakeAsyncRedis().connection_pool))
+        with patch("jobs.scheduler.redis_client", client):
+            assert await record_discovery_yield("c1", "s", 10, 5, fencing_token=3)
+            assert not await record_discovery_yield("c1", "s", 10, 0, fencing_token=2)
+            assert await client._execute("HGET", YIELD_KEY, "c1:s") == "0.5"
+            assert await record_discovery_yield("c1", "s", 10, 10, fencing_token=4)
+            assert await client._execute("HGET", YIELD_KEY, "c1:s") == "1.0"
+
+    def test_interval_adapts_to_yield_and_freshness(self):
+        from jobs.scheduler import DISCOVERY_BASE_INTERVAL_MINUTES, discovery_interval
+
+        base = discovery_interval(None, None)
+        assert base == DISCOVERY_BASE_INTERVAL_MINUTES * 60
+        assert discovery_interval(None, 1.0) < base < discovery_interval(None, 0.0)
+        assert discovery_interval(2.0, None) < base
+        assert discovery_interval(200.0, None) == base
+
+    def test_interval_is_clamped(self):
+        from jobs.scheduler import DISCOVERY_MAX_INTERVAL_MINUTES, DISCOVERY_MIN_INTERVAL_MINUTES, discovery_interval
+
+        with patch("jobs.scheduler.DISCOVERY_BASE_INTERVAL_MINUTES", 10_000):
+            assert discovery_interval(None, 0.0) == DISCOVERY_MAX_INTERVAL_MINUTES * 60
+        with patch("jobs.scheduler.DISCOVERY_BASE_INTERVAL_MINUTES", 1):
+            assert discovery_interval(1.0, 1.0) == DISCOVERY_MIN_INTERVAL_MINUTES * 60
+
+    @pytest.mark.asyncio
+    async def test_enqueues_only_due_shops(self):
+        import time
+        from jobs.scheduler import schedule_discovery_job
+
+        now = time.time()
+        supabase, _ = _supabase_with_products([
+            {"company_id": "c1", "shop_domain": "a.myshopify.com", "last_product_sync": None},
+            {"company_id": "c2", "shop_domain": "b.myshopify.com", "last_product_sync": None},
+        ])
+        pool = MagicMock()
+        pool.enqueue_job = AsyncMock(return_value=MagicMock())
+
+        with patch("jobs.scheduler.redis_client") as redis:
+            redis.is_configured = True
+            redis.execute_pipeline = AsyncMock(return_value=[
+                ["c1:a.myshopify.com", str(now + 600)],   # not due yet
+                ["c2:b.myshopify.com", "0.9"],
+            ])
+            from utils.redis_client import Pipeline
+            redis.pipeline = lambda transaction=False: Pipeline(redis, transaction=transaction)
+            redis._execute = AsyncMock()
+            redis.set = AsyncMock(return_value=True)
+
+            result = await schedule_discovery_job({"redis": pool, "supabase": supabase})
+
+        assert result == {"status": "scheduled", "shops": 2, "enqueued": 1, "over_budget": 0}
+        kwargs = pool.enqueue_job.call_args.kwargs
+        assert kwargs["company_id"] == "c2"
+        assert kwargs["_job_id"].startswith("discover:c2:b.myshopify.com:")
+        assert kwargs["_queue_name"] == "maatchaa:jobs"
+        zadd = redis._execute.call_args.args
+        assert zadd[:2] == ("ZADD", "discovery:next_run") and zadd[3] == "c2:b.myshopify.com"
+        assert redis.set.call_args.args[0] == "discovery:scheduler:alive"
+
+    @pytest.mark.asyncio
+    async def test_standalone_loop_idles_while_the_cron_runs(self, background_worker):
+        supabase, query = _supabase_with_products(PRODUCTS)
+
+        class Stop(BaseException):
+            pass
+
+        with patch("jobs.scheduler.scheduler_active", AsyncMock(return_value=True)), \
+                patch.object(background_worker.asyncio, "sleep", AsyncMock(side_effect=Stop)):
+            with pytest.raises(Stop):
+                await background_worker._discovery_loop(supabase, MagicMock())
+
+        query.execute.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_skips_companies_over_budget(self):
+        from jobs.scheduler import schedule_discovery_job
+
+        supabase, _ = _supabase_with_products([
+            {"company_id": "c1", "shop_domain": "a.myshopify.com", "last_product_sync": None},
+            {"company_id": "c2", "shop_domain": "b.myshopify.com", "last_product_sync": None},
+        ])
+        pool = MagicMock()
+        pool.enqueue_job = AsyncMock(return_value=MagicMock())
+
+        with patch("jobs.scheduler.redis_client") as redis, \
+                patch("jobs.scheduler.over_budget", AsyncMock(return_value={"c1"})):
+            redis.is_configured = False
+            redis._execute = AsyncMock()
+            result = await schedule_discovery_job({"redis": pool, "supabase": supabase})
+
+        assert result["enqueued"] == 1
+        assert result["over_budget"] == 1
+        assert pool.enqueue_job.call_args.kwargs["company_id"] == "c2"
+
+    def test_only_the_bulk_worker_runs_the_cron(self):
+        assert [job.name for job in WorkerSettings.cron_jobs] == ["cron:schedule_discovery_job"]
+        assert InteractiveWorkerSettings.cron_jobs == []
+        assert OutreachWorkerSettings.cron_jobs == []
+
+
+class TestInstrumentation:
+    @staticmethod
+    def _sample(name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    @pytest.mark.asyncio
+    async def test_records_latency_outcome_and_retries(self):
+        from datetime import datetime, timedelta, timezone
+        from arq import Retry
+        from jobs.instrumentation import instrument
+
+        async def instrumented_probe_job(ctx, fail=False):
+            if fail:
+                raise Retry(defer=1)
+            return {"status": "deferred"} if ctx.get("defer") else {"status": "ok"}
+
+        job = instrument(instrumented_probe_job)
+        now = datetime.now(timezone.utc)
+        ctx = {
+            "redis": MagicMock(default_queue_name="maatchaa:jobs"),
+            # Enqueued an hour ago but deferred until 3s ago: only the 3s count
+            "enqueue_time": now - timedelta(hours=1),
+            "score": int((now - timedelta(seconds=3)).timestamp() * 1000),
+            "job_try": 2,
+        }
+        before = self._sample("job_start_latency_seconds_sum", queue_name="maatchaa:jobs", job_type="instrumented_probe_job")
+
+        assert await job(ctx) == {"status": "ok"}
+        await job({**ctx, "defer": True})
+        with pytest.raises(Retry):
+            await job(ctx, fail=True)
+
+        latency = self._sample("job_start_latency_seconds_sum", queue_name="maatchaa:jobs", job_type="instrumented_probe_job")
+        assert 9 <= latency - before < 60
+        for status in ("success", "deferred", "retry"):
+            assert self._sample("jobs_total", job_type="instrumented_probe_job", status=status) == 1
+        assert self._sample("job_retries_total", job_type="instrumented_probe_job") == 3
+
+    def test_registered_functions_are_instrumented(self):
+        assert all(hasattr(f, "__wrapped__") for f in WorkerSettings.functions)
+
+    @pytest.mark.asyncio
+    async def test_samples_pending_active_and_deferred(self):
+        import time
+        fakeredis = pytest.importorskip("fakeredis")
+        from jobs.instrumentation import sample_queue, sample_queues
+
+        pool = fakeredis.FakeAsyncRedis()
+        now_ms = int(time.time() * 1000)
+        await pool.zadd("maatchaa:jobs", {"old": now_ms - 5000, "running": now_ms - 1000, "later": now_ms + 60000})
+        await pool.set("arq:in-progress:running", b"1")
+
+        sample = await sample_queue(pool, "maatchaa:jobs")
+        assert (sample["pending"], sample["active"], sample["deferred"]) == (1, 1, 1)
+        assert 4.5 < sample["oldest_pending_seconds"] < 10
+
+        await sample_queues(pool)
+        assert self._sample("job_queue_depth", queue_name="maatchaa:jobs", status="deferred") == 1
+        assert self._sample("job_queue_depth", queue_name="maatchaa:jobs:interactive", status="pending") == 0
+
+    @pytest.mark.asyncio
+    async def test_counts_every_runnable_job_past_the_sample_limit(self):
+        import time
+        fakeredis = pytest.importorskip("fakeredis")
+        from jobs.instrumentation import sample_queue
+
+        pool = fakeredis.FakeAsyncRedis()
+        now_ms = int(time.time() * 1000)
+        await pool.zadd("maatchaa:jobs", {f"job-{n}": now_ms - 1000 - n for n in range(30)})
+        await pool.zadd("maatchaa:jobs", {f"later-{n}": now_ms + 60000 for n in range(5)})
+
+        with patch("jobs.instrumentation.SAMPLE_LIMIT", 10):
+            sample = await sample_queue(pool, "maatchaa:jobs")
+        assert (sample["pending"], sample["active"], sample["deferred"]) == (30, 0, 5)
@@ -0,0 +1,62 @@
+"""Tests for the in-process BM25 index and reciprocal-rank fusion."""
+import pytest
+
+from utils.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+class TestTokenize:
+    def test_strips_html_and_stopwords(self):
+        assert tokenize("<p>The <b>Red</b> Dress</p>") == ["red", "dress"]
+
+    def test_keeps_compound_tokens_and_parts(self):
+        assert tokenize("SKU SB-2024-X") == ["sku", "sb-2024-x", "sb", "2024", "x"]
+
+    def test_empty_input(self):
+        assert tokenize(None) == []
+        assert tokenize("") == []
+
+
+class TestBM25Index:
+    @pytest.fixture
+    def index(self):
+        index = BM25Index()
+        index.upsert("1", {"title": "Burton Custom Snowboard", "vendor": "Burton", "body_html": "<p>All-mountain board</p>"})
+        index.upsert("2", {"title": "Ski Wax", "vendor": "Toko", "body_html": "Fast wax for snowboard and ski bases"})
+        index.upsert("3", {"title": "Gift Card", "vendor": "Snowdevil", "body_html": "SKU GC-100"})
+        return index
+
+    def test_ranks_title_matches_above_body_matches(self, index):
+        hits = index.search("snowboard")
+        assert [hit.id for hit in hits] == ["1", "2"]
+
+    def test_exact_sku_lookup(self, index):
+        hits = index.search("GC-100")
+        assert hits[0].id == "3"
+        assert hits[0].matched_terms == hits[0].query_terms
+
+    def test_no_match_returns_empty(self, index):
+        assert index.search("kayak") == []
+
+    def test_upsert_replaces_previous_version(self, index):
+        index.upsert("2", {"title": "Wax Scraper", "vendor": "Toko"})
+        assert [hit.id for hit in index.search("snowboard")] == ["1"]
+        assert len(index) == 3
+
+    def test_remove_drops_document(self, index):
+        index.remove("1")
+        assert "1" not in index
+        assert [hit.id for hit in index.search("burton")] == []
+        index.remove("missing")  # no-op
+
+    def test_metadata_is_kept(self, index):
+        assert index.get_metadata("3")["vendor"] == "Snowdevil"
+
+
+class TestReciprocalRankFusion:
+    def test_rewards_ids_ranked_by_both_lists(self):
+        fused = reciprocal_rank_fusion(["a", "b", "c"], ["c", "b", "d"])
+        assert {doc_id for doc_id, _ in fused[:2]} == {"b", "c"}
+
+    def test_scores_use_k(self):
+        fused = dict(reciprocal_rank_fusion(["a"], k=10))
+        assert fused["a"] == pytest.approx(1 / 11)
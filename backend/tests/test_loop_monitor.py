@@ -0,0 +1,95 @@
+"""Tests for the event loop lag monitor and blocking-call detector."""
+import asyncio
+import time
+import traceback
+
+import pytest
+from prometheus_client import REGISTRY
+
+from utils.loop_monitor import (
+    LoopMonitor,
+    blocking_site,
+    get_loop_monitor,
+    start_loop_monitor,
+    stop_loop_monitor,
+)
+
+
+def _block_the_loop(seconds):
+    time.sleep(seconds)  # a sync call on the event loop
+
+
+class TestLag:
+    @pytest.mark.asyncio
+    async def test_lag_is_measured_and_exported(self):
+        monitor = LoopMonitor("test-lag", interval=0.02, slow_callback_ms=0).start()
+        try:
+            await asyncio.sleep(0.01)
+            _block_the_loop(0.1)
+            await asyncio.sleep(0.05)
+        finally:
+            await monitor.stop()
+
+        assert monitor.max_lag >= 0.05
+        assert REGISTRY.get_sample_value("event_loop_lag_seconds", {"process": "test-lag"}) is not None
+        assert REGISTRY.get_sample_value("event_loop_delay_seconds_count", {"process": "test-lag"}) >= 1
+
+
+class TestBlockingDetector:
+    @pytest.mark.asyncio
+    async def test_blocking_callback_is_charged_to_its_call_site(self):
+        monitor = LoopMonitor("test-block", interval=1, slow_callback_ms=40).start()
+        try:
+            await asyncio.sleep(0.05)
+            _block_the_loop(0.3)
+            await asyncio.sleep(0.1)
+        finally:
+            await monitor.stop()
+
+        spots = monitor.hotspots()
+        assert len(spots) == 1
+        assert "test_loop_monitor.py" in spots[0]["site"]
+        assert "_block_the_loop" in spots[0]["site"]
+        assert spots[0]["count"] == 1
+        assert 150 <= spots[0]["total_ms"] <= 400
+        assert any("time.sleep" in line for line in spots[0]["stack"])
+
+    @pytest.mark.asyncio
+    async def test_debug_mode_off_records_nothing(self):
+        monitor = LoopMonitor("test-off", interval=1, slow_callback_ms=0).start()
+        try:
+            _block_the_loop(0.1)
+            await asyncio.sleep(0.02)
+        finally:
+            await monitor.stop()
+        assert monitor.hotspots() == []
+
+    def test_hotspots_rank_by_total_time(self):
+        monitor = LoopMonitor("test-rank", slow_callback_ms=10)
+        stack = traceback.extract_stack()
+        monitor._hotspots = {
+            "a.py:1 f": {"site": "a.py:1 f", "count": 5, "total_ms": 100.0, "max_ms": 30.0},
+            "b.py:2 g": {"site": "b.py:2 g", "count": 1, "total_ms": 900.0, "max_ms": 900.0},
+        }
+        monitor.record_block(0.05, stack)
+        assert [s["site"] for s in monitor.hotspots()][:2] == ["b.py:2 g", "a.py:1 f"]
+
+    def test_site_skips_library_frames(self):
+        stack = traceback.StackSummary.from_list([
+            ("/app/utils/shopify.py", 30, "fetch_products", "requests.get(url)"),
+            ("/usr/lib/python3/site-packages/requests/api.py", 73, "get", ""),
+            ("/usr/lib/python3/site-packages/urllib3/connection.py", 10, "connect", ""),
+        ])
+        assert blocking_site(stack).endswith("shopify.py:30 fetch_products")
+
+
+class TestRegistry:
+    @pytest.mark.asyncio
+    async def test_one_monitor_per_loop(self):
+        first = start_loop_monitor("api")
+        try:
+            assert start_loop_monitor("worker:bulk") is first
+            assert get_loop_monitor() is first
+        finally:
+            await stop_loop_monitor()
+        assert get_loop_monitor() is None
@@ -123,3 +123,115 @@ class TestMetricsExport:
         assert b"api_requests_total" in output
         assert b"external_api_calls_total" in output
         assert b"job_queue_depth" in output
+
+
+class TestRequestMetricsMiddleware:
+    def _app(self):
+        from blacksheep import Application, json
+        from blacksheep.server.routing import Router
+        from utils.metrics import request_metrics_middleware
+        from utils.timing import add_time
+
+        app = Application(router=Router())
+        app.middlewares.append(request_metrics_middleware(app.router))
+
+        @app.router.get("/items/{item_id}")
+        async def get_item(item_id: str):
+            add_time("redis", 0.002)
+            add_time("supabase", 0.004)
+            return json({"id": item_id})
+
+        @app.router.get("/boom")
+        async def boom():
+            raise RuntimeError("broken")
+
+        return app
+
+    @staticmethod
+    def _count(method, endpoint, status):
+        from prometheus_client import REGISTRY
+        value = REGISTRY.get_sample_value(
+            "api_requests_total", {"method": method, "endpoint": endpoint, "status": status}
+        )
+        return value or 0
+
+    @pytest.mark.asyncio
+    async def test_labels_by_route_template(self):
+        from blacksheep.testing import TestClient
+
+        app = self._app()
+        await app.start()
+        before = self._count("GET", "/items/{item_id}", "200")
+
+        await TestClient(app).get("/items/1")
+        await TestClient(app).get("/items/2")
+
+        assert self._count("GET", "/items/{item_id}", "200") == before + 2
+        assert self._count("GET", "/items/1", "200") == 0
+
+    @pytest.mark.asyncio
+    async def test_server_timing_breaks_out_backends(self):
+        from blacksheep.testing import TestClient
+
+        app = self._app()
+        await app.start()
+        response = await TestClient(app).get("/items/1")
+
+        header = response.headers.get_first(b"Server-Timing").decode()
+        assert "supabase;dur=4.0" in header
+        assert "redis;dur=2.0" in header
+        assert "external" not in header
+        assert "total;dur=" in header
+
+    @pytest.mark.asyncio
+    async def test_unmatched_paths_share_one_label(self):
+        from blacksheep.testing import TestClient
+
+        app = self._app()
+        await app.start()
+        before = self._count("GET", "unmatched", "404")
+
+        await TestClient(app).get("/nope/a")
+        await TestClient(app).get("/nope/b")
+
+        assert self._count("GET", "unmatched", "404") == before + 2
+
+    @pytest.mark.asyncio
+    async def test_errors_count_as_500(self):
+        from blacksheep.testing import TestClient
+
+        app = self._app()
+        await app.start()
+        before = self._count("GET", "/boom", "500")
+
+        response = await TestClient(app).get("/boom")
+
+        assert response.status == 500
+        assert self._count("GET", "/boom", "500") == before + 1
+
+
+class TestRequestTiming:
+    @pytest.mark.asyncio
+    async def test_no_scope_outside_requests(self):
+        from utils.timing import add_time, start_timing, stop_timing
+
+        add_time("redis", 1.0)  # no-op without a scope
+        token = start_timing()
+        add_time("redis", 0.5)
+        add_time("redis", 0.25)
+        assert stop_timing(token) == {"redis": 0.75}
+
+    @pytest.mark.asyncio
+    async def test_redis_commands_are_timed(self):
+        from utils.redis_client import RedisClient
+        from utils.timing import start_timing, stop_timing
+
+        transport = AsyncMock()
+        transport.execute.return_value = ("OK", None)
+        client = RedisClient(transport=transport)
+
+        token = start_timing()
+        await client.set("k", "v")
+        timings = stop_timing(token)
+
+        assert timings["redis"] >= 0
@@ -0,0 +1,145 @@
+"""Tests for the on-demand sampling and allocation profiler."""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from utils import profiler
+from utils.profiler import clamp_seconds, run_profile, sample_allocations, sample_cpu
+
+
+def _spin_until(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=_spin_until, args=(stop,), name="busy", daemon=True)
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+class TestCpuSampling:
+    @pytest.mark.asyncio
+    async def test_samples_busy_thread(self, busy_thread):
+        profile = await sample_cpu(0.2, interval_ms=5)
+
+        assert profile.ticks > 5
+        busy = [stack for (thread, stack) in profile.samples if thread == "busy"]
+        assert busy
+        assert any(frame[0] == "_spin_until" for stack in busy for frame in stack)
+
+    @pytest.mark.asyncio
+    async def test_collapsed_format(self, busy_thread):
+        profile = await sample_cpu(0.1, interval_ms=5)
+
+        lines = profile.collapsed().strip().splitlines()
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) >= 1
+        assert any(line.startswith("busy;") and "_spin_until (test_profiler.py:" in line for line in lines)
+
+    @pytest.mark.asyncio
+    async def test_speedscope_format(self, busy_thread):
+        profile = await sample_cpu(0.1, interval_ms=5)
+
+        doc = json.loads(profile.render("speedscope"))
+        assert doc["$schema"].startswith("https://www.speedscope.app/")
+        frames = doc["shared"]["frames"]
+        busy = next(p for p in doc["profiles"] if p["name"] == "busy")
+        assert busy["type"] == "sampled"
+        assert len(busy["samples"]) == len(busy["weights"])
+        assert all(0 <= i < len(frames) for sample in busy["samples"] for i in sample)
+
+    @pytest.mark.asyncio
+    async def test_idle_threads_skipped(self):
+        stop = threading.Event()
+        idle = threading.Thread(target=stop.wait, name="idle", daemon=True)
+        idle.start()
+        try:
+            profile = await sample_cpu(0.05, interval_ms=5)
+        finally:
+            stop.set()
+            idle.join()
+        assert not [thread for (thread, _) in profile.samples if thread == "idle"]
+
+    def test_seconds_are_capped(self):
+        assert clamp_seconds(10_000) == profiler.PROFILE_MAX_SECONDS
+        assert clamp_seconds(0) == 0.1
+
+
+class TestAllocations:
+    @pytest.mark.asyncio
+    async def test_reports_growing_lines(self):
+        hoard = []
+
+        async def allocate():
+            await asyncio.sleep(0.02)
+            hoard.extend(bytearray(1024) for _ in range(500))
+
+        task = asyncio.create_task(allocate())
+        result = await sample_allocations(0.1, limit=10)
+        await task
+
+        assert result["traced_peak_bytes"] > 0
+        top = result["top"][0]
+        assert top["file"].endswith("test_profiler.py")
+        assert top["size_diff_bytes"] >= 500 * 1024
+
+
+class TestRunProfile:
+    @pytest.mark.asyncio
+    async def test_one_profile_at_a_time(self):
+        first = asyncio.create_task(run_profile("cpu", 0.2))
+        await asyncio.sleep(0.05)
+        assert await run_profile("cpu", 0.1) is None
+        result = await first
+        assert result["mode"] == "cpu"
+        assert result["format"] == "collapsed"
+
+    @pytest.mark.asyncio
+    async def test_profile_job_returns_profile(self):
+        from jobs.tasks import profile_job
+
+        result = await profile_job({"lane": "bulk"}, mode="memory", seconds=0.1, limit=5)
+        assert result["status"] == "ok"
+        assert result["lane"] == "bulk"
+        assert result["mode"] == "memory"
+        assert len(result["top"]) <= 5
+
+
+class TestAdminToken:
+    @pytest.fixture
+    def api(self):
+        from unittest.mock import patch
+
+        from benchmarks.fakes import StandIns
+
+        with StandIns(catalog_size=1).install():
+            import API
+            with patch.object(API, "ADMIN_TOKEN", "s3cret"):
+                yield API
+
+    @staticmethod
+    def _request(**headers):
+        from unittest.mock import MagicMock
+
+        request = MagicMock()
+        request.get_first_header.side_effect = lambda name: headers.get(name.decode().replace("-", "_"))
+        return request
+
+    def test_accepts_bearer_or_header_token(self, api):
+        assert api._is_admin(self._request(Authorization=b"Bearer s3cret"))
+        assert api._is_admin(self._request(X_Admin_Token=b"s3cret"))
+        assert not api._is_admin(self._request(X_Admin_Token=b"wrong"))
+        assert not api._is_admin(self._request())
+
+    def test_non_ascii_token_is_rejected_not_an_error(self, api):
+        assert not api._is_admin(self._request(X_Admin_Token="sécret".encode()))
+        assert not api._is_admin(self._request(Authorization=b"Bearer \xff\xfe"))
@@ -0,0 +1,97 @@
+"""Tests for quantized local vector storage."""
+import numpy as np
+import pytest
+
+from utils.quantized import QuantizedVectorStore
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(42)
+    matrix = rng.standard_normal((500, 64)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def _exact_top(vectors, query, k):
+    return [str(i) for i in np.argsort(-(vectors @ query))[:k]]
+
+
+class TestQuantizedVectorStore:
+    @pytest.mark.parametrize("quantization", ["float32", "int8", "binary"])
+    def test_rescored_search_matches_exact_ranking(self, vectors, quantization):
+        store = QuantizedVectorStore(dim=64, quantization=quantization, keep_float=True, initial_capacity=8)
+        store.add([str(i) for i in range(len(vectors))], vectors)
+
+        query = vectors[7] + 0.1 * vectors[3]
+        query = query / np.linalg.norm(query)
+        results = store.search(query, top_k=5, rescore_factor=40)
+
+        assert [vector_id for vector_id, _ in results] == _exact_top(vectors, query, 5)
+        assert results[0][1] == pytest.approx(float(vectors[7] @ query), abs=1e-5)
+
+    def test_int8_without_rescore_is_close(self, vectors):
+        store = QuantizedVectorStore(dim=64, quantization="int8", keep_float=False)
+        store.add([str(i) for i in range(len(vectors))], vectors)
+
+        results = store.search(vectors[10], top_k=1, rescore=False)
+        assert results[0][0] == "10"
+        assert results[0][1] == pytest.approx(1.0, abs=0.02)
+
+    def test_memory_per_vector(self, vectors):
+        ids = [str(i) for i in range(len(vectors))]
+        binary = QuantizedVectorStore(dim=64, quantization="binary")
+        int8 = QuantizedVectorStore(dim=64, quantization="int8")
+        binary.add(ids, vectors)
+        int8.add(ids, vectors)
+
+        assert binary.memory_bytes()["resident"] == 500 * 8
+        assert int8.memory_bytes()["resident"] == 500 * (64 + 4)
+
+    def test_quantized_stores_keep_no_floats_by_default(self, vectors):
+        store = QuantizedVectorStore(dim=64, quantization="binary")
+        store.add([str(i) for i in range(len(vectors))], vectors)
+
+        memory = store.memory_bytes()
+        assert memory["float"] == memory["float_on_disk"] == 0
+        # Without floats to re-score from, search falls back to hamming scores
+        assert store.search(vectors[42], top_k=1)[0] == ("42", pytest.approx(1.0))
+
+    def test_memory_mapped_rescore_floats(self, vectors, tmp_path):
+        path = tmp_path / "floats.f32"
+        store = QuantizedVectorStore(
+            dim=64, quantization="binary", rescore_path=str(path), initial_capacity=4
+        )
+        store.add([str(i) for i in range(len(vectors))], vectors)
+
+        memory = store.memory_bytes()
+        assert memory["float"] == 0
+        assert memory["float_on_disk"] == 500 * 64 * 4
+        assert store.search(vectors[42], top_k=1, rescore_factor=10)[0][0] == "42"
+
+    def test_upsert_overwrites_and_remove_hides(self, vectors):
+        store = QuantizedVectorStore(dim=64, quantization="int8")
+        store.add(["a", "b"], vectors[:2])
+        store.add(["a"], vectors[2:3])
+
+        assert len(store) == 2
+        assert store.search(vectors[2], top_k=1)[0][0] == "a"
+
+        store.remove("a")
+        assert "a" not in store
+        assert [vector_id for vector_id, _ in store.search(vectors[2], top_k=5)] == ["b"]
+
+    def test_from_items_infers_dimension(self):
+        items = [{"id": "1", "values": [1.0, 0.0, 0.0]}, {"id": "2", "values": [0.0, 1.0, 0.0]}]
+        store = QuantizedVectorStore.from_items(items, quantization="float32")
+
+        assert store.dim == 3
+        assert store.search([0.0, 2.0, 0.0], top_k=1) == [("2", pytest.approx(1.0))]
+
+    def test_rejects_bad_input(self):
+        with pytest.raises(ValueError):
+            QuantizedVectorStore(quantization="int4")
+
+        store = QuantizedVectorStore(dim=4)
+        with pytest.raises(ValueError):
+            store.add(["1"], [[1.0, 0.0]])
+        assert store.search([1.0, 0.0, 0.0, 0.0]) == []
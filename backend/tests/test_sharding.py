@@ -0,0 +1,114 @@
+"""Tests for lease-based shard ownership."""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from utils.redis_client import RedisClient, NativeTransport
+from utils.sharding import ShardCoordinator, assign_shards, shard_for
+
+
+@pytest.fixture
+def shared_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    pool = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer()).connection_pool
+    client = RedisClient(NativeTransport(connection_pool=pool))
+    with patch("utils.redis_client.redis_client", client), patch("utils.sharding.redis_client", client):
+        yield client
+
+
+class TestAssignment:
+    def test_shard_for_is_stable(self):
+        assert shard_for("company-1", 16) == shard_for("company-1", 16)
+        assert 0 <= shard_for("company-1", 16) < 16
+
+    def test_every_shard_has_exactly_one_owner(self):
+        assignment = assign_shards(["w1", "w2", "w3"], 32)
+        owned = [shard for shards in assignment.values() for shard in shards]
+        assert sorted(owned) == list(range(32))
+        assert all(shards for shards in assignment.values())
+
+    def test_joining_member_only_takes_shards(self):
+        before = assign_shards(["w1", "w2"], 64)
+        after = assign_shards(["w1", "w2", "w3"], 64)
+        # Existing members only lose shards, never swap them between each other
+        assert after["w1"] <= before["w1"]
+        assert after["w2"] <= before["w2"]
+
+
+class TestShardCoordinator:
+    @pytest.mark.asyncio
+    async def test_replicas_split_shards_without_overlap(self, shared_redis):
+        a = ShardCoordinator("test", shards=16, lease_seconds=5, member_id="a")
+        b = ShardCoordinator("test", shards=16, lease_seconds=5, member_id="b")
+
+        assert await a.heartbeat() == set(range(16))
+        await b.heartbeat()          # b joins; its shards are still leased by a
+        await a.heartbeat()          # a hands them over
+        await b.heartbeat()          # b claims them
+
+        assert a.owned_shards and b.owned_shards
+        assert a.owned_shards.isdisjoint(b.owned_shards)
+        assert a.owned_shards | b.owned_shards == set(range(16))
+        assert a.owns("company-1") != b.owns("company-1")
+
+    @pytest.mark.asyncio
+    async def test_survivor_takes_over_from_a_dead_replica(self, shared_redis):
+        a = ShardCoordinator("test", shards=8, lease_seconds=0.3, member_id="a")
+        b = ShardCoordinator("test", shards=8, lease_seconds=0.3, member_id="b")
+        await a.heartbeat()
+        await b.heartbeat()
+        await a.heartbeat()
+        await b.heartbeat()
+        assert b.owned_shards != set(range(8))
+
+        # a crashes: no release, no more heartbeats
+        await asyncio.sleep(0.4)
+        assert await b.heartbeat() == set(range(8))
+
+    @pytest.mark.asyncio
+    async def test_stop_releases_leases_for_immediate_takeover(self, shared_redis):
+        a = ShardCoordinator("test", shards=8, lease_seconds=30, member_id="a")
+        b = ShardCoordinator("test", shards=8, lease_seconds=30, member_id="b")
+        await a.start()
+        await b.heartbeat()
+        await a.stop()
+
+        assert await b.heartbeat() == set(range(8))
+
+    @pytest.mark.asyncio
+    async def test_partitioned_replica_drops_its_shards(self, shared_redis):
+        from unittest.mock import AsyncMock
+
+        a = ShardCoordinator("test", shards=8, lease_seconds=30, member_id="a")
+        assert await a.heartbeat() == set(range(8))
+
+        unreachable = AsyncMock(side_effect=lambda commands, transaction=False: [None] * len(commands))
+        with patch.object(shared_redis, "eval", AsyncMock(return_value=None)), \
+                patch.object(shared_redis, "execute_pipeline", unreachable):
+            assert await a.heartbeat() == set()
+
+    @pytest.mark.asyncio
+    async def test_new_replica_wakes_up_when_handed_shards(self, shared_redis):
+        import time
+
+        a = ShardCoordinator("test", shards=8, lease_seconds=0.3, member_id="a")
+        b = ShardCoordinator("test", shards=8, lease_seconds=0.3, member_id="b")
+        await a.start()
+        await b.start()
+        try:
+            assert b.owned_shards == set()
+            start = time.monotonic()
+            assert await b.wait_for_change(30)
+            assert time.monotonic() - start < 5
+        finally:
+            await a.stop()
+            await b.stop()
+
+    def test_owns_everything_without_redis(self):
+        with patch("utils.sharding.redis_client") as client:
+            client.is_configured = False
+            coordinator = ShardCoordinator("test", shards=4)
+            assert coordinator.owned_shards == {0, 1, 2, 3}
+            assert coordinator.owns("any-company")
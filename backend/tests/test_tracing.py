@@ -0,0 +1,147 @@
+"""Tests for the span API and external call tracing."""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from prometheus_client import REGISTRY
+
+from utils.tracing import (
+    ERROR,
+    OK,
+    current_traceparent,
+    exporter,
+    external_call,
+    get_current_span,
+    parse_traceparent,
+    start_span,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_spans():
+    exporter.clear()
+    yield
+    exporter.clear()
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestSpans:
+    def test_nested_spans_share_trace_and_link_parent(self):
+        with start_span("discovery.search") as parent:
+            with start_span("child") as child:
+                assert get_current_span() is child
+            assert get_current_span() is parent
+        assert get_current_span() is None
+
+        assert child.trace_id == parent.trace_id
+        assert child.parent_id == parent.span_id
+        assert parent.parent_id is None
+        assert [s["name"] for s in exporter.spans()] == ["child", "discovery.search"]
+
+    def test_exception_marks_span_as_error(self):
+        with pytest.raises(ValueError):
+            with start_span("failing") as span:
+                raise ValueError("nope")
+
+        assert span.status == ERROR
+        assert span.attributes["error.type"] == "ValueError"
+        assert span.events[0]["name"] == "exception"
+
+    def test_traceparent_round_trip(self):
+        with start_span("job.discover_creators_job") as parent:
+            traceparent = current_traceparent()
+
+        assert parse_traceparent(traceparent) == (parent.trace_id, parent.span_id)
+        with start_span("job.process_video_job", traceparent=traceparent) as child:
+            pass
+        assert child.trace_id == parent.trace_id
+        assert child.parent_id == parent.span_id
+
+    def test_malformed_traceparent_starts_new_trace(self):
+        assert parse_traceparent("garbage") == (None, None)
+        with start_span("job", traceparent="garbage") as span:
+            pass
+        assert span.parent_id is None
+        assert len(span.trace_id) == 32
+
+
+class TestExternalCall:
+    def test_records_latency_payload_and_quota(self):
+        calls = _sample("external_api_calls_total", {"service": "youtube", "status": "success"})
+        units = _sample("external_api_quota_units_total", {"service": "youtube"})
+
+        with start_span("discovery.search") as parent:
+            with external_call("youtube", "search.list", quota_units=100, request_bytes=40) as span:
+                span.set_attribute("payload.response_bytes", 2048)
+
+        assert span.parent_id == parent.span_id
+        assert span.status == OK
+        assert span.attributes["service"] == "youtube"
+        assert _sample("external_api_calls_total", {"service": "youtube", "status": "success"}) == calls + 1
+        assert _sample("external_api_quota_units_total", {"service": "youtube"}) == units + 100
+        assert _sample(
+            "external_api_duration_seconds_count", {"service": "youtube", "operation": "search.list"}
+        ) >= 1
+        assert _sample(
+            "external_api_payload_bytes_sum", {"service": "youtube", "direction": "response"}
+        ) >= 2048
+
+    def test_counts_errors_by_class(self):
+        errors = _sample("external_api_errors_total", {"service": "gemini", "error": "TimeoutError"})
+
+        with pytest.raises(TimeoutError):
+            with external_call("gemini", "generate_content"):
+                raise TimeoutError()
+
+        assert _sample("external_api_errors_total", {"service": "gemini", "error": "TimeoutError"}) == errors + 1
+        assert exporter.spans()[-1]["status"]["code"] == ERROR
+
+    def test_adds_to_request_external_time(self):
+        from utils.timing import start_timing, stop_timing
+
+        token = start_timing()
+        with external_call("pinecone", "query"):
+            pass
+        assert "external" in stop_timing(token)
+
+
+class TestJobSpans:
+    @pytest.mark.asyncio
+    async def test_job_span_parents_external_calls(self):
+        from jobs.instrumentation import instrument
+
+        async def sample_job(ctx):
+            with external_call("cohere", "embed", quota_units=1):
+                pass
+            return {"status": "ok"}
+
+        ctx = {"redis": MagicMock(default_queue_name="maatchaa:jobs"), "job_id": "j1", "job_try": 1}
+        with start_span("job.discover_creators_job") as planner:
+            traceparent = current_traceparent()
+
+        await instrument(sample_job)(ctx, traceparent=traceparent)
+
+        spans = {s["name"]: s for s in exporter.spans()}
+        job, call = spans["job.sample_job"], spans["cohere.embed"]
+        assert job["trace_id"] == planner.trace_id
+        assert job["parent_span_id"] == planner.span_id
+        assert job["attributes"]["job.id"] == "j1"
+        assert call["parent_span_id"] == job["span_id"]
+
+    @pytest.mark.asyncio
+    async def test_enqueue_job_propagates_traceparent(self, monkeypatch):
+        from jobs import worker
+
+        pool = MagicMock()
+        pool.enqueue_job = AsyncMock()
+        monkeypatch.setattr(worker, "get_redis_pool", AsyncMock(return_value=pool))
+
+        async def send_email_job(ctx):
+            pass
+
+        with start_span("discovery.search"):
+            expected = current_traceparent()
+            await worker.enqueue_job(send_email_job, to="a@b.c")
+
+        assert pool.enqueue_job.call_args.kwargs["traceparent"] == expected
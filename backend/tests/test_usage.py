@@ -0,0 +1,155 @@
+"""Tests for per-tenant external API usage accounting."""
+import pytest
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from utils import usage
+from utils.tracing import external_call
+from utils.usage import (
+    UsageRecorder,
+    current_tenant,
+    get_usage,
+    over_budget,
+    tenant_scope,
+    usage_keys,
+    usage_summary,
+    within_budget,
+)
+
+
+@pytest.fixture
+def recorder():
+    fresh = UsageRecorder()
+    with patch.object(usage, "usage_recorder", fresh):
+        yield fresh
+
+
+@pytest.fixture
+def fake_redis():
+    """utils.usage's redis_client on a fakeredis-backed native transport"""
+    fakeredis = pytest.importorskip("fakeredis")
+    from utils.redis_client import NativeTransport, RedisClient
+
+    pool = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer()).connection_pool
+    client = RedisClient(NativeTransport(connection_pool=pool))
+    with patch.object(usage, "redis_client", client):
+        yield client
+
+
+class TestTenantScope:
+    def test_scope_sets_and_restores_tenant(self):
+        assert current_tenant() is None
+        with tenant_scope("c1"):
+            assert current_tenant() == "c1"
+            with tenant_scope(None):
+                assert current_tenant() == "c1"
+        assert current_tenant() is None
+
+    @pytest.mark.asyncio
+    async def test_middleware_only_trusts_authorized_company_ids(self):
+        from types import SimpleNamespace
+
+        async def handler(request):
+            return current_tenant()
+
+        request = SimpleNamespace(query={"company_id": ["c1"]})
+        assert await usage.tenant_middleware(lambda r: True)(request, handler) == "c1"
+        assert await usage.tenant_middleware(lambda r: False)(request, handler) is None
+
+    def test_keys_roll_up_hourly_and_daily(self):
+        hour, day = usage_keys("c1", now=1_700_000_000)  # 2023-11-14 22:13 UTC
+        assert hour == "usage:c1:hour:2023111422"
+        assert day == "usage:c1:day:20231114"
+
+
+class TestRecording:
+    @pytest.mark.asyncio
+    async def test_external_calls_are_charged_to_the_tenant(self, recorder):
+        with tenant_scope("c1"):
+            with external_call("youtube", "search.list", quota_units=100):
+                pass
+            with external_call("youtube", "videos.list", quota_units=1):
+                pass
+        with external_call("youtube", "search.list", quota_units=100):
+            pass  # no tenant: not charged
+
+        day = await get_usage("c1", "day")
+        assert day["youtube:units"] == 101
+        assert day["youtube:calls"] == 2
+        assert day["youtube.search.list:calls"] == 1
+        assert REGISTRY.get_sample_value(
+            "tenant_api_units_total", {"service": "youtube"}
+        ) >= 101
+
+    @pytest.mark.asyncio
+    async def test_flush_moves_pending_counts_to_redis(self, recorder, fake_redis):
+        with tenant_scope("c2"):
+            with external_call("gemini", "generate_content", quota_units=1200):
+                pass
+
+        assert await recorder.flush() > 0
+        assert recorder.pending("c2", usage_keys("c2")[1]) == {}
+
+        day = await get_usage("c2", "day")
+        hour = await get_usage("c2", "hour")
+        assert day["gemini:units"] == hour["gemini:units"] == 1200
+        assert await fake_redis.ttl(usage_keys("c2")[0]) > 0
+
+        with tenant_scope("c2"):
+            with external_call("gemini", "generate_content", quota_units=300):
+                pass
+        # Unflushed usage still counts
+        assert (await get_usage("c2", "day"))["gemini:units"] == 1500
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_counts_for_the_next_one(self, recorder, fake_redis):
+        from unittest.mock import AsyncMock
+
+        with tenant_scope("c4"):
+            with external_call("cohere", "embed", quota_units=3):
+                pass
+
+        unreachable = AsyncMock(side_effect=lambda commands, transaction=False: [None] * len(commands))
+        with patch.object(fake_redis.transport, "execute_pipeline", unreachable):
+            assert await recorder.flush() == 0
+        assert recorder.pending("c4", usage_keys("c4")[1])["cohere:units"] == 3
+
+        assert await recorder.flush() > 0
+        assert recorder.pending("c4", usage_keys("c4")[1]) == {}
+        assert (await get_usage("c4", "day"))["cohere:units"] == 3
+
+    @pytest.mark.asyncio
+    async def test_summary_groups_by_service(self, recorder):
+        with tenant_scope("c3"):
+            with external_call("cohere", "embed", quota_units=1):
+                pass
+            with external_call("shopify", "GET /products.json", quota_units=1):
+                pass
+
+        with patch.object(usage, "TENANT_DAILY_BUDGETS", {"cohere": 10}):
+            summary = await usage_summary("c3")
+
+        assert summary["day"]["cohere"] == {"units": 1, "calls": 1, "operations": {"embed": 1}}
+        assert summary["day"]["shopify"]["operations"] == {"GET /products.json": 1}
+        assert summary["budgets"]["cohere"] == {"daily_units": 10, "used": 1, "remaining": 9}
+
+
+class TestBudgets:
+    @pytest.mark.asyncio
+    async def test_within_budget(self, recorder):
+        recorder.record("c4", "youtube", "search.list", 9900)
+        with patch.object(usage, "TENANT_DAILY_BUDGETS", {"youtube": 10000}):
+            assert await within_budget("c4", "youtube", 100)
+            assert not await within_budget("c4", "youtube", 101)
+            assert await within_budget("c4", "gemini", 10**9)  # no budget set
+
+    @pytest.mark.asyncio
+    async def test_over_budget_checks_many_companies(self, recorder, fake_redis):
+        recorder.record("c5", "youtube", "search.list", 600)
+        await recorder.flush()
+        recorder.record("c6", "youtube", "search.list", 100)
+
+        with patch.object(usage, "TENANT_DAILY_BUDGETS", {"youtube": 500}):
+            assert await over_budget(["c5", "c6", "c7"], "youtube") == {"c5"}
+        assert await over_budget(["c5"], "youtube") == set()
@@ -0,0 +1,283 @@
+"""Tests for vector database helpers (Pinecone and Cohere are mocked)."""
+import sys
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+@pytest.fixture
+def vectordb(monkeypatch):
+    monkeypatch.setenv("COHERE_KEY", "test-cohere-key")
+    monkeypatch.setenv("PINECONE_KEY", "test-pinecone-key")
+    monkeypatch.setenv("INDEX_NAME", "test-index")
+
+    sys.modules.pop("utils.vectordb", None)
+    with patch("pinecone.Pinecone"), patch("cohere.ClientV2"):
+        import utils.vectordb as module
+    module.index = MagicMock()
+    yield module
+    sys.modules.pop("utils.vectordb", None)
+
+
+def _listing(ids, next_token=None):
+    return SimpleNamespace(
+        vectors=[SimpleNamespace(id=i) for i in ids],
+        pagination=SimpleNamespace(next=next_token) if next_token else None,
+    )
+
+
+def _fetched(vectors):
+    return SimpleNamespace(vectors={
+        vector_id: SimpleNamespace(metadata=metadata, values=[0.1, 0.2])
+        for vector_id, metadata in vectors.items()
+    })
+
+
+class TestListCatalogPage:
+    def test_returns_items_in_listing_order_with_cursor(self, vectordb):
+        vectordb.index.list_paginated.return_value = _listing(["2", "10", "3"], "token-1")
+        vectordb.index.fetch.return_value = _fetched({
+            "3": {"title": "C"}, "2": {"title": "A"}, "10": {"title": "B"},
+        })
+
+        page = vectordb.list_catalog_page(limit=3)
+
+        assert [item["id"] for item in page["items"]] == ["2", "10", "3"]
+        assert page["next_cursor"] == "token-1"
+        assert "values" not in page["items"][0]
+
+    def test_passes_cursor_and_clamps_limit(self, vectordb):
+        vectordb.index.list_paginated.return_value = _listing([])
+
+        page = vectordb.list_catalog_page(limit=500, cursor="token-1")
+
+        vectordb.index.list_paginated.assert_called_once_with(
+            prefix=None, limit=100, pagination_token="token-1"
+        )
+        vectordb.index.fetch.assert_not_called()
+        assert page == {"items": [], "next_cursor": None}
+
+    def test_filters_creator_videos(self, vectordb):
+        vectordb.index.list_paginated.return_value = _listing(["1", "video_abc", "2"])
+        vectordb.index.fetch.return_value = _fetched({
+            "1": {"title": "A"},
+            "video_abc": {"video_id": "abc"},
+            "2": {"type": "creator_video"},
+        })
+
+        page = vectordb.list_catalog_page()
+        assert [item["id"] for item in page["items"]] == ["1"]
+
+    def test_includes_values_when_requested(self, vectordb):
+        vectordb.index.list_paginated.return_value = _listing(["1"])
+        vectordb.index.fetch.return_value = _fetched({"1": {"title": "A"}})
+
+        page = vectordb.list_catalog_page(include_values=True)
+        assert page["items"][0]["values"] == [0.1, 0.2]
+
+
+class TestIterCatalog:
+    def test_follows_cursor_until_exhausted(self, vectordb):
+        vectordb.index.list_paginated.side_effect = [
+            _listing(["1", "2"], "token-1"),
+            _listing(["3"]),
+        ]
+        vectordb.index.fetch.side_effect = [
+            _fetched({"1": {}, "2": {}}),
+            _fetched({"3": {}}),
+        ]
+
+        ids = [item["id"] for item in vectordb.iter_catalog(batch_size=2)]
+
+        assert ids == ["1", "2", "3"]
+        assert vectordb.index.list_paginated.call_count == 2
+
+
+def _vector_results(matches):
+    return SimpleNamespace(matches=[
+        SimpleNamespace(id=vector_id, score=score, metadata=metadata)
+        for vector_id, score, metadata in matches
+    ])
+
+
+class TestHybridQuery:
+    @pytest.fixture
+    def catalog(self, vectordb):
+        vectordb.catalog_index.upsert("1", {"title": "Burton Custom Snowboard", "vendor": "Burton"})
+        vectordb.catalog_index.upsert("2", {"title": "Ski Wax", "vendor": "Toko"})
+        vectordb._catalog_index_loaded = True
+        return vectordb
+
+    def test_keyword_lookup_skips_embedding(self, catalog):
+        with patch.object(catalog, "text_to_embedding") as embed:
+            result = catalog.hybrid_query("burton", top_k=5)
+
+        embed.assert_not_called()
+        assert result.mode == "lexical"
+        assert result.matches[0].id == "1"
+        assert result.matches[0].metadata["vendor"] == "Burton"
+
+    def test_fuses_lexical_and_vector_rankings(self, catalog):
+        vector_results = _vector_results([
+            ("2", 0.8, {"title": "Ski Wax"}),
+            ("video_x", 0.7, {"video_id": "x"}),
+            ("3", 0.6, {"title": "Goggles"}),
+        ])
+        with patch.object(catalog, "query_text", return_value=vector_results):
+            result = catalog.hybrid_query("ski wax", top_k=5, mode="hybrid")
+
+        assert result.mode == "hybrid"
+        assert result.matches[0].id == "2"
+        assert result.matches[0].vector_score == 0.8
+        assert result.matches[0].lexical_score is not None
+        assert "video_x" not in [m.id for m in result.matches]
+
+    def test_vector_mode_ignores_lexical_index(self, catalog):
+        vector_results = _vector_results([("1", 0.5, {"title": "Burton Custom Snowboard"})])
+        with patch.object(catalog, "query_text", return_value=vector_results):
+            result = catalog.hybrid_query("burton", mode="vector")
+
+        assert result.mode == "vector"
+        assert result.matches[0].score == 0.5
+
+    def test_stale_index_rebuilds_in_background(self, catalog):
+        import threading
+
+        release = threading.Event()
+
+        def slow_catalog():
+            release.wait(5)
+            yield {"id": "7", "metadata": {"title": "Avalanche Shovel"}}
+
+        stale = catalog.catalog_index
+        stale.built_at = 0
+        with patch.object(catalog, "iter_catalog", slow_catalog):
+            assert catalog.ensure_catalog_index() is stale
+            assert catalog.hybrid_query("burton", mode="lexical").matches[0].id == "1"
+
+            release.set()
+            catalog._catalog_rebuild.join(5)
+
+        assert "7" in catalog.catalog_index
+        assert "1" not in catalog.catalog_index
+
+    def test_writes_during_a_rebuild_survive_the_swap(self, catalog):
+        def catalog_listed_before_the_writes():
+            catalog.upsert_embeddings([{"id": "8", "values": [0.0], "metadata": {"title": "Avalanche Probe"}}])
+            catalog.delete_embeddings(["2"])
+            yield {"id": "2", "metadata": {"title": "Ski Wax", "vendor": "Toko"}}
+
+        with patch.object(catalog, "iter_catalog", catalog_listed_before_the_writes):
+            catalog.rebuild_catalog_index()
+
+        assert "8" in catalog.catalog_index
+        assert "2" not in catalog.catalog_index
+        assert catalog._catalog_writes is None
+
+    def test_matches_report_query_term_coverage(self, catalog):
+        vector_results = _vector_results([("2", 0.8, {"title": "Ski Wax"})])
+        with patch.object(catalog, "query_text", return_value=vector_results):
+            result = catalog.hybrid_query("burton wax", top_k=5, mode="hybrid")
+
+        coverage = {m.id: m.lexical_coverage for m in result.matches}
+        assert coverage == {"1": 0.5, "2": 0.5}
+        assert catalog.hybrid_query("burton", mode="lexical").matches[0].lexical_coverage == 1.0
+
+    def test_rejects_unknown_mode(self, catalog):
+        with pytest.raises(ValueError):
+            catalog.hybrid_query("burton", mode="fuzzy")
+
+    def test_upsert_and_delete_keep_index_in_sync(self, catalog):
+        catalog.upsert_embeddings([
+            {"id": "9", "values": [0.0], "metadata": {"title": "Avalanche Beacon"}},
+            {"id": "video_y", "values": [0.0], "metadata": {"title": "Avalanche video"}},
+        ])
+        assert "9" in catalog.catalog_index
+        assert "video_y" not in catalog.catalog_index
+
+        catalog.delete_embeddings(["9"])
+        assert "9" not in catalog.catalog_index
+        catalog.index.delete.assert_called_once_with(ids=["9"])
+
+
+from utils.images import PreparedImage
+
+
+def _embedding(values):
+    return SimpleNamespace(embeddings=SimpleNamespace(float_=[values]))
+
+
+class TestEmbedProducts:
+    @pytest.mark.asyncio
+    async def test_prepares_images_up_front_and_falls_back_to_text(self, vectordb, monkeypatch):
+        monkeypatch.setenv("USE_IMAGE_EMBEDDINGS", "true")
+        monkeypatch.setattr(vectordb.asyncio, "sleep", AsyncMock())
+        products = [
+            {"name": "Board", "image": "https://cdn.test/a.jpg", "price": 10},
+            {"name": "Wax", "image": "https://cdn.test/broken.jpg", "price": 5},
+        ]
+        prepared = {
+            "https://cdn.test/a.jpg": PreparedImage("data:image/jpeg;base64,AAA", "ff00ff00ff00ff00"),
+            "https://cdn.test/broken.jpg": None,
+        }
+
+        with patch.object(vectordb, "prepare_images", AsyncMock(return_value=prepared)), \
+             patch.object(vectordb, "image_to_embedding", return_value=_embedding([1.0])) as image_embed, \
+             patch.object(vectordb, "text_to_embedding", return_value=_embedding([2.0])) as text_embed:
+            items = await vectordb.embed_products(products)
+
+        image_embed.assert_called_once_with("data:image/jpeg;base64,AAA")
+        text_embed.assert_called_once_with("Wax ")
+        assert [(item["id"], item["values"]) for item in items] == [("0", [1.0]), ("1", [2.0])]
+        assert items[0]["metadata"]["imageURL"] == "https://cdn.test/a.jpg"
+        assert items[0]["metadata"]["imageHash"] == "ff00ff00ff00ff00"
+        assert "imageHash" not in items[1]["metadata"]
+
+    @pytest.mark.asyncio
+    async def test_near_duplicate_images_share_one_embedding(self, vectordb, monkeypatch):
+        monkeypatch.setenv("USE_IMAGE_EMBEDDINGS", "true")
+        monkeypatch.setattr(vectordb.asyncio, "sleep", AsyncMock())
+        products = [
+            {"name": "Board - Red", "image": "https://cdn.test/hero.jpg"},
+            {"name": "Board - Blue", "image": "https://cdn.test/hero_copy.jpg"},
+        ]
+        prepared = {
+            "https://cdn.test/hero.jpg": PreparedImage("data:a", "ff00ff00ff00ff00"),
+            "https://cdn.test/hero_copy.jpg": PreparedImage("data:b", "ff00ff00ff00ff01"),
+        }
+
+        with patch.object(vectordb, "prepare_images", AsyncMock(return_value=prepared)), \
+             patch.object(vectordb, "image_to_embedding", return_value=_embedding([1.0])) as image_embed:
+            items = await vectordb.embed_products(products)
+
+        image_embed.assert_called_once_with("data:a")
+        assert [item["values"] for item in items] == [[1.0], [1.0]]
+        assert vectordb.image_hashes_by_id(items) == {"0": "ff00ff00ff00ff00", "1": "ff00ff00ff00ff01"}
+
+    @pytest.mark.asyncio
+    async def test_unchanged_images_reuse_stored_vectors_without_download(self, vectordb, monkeypatch):
+        monkeypatch.setenv("USE_IMAGE_EMBEDDINGS", "true")
+        monkeypatch.setattr(vectordb.asyncio, "sleep", AsyncMock())
+        products = [
+            {"name": "Board", "image": "https://cdn.test/a.jpg"},
+            {"name": "Wax", "image": "https://cdn.test/b.jpg"},
+        ]
+        known_images = {
+            "https://cdn.test/a.jpg": {"image_hash": "ff00ff00ff00ff00", "pinecone_id": "7"},
+            # Stale: vector 8 now belongs to a different image
+            "https://cdn.test/b.jpg": {"image_hash": "0f0f0f0f0f0f0f0f", "pinecone_id": "8"},
+        }
+        vectordb.index.fetch.return_value = SimpleNamespace(vectors={
+            "7": SimpleNamespace(values=[0.5], metadata={"imageHash": "ff00ff00ff00ff00"}),
+            "8": SimpleNamespace(values=[0.9], metadata={"imageHash": "aaaaaaaaaaaaaaaa"}),
+        })
+        prepare = AsyncMock(return_value={"https://cdn.test/b.jpg": PreparedImage("data:b", "0f0f0f0f0f0f0f0f")})
+
+        with patch.object(vectordb, "prepare_images", prepare), \
+             patch.object(vectordb, "image_to_embedding", return_value=_embedding([2.0])) as image_embed:
+            items = await vectordb.embed_products(products, known_images=known_images)
+
+        assert list(prepare.call_args.args[0]) == ["https://cdn.test/b.jpg"]
+        image_embed.assert_called_once_with("data:b")
+        assert [item["values"] for item in items] == [[0.5], [2.0]]
+        assert items[0]["metadata"]["imageHash"] == "ff00ff00ff00ff00"
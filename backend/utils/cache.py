@@ -0,0 +1,394 @@
+"""
+Two-tier response cache for hot read endpoints.
+
+Lookups go to a small in-process LRU first and then to Redis. Every entry is
+stored under an explicit key built from the endpoint name and the parameters
+that shape the response (see cache_key), and carries tags such as
+"company:{id}:partnerships". Writes invalidate by tag: one Lua script reads
+the tag set and UNLINKs its members, so no keyspace scan is needed.
+
+The local tier is per process and is only cleared by invalidations made in
+that process, so it keeps entries for at most CACHE_LOCAL_TTL_SECONDS. Redis
+errors never fail a request; the handler just runs uncached.
+
+Entries have a soft and a hard expiry. Until `ttl` they are fresh; for
+`stale_ttl` seconds after that they are still served, while one background
+refresh per key recomputes them (deduplicated in-process and guarded by a
+DistributedLock across instances). Concurrent misses on the same key share
+a single handler call instead of all hitting Supabase, Cohere and Pinecone.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+
+from blacksheep import Content, Response
+from dotenv import load_dotenv
+
+from utils.metrics import cache_invalidations_total, cache_refreshes_total, cache_requests_total
+from utils.redis_client import DistributedLock, redis_client
+
+load_dotenv()
+
+CACHE_PREFIX = "cache"
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "1024"))
+CACHE_LOCAL_TTL_SECONDS = float(os.getenv("CACHE_LOCAL_TTL_SECONDS", "5"))
+# Tag sets outlive their entries so a refreshed entry is always reachable
+CACHE_TAG_TTL_SECONDS = int(os.getenv("CACHE_TAG_TTL_SECONDS", "3600"))
+# Lease on the cross-instance lock held while one instance refreshes a key
+CACHE_REFRESH_LOCK_SECONDS = int(os.getenv("CACHE_REFRESH_LOCK_SECONDS", "30"))
+
+# KEYS: tag sets. Removes every member of each set and the set itself.
+INVALIDATE_TAGS_SCRIPT = """
+local removed = 0
+for _, tag in ipairs(KEYS) do
+    local members = redis.call('SMEMBERS', tag)
+    for i = 1, #members, 500 do
+        removed = removed + redis.call('UNLINK', unpack(members, i, math.min(i + 499, #members)))
+    end
+    redis.call('UNLINK', tag)
+end
+return removed
+"""
+
+
+def cache_key(endpoint: str, **params) -> str:
+    """
+    Build the cache key for an endpoint.
+
+    Only the parameters passed here take part in the key, so each endpoint
+    spells out exactly what its response depends on. None values are dropped.
+
+    Example:
+        cache_key("partnerships", company_id="c1", status="active")
+        # -> "cache:partnerships:company_id=c1&status=active"
+    """
+    query = urlencode(sorted((k, str(v)) for k, v in params.items() if v is not None))
+    return f"{CACHE_PREFIX}:{endpoint}:{query}"
+
+
+def company_tag(company_id: str, kind: str) -> str:
+    """Tag for everything of one kind belonging to a company"""
+    return f"company:{company_id}:{kind}"
+
+
+def product_tag(product_id: str, kind: str) -> str:
+    """Tag for everything of one kind belonging to a product"""
+    return f"product:{product_id}:{kind}"
+
+
+def _tag_key(tag: str) -> str:
+    return f"{CACHE_PREFIX}:tag:{tag}"
+
+
+def _tag_kind(tag: str) -> str:
+    """Tag without its ids, for metric labels ("company:c1:products" -> "company:products")"""
+    return ":".join(tag.split(":")[::2])
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    fresh_until: float  # epoch seconds; served as stale after this
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.fresh_until > time.time()
+
+
+def _encode_entry(body: bytes, fresh_until: float) -> str:
+    """Redis value: soft expiry on the first line, then the body"""
+    return f"{fresh_until:.3f}\n{body.decode()}"
+
+
+def _decode_entry(raw: str) -> CacheEntry:
+    header, sep, body = raw.partition("\n")
+    try:
+        return CacheEntry(body.encode(), float(header)) if sep else CacheEntry(raw.encode(), 0.0)
+    except ValueError:
+        # No soft-expiry header: treat as stale so it gets rewritten
+        return CacheEntry(raw.encode(), 0.0)
+
+
+class LocalCache:
+    """In-process LRU of response bodies with per-entry expiry and tags"""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, CacheEntry, frozenset]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, entry, _ = item
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry, ttl: float, tags: Iterable[str] = ()):
+        self._entries[key] = (time.monotonic() + ttl, entry, frozenset(tags))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        tags = set(tags)
+        stale = [key for key, (_, _, entry_tags) in self._entries.items() if entry_tags & tags]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+local_cache = LocalCache()
+
+
+def _local_ttl(entry: CacheEntry, stale_ttl: float) -> float:
+    """Keep a local copy no longer than CACHE_LOCAL_TTL_SECONDS or its hard expiry"""
+    return max(0.0, min(CACHE_LOCAL_TTL_SECONDS, entry.fresh_until + stale_ttl - time.time()))
+
+
+async def get_cached(key: str) -> Tuple[Optional[CacheEntry], str]:
+    """
+    Look a key up in both tiers.
+
+    Returns:
+        (entry, result) where result is "local_hit", "redis_hit" or "miss"
+    """
+    entry = local_cache.get(key)
+    if entry is not None:
+        return entry, "local_hit"
+
+    if redis_client.is_configured:
+        try:
+            cached = await redis_client.get(key)
+            if cached is not None:
+                return _decode_entry(cached), "redis_hit"
+        except Exception as e:
+            print(f"Cache read error: {e}")
+    return None, "miss"
+
+
+async def set_cached(key: str, body: bytes, ttl: int, tags: Iterable[str] = (), stale_ttl: int = 0):
+    """
+    Store a body in both tiers and add the key to each tag set.
+
+    The entry is fresh for `ttl` seconds and kept (as stale) for another
+    `stale_ttl` seconds.
+    """
+    tags = list(tags)
+    entry = CacheEntry(body, time.time() + ttl)
+    local_cache.set(key, entry, _local_ttl(entry, stale_ttl), tags)
+
+    if not redis_client.is_configured:
+        return
+    try:
+        async with redis_client.pipeline() as pipe:
+            pipe.set(key, _encode_entry(body, entry.fresh_until), ex=ttl + stale_ttl)
+            for tag in tags:
+                pipe.sadd(_tag_key(tag), key)
+                pipe.expire(_tag_key(tag), max(ttl + stale_ttl, CACHE_TAG_TTL_SECONDS))
+    except Exception as e:
+        print(f"Cache write error: {e}")
+
+
+# ============================================================================
+# SINGLE-FLIGHT AND BACKGROUND REFRESH
+# ============================================================================
+
+# Key -> the one computation (miss or refresh) running for it in this process
+_in_flight: Dict[str, "asyncio.Task"] = {}
+
+
+def _start(key: str, coro: Awaitable) -> "asyncio.Task":
+    task = asyncio.ensure_future(coro)
+    _in_flight[key] = task
+    task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return task
+
+
+async def single_flight(key: str, compute: Callable[[], Awaitable]):
+    """
+    Run `compute` once per key at a time in this process.
+
+    Callers arriving while a computation is running await its result instead
+    of starting their own. Returns (result, shared) where shared is True for
+    callers that joined an existing computation.
+    """
+    task = _in_flight.get(key)
+    if task is not None:
+        return await asyncio.shield(task), True
+    return await asyncio.shield(_start(key, compute())), False
+
+
+async def _refresh(key: str, compute: Callable[[], Awaitable], endpoint: str):
+    lock = DistributedLock(f"cache_refresh:{key}", timeout_seconds=CACHE_REFRESH_LOCK_SECONDS)
+    if not await lock.acquire():
+        # Another instance is already refreshing this key
+        cache_refreshes_total.labels(endpoint=endpoint, outcome="skipped").inc()
+        return None
+    try:
+        result = await compute()
+        cache_refreshes_total.labels(endpoint=endpoint, outcome="success").inc()
+        return result
+    except Exception as e:
+        print(f"Cache refresh error for {key}: {e}")
+        cache_refreshes_total.labels(endpoint=endpoint, outcome="failure").inc()
+        return None
+    finally:
+        await lock.release()
+
+
+def schedule_refresh(key: str, compute: Callable[[], Awaitable], endpoint: str = "unknown") -> bool:
+    """
+    Recompute a stale key in the background, unless a computation for it is
+    already running. Returns True if a refresh was started.
+    """
+    if key in _in_flight:
+        return False
+    _start(key, _refresh(key, compute, endpoint))
+    return True
+
+
+async def invalidate_tags(*tags: str) -> int:
+    """
+    Drop every cached entry carrying any of the given tags.
+
+    Usage:
+        await invalidate_tags(company_tag(company_id, "partnerships"))
+
+    Returns:
+        Number of Redis entries removed
+    """
+    tags = [tag for tag in tags if tag]
+    if not tags:
+        return 0
+
+    local_cache.invalidate_tags(tags)
+    if not redis_client.is_configured:
+        return 0
+
+    try:
+        removed = await redis_client.eval(
+            INVALIDATE_TAGS_SCRIPT, [_tag_key(tag) for tag in tags], []
+        ) or 0
+    except Exception as e:
+        print(f"Cache invalidation error: {e}")
+        return 0
+
+    for kind in {_tag_kind(tag) for tag in tags}:
+        cache_invalidations_total.labels(tag_kind=kind).inc(removed)
+    return removed
+
+
+async def invalidate_company(company_id: str, *kinds: str) -> int:
+    """Invalidate the given kinds (e.g. "partnerships", "products") for a company"""
+    if not company_id:
+        return 0
+    return await invalidate_tags(*(company_tag(company_id, kind) for kind in kinds))
+
+
+
+
+def _is_cacheable(response) -> bool:
+    content = getattr(response, "content", None)
+    return (
+        response is not None
+        and response.status == 200
+        and content is not None
+        and content.body is not None
+        and content.type.startswith(b"application/json")
+    )
+
+
+def cached_response(
+    key: Callable[..., Optional[str]],
+    tags: Callable[..., List[str]] = None,
+    ttl: int = 60,
+    stale_ttl: int = 0,
+):
+    """
+    Cache the JSON body of a BlackSheep handler.
+
+    `key` and `tags` are called with the handler's own arguments. `key`
+    returns a cache_key(...) string, or None to skip the cache for that
+    request (e.g. a required parameter is missing). Only 200 JSON responses
+    are stored; errors always go through to the handler.
+
+    With `stale_ttl`, an entry older than `ttl` is still returned for that
+    many more seconds while the handler re-runs in the background. The
+    refresh reuses the original arguments, so this is only for GET handlers
+    that read nothing but route and query values.
+
+    Usage:
+        @get("/partnerships")
+        @cached_response(
+            key=lambda request: cache_key("partnerships", company_id=_qstr(request, "company_id")),
+            tags=lambda request: [company_tag(_qstr(request, "company_id"), "partnerships")],
+            ttl=60,
+        )
+        async def get_partnerships(request: Request):
+            ...
+    """
+    def decorator(func: Callable):
+        endpoint = func.__name__
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                entry_key = key(*args, **kwargs)
+            except Exception:
+                entry_key = None
+            if entry_key is None:
+                cache_requests_total.labels(endpoint=endpoint, result="bypass").inc()
+                return await func(*args, **kwargs)
+
+            entry_tags = tags(*args, **kwargs) if tags else []
+
+            async def compute():
+                response = await func(*args, **kwargs)
+                if _is_cacheable(response):
+                    await set_cached(entry_key, response.content.body, ttl, entry_tags, stale_ttl)
+                return response
+
+            entry, result = await get_cached(entry_key)
+            if entry is not None and (entry.is_fresh or stale_ttl):
+                if result == "redis_hit":
+                    local_cache.set(entry_key, entry, _local_ttl(entry, stale_ttl), entry_tags)
+                if not entry.is_fresh:
+                    result = "stale_hit"
+                    schedule_refresh(entry_key, compute, endpoint)
+                cache_requests_total.labels(endpoint=endpoint, result=result).inc()
+                return Response(
+                    200,
+                    [(b"X-Cache", result.upper().encode())],
+                    Content(b"application/json", entry.body),
+                )
+
+            response, shared = await single_flight(entry_key, compute)
+            if not shared:
+                cache_requests_total.labels(endpoint=endpoint, result="miss").inc()
+                return response
+
+            # Joined another request's computation: answer from its result
+            cache_requests_total.labels(endpoint=endpoint, result="coalesced").inc()
+            content = getattr(response, "content", None)
+            if content is None or content.body is None:
+                return await func(*args, **kwargs)
+            return Response(
+                response.status,
+                [(b"X-Cache", b"COALESCED")],
+                Content(content.type, content.body),
+            )
+        return wrapper
+    return decorator
@@ -10,6 +10,8 @@ from email.mime.multipart import MIMEMultipart
 from typing import Optional, Dict, List
 from dotenv import load_dotenv
 
+from utils.tracing import external_call, payload_size
+
 load_dotenv()
 
 
@@ -247,9 +249,11 @@ def send_email(
         message.attach(html_part)
 
         # Send via Gmail SMTP
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender_email, sender_password)
-            server.send_message(message)
+        with external_call("gmail", "smtp.send", quota_units=1,
+                           request_bytes=payload_size(message.as_string())):
+            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
+                server.login(sender_email, sender_password)
+                server.send_message(message)
 
         return True, f"Email sent successfully to {to_email}"
 
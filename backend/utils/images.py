@@ -0,0 +1,406 @@
+"""
+Image preparation for product embeddings.
+
+Shopify serves product images at full resolution (often several MB), while
+Cohere only needs a small image to embed. Each image is streamed over a
+pooled HTTP client with a size cap, decoded in Pillow's draft/thumbnail mode,
+and re-encoded as a bounded JPEG before it reaches the embed payload.
+Prepared images are kept in a small on-disk cache keyed by URL, so re-syncs
+don't download the same catalog again.
+
+Every prepared image also carries a 64-bit perceptual hash (pHash). Variants
+and duplicated collections usually reuse one hero image, possibly re-encoded
+or resized; ImageHashIndex finds those near-duplicates so they can share one
+embedding.
+
+Usage:
+    from utils.images import ImageHashIndex, prepare_images
+
+    prepared = await prepare_images([p["image"] for p in products])
+    # {url: PreparedImage(data_uri, image_hash) or None if the image failed}
+
+    seen = ImageHashIndex()
+    seen.add(prepared[url].image_hash, embedding)
+    seen.find(other.image_hash)   # embedding if within IMAGE_HASH_MAX_DISTANCE bits
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import httpx
+import numpy as np
+import requests
+from PIL import Image
+
+from utils.timing import httpx_hooks
+
+# Images larger than this are rejected before they are fully downloaded
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(15 * 1024 * 1024)))
+
+# Longest edge and JPEG quality of the images sent to Cohere
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "512"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Parallel downloads per prepare_images() call
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", "8"))
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "/tmp/maatchaa-images")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Hashes at most this many bits apart are treated as the same image
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv("IMAGE_HASH_MAX_DISTANCE", "4"))
+
+DOWNLOAD_TIMEOUT = httpx.Timeout(20.0, connect=5.0)
+
+
+class ImageTooLargeError(Exception):
+    """Raised when an image exceeds IMAGE_MAX_BYTES"""
+    pass
+
+
+class PreparedImage(NamedTuple):
+    data_uri: str    # Downscaled JPEG for the Cohere embed API
+    image_hash: str  # 64-bit pHash as 16 hex characters
+
+
+# ============================================================================
+# Decoding
+# ============================================================================
+
+def downscale_image(
+    data: bytes,
+    max_dimension: int = IMAGE_MAX_DIMENSION,
+    quality: int = IMAGE_JPEG_QUALITY,
+) -> bytes:
+    """
+    Shrink an encoded image so its longest edge is at most max_dimension.
+
+    JPEGs are decoded in draft mode, which lets libjpeg scale by 1/2, 1/4 or
+    1/8 while decoding instead of materialising every full-resolution pixel.
+
+    Returns:
+        JPEG bytes
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("RGB", (max_dimension, max_dimension))
+        if image.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto white, the usual storefront background
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue()
+
+
+def to_data_uri(data: bytes, content_type: str = "image/jpeg") -> str:
+    """Encode image bytes as a data URI for the Cohere embed API"""
+    return f"data:{content_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+# ============================================================================
+# Perceptual hashing
+# ============================================================================
+
+@lru_cache(maxsize=4)
+def _dct_matrix(size: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.sqrt(2.0 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def phash(data: bytes, hash_size: int = 8) -> str:
+    """
+    Perceptual hash of an encoded image.
+
+    The image is reduced to a 32x32 grayscale thumbnail, transformed with a
+    2D DCT, and the lowest 8x8 frequencies are compared against their median.
+    Re-encoding, resizing and small colour shifts flip only a few bits.
+
+    Returns:
+        The hash as a hex string (16 characters for the default 64 bits)
+    """
+    size = hash_size * 4
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (size, size))
+        pixels = np.asarray(image.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+
+    dct = _dct_matrix(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size].flatten()
+    # Skip the DC term, which only encodes overall brightness
+    bits = low > np.median(low[1:])
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    """Number of differing bits between two hex hashes"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+class ImageHashIndex:
+    """
+    Near-duplicate lookup over 64-bit image hashes.
+
+    Hashes are split into (max_distance + 1) bands; two hashes within
+    max_distance bits must agree exactly on at least one band, so each lookup
+    only compares against hashes sharing a band instead of the whole index.
+    """
+
+    def __init__(self, max_distance: int = IMAGE_HASH_MAX_DISTANCE, hash_bits: int = 64):
+        self.max_distance = max_distance
+        self.hash_bits = hash_bits
+        band_count = max_distance + 1
+        edges = [round(i * hash_bits / band_count) for i in range(band_count + 1)]
+        self._bands: List[Tuple[int, int]] = [
+            (start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])
+        ]
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in self._bands]
+        self._entries: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, image_hash: str, value: Any) -> None:
+        """Store a value under a hash (the first value stored for a hash wins)"""
+        key = int(image_hash, 16)
+        if key in self._entries:
+            return
+        self._entries[key] = value
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((key >> shift) & mask, []).append(key)
+
+    def find(self, image_hash: str) -> Optional[Any]:
+        """Value of the closest stored hash within max_distance bits, if any"""
+        key = int(image_hash, 16)
+        if key in self._entries:
+            return self._entries[key]
+
+        best, best_distance = None, self.max_distance + 1
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for candidate in buckets.get((key >> shift) & mask, ()):
+                distance = bin(key ^ candidate).count("1")
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+        return self._entries[best] if best is not None else None
+
+
+# ============================================================================
+# On-disk cache
+# ============================================================================
+
+_cache_lock = threading.Lock()
+_cache_bytes_written = 0
+
+
+def _cache_path(image_url: str) -> str:
+    key = f"{image_url}|{IMAGE_MAX_DIMENSION}|{IMAGE_JPEG_QUALITY}"
+    return os.path.join(IMAGE_CACHE_DIR, hashlib.sha256(key.encode()).hexdigest() + ".jpg")
+
+
+def _read_cache(image_url: str) -> Optional[bytes]:
+    path = _cache_path(image_url)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # Keep recently used images on prune
+        return data
+    except OSError:
+        return None
+
+
+def _write_cache(image_url: str, data: bytes) -> None:
+    global _cache_bytes_written
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        path = _cache_path(image_url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️  Image cache write failed: {e}")
+        return
+
+    with _cache_lock:
+        _cache_bytes_written += len(data)
+        should_prune = _cache_bytes_written >= IMAGE_CACHE_MAX_BYTES // 10
+        if should_prune:
+            _cache_bytes_written = 0
+    if should_prune:
+        prune_cache()
+
+
+def prune_cache(max_bytes: int = IMAGE_CACHE_MAX_BYTES) -> int:
+    """
+    Delete least recently used cached images until the cache fits max_bytes.
+
+    Returns:
+        Number of files removed
+    """
+    try:
+        entries = []
+        for name in os.listdir(IMAGE_CACHE_DIR):
+            path = os.path.join(IMAGE_CACHE_DIR, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    except OSError:
+        return 0
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+# ============================================================================
+# Downloading
+# ============================================================================
+
+_http_client: Optional[httpx.AsyncClient] = None
+_http_session: Optional[requests.Session] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared async client, so downloads reuse connections to the Shopify CDN"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=DOWNLOAD_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=IMAGE_CONCURRENCY * 2, max_keepalive_connections=IMAGE_CONCURRENCY),
+            event_hooks=httpx_hooks("external"),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _get_http_session() -> requests.Session:
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+    return _http_session
+
+
+async def download_image(image_url: str, max_bytes: int = IMAGE_MAX_BYTES) -> bytes:
+    """
+    Stream an image into memory, aborting once it exceeds max_bytes.
+
+    Raises:
+        ImageTooLargeError: If the image is larger than max_bytes
+        httpx.HTTPError: On network errors or non-2xx responses
+    """
+    client = get_http_client()
+    async with client.stream("GET", image_url) as response:
+        response.raise_for_status()
+        declared = int(response.headers.get("Content-Length") or 0)
+        if declared > max_bytes:
+            raise ImageTooLargeError(f"{image_url} is {declared} bytes (limit {max_bytes})")
+
+        buffer = bytearray()
+        async for chunk in response.aiter_bytes():
+            buffer.extend(chunk)
+            if len(buffer) > max_bytes:
+                raise ImageTooLargeError(f"{image_url} exceeds {max_bytes} bytes")
+        return bytes(buffer)
+
+
+def download_image_sync(image_url: str, max_bytes: int = IMAGE_MAX_BYTES) -> bytes:
+    """Blocking variant of download_image() for synchronous callers"""
+    with _get_http_session().get(image_url, stream=True, timeout=(5, 20)) as response:
+        response.raise_for_status()
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            buffer.extend(chunk)
+            if len(buffer) > max_bytes:
+                raise ImageTooLargeError(f"{image_url} exceeds {max_bytes} bytes")
+        return bytes(buffer)
+
+
+# ============================================================================
+# Pipeline
+# ============================================================================
+
+async def prepare_image(image_url: str) -> Optional[PreparedImage]:
+    """
+    Download, downscale, hash and encode one image (cached on disk).
+
+    Returns:
+        The prepared image, or None if it could not be downloaded or decoded
+    """
+    try:
+        data = await asyncio.to_thread(_read_cache, image_url)
+        if data is None:
+            raw = await download_image(image_url)
+            data = await asyncio.to_thread(downscale_image, raw)
+            await asyncio.to_thread(_write_cache, image_url, data)
+        image_hash = await asyncio.to_thread(phash, data)
+    except Exception as e:
+        print(f"⚠️  Failed to prepare image {image_url}: {e}")
+        return None
+    return PreparedImage(to_data_uri(data), image_hash)
+
+
+async def prepare_images(
+    image_urls: Iterable[str],
+    concurrency: int = IMAGE_CONCURRENCY,
+) -> Dict[str, Optional[PreparedImage]]:
+    """
+    Prepare many images concurrently (duplicate URLs are fetched once).
+
+    Returns:
+        Mapping of URL to prepared image (None for images that failed)
+    """
+    urls = list(dict.fromkeys(url for url in image_urls if url))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def prepare(url: str) -> Optional[PreparedImage]:
+        async with semaphore:
+            return await prepare_image(url)
+
+    results = await asyncio.gather(*(prepare(url) for url in urls))
+    return dict(zip(urls, results))
+
+
+def prepare_image_sync(image_url: str) -> str:
+    """
+    Blocking variant of prepare_image() for synchronous callers.
+
+    Raises:
+        Exception: If the image cannot be downloaded or decoded
+    """
+    data = _read_cache(image_url)
+    if data is None:
+        data = downscale_image(download_image_sync(image_url))
+        _write_cache(image_url, data)
+    return to_data_uri(data)
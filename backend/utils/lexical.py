@@ -0,0 +1,198 @@
+"""
+In-process lexical (BM25) index over the product catalog.
+
+Dense Cohere vectors are good at "find products that feel like this video",
+but poor at exact lookups such as a SKU, a brand or a model number, and every
+vector query costs an embedding call. This index scores products by term
+overlap on title, vendor and body_html so those lookups can be answered
+locally, and its ranking can be fused with the vector ranking through
+reciprocal-rank fusion.
+
+Usage:
+    from utils.lexical import BM25Index, reciprocal_rank_fusion
+
+    index = BM25Index()
+    index.upsert("42", {"title": "Burton Custom 158", "vendor": "Burton"})
+
+    hits = index.search("burton custom", top_k=5)
+    fused = reciprocal_rank_fusion([h.id for h in hits], vector_ids)
+"""
+import html
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Field weights applied to term frequencies (a light-weight BM25F)
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "vendor": 2.0,
+    "body_html": 1.0,
+}
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in",
+    "is", "it", "of", "on", "or", "that", "the", "this", "to", "with",
+}
+
+_TAG_RE = re.compile(r"<[^>]+>")
+# Keeps compound tokens such as SKUs ("sb-2024-x") or sizes ("10.5") together
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[-_./]")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Lowercase, strip HTML and split text into search terms.
+
+    Compound tokens are emitted whole and as their parts, so "SB-2024-X"
+    matches both an exact SKU query and a query for "sb 2024".
+    """
+    if not text:
+        return []
+
+    text = html.unescape(_TAG_RE.sub(" ", text)).lower()
+    terms = []
+    for token in _TOKEN_RE.findall(text):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        parts = _SPLIT_RE.split(token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p and p not in STOPWORDS)
+    return terms
+
+
+class LexicalHit(NamedTuple):
+    id: str
+    score: float
+    matched_terms: int  # distinct query terms found in the document
+    query_terms: int    # distinct terms in the query
+
+
+class BM25Index:
+    """
+    Incrementally maintained BM25 index.
+
+    Documents can be upserted and removed one at a time, so catalog syncs keep
+    the index current without rebuilding it. All methods are thread-safe.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.built_at = time.time()
+        self._lock = threading.RLock()
+        self._term_freqs: Dict[str, Counter] = {}
+        self._lengths: Dict[str, float] = {}
+        self._metadata: Dict[str, dict] = {}
+        self._postings: Dict[str, set] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._term_freqs)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._term_freqs
+
+    def get_metadata(self, doc_id: str) -> Optional[dict]:
+        """Metadata stored alongside a document"""
+        return self._metadata.get(doc_id)
+
+    def upsert(self, doc_id: str, metadata: dict) -> None:
+        """Add a document, replacing any previous version with the same id"""
+        term_freqs: Counter = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(metadata.get(field)):
+                term_freqs[term] += weight
+        length = sum(term_freqs.values())
+
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._term_freqs[doc_id] = term_freqs
+            self._lengths[doc_id] = length
+            self._metadata[doc_id] = dict(metadata)
+            self._total_length += length
+            for term in term_freqs:
+                self._postings.setdefault(term, set()).add(doc_id)
+
+    def upsert_many(self, documents: Iterable[Tuple[str, dict]]) -> None:
+        """Upsert (doc_id, metadata) pairs"""
+        for doc_id, metadata in documents:
+            self.upsert(doc_id, metadata)
+
+    def remove(self, doc_id: str) -> None:
+        """Remove a document (no-op if it is not indexed)"""
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str) -> None:
+        term_freqs = self._term_freqs.pop(doc_id, None)
+        if term_freqs is None:
+            return
+        self._total_length -= self._lengths.pop(doc_id, 0.0)
+        self._metadata.pop(doc_id, None)
+        for term in term_freqs:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, top_k: int = 10) -> List[LexicalHit]:
+        """
+        Rank documents against a query.
+
+        Returns:
+            Up to top_k hits, best first. Documents that share no term with
+            the query are never returned.
+        """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self._term_freqs)
+            if doc_count == 0:
+                return []
+            avg_length = self._total_length / doc_count or 1.0
+
+            scores: Dict[str, float] = {}
+            matched: Counter = Counter()
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for doc_id in postings:
+                    tf = self._term_freqs[doc_id][term]
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                    matched[doc_id] += 1
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [
+            LexicalHit(doc_id, score, matched[doc_id], len(query_terms))
+            for doc_id, score in ranked
+        ]
+
+
+def reciprocal_rank_fusion(*rankings: Sequence[str], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings of ids with reciprocal-rank fusion.
+
+    Each list contributes 1 / (k + rank) for every id it contains, so ids
+    ranked well by more than one retriever float to the top without having to
+    calibrate BM25 scores against cosine similarities.
+
+    Returns:
+        (id, fused_score) pairs, best first
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))
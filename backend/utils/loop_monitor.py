@@ -0,0 +1,221 @@
+"""
+Event-loop lag monitor and blocking-call detector.
+
+Much of the async code still calls synchronous libraries (requests,
+smtplib, the sync Cohere/Pinecone/genai clients). While one of those runs on
+the event loop, every other request and job on that loop waits.
+
+Two parts, started once per event loop by start_loop_monitor():
+
+- Lag: a task sleeps LOOP_MONITOR_INTERVAL_SECONDS and measures how late it
+  wakes up. That delay is what any callback on the loop waits before it
+  runs. Exported as event_loop_lag_seconds (latest) and
+  event_loop_delay_seconds (histogram).
+- Blocking calls (debug mode, LOOP_SLOW_CALLBACK_MS > 0): the loop posts a
+  heartbeat every few ms. A watchdog thread notices when the heartbeat
+  stops for longer than the threshold and captures the loop thread's stack
+  while the callback is still running. When the loop comes back, the
+  episode is logged with that stack and charged to the innermost
+  application frame (the call site into the sync library). hotspots() ranks
+  the sites by total blocked time. The API serves them at /debug/loop.
+
+Usage:
+    monitor = start_loop_monitor("api")
+    ...
+    monitor.hotspots()
+    await stop_loop_monitor()
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from utils.metrics import (
+    event_loop_blocked_seconds_total,
+    event_loop_blocked_total,
+    event_loop_delay_seconds,
+    event_loop_lag_seconds,
+)
+
+LOOP_MONITOR_INTERVAL_SECONDS = float(os.getenv("LOOP_MONITOR_INTERVAL_SECONDS", "0.5"))
+# Debug mode: log callbacks that hold the loop longer than this (0 = off)
+LOOP_SLOW_CALLBACK_MS = float(os.getenv("LOOP_SLOW_CALLBACK_MS", "0"))
+LOOP_STACK_DEPTH = int(os.getenv("LOOP_STACK_DEPTH", "12"))
+
+# Frames in these places are libraries, not the call site we want to blame
+_LIBRARY_PREFIXES = tuple({sys.prefix, sys.base_prefix, os.path.dirname(os.__file__)})
+_LIBRARY_MARKERS = ("site-packages", "dist-packages", "<frozen")
+
+_monitors: Dict[int, "LoopMonitor"] = {}
+
+
+def _is_library(filename: str) -> bool:
+    return filename.startswith(_LIBRARY_PREFIXES) or any(m in filename for m in _LIBRARY_MARKERS)
+
+
+def blocking_site(stack: List[traceback.FrameSummary]) -> str:
+    """'file:line function' of the innermost application frame in a stack"""
+    for frame in reversed(stack):
+        if not _is_library(frame.filename) and not frame.filename.endswith("loop_monitor.py"):
+            return f"{os.path.relpath(frame.filename)}:{frame.lineno} {frame.name}"
+    if stack:
+        frame = stack[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "unknown"
+
+
+class LoopMonitor:
+    """Measures lag on one event loop and, in debug mode, catches blocking callbacks"""
+
+    def __init__(
+        self,
+        process: str,
+        interval: float = LOOP_MONITOR_INTERVAL_SECONDS,
+        slow_callback_ms: float = LOOP_SLOW_CALLBACK_MS,
+    ):
+        self.process = process
+        self.interval = interval
+        self.slow_callback_ms = slow_callback_ms
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._hotspots: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._heartbeat: Optional[asyncio.TimerHandle] = None
+        self._last_beat = time.perf_counter()
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def debug(self) -> bool:
+        return self.slow_callback_ms > 0
+
+    @property
+    def _beat_interval(self) -> float:
+        return self.slow_callback_ms / 4000
+
+    # ---- lag ----
+
+    async def _measure(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.record_lag(max(time.perf_counter() - start - self.interval, 0.0))
+
+    def record_lag(self, lag: float) -> None:
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        event_loop_lag_seconds.labels(process=self.process).set(lag)
+        event_loop_delay_seconds.labels(process=self.process).observe(lag)
+
+    # ---- blocking callbacks (debug mode) ----
+
+    def _beat(self):
+        self._last_beat = time.perf_counter()
+        self._heartbeat = self._loop.call_later(self._beat_interval, self._beat)
+
+    def _watch(self):
+        """Watchdog thread: snapshot the loop thread's stack while it is blocked"""
+        threshold = self.slow_callback_ms / 1000
+        episode = None  # (heartbeat it stalled after, stack)
+        while not self._stopped.wait(self._beat_interval):
+            last_beat = self._last_beat
+            if episode is None:
+                if time.perf_counter() - last_beat > threshold:
+                    frame = sys._current_frames().get(self._loop_thread)
+                    if frame is not None:
+                        episode = (last_beat, traceback.extract_stack(frame)[-LOOP_STACK_DEPTH:])
+            elif last_beat != episode[0]:
+                # The loop is back: the heartbeat that was due ran late by ~the block
+                self.record_block(last_beat - episode[0] - self._beat_interval, episode[1])
+                episode = None
+
+    def record_block(self, seconds: float, stack: List[traceback.FrameSummary]) -> str:
+        """Log one blocking episode and charge it to its call site"""
+        site = blocking_site(stack)
+        with self._lock:
+            spot = self._hotspots.setdefault(site, {"site": site, "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            spot["count"] += 1
+            spot["total_ms"] += seconds * 1000
+            spot["max_ms"] = max(spot["max_ms"], seconds * 1000)
+            spot["stack"] = traceback.format_list(stack)
+        event_loop_blocked_total.labels(process=self.process, site=site).inc()
+        event_loop_blocked_seconds_total.labels(process=self.process, site=site).inc(seconds)
+        print(f"⚠️  Event loop ({self.process}) blocked ~{seconds * 1000:.0f}ms at {site}\n"
+              + "".join(traceback.format_list(stack)))
+        return site
+
+    def hotspots(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Blocking call sites ranked by total blocked time"""
+        with self._lock:
+            spots = [dict(spot) for spot in self._hotspots.values()]
+        spots.sort(key=lambda spot: spot["total_ms"], reverse=True)
+        for spot in spots:
+            spot["total_ms"] = round(spot["total_ms"], 1)
+            spot["max_ms"] = round(spot["max_ms"], 1)
+        return spots[:limit]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "process": self.process,
+            "lag_ms": round(self.lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "interval_s": self.interval,
+            "debug": self.debug,
+            "slow_callback_ms": self.slow_callback_ms,
+            "hotspots": self.hotspots(),
+        }
+
+    # ---- lifecycle ----
+
+    def start(self) -> "LoopMonitor":
+        """Start monitoring the running loop (call from inside it)"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.create_task(self._measure())
+        if self.debug:
+            self._beat()
+            self._watchdog = threading.Thread(target=self._watch, name=f"loop-watchdog-{self.process}", daemon=True)
+            self._watchdog.start()
+        return self
+
+    async def stop(self):
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def start_loop_monitor(process: str, **kwargs) -> LoopMonitor:
+    """Monitor the running loop, once per loop (embedded workers share the API's)"""
+    loop = asyncio.get_running_loop()
+    monitor = _monitors.get(id(loop))
+    if monitor is None:
+        monitor = _monitors[id(loop)] = LoopMonitor(process, **kwargs).start()
+        mode = f", logging callbacks over {monitor.slow_callback_ms:.0f}ms" if monitor.debug else ""
+        print(f"⏱️  Event loop monitor started for {process}{mode}")
+    return monitor
+
+
+def get_loop_monitor() -> Optional[LoopMonitor]:
+    try:
+        return _monitors.get(id(asyncio.get_running_loop()))
+    except RuntimeError:
+        return None
+
+
+async def stop_loop_monitor():
+    monitor = _monitors.pop(id(asyncio.get_running_loop()), None)
+    if monitor is not None:
+        await monitor.stop()
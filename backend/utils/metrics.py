@@ -13,6 +13,9 @@ Usage:
 
     async with track_external_api("youtube"):
         result = await youtube_api.search(...)
+
+Every route is covered by request_metrics_middleware, registered in API.py;
+track_request is only needed for handlers outside the router.
 """
 import time
 from functools import wraps
@@ -27,6 +30,8 @@ from prometheus_client import (
     CONTENT_TYPE_LATEST,
 )
 
+from utils.timing import server_timing_header, start_timing, stop_timing
+
 
 # ============================================================================
 # API METRICS
@@ -70,10 +75,32 @@ external_api_calls_total = Counter(
 external_api_duration_seconds = Histogram(
     "external_api_duration_seconds",
     "External API call duration in seconds",
-    ["service"],
+    ["service", "operation"],  # operation: e.g. search.list, embed, generate_content
     buckets=[0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
 )
 
+# Failed external calls by exception class
+external_api_errors_total = Counter(
+    "external_api_errors_total",
+    "External API calls that raised, by error class",
+    ["service", "error"]
+)
+
+# Request and response body sizes
+external_api_payload_bytes = Histogram(
+    "external_api_payload_bytes",
+    "External API payload size in bytes",
+    ["service", "direction"],  # direction: request, response
+    buckets=[256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+)
+
+# Quota spent: YouTube units, Gemini tokens, Cohere inputs, Pinecone vectors
+external_api_quota_units_total = Counter(
+    "external_api_quota_units_total",
+    "Quota units spent on external APIs",
+    ["service"]
+)
+
 # Remaining quota gauge (updated periodically)
 external_api_quota_remaining = Gauge(
     "external_api_quota_remaining",
@@ -82,15 +109,59 @@ external_api_quota_remaining = Gauge(
 )
 
 
+# ============================================================================
+# TENANT USAGE METRICS
+# ============================================================================
+
+# External calls charged to some company (utils.usage). Per-company totals
+# live in the usage:{company_id}:* Redis hashes; a company_id label would
+# grow without bound with the tenant count
+tenant_api_calls_total = Counter(
+    "tenant_api_calls_total",
+    "External API calls charged to a company",
+    ["service"]
+)
+
+# Quota units charged to some company
+tenant_api_units_total = Counter(
+    "tenant_api_units_total",
+    "External API quota units charged to a company",
+    ["service"]
+)
+
+
 # ============================================================================
 # JOB QUEUE METRICS
 # ============================================================================
 
-# Job queue depth
+# Job queue depth, sampled from each lane's queue (jobs.instrumentation)
 job_queue_depth = Gauge(
     "job_queue_depth",
     "Number of jobs in queue",
-    ["queue_name", "status"]  # status: pending, active, completed, failed
+    ["queue_name", "status"]  # status: pending, deferred, active
+)
+
+# Age of the oldest job that is runnable but not yet picked up
+job_queue_oldest_pending_seconds = Gauge(
+    "job_queue_oldest_pending_seconds",
+    "Seconds the oldest runnable job has been waiting",
+    ["queue_name"]
+)
+
+# From the job becoming runnable (its queue score, so deliberate deferrals
+# don't count) until a worker starts it; job_wait_seconds per job type
+job_start_latency_seconds = Histogram(
+    "job_start_latency_seconds",
+    "Time from a job becoming runnable until a worker starts it",
+    ["queue_name", "job_type"],
+    buckets=[0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600]
+)
+
+# Attempts after the first that actually ran
+job_retries_total = Counter(
+    "job_retries_total",
+    "Job attempts beyond the first",
+    ["job_type"]
 )
 
 # Job processing duration
@@ -101,11 +172,123 @@ job_processing_duration_seconds = Histogram(
     buckets=[1, 5, 10, 30, 60, 120, 300, 600, 1800]
 )
 
+# Time a job sat runnable in its lane before a worker picked it up
+job_wait_seconds = Histogram(
+    "job_wait_seconds",
+    "Time from a job becoming runnable until a worker starts it",
+    ["lane"],  # lane: interactive, outreach, bulk
+    buckets=[0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800]
+)
+
 # Total jobs processed
 jobs_total = Counter(
     "jobs_total",
     "Total jobs processed",
-    ["job_type", "status"]  # status: success, failure, retry
+    ["job_type", "status"]  # status: success, failure, retry, deferred
+)
+
+
+# ============================================================================
+# DISTRIBUTED LOCK METRICS
+# ============================================================================
+
+# Acquisition attempts that found the lock held by another owner
+lock_contention_total = Counter(
+    "lock_contention_total",
+    "Lock acquisition attempts that found the lock already held",
+    ["resource"]  # resource: lock name prefix, e.g. "video", "discovery"
+)
+
+# Time from the first acquisition attempt until the lock was taken or given up
+lock_wait_seconds = Histogram(
+    "lock_wait_seconds",
+    "Time spent waiting to acquire a distributed lock",
+    ["resource", "outcome"],  # outcome: acquired, timeout
+    buckets=[0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60]
+)
+
+# Locks whose lease expired or was taken over while still held
+lock_lost_total = Counter(
+    "lock_lost_total",
+    "Locks lost before release (lease renewal failed)",
+    ["resource"]
+)
+
+
+# ============================================================================
+# SHARD OWNERSHIP METRICS
+# ============================================================================
+
+# Shard leases this worker currently holds (utils.sharding)
+shard_leases_owned = Gauge(
+    "shard_leases_owned",
+    "Shard leases held by this worker",
+    ["group"]
+)
+
+# Shards changing hands as workers join or leave
+shard_handoffs_total = Counter(
+    "shard_handoffs_total",
+    "Shard leases claimed or released during rebalancing",
+    ["group", "direction"]  # direction: claimed, released
+)
+
+
+# ============================================================================
+# EVENT LOOP METRICS
+# ============================================================================
+
+# How late the loop monitor's timer fired on its last tick (utils.loop_monitor)
+event_loop_lag_seconds = Gauge(
+    "event_loop_lag_seconds",
+    "Latest event loop scheduling delay",
+    ["process"]  # process: api, worker:<lane>
+)
+
+event_loop_delay_seconds = Histogram(
+    "event_loop_delay_seconds",
+    "Event loop scheduling delay",
+    ["process"],
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5]
+)
+
+# Callbacks that held the loop past LOOP_SLOW_CALLBACK_MS (debug mode only)
+event_loop_blocked_total = Counter(
+    "event_loop_blocked_total",
+    "Callbacks that blocked the event loop, by call site",
+    ["process", "site"]  # site: innermost application frame, "file:line function"
+)
+
+event_loop_blocked_seconds_total = Counter(
+    "event_loop_blocked_seconds_total",
+    "Time the event loop spent blocked, by call site",
+    ["process", "site"]
+)
+
+
+# ============================================================================
+# RESPONSE CACHE METRICS
+# ============================================================================
+
+# Lookups against the two-tier response cache (utils.cache)
+cache_requests_total = Counter(
+    "cache_requests_total",
+    "Response cache lookups",
+    ["endpoint", "result"]  # result: local_hit, redis_hit, stale_hit, miss, coalesced, bypass
+)
+
+# Background refreshes of stale entries (stale-while-revalidate)
+cache_refreshes_total = Counter(
+    "cache_refreshes_total",
+    "Background refreshes of stale cache entries",
+    ["endpoint", "outcome"]  # outcome: success, failure, skipped (another instance held the lock)
+)
+
+# Tag invalidations and the number of cached entries they removed
+cache_invalidations_total = Counter(
+    "cache_invalidations_total",
+    "Cache entries removed by tag invalidation",
+    ["tag_kind"]  # tag_kind: tag without ids, e.g. "company:partnerships"
 )
 
 
@@ -195,26 +378,20 @@ def track_request(endpoint: str, method: str = "GET"):
 
 
 @asynccontextmanager
-async def track_external_api(service: str):
+async def track_external_api(service: str, operation: str = "call"):
     """
     Context manager to track external API calls.
 
+    Records the same span and metrics as utils.tracing.external_call.
+
     Usage:
-        async with track_external_api("youtube"):
+        async with track_external_api("youtube", "search.list") as span:
             result = await youtube_api.search(keyword)
     """
-    start_time = time.time()
-    status = "success"
+    from utils.tracing import external_call
 
-    try:
-        yield
-    except Exception as e:
-        status = "error"
-        raise
-    finally:
-        duration = time.time() - start_time
-        external_api_calls_total.labels(service=service, status=status).inc()
-        external_api_duration_seconds.labels(service=service).observe(duration)
+    with external_call(service, operation) as span:
+        yield span
 
 
 def track_job(job_type: str):
@@ -249,6 +426,70 @@ def track_job(job_type: str):
     return decorator
 
 
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(router, request) -> str:
+    """
+    The route pattern a request matches, e.g. "/partnerships/{id}".
+
+    Labels use the template rather than the raw path so cardinality stays
+    bounded; paths no route matches (or only the "*" fallback) share a
+    single label.
+    """
+    try:
+        match = router.get_match(request)
+    except Exception:
+        match = None
+    if match is None:
+        return UNMATCHED_ROUTE
+    pattern = match.pattern
+    pattern = pattern.decode() if isinstance(pattern, bytes) else str(pattern)
+    return UNMATCHED_ROUTE if pattern == "*" else pattern
+
+
+def request_metrics_middleware(router):
+    """
+    BlackSheep middleware recording the api_* metrics for every route and
+    adding a Server-Timing header with Supabase, Redis and external-API time.
+
+    Usage:
+        app.middlewares.append(request_metrics_middleware(app.router))
+    """
+    async def middleware(request, handler):
+        endpoint = route_template(router, request)
+        method = request.method
+        api_active_requests.labels(endpoint=endpoint).inc()
+        token = start_timing()
+        start_time = time.perf_counter()
+        status = "500"
+
+        try:
+            response = await handler(request)
+            status = str(response.status)
+            timing = server_timing_header(stop_timing(token), time.perf_counter() - start_time)
+            token = None
+            response.add_header(b"Server-Timing", timing.encode())
+            return response
+        except Exception as e:
+            # HTTPException carries its own status; anything else becomes a 500
+            status = str(getattr(e, "status", 500))
+            raise
+        finally:
+            if token is not None:
+                stop_timing(token)
+            duration = time.perf_counter() - start_time
+            api_requests_total.labels(method=method, endpoint=endpoint, status=status).inc()
+            api_request_duration_seconds.labels(method=method, endpoint=endpoint).observe(duration)
+            api_active_requests.labels(endpoint=endpoint).dec()
+
+    return middleware
+
+
 # ============================================================================
 # UPDATE FUNCTIONS
 # ============================================================================
@@ -340,6 +581,11 @@ def record_job_enqueued(job_type: str):
     job_queue_depth.labels(queue_name="maatchaa:jobs", status="pending").inc()
 
 
+def record_job_wait(lane: str, seconds: float):
+    """Record how long a job waited in its lane."""
+    job_wait_seconds.labels(lane=lane).observe(seconds)
+
+
 def record_job_started(job_type: str):
     """Record a job starting execution."""
     job_queue_depth.labels(queue_name="maatchaa:jobs", status="pending").dec()
@@ -0,0 +1,202 @@
+"""
+On-demand CPU sampling and allocation profiling.
+
+Nothing here runs until a profile is requested, so leaving it in
+production costs nothing. A request then runs for a bounded time:
+
+- sample_cpu(seconds) starts a thread that reads every other thread's
+  Python stack (sys._current_frames) every PROFILE_INTERVAL_MS. It
+  aggregates identical stacks. The profiled code isn't instrumented, so
+  overhead is one stack walk per thread per tick, in a thread that sleeps
+  in between. The result renders as collapsed stacks (flamegraph.pl,
+  speedscope, inferno) or as a speedscope JSON file.
+- sample_allocations(seconds) runs tracemalloc for the window and returns
+  the source lines whose allocations grew the most. tracemalloc slows
+  allocation-heavy code down noticeably while it runs, and is stopped
+  again afterwards unless it was already running.
+
+Only one profile runs per process at a time (profile_lock).
+
+The API exposes both at /debug/profile and /debug/allocations. An ARQ
+worker is profiled by enqueueing profile_job onto its lane
+(jobs.tasks.profile_job).
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1"))
+
+FORMATS = ("collapsed", "speedscope")
+
+# Innermost frames of a thread that is waiting rather than working
+_IDLE_FILES = ("selectors.py", "threading.py", "queue.py")
+
+Frame = Tuple[str, str, int]  # (function, file, line)
+
+profile_lock = asyncio.Lock()
+
+
+def clamp_seconds(seconds: float) -> float:
+    return min(max(float(seconds), 0.1), PROFILE_MAX_SECONDS)
+
+
+def _walk(frame) -> Tuple[Frame, ...]:
+    """Outermost-first stack of a frame, without touching source files"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, frame.f_lineno))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def _is_idle(stack: Tuple[Frame, ...]) -> bool:
+    return not stack or stack[-1][1].endswith(_IDLE_FILES)
+
+
+class CpuProfile:
+    """Aggregated stack samples from sample_cpu"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()  # (thread name, stack) -> count
+        self.duration = 0.0
+        self.ticks = 0
+
+    def collapsed(self) -> str:
+        """One "thread;outer;...;inner count" line per distinct stack"""
+        lines = []
+        for (thread, stack), count in self.samples.most_common():
+            frames = ";".join(f"{name} ({os.path.basename(path)}:{line})" for name, path, line in stack)
+            lines.append(f"{thread};{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "maatchaa") -> Dict[str, Any]:
+        """The profile in speedscope's file format, one sampled profile per thread"""
+        frames: List[Dict[str, Any]] = []
+        index: Dict[Frame, int] = {}
+        by_thread: Dict[str, Dict[str, list]] = {}
+        for (thread, stack), count in self.samples.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            profile = by_thread.setdefault(thread, {"samples": [], "weights": []})
+            profile["samples"].append(ids)
+            profile["weights"].append(count * self.interval)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "maatchaa-profiler",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(profile["weights"]),
+                    "samples": profile["samples"],
+                    "weights": profile["weights"],
+                }
+                for thread, profile in sorted(by_thread.items())
+            ],
+        }
+
+    def render(self, fmt: str) -> str:
+        if fmt == "speedscope":
+            return json.dumps(self.speedscope())
+        return self.collapsed()
+
+
+def _sample(seconds: float, interval: float, include_idle: bool) -> CpuProfile:
+    profile = CpuProfile(interval)
+    me = threading.get_ident()
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = _walk(frame)
+            if include_idle or not _is_idle(stack):
+                profile.samples[(names.get(ident, str(ident)), stack)] += 1
+        profile.ticks += 1
+        time.sleep(interval)
+    profile.duration = time.perf_counter() - start
+    return profile
+
+
+async def sample_cpu(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS,
+                     include_idle: bool = False) -> CpuProfile:
+    """Sample every thread's stack for `seconds` (capped at PROFILE_MAX_SECONDS)"""
+    return await asyncio.to_thread(_sample, clamp_seconds(seconds), interval_ms / 1000, include_idle)
+
+
+async def sample_allocations(seconds: float, limit: int = 30) -> Dict[str, Any]:
+    """Source lines whose live allocations grew most during the window"""
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(clamp_seconds(seconds))
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    ignore = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ]
+    diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+    return {
+        "seconds": clamp_seconds(seconds),
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "top": [
+            {
+                "file": stat.traceback[0].filename,
+                "line": stat.traceback[0].lineno,
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in diff[:limit]
+        ],
+    }
+
+
+async def run_profile(mode: str, seconds: float, fmt: str = "collapsed",
+                      limit: int = 30) -> Optional[Dict[str, Any]]:
+    """
+    One profile of this process, or None if another is already running.
+
+    Returns {"mode", "format", "content"} for CPU profiles and the
+    sample_allocations result (plus "mode") for memory.
+    """
+    if profile_lock.locked():
+        return None
+    async with profile_lock:
+        if mode == "memory":
+            return {"mode": mode, **await sample_allocations(seconds, limit=limit)}
+        profile = await sample_cpu(seconds)
+        print(f"🔬 CPU profile: {profile.ticks} ticks, {sum(profile.samples.values())} samples "
+              f"over {profile.duration:.1f}s")
+        return {"mode": "cpu", "format": fmt, "content": profile.render(fmt)}
@@ -0,0 +1,298 @@
+"""
+Compact local storage for embedding vectors.
+
+An embed-english-v3.0 vector held as a Python list of floats (the
+EmbeddingItem shape) costs roughly 32KB once every float is boxed. This store
+keeps vectors in contiguous NumPy arrays instead, optionally quantized:
+
+    float32  4 bytes/dim   exact cosine scores                (~4KB/vector)
+    int8     1 byte/dim    per-vector scale, ~exact ranking   (~1KB/vector)
+    binary   1 bit/dim     sign bits, hamming distance        (~128B/vector)
+
+Quantized stores keep only their compact codes by default. Searches can
+re-score their top candidates with the original float vectors when asked:
+rescore_path keeps those floats in a memory-mapped file on disk, so a large
+mirror still only keeps the codes resident, and keep_float=True holds them in
+memory instead.
+
+Usage:
+    from utils.quantized import QuantizedVectorStore
+    from utils.vectordb import iter_catalog
+
+    store = QuantizedVectorStore.from_items(
+        iter_catalog(include_values=True),
+        quantization="binary",
+        rescore_path="/tmp/catalog.f32",
+    )
+    hits = store.search(query_vector, top_k=10)   # [(id, score), ...]
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+QUANTIZATIONS = ("float32", "int8", "binary")
+
+# Number of set bits for every byte value, used for hamming distances on
+# NumPy releases without np.bitwise_count (added in 2.0)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+# Rows scored per chunk so temporary arrays stay small on large stores
+_CHUNK_ROWS = 4096
+
+
+def _hamming(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """Hamming distance between each row of packed codes and a packed query"""
+    if codes.shape[1] % 8 == 0:
+        # XOR eight bytes at a time
+        codes = codes.view(np.uint64)
+        query_bits = query_bits.view(np.uint64)
+    diff = np.bitwise_xor(codes, query_bits)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT[diff.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+class QuantizedVectorStore:
+    """
+    In-memory vector mirror with float32, int8 or binary codes.
+
+    Vectors are L2-normalised on insert, so scores are cosine similarities.
+    Adding an id that already exists overwrites its row.
+    """
+
+    def __init__(
+        self,
+        dim: int = 1024,
+        quantization: str = "int8",
+        keep_float: bool = False,
+        rescore_path: Optional[str] = None,
+        initial_capacity: int = 1024,
+    ):
+        """
+        Args:
+            dim: Vector dimension (1024 for embed-english-v3.0)
+            quantization: "float32", "int8" or "binary"
+            keep_float: Keep float vectors in memory for re-scoring
+                quantized results (float32 stores always keep them)
+            rescore_path: Store the re-scoring floats in a memory-mapped
+                file at this path instead of in memory
+            initial_capacity: Rows to allocate up front (grows by doubling)
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of: {', '.join(QUANTIZATIONS)}")
+
+        self.dim = dim
+        self.quantization = quantization
+        self.rescore_path = rescore_path
+        self.keep_float = keep_float or rescore_path is not None or quantization == "float32"
+
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._capacity = 0
+        self._valid = np.zeros(0, dtype=bool)
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._floats: Optional[np.ndarray] = None
+        self._grow(max(1, initial_capacity))
+
+    @classmethod
+    def from_items(cls, items: Iterable[dict], **kwargs) -> "QuantizedVectorStore":
+        """Build a store from EmbeddingItem-style dicts ({"id", "values"})"""
+        store = None
+        batch_ids: List[str] = []
+        batch_values: List[Sequence[float]] = []
+        for item in items:
+            if store is None:
+                kwargs.setdefault("dim", len(item["values"]))
+                store = cls(**kwargs)
+            batch_ids.append(item["id"])
+            batch_values.append(item["values"])
+            if len(batch_ids) >= 1000:
+                store.add(batch_ids, batch_values)
+                batch_ids, batch_values = [], []
+        if store is None:
+            return cls(**kwargs)
+        if batch_ids:
+            store.add(batch_ids, batch_values)
+        return store
+
+    def __len__(self) -> int:
+        return int(self._valid[:len(self._ids)].sum())
+
+    def __contains__(self, vector_id: str) -> bool:
+        row = self._rows.get(vector_id)
+        return row is not None and bool(self._valid[row])
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _allocate_floats(self, capacity: int) -> np.ndarray:
+        if self.rescore_path is None:
+            return np.zeros((capacity, self.dim), dtype=np.float32)
+
+        mode = "r+" if self._floats is not None and os.path.exists(self.rescore_path) else "w+"
+        if mode == "r+":
+            self._floats.flush()
+            with open(self.rescore_path, "r+b") as f:
+                f.truncate(capacity * self.dim * 4)
+        return np.memmap(self.rescore_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+
+    def _grow(self, capacity: int) -> None:
+        old_rows = len(self._ids)
+
+        def resized(array: Optional[np.ndarray], shape: tuple, dtype) -> np.ndarray:
+            fresh = np.zeros(shape, dtype=dtype)
+            if array is not None and old_rows:
+                fresh[:old_rows] = array[:old_rows]
+            return fresh
+
+        if self.quantization == "binary":
+            self._codes = resized(self._codes, (capacity, (self.dim + 7) // 8), np.uint8)
+        elif self.quantization == "int8":
+            self._codes = resized(self._codes, (capacity, self.dim), np.int8)
+            self._scales = resized(self._scales, (capacity,), np.float32)
+
+        if self.keep_float:
+            if self.rescore_path is not None:
+                self._floats = self._allocate_floats(capacity)
+            else:
+                self._floats = resized(self._floats, (capacity, self.dim), np.float32)
+
+        self._valid = resized(self._valid, (capacity,), bool)
+        self._capacity = capacity
+
+    def _normalise(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix[None, :]
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"expected vectors of dimension {self.dim}, got {matrix.shape[1]}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def add(self, ids: Sequence[str], vectors) -> None:
+        """Insert or overwrite vectors"""
+        matrix = self._normalise(vectors)
+        if len(ids) != len(matrix):
+            raise ValueError("ids and vectors must have the same length")
+
+        rows = []
+        for vector_id in ids:
+            row = self._rows.get(vector_id)
+            if row is None:
+                row = len(self._ids)
+                if row >= self._capacity:
+                    self._grow(self._capacity * 2)
+                self._ids.append(vector_id)
+                self._rows[vector_id] = row
+            rows.append(row)
+        rows = np.asarray(rows)
+
+        if self.quantization == "binary":
+            self._codes[rows] = np.packbits(matrix > 0, axis=1)
+        elif self.quantization == "int8":
+            scales = np.abs(matrix).max(axis=1)
+            scales[scales == 0] = 1.0
+            self._codes[rows] = np.round(matrix / scales[:, None] * 127).astype(np.int8)
+            self._scales[rows] = scales / 127
+        if self.keep_float:
+            self._floats[rows] = matrix
+        self._valid[rows] = True
+
+    def remove(self, vector_id: str) -> None:
+        """Drop a vector from search results (its row is not reused)"""
+        row = self._rows.get(vector_id)
+        if row is not None:
+            self._valid[row] = False
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """
+        Bytes held by the store's arrays.
+
+        Floats kept in a memory-mapped file are reported under "float_on_disk"
+        because they only occupy page cache while being re-scored.
+        """
+        used = len(self._ids)
+        report = {"codes": 0, "scales": 0, "float": 0, "float_on_disk": 0}
+        if self._codes is not None:
+            report["codes"] = self._codes[:used].nbytes
+        if self._scales is not None:
+            report["scales"] = self._scales[:used].nbytes
+        if self._floats is not None:
+            key = "float_on_disk" if self.rescore_path else "float"
+            report[key] = self._floats[:used].nbytes
+        report["resident"] = report["codes"] + report["scales"] + report["float"]
+        return report
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        used = len(self._ids)
+        scores = np.empty(used, dtype=np.float32)
+
+        if self.quantization == "binary":
+            query_bits = np.packbits(query > 0)
+            for start in range(0, used, _CHUNK_ROWS):
+                end = min(start + _CHUNK_ROWS, used)
+                distances = _hamming(self._codes[start:end], query_bits)
+                # Agreeing sign bits, rescaled to [-1, 1]
+                scores[start:end] = 1.0 - 2.0 * distances / self.dim
+        elif self.quantization == "int8":
+            for start in range(0, used, _CHUNK_ROWS):
+                end = min(start + _CHUNK_ROWS, used)
+                dots = self._codes[start:end].astype(np.float32) @ query
+                scores[start:end] = dots * self._scales[start:end]
+        else:
+            for start in range(0, used, _CHUNK_ROWS):
+                end = min(start + _CHUNK_ROWS, used)
+                scores[start:end] = self._floats[start:end] @ query
+
+        scores[~self._valid[:used]] = -np.inf
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def search(
+        self,
+        query,
+        top_k: int = 10,
+        rescore: bool = True,
+        rescore_factor: int = 4,
+    ) -> List[Tuple[str, float]]:
+        """
+        Return the top_k (id, score) pairs for a query vector.
+
+        Args:
+            query: Query vector
+            top_k: Number of results
+            rescore: Re-score quantized candidates with float vectors, if
+                the store keeps them (keep_float or rescore_path)
+            rescore_factor: Candidates fetched per result before re-scoring
+        """
+        if not self._ids:
+            return []
+
+        query_vector = self._normalise(query)[0]
+        scores = self._approximate_scores(query_vector)
+
+        if rescore and self.quantization != "float32" and self.keep_float:
+            candidates = self._top(scores, top_k * max(1, rescore_factor))
+            candidates = candidates[np.isfinite(scores[candidates])]
+            exact = np.asarray(self._floats[np.sort(candidates)] @ query_vector)
+            order = np.argsort(-exact, kind="stable")[:top_k]
+            rows = np.sort(candidates)[order]
+            return [(self._ids[row], float(exact[i])) for row, i in zip(rows, order)]
+
+        rows = self._top(scores, top_k)
+        return [(self._ids[row], float(scores[row])) for row in rows if np.isfinite(scores[row])]
@@ -1,40 +1,65 @@
 """
 Redis client for caching, rate limiting, and distributed locks.
-Uses Upstash Redis REST API for serverless compatibility with Cloud Run.
+
+Commands go through a pluggable transport:
+- RestTransport (default) talks to the Upstash Redis REST API, which suits
+  serverless deployments like Cloud Run where persistent connections are
+  problematic.
+- NativeTransport speaks the Redis protocol over a connection pool. When the
+  ARQ job queue is connected, it reuses ARQ's pool instead of opening its own.
+
+Select one with REDIS_TRANSPORT=rest|native|auto ("auto" uses the native
+protocol whenever a Redis URL is configured). Both transports return results
+in the same shape (strings, integers, lists, None), so everything above them
+is transport-agnostic.
+
+Helpers that need several commands send them together through
+RedisClient.pipeline(), which maps to Upstash's /pipeline and /multi-exec
+endpoints (or a native MULTI/EXEC pipeline), so each operation costs a single
+round-trip.
 """
 import os
 import json
 import hashlib
-from typing import Optional, Any, Callable, TypeVar
-from functools import wraps
+import asyncio
+import random
+import secrets
+import time
+from typing import Optional, Any, List, Tuple, TypeVar
 import httpx
 from dotenv import load_dotenv
 
+from utils.metrics import lock_contention_total, lock_lost_total, lock_wait_seconds
+from utils.timing import timed
+
 load_dotenv()
 
 UPSTASH_REDIS_REST_URL = os.getenv("UPSTASH_REDIS_REST_URL")
 UPSTASH_REDIS_REST_TOKEN = os.getenv("UPSTASH_REDIS_REST_TOKEN")
+# Same URL the ARQ worker connects to (see jobs.worker.REDIS_URL)
+REDIS_URL = os.getenv("UPSTASH_REDIS_URL") or os.getenv("REDIS_URL")
+REDIS_TRANSPORT = os.getenv("REDIS_TRANSPORT", "rest").lower()
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
 
 T = TypeVar('T')
 
 
-class RedisClient:
-    """
-    Async Redis client using Upstash REST API.
+# ============================================================================
+# TRANSPORTS
+# ============================================================================
 
-    Upstash provides a serverless Redis with HTTP API, perfect for
-    stateless environments like Cloud Run where persistent connections
-    are problematic.
-    """
+class RestTransport:
+    """Upstash REST API: one HTTPS request per command or pipeline"""
+
+    name = "rest"
 
-    def __init__(self):
-        self.url = UPSTASH_REDIS_REST_URL
-        self.token = UPSTASH_REDIS_REST_TOKEN
-        self._client: Optional[httpx.AsyncClient] = None
+    def __init__(self, url: str = None, token: str = None, client: httpx.AsyncClient = None):
+        self.url = url
+        self.token = token
+        self._client = client
 
     @property
     def is_configured(self) -> bool:
-        """Check if Redis is properly configured"""
         return bool(self.url and self.token)
 
     async def _get_client(self) -> httpx.AsyncClient:
@@ -47,10 +72,10 @@ class RedisClient:
             )
         return self._client
 
-    async def _execute(self, *args) -> Any:
-        """Execute a Redis command via REST API"""
+    async def execute(self, *args) -> Tuple[Any, Optional[str]]:
+        """Execute a command, returning (result, error message or None)"""
         if not self.is_configured:
-            return None
+            return None, None
 
         try:
             client = await self._get_client()
@@ -59,19 +84,235 @@ class RedisClient:
             data = response.json()
 
             if "error" in data:
+                return None, str(data["error"])
+
+            return data.get("result"), None
+        except Exception as e:
+            return None, f"connection error: {e}"
+
+    async def execute_pipeline(self, commands: List[list], transaction: bool = False) -> List[Any]:
+        """Send commands to /pipeline (or /multi-exec) in one request"""
+        if not self.is_configured:
+            return [None] * len(commands)
+
+        try:
+            client = await self._get_client()
+            path = "/multi-exec" if transaction else "/pipeline"
+            response = await client.post(path, json=[list(c) for c in commands])
+            data = response.json()
+
+            if isinstance(data, dict) and "error" in data:
                 print(f"Redis error: {data['error']}")
-                return None
+                return [None] * len(commands)
+
+            results = []
+            for entry in data:
+                if "error" in entry:
+                    print(f"Redis error: {entry['error']}")
+                    results.append(None)
+                else:
+                    results.append(entry.get("result"))
+            return results
+        except Exception as e:
+            print(f"Redis connection error: {e}")
+            return [None] * len(commands)
+
+    async def close(self):
+        """Close the HTTP client"""
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
 
-            return data.get("result")
+def _decode(value: Any) -> Any:
+    """Turn a raw RESP reply into the shape the REST API returns (str, not bytes)"""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+class NativeTransport:
+    """
+    Redis protocol over a pooled connection (redis-py asyncio).
+
+    Response callbacks are disabled so replies come back raw ("OK", integers,
+    bulk strings) exactly as the REST API reports them. The pool is either
+    created lazily from `url` or borrowed from another client (the ARQ pool);
+    a borrowed pool is left open on close().
+    """
+
+    name = "native"
+
+    def __init__(self, url: str = None, connection_pool=None, max_connections: int = REDIS_MAX_CONNECTIONS):
+        self.url = url
+        self.max_connections = max_connections
+        self._pool = connection_pool
+        self._owns_pool = connection_pool is None
+        self._client = None
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.url or self._pool)
+
+    def _get_client(self):
+        if self._client is None:
+            import redis.asyncio as aioredis
+
+            if self._pool is None:
+                self._pool = aioredis.ConnectionPool.from_url(
+                    self.url, max_connections=self.max_connections
+                )
+            self._client = aioredis.Redis(connection_pool=self._pool)
+            self._client.response_callbacks.clear()
+        return self._client
+
+    async def execute(self, *args) -> Tuple[Any, Optional[str]]:
+        """Execute a command, returning (result, error message or None)"""
+        if not self.is_configured:
+            return None, None
+
+        from redis.exceptions import NoScriptError, ResponseError
+
+        try:
+            return _decode(await self._get_client().execute_command(*args)), None
+        except NoScriptError as e:
+            # redis-py strips the error code; eval() looks for it
+            return None, f"NOSCRIPT {e}"
+        except ResponseError as e:
+            return None, str(e)
+        except Exception as e:
+            return None, f"connection error: {e}"
+
+    async def execute_pipeline(self, commands: List[list], transaction: bool = False) -> List[Any]:
+        """Queue commands on a redis-py pipeline (MULTI/EXEC if transaction)"""
+        if not self.is_configured:
+            return [None] * len(commands)
+
+        try:
+            pipe = self._get_client().pipeline(transaction=transaction)
+            for command in commands:
+                pipe.execute_command(*command)
+            raw = await pipe.execute(raise_on_error=False)
         except Exception as e:
             print(f"Redis connection error: {e}")
+            return [None] * len(commands)
+
+        results = []
+        for entry in raw:
+            if isinstance(entry, Exception):
+                print(f"Redis error: {entry}")
+                results.append(None)
+            else:
+                results.append(_decode(entry))
+        return results
+
+    async def close(self):
+        """Close the pool if this transport created it"""
+        if self._client is not None:
+            if self._owns_pool:
+                await self._pool.aclose()
+                self._pool = None
+            self._client = None
+
+
+def transport_from_env():
+    """Build the transport selected by REDIS_TRANSPORT"""
+    if REDIS_TRANSPORT == "native" or (REDIS_TRANSPORT == "auto" and REDIS_URL):
+        return NativeTransport(url=REDIS_URL)
+    return RestTransport(url=UPSTASH_REDIS_REST_URL, token=UPSTASH_REDIS_REST_TOKEN)
+
+
+class RedisClient:
+    """
+    Async Redis client over a pluggable transport.
+
+    Defaults to the transport chosen by REDIS_TRANSPORT (Upstash REST unless
+    configured otherwise). Command helpers return the same values whichever
+    transport is in use.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport if transport is not None else transport_from_env()
+
+    @property
+    def is_configured(self) -> bool:
+        """Check if Redis is properly configured"""
+        return self.transport.is_configured
+
+    def use_connection_pool(self, connection_pool):
+        """
+        Switch to the native protocol over an existing redis-py pool, e.g.
+        the ARQ pool's, so the process keeps a single set of connections.
+        """
+        self.transport = NativeTransport(connection_pool=connection_pool)
+
+    async def _execute(self, *args) -> Any:
+        """Execute a Redis command"""
+        result, error = await self._execute_with_error(*args)
+        if error:
+            print(f"Redis error: {error}")
+        return result
+
+    async def _execute_with_error(self, *args) -> Tuple[Any, Optional[str]]:
+        """Execute a command, returning (result, error message or None)"""
+        async with timed("redis"):
+            return await self.transport.execute(*args)
+
+    async def eval(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        """
+        Run a Lua script atomically on the server.
+
+        Sends EVALSHA first, so the script body only crosses the network the
+        first time a server sees it (or after a SCRIPT FLUSH).
+
+        Returns:
+            The script's return value, or None on error
+        """
+        sha = hashlib.sha1(script.encode()).hexdigest()
+        result, error = await self._execute_with_error("EVALSHA", sha, len(keys), *keys, *args)
+        if error and "NOSCRIPT" in error:
+            result, error = await self._execute_with_error("EVAL", script, len(keys), *keys, *args)
+        if error:
+            print(f"Redis script error: {error}")
             return None
+        return result
+
+    async def execute_pipeline(self, commands: List[list], transaction: bool = False) -> List[Any]:
+        """
+        Execute several commands in one round-trip.
+
+        Over REST this uses Upstash's /pipeline endpoint, or /multi-exec when
+        transaction is True (commands then run atomically, with no other
+        client's commands interleaved); natively it is a MULTI/EXEC pipeline.
+
+        Returns:
+            One result per command. A command that failed, or every command
+            if the request failed, yields None.
+        """
+        if not commands:
+            return []
+        async with timed("redis"):
+            return await self.transport.execute_pipeline(commands, transaction=transaction)
+
+    def pipeline(self, transaction: bool = False) -> "Pipeline":
+        """
+        Start a pipeline of queued commands.
+
+        Usage:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.get("a")
+                pipe.ttl("a")
+            value, ttl = pipe.results
+        """
+        return Pipeline(self, transaction=transaction)
 
     async def get(self, key: str) -> Optional[str]:
         """Get a value by key"""
         return await self._execute("GET", key)
 
-    async def set(self, key: str, value: str, ex: int = None) -> bool:
+    async def set(self, key: str, value: str, ex: int = None, nx: bool = False) -> bool:
         """
         Set a key-value pair.
 
@@ -79,11 +320,14 @@ class RedisClient:
             key: The key to set
             value: The value to store
             ex: Optional expiration time in seconds
+            nx: Only set the key if it does not already exist
         """
+        args = ["SET", key, value]
         if ex:
-            result = await self._execute("SET", key, value, "EX", ex)
-        else:
-            result = await self._execute("SET", key, value)
+            args += ["EX", ex]
+        if nx:
+            args.append("NX")
+        result = await self._execute(*args)
         return result == "OK"
 
     async def setex(self, key: str, seconds: int, value: str) -> bool:
@@ -111,6 +355,11 @@ class RedisClient:
         result = await self._execute("INCRBY", key, amount)
         return result if result else 0
 
+    async def decrby(self, key: str, amount: int) -> int:
+        """Decrement a key by a specific amount"""
+        result = await self._execute("DECRBY", key, amount)
+        return result if result else 0
+
     async def expire(self, key: str, seconds: int) -> bool:
         """Set expiration on a key"""
         result = await self._execute("EXPIRE", key, seconds)
@@ -131,101 +380,131 @@ class RedisClient:
         result = await self._execute("KEYS", pattern)
         return result if result else []
 
+    async def scan(self, cursor: int = 0, match: str = None, count: int = 500) -> Tuple[int, list]:
+        """
+        One SCAN step. Returns (next_cursor, keys); iteration is complete when
+        the cursor comes back as 0. Unlike KEYS this never blocks the server
+        for longer than one batch.
+        """
+        args = ["SCAN", cursor]
+        if match:
+            args += ["MATCH", match]
+        args += ["COUNT", count]
+        result = await self._execute(*args)
+        if not result:
+            return 0, []
+        return int(result[0]), result[1] or []
+
     async def close(self):
-        """Close the HTTP client"""
-        if self._client:
-            await self._client.aclose()
-            self._client = None
+        """Release the transport's connections"""
+        await self.transport.close()
 
 
-# Singleton instance
-redis_client = RedisClient()
+class Pipeline:
+    """
+    Commands queued client-side and sent in a single request.
 
+    Command methods return the pipeline, so calls can be chained. Leaving the
+    context manager (without an exception) executes the queued commands and
+    stores their results on `results`, in order.
+    """
 
-# ============================================================================
-# CACHING DECORATOR
-# ============================================================================
+    def __init__(self, client: RedisClient, transaction: bool = False):
+        self._client = client
+        self.transaction = transaction
+        self.commands: List[list] = []
+        self.results: List[Any] = []
 
-def cache_response(ttl_seconds: int = 300, key_prefix: str = "cache"):
-    """
-    Decorator to cache async function results in Redis.
+    def command(self, *args) -> "Pipeline":
+        """Queue an arbitrary command"""
+        self.commands.append(list(args))
+        return self
 
-    Caches the JSON-serializable return value of an async function.
-    If Redis is unavailable, the function executes normally without caching.
+    def get(self, key: str) -> "Pipeline":
+        return self.command("GET", key)
 
-    Usage:
-        @cache_response(ttl_seconds=600, key_prefix="products")
-        async def get_products(company_id: str):
-            # Expensive database query
-            ...
-            return products
+    def set(self, key: str, value: str, ex: int = None, nx: bool = False) -> "Pipeline":
+        args = ["SET", key, value]
+        if ex:
+            args += ["EX", ex]
+        if nx:
+            args.append("NX")
+        return self.command(*args)
 
-    Args:
-        ttl_seconds: How long to cache the result (default 5 minutes)
-        key_prefix: Prefix for the cache key
-    """
-    def decorator(func: Callable):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            # Skip caching if Redis not configured
-            if not redis_client.is_configured:
-                return await func(*args, **kwargs)
-
-            # Generate cache key from function name and arguments
-            # Filter out non-serializable args (like Request objects)
-            serializable_args = []
-            for arg in args:
-                if hasattr(arg, '__dict__'):
-                    # Skip complex objects like Request
-                    continue
-                serializable_args.append(str(arg))
-
-            serializable_kwargs = {
-                k: str(v) for k, v in kwargs.items()
-                if not hasattr(v, '__dict__')
-            }
-
-            key_data = f"{func.__name__}:{serializable_args}:{sorted(serializable_kwargs.items())}"
-            cache_key = f"{key_prefix}:{hashlib.md5(key_data.encode()).hexdigest()}"
-
-            # Try to get from cache
-            try:
-                cached = await redis_client.get(cache_key)
-                if cached:
-                    return json.loads(cached)
-            except Exception as e:
-                print(f"Cache read error: {e}")
+    def delete(self, *keys: str) -> "Pipeline":
+        return self.command("DEL", *keys)
 
-            # Execute function
-            result = await func(*args, **kwargs)
+    def unlink(self, *keys: str) -> "Pipeline":
+        return self.command("UNLINK", *keys)
 
-            # Cache result
-            try:
-                await redis_client.set(cache_key, json.dumps(result), ex=ttl_seconds)
-            except Exception as e:
-                print(f"Cache write error: {e}")
+    def sadd(self, key: str, *members: str) -> "Pipeline":
+        return self.command("SADD", key, *members)
+
+    def incrby(self, key: str, amount: int) -> "Pipeline":
+        return self.command("INCRBY", key, amount)
 
-            return result
-        return wrapper
-    return decorator
+    def decrby(self, key: str, amount: int) -> "Pipeline":
+        return self.command("DECRBY", key, amount)
 
+    def expire(self, key: str, seconds: int) -> "Pipeline":
+        return self.command("EXPIRE", key, seconds)
 
-async def invalidate_cache(pattern: str):
+    def ttl(self, key: str) -> "Pipeline":
+        return self.command("TTL", key)
+
+    async def execute(self) -> List[Any]:
+        """Send the queued commands and return their results"""
+        commands, self.commands = self.commands, []
+        self.results = await self._client.execute_pipeline(commands, transaction=self.transaction)
+        return self.results
+
+    async def __aenter__(self) -> "Pipeline":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None and self.commands:
+            await self.execute()
+
+
+# Singleton instance
+redis_client = RedisClient()
+
+
+# ============================================================================
+# CACHE INVALIDATION
+# ============================================================================
+
+async def invalidate_cache(pattern: str) -> int:
     """
     Invalidate cache entries matching a pattern.
 
+    Walks the keyspace with SCAN and UNLINKs each batch, so large keyspaces
+    never block Redis the way KEYS + DEL did. Prefer tag invalidation
+    (utils.cache.invalidate_tags) when the affected entries are known.
+
     Usage:
         await invalidate_cache("products:*")  # Clear all product caches
+
+    Returns:
+        Number of keys removed
     """
     if not redis_client.is_configured:
-        return
+        return 0
 
+    removed = 0
     try:
-        keys = await redis_client.keys(pattern)
-        for key in keys:
-            await redis_client.delete(key)
+        cursor = 0
+        while True:
+            cursor, keys = await redis_client.scan(cursor, match=pattern)
+            if keys:
+                async with redis_client.pipeline() as pipe:
+                    pipe.unlink(*keys)
+                removed += pipe.results[0] or 0
+            if cursor == 0:
+                break
     except Exception as e:
         print(f"Cache invalidation error: {e}")
+    return removed
 
 
 # ============================================================================
@@ -278,19 +557,20 @@ class RateLimiter:
             return True  # Allow all requests if Redis unavailable
 
         try:
-            current = await redis_client.get(self.key)
-            count = int(current) if current else 0
-
-            if count + cost > self.max_requests:
+            # Start the window if needed and take the units in one transaction
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.set(self.key, "0", ex=self.window_seconds, nx=True)
+                pipe.incrby(self.key, cost)
+            count = pipe.results[1]
+
+            if count is None:
+                return True  # Fail open
+
+            if count > self.max_requests:
+                # Over quota - give the units back
+                await redis_client.decrby(self.key, cost)
                 return False
 
-            if count == 0:
-                # First request in window - set with expiration
-                await redis_client.set(self.key, str(cost), ex=self.window_seconds)
-            else:
-                # Increment existing counter
-                await redis_client.incrby(self.key, cost)
-
             return True
         except Exception as e:
             print(f"Rate limiter error: {e}")
@@ -311,9 +591,19 @@ class RateLimiter:
 
     async def get_usage(self) -> dict:
         """Get current usage stats"""
-        remaining = await self.get_remaining()
+        remaining, ttl = self.max_requests, -1
+        if redis_client.is_configured:
+            try:
+                # Count and TTL in one round-trip
+                async with redis_client.pipeline() as pipe:
+                    pipe.get(self.key)
+                    pipe.ttl(self.key)
+                current, ttl = pipe.results
+                remaining = max(0, self.max_requests - int(current or 0))
+                ttl = ttl if ttl is not None else -1
+            except Exception as e:
+                print(f"Rate limiter error: {e}")
         used = self.max_requests - remaining
-        ttl = await redis_client.ttl(self.key) if redis_client.is_configured else -1
 
         return {
             "name": self.name,
@@ -330,23 +620,287 @@ class RateLimiter:
             await redis_client.delete(self.key)
 
 
+# Sliding-log limiter. Each grant is a sorted-set member "<seq>:<cost>" scored
+# by its timestamp; a companion key keeps the running sum so a check doesn't
+# walk the whole log.
+# KEYS: log, sum, seq  ARGV: limit, window_ms, cost
+# Returns {allowed, remaining, retry_after_ms, reset_ms}
+SLIDING_LOG_SCRIPT = """
+local log_key, sum_key, seq_key = KEYS[1], KEYS[2], KEYS[3]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local used = tonumber(redis.call('GET', sum_key) or '0')
+local expired = redis.call('ZRANGEBYSCORE', log_key, '-inf', now - window)
+for _, member in ipairs(expired) do
+    used = used - tonumber(string.match(member, ':(%d+)$'))
+end
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', log_key, '-inf', now - window)
+end
+if used < 0 then used = 0 end
+
+-- The sum totals the log and lives exactly as long as it does
+local log_ttl = redis.call('PTTL', log_key)
+if log_ttl == -2 then
+    used = 0
+    redis.call('DEL', sum_key)
+elseif #expired > 0 and log_ttl > 0 then
+    redis.call('SET', sum_key, used, 'PX', log_ttl)
+end
+
+local reset = 0
+local oldest = redis.call('ZRANGE', log_key, 0, 0, 'WITHSCORES')
+if #oldest > 0 then reset = tonumber(oldest[2]) + window - now end
+
+if used + cost > limit then
+    local retry = -1
+    if cost <= limit then
+        local freed = 0
+        local entries = redis.call('ZRANGE', log_key, 0, -1, 'WITHSCORES')
+        for i = 1, #entries, 2 do
+            freed = freed + tonumber(string.match(entries[i], ':(%d+)$'))
+            if used - freed + cost <= limit then
+                retry = tonumber(entries[i + 1]) + window - now
+                break
+            end
+        end
+    end
+    return {0, limit - used, retry, reset}
+end
+
+if cost > 0 then
+    local seq = redis.call('INCR', seq_key)
+    redis.call('ZADD', log_key, now, seq .. ':' .. cost)
+    used = used + cost
+    if reset == 0 then reset = window end
+    redis.call('PEXPIRE', log_key, window)
+    redis.call('PEXPIRE', seq_key, window)
+    redis.call('SET', sum_key, used, 'PX', window)
+end
+return {1, limit - used, 0, reset}
+"""
+
+# Generic cell rate algorithm. Stores only the "theoretical arrival time";
+# units replenish continuously at limit / window with a burst of `limit`.
+# KEYS: tat  ARGV: limit, window_ms, cost
+# Returns {allowed, remaining, retry_after_ms, reset_ms}
+GCRA_SCRIPT = """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local emission = window / limit
+
+local tat = tonumber(redis.call('GET', key) or '0')
+if tat < now then tat = now end
+local new_tat = tat + cost * emission
+local allow_at = new_tat - window
+
+if allow_at > now then
+    local retry = math.ceil(allow_at - now)
+    if cost > limit then retry = -1 end
+    return {0, math.floor((now - (tat - window)) / emission), retry, math.ceil(tat - now)}
+end
+
+if cost > 0 then
+    redis.call('SET', key, tostring(new_tat), 'PX', math.ceil(new_tat - now))
+end
+return {1, math.floor((now - allow_at) / emission), 0, math.ceil(new_tat - now)}
+"""
+
+RATE_LIMIT_MODES = ("sliding", "gcra")
+
+
+class AtomicRateLimiter(RateLimiter):
+    """
+    Rate limiter whose check-and-consume runs as one server-side script.
+
+    Unlike RateLimiter there is no read-then-write window, so concurrent
+    workers can never overshoot the quota. Two algorithms are available:
+
+    - "sliding": exact sliding log; no burst at window boundaries
+    - "gcra": generic cell rate algorithm; smooth replenishment, one key
+
+    Each process also leases `lease_size` units at a time and hands them out
+    locally until they run out or `lease_ttl` passes, so most checks make no
+    network call. Leased units count against the shared quota as soon as
+    they are taken; units left when a lease expires are not returned, so
+    leasing only suits cheap, frequent calls. Sparse, costly quotas
+    (YouTube, Gemini) keep lease_size=1.
+
+    Usage:
+        allowed, retry_after = await gemini_limiter.acquire()
+        if not allowed:
+            raise Retry(defer=retry_after)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_requests: int,
+        window_seconds: int,
+        mode: str = "sliding",
+        lease_size: int = 1,
+        lease_ttl: float = 5.0,
+    ):
+        """
+        Args:
+            name: Identifier for this rate limiter (e.g., "gemini_api")
+            max_requests: Maximum units allowed in the window
+            window_seconds: Time window in seconds
+            mode: "sliding" or "gcra"
+            lease_size: Units reserved per round-trip (1 disables leasing)
+            lease_ttl: Seconds a local lease stays usable
+        """
+        if mode not in RATE_LIMIT_MODES:
+            raise ValueError(f"mode must be one of: {', '.join(RATE_LIMIT_MODES)}")
+
+        super().__init__(name, max_requests, window_seconds)
+        self.mode = mode
+        self.lease_size = max(1, lease_size)
+        self.lease_ttl = lease_ttl
+        self._leased = 0
+        self._lease_expires = 0.0
+        self._lease_lock = asyncio.Lock()
+
+    def _script_keys(self) -> List[str]:
+        if self.mode == "gcra":
+            return [f"{self.key}:tat"]
+        return [f"{self.key}:log", f"{self.key}:sum", f"{self.key}:seq"]
+
+    async def _run(self, cost: int) -> Optional[Tuple[bool, int, float, float]]:
+        """Run the limiter script: (allowed, remaining, retry_after_s, reset_s)"""
+        script = GCRA_SCRIPT if self.mode == "gcra" else SLIDING_LOG_SCRIPT
+        result = await redis_client.eval(
+            script,
+            self._script_keys(),
+            [self.max_requests, self.window_seconds * 1000, cost],
+        )
+        if not result or len(result) < 4:
+            return None
+        allowed, remaining, retry_ms, reset_ms = (int(v) for v in result[:4])
+        # A negative retry means the cost can never fit in the window
+        retry_after = retry_ms / 1000 if retry_ms >= 0 else float(self.window_seconds)
+        return bool(allowed), max(0, remaining), retry_after, max(0, reset_ms) / 1000
+
+    async def acquire(self, cost: int = 1) -> Tuple[bool, float]:
+        """
+        Take `cost` units from the local lease, or from Redis if it runs out.
+
+        Returns:
+            (allowed, retry_after_seconds). retry_after is 0 when allowed.
+        """
+        if not redis_client.is_configured:
+            return True, 0.0  # Allow all requests if Redis unavailable
+
+        async with self._lease_lock:
+            now = time.monotonic()
+            leased = self._leased if now < self._lease_expires else 0
+            if leased >= cost:
+                self._leased = leased - cost
+                return True, 0.0
+
+            try:
+                needed = cost - leased
+                request = max(needed, self.lease_size)
+                result = await self._run(request)
+                if result is not None and not result[0] and request > needed:
+                    # Not enough left for a full lease - take just what's needed
+                    request = needed
+                    result = await self._run(request)
+            except Exception as e:
+                print(f"Rate limiter error: {e}")
+                result = None
+
+            if result is None:
+                return True, 0.0  # Fail open
+
+            allowed, _, retry_after, _ = result
+            if not allowed:
+                self._leased = leased
+                return False, retry_after
+
+            self._leased = leased + request - cost
+            self._lease_expires = now + self.lease_ttl
+            return True, 0.0
+
+    async def is_allowed(self, cost: int = 1) -> bool:
+        """Check if a request is allowed and consume its units"""
+        allowed, _ = await self.acquire(cost)
+        return allowed
+
+    async def get_remaining(self) -> int:
+        """Get remaining quota units (leased units count as used)"""
+        if not redis_client.is_configured:
+            return self.max_requests
+
+        try:
+            result = await self._run(0)
+            return result[1] if result else self.max_requests
+        except Exception as e:
+            print(f"Rate limiter error: {e}")
+            return self.max_requests
+
+    async def get_usage(self) -> dict:
+        """Get current usage stats"""
+        remaining, resets_in = self.max_requests, 0.0
+        if redis_client.is_configured:
+            try:
+                result = await self._run(0)
+                if result:
+                    _, remaining, _, resets_in = result
+            except Exception as e:
+                print(f"Rate limiter error: {e}")
+
+        return {
+            "name": self.name,
+            "mode": self.mode,
+            "used": self.max_requests - remaining,
+            "remaining": remaining,
+            "leased_locally": self._leased if time.monotonic() < self._lease_expires else 0,
+            "max": self.max_requests,
+            "window_seconds": self.window_seconds,
+            "resets_in_seconds": round(resets_in) if resets_in > 0 else self.window_seconds
+        }
+
+    async def reset(self):
+        """Reset the rate limit (for testing/admin use)"""
+        self._leased = 0
+        self._lease_expires = 0.0
+        if redis_client.is_configured:
+            await redis_client._execute("DEL", *self._script_keys())
+
+
 # Pre-configured rate limiters for external APIs
-youtube_limiter = RateLimiter(
+youtube_limiter = AtomicRateLimiter(
     "youtube_api",
     max_requests=10000,  # 10K quota units/day (free tier)
-    window_seconds=86400  # 24 hours
+    window_seconds=86400,  # 24 hours
+    mode="gcra",
+    lease_size=1  # searches are sparse; an expired lease would burn 100s of units
 )
 
-gemini_limiter = RateLimiter(
+gemini_limiter = AtomicRateLimiter(
     "gemini_api",
     max_requests=15,  # 15 requests/minute (free tier)
-    window_seconds=60  # 1 minute
+    window_seconds=60,  # 1 minute
+    mode="sliding",
+    lease_size=1  # 15/min is too tight to strand units in expired leases
 )
 
-cohere_limiter = RateLimiter(
+cohere_limiter = AtomicRateLimiter(
     "cohere_api",
     max_requests=100,  # 100 requests/minute
-    window_seconds=60  # 1 minute
+    window_seconds=60,  # 1 minute
+    mode="sliding",
+    lease_size=10,
+    lease_ttl=10
 )
 
 shopify_limiter = RateLimiter(
@@ -360,13 +914,51 @@ shopify_limiter = RateLimiter(
 # DISTRIBUTED LOCKING
 # ============================================================================
 
+# Acquire: SET NX PX with the owner token, then bump the fencing counter.
+# KEYS: lock, fence  ARGV: token, ttl_ms
+# Returns the new fencing token, or 0 if the lock is held
+LOCK_ACQUIRE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return redis.call('INCR', KEYS[2])
+end
+return 0
+"""
+
+# Release only if we still own the lock. KEYS: lock  ARGV: token
+LOCK_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Extend the lease only if we still own the lock. KEYS: lock  ARGV: token, ttl_ms
+LOCK_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
 class DistributedLock:
     """
-    Distributed lock using Redis SETNX.
+    Distributed lock using Redis SET NX PX with an owner token.
 
     Prevents duplicate processing across multiple workers/instances.
     Uses automatic expiration to prevent deadlocks if a worker crashes.
 
+    - The key is created with its expiry in one command, so a crash can't
+      leave a lock that never expires.
+    - Release and renewal compare the random owner token first, so a holder
+      whose lease expired can't delete or extend someone else's lock.
+    - With auto_renew=True a background task extends the lease every
+      timeout/3 while the lock is held, so long jobs can use short leases.
+    - Each acquisition gets a fencing token (monotonically increasing per
+      resource). Pass it to writes that must reject stale holders, as the
+      discovery planner does (jobs.scheduler.record_discovery_yield), and
+      check `lost` before each step of long work.
+
     Usage:
         async with DistributedLock(f"video:{video_id}") as acquired:
             if acquired:
@@ -375,39 +967,141 @@ class DistributedLock:
             else:
                 # Another worker is already processing
                 print("Skipping - already being processed")
+
+        lock = DistributedLock(f"discovery:{company_id}", timeout_seconds=300, auto_renew=True)
+        async with lock as acquired:
+            ...
+            if lock.lost:
+                # Lease could not be renewed - another worker may own it now
+                ...
     """
 
-    def __init__(self, resource_name: str, timeout_seconds: int = 300):
+    def __init__(
+        self,
+        resource_name: str,
+        timeout_seconds: int = 300,
+        auto_renew: bool = False,
+        wait_seconds: float = 0,
+        fail_open: bool = True,
+    ):
         """
         Initialize a distributed lock.
 
         Args:
             resource_name: Unique identifier for the resource being locked
-            timeout_seconds: Lock timeout (auto-release after this time)
+            timeout_seconds: Lock lease (auto-release after this time unless renewed)
+            auto_renew: Renew the lease in the background while held
+            wait_seconds: Keep retrying for up to this long if the lock is held
+            fail_open: Treat an unreachable Redis as acquired / renewed. Leases
+                that must never be held twice (shard ownership) pass False.
         """
         self.key = f"lock:{resource_name}"
+        self.fence_key = f"lock:{resource_name}:fence"
+        self.resource = resource_name.split(":", 1)[0]
         self.timeout = timeout_seconds
+        self.auto_renew = auto_renew
+        self.wait_seconds = wait_seconds
+        self.fail_open = fail_open
+        self.token = secrets.token_hex(16)
+        self.fencing_token: Optional[int] = None
         self.acquired = False
+        self.lost = False
+        self._renew_task: Optional[asyncio.Task] = None
+
+    async def _try_acquire(self) -> Optional[bool]:
+        """One attempt; None means Redis could not be reached"""
+        result = await redis_client.eval(
+            LOCK_ACQUIRE_SCRIPT,
+            [self.key, self.fence_key],
+            [self.token, int(self.timeout * 1000)],
+        )
+        if result is None:
+            return None
+        if int(result) > 0:
+            self.fencing_token = int(result)
+            return True
+        return False
 
     async def acquire(self) -> bool:
-        """Attempt to acquire the lock"""
+        """Attempt to acquire the lock, waiting up to wait_seconds"""
         if not redis_client.is_configured:
+            self.acquired = True
             return True  # No Redis = no locking (single instance mode)
 
+        start = time.monotonic()
+        delay = 0.05
         try:
-            self.acquired = await redis_client.setnx(self.key, "1")
-            if self.acquired:
-                await redis_client.expire(self.key, self.timeout)
-            return self.acquired
+            while True:
+                result = await self._try_acquire()
+                if result is None:
+                    self.acquired = self.fail_open
+                    return self.fail_open
+                if result:
+                    break
+
+                lock_contention_total.labels(resource=self.resource).inc()
+                remaining = self.wait_seconds - (time.monotonic() - start)
+                if remaining <= 0:
+                    lock_wait_seconds.labels(resource=self.resource, outcome="timeout").observe(
+                        time.monotonic() - start
+                    )
+                    self.acquired = False
+                    return False
+                await asyncio.sleep(min(delay, remaining) * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, 1.0)
         except Exception as e:
             print(f"Lock acquisition error: {e}")
-            return True  # Fail open
+            self.acquired = self.fail_open
+            return self.fail_open
+
+        lock_wait_seconds.labels(resource=self.resource, outcome="acquired").observe(
+            time.monotonic() - start
+        )
+        self.acquired = True
+        self.lost = False
+        if self.auto_renew:
+            self._renew_task = asyncio.create_task(self._renew_loop())
+        return True
+
+    async def renew(self) -> bool:
+        """Extend the lease; False if the lock is no longer ours"""
+        if not redis_client.is_configured:
+            return True
+
+        result = await redis_client.eval(
+            LOCK_RENEW_SCRIPT, [self.key], [self.token, int(self.timeout * 1000)]
+        )
+        if result is None:
+            # Redis unreachable: by default keep going and retry next interval
+            return self.fail_open
+        return int(result) == 1
+
+    async def _renew_loop(self):
+        interval = max(self.timeout / 3, 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.renew():
+                    self.lost = True
+                    lock_lost_total.labels(resource=self.resource).inc()
+                    print(f"⚠️  Lost lock {self.key} (fencing token {self.fencing_token})")
+                    return
+            except Exception as e:
+                print(f"Lock renewal error: {e}")
 
     async def release(self):
-        """Release the lock"""
-        if self.acquired and redis_client.is_configured:
+        """Release the lock if we still own it"""
+        if self._renew_task is not None:
+            self._renew_task.cancel()
             try:
-                await redis_client.delete(self.key)
+                await self._renew_task
+            except asyncio.CancelledError:
+                pass
+            self._renew_task = None
+
+        if self.acquired and redis_client.is_configured and not self.lost:
+            try:
+                await redis_client.eval(LOCK_RELEASE_SCRIPT, [self.key], [self.token])
             except Exception as e:
                 print(f"Lock release error: {e}")
         self.acquired = False
@@ -485,10 +1179,19 @@ class SessionStore:
 
     async def get_and_delete(self, session_id: str) -> Optional[dict]:
         """Retrieve and delete session data (one-time use)"""
-        data = await self.get(session_id)
-        if data:
-            await redis_client.delete(self._key(session_id))
-        return data
+        if not redis_client.is_configured:
+            return None
+
+        try:
+            # Atomic, so two callers can never both consume the same state
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.get(self._key(session_id))
+                pipe.delete(self._key(session_id))
+            data = pipe.results[0]
+            return json.loads(data) if data else None
+        except Exception as e:
+            print(f"Session retrieve error: {e}")
+            return None
 
     async def delete(self, session_id: str) -> bool:
         """Delete session data"""
@@ -0,0 +1,194 @@
+"""
+Lease-based shard ownership for horizontally scaled workers.
+
+Work keys (company ids) hash into a fixed number of shards. Each worker
+heartbeats into a Redis sorted set of live members, and every member
+computes the same shard -> member assignment from that set with
+rendezvous hashing. A worker holds a lease (a DistributedLock) on each of
+its shards, and only processes keys in shards it currently leases.
+
+- A worker joins: the next heartbeats move its share of shards over. Old
+  owners release them, then the new member claims them. Only about 1/N of
+  the shards move.
+- A worker dies: its member entry and its leases expire after
+  lease_seconds, and the survivors pick up its shards.
+- A shard is leased by at most one worker at a time, so two replicas never
+  work the same company. Leases fail closed: a worker that can't reach
+  Redis drops its shards rather than keep ones a survivor may take over.
+
+Without Redis every worker owns every shard (single instance mode).
+
+Usage:
+    coordinator = ShardCoordinator("discovery")
+    await coordinator.start()
+    ...
+    if coordinator.owns(company_id):
+        await process(company_id)
+    ...
+    await coordinator.stop()
+"""
+import asyncio
+import hashlib
+import os
+import secrets
+import socket
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Set
+
+from utils.redis_client import DistributedLock, redis_client
+
+DISCOVERY_SHARDS = int(os.getenv("DISCOVERY_SHARDS", "16"))
+SHARD_LEASE_SECONDS = float(os.getenv("SHARD_LEASE_SECONDS", "30"))
+
+
+def shard_for(key: str, shards: int = DISCOVERY_SHARDS) -> int:
+    """Stable shard number for a work key"""
+    return zlib.crc32(str(key).encode()) % shards
+
+
+def _weight(shard: int, member: str) -> int:
+    digest = hashlib.sha1(f"{shard}:{member}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def assign_shards(members: Iterable[str], shards: int = DISCOVERY_SHARDS) -> Dict[str, Set[int]]:
+    """
+    Rendezvous (highest random weight) assignment of shards to members.
+
+    Deterministic for a given member set, so every worker computes the same
+    answer without talking to the others.
+    """
+    members = sorted(set(members))
+    assignment: Dict[str, Set[int]] = {member: set() for member in members}
+    if not members:
+        return assignment
+    for shard in range(shards):
+        owner = max(members, key=lambda member: _weight(shard, member))
+        assignment[owner].add(shard)
+    return assignment
+
+
+class ShardCoordinator:
+    """Claims and heartbeats shard leases for one worker in a group"""
+
+    def __init__(
+        self,
+        group: str,
+        shards: int = DISCOVERY_SHARDS,
+        lease_seconds: float = SHARD_LEASE_SECONDS,
+        member_id: Optional[str] = None,
+    ):
+        self.group = group
+        self.shards = shards
+        self.lease_seconds = lease_seconds
+        self.member_id = member_id or f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.members_key = f"shards:{group}:members"
+        self.members: List[str] = []
+        self._leases: Dict[int, DistributedLock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def owned_shards(self) -> Set[int]:
+        if not redis_client.is_configured:
+            return set(range(self.shards))
+        return set(self._leases)
+
+    def owns(self, key: str) -> bool:
+        """True if this worker currently leases the shard for `key`"""
+        return shard_for(key, self.shards) in self.owned_shards
+
+    async def _live_members(self) -> List[str]:
+        """Register our heartbeat, drop expired members, return the live set"""
+        now = time.time()
+        async with redis_client.pipeline() as pipe:
+            pipe.command("ZADD", self.members_key, now, self.member_id)
+            pipe.command("ZREMRANGEBYSCORE", self.members_key, "-inf", now - self.lease_seconds)
+            pipe.command("ZRANGE", self.members_key, 0, -1)
+            pipe.expire(self.members_key, max(int(self.lease_seconds * 10), 60))
+        members = pipe.results[2] if pipe.results and pipe.results[2] else []
+        return members if self.member_id in members else members + [self.member_id]
+
+    async def heartbeat(self) -> Set[int]:
+        """
+        One rebalance step: renew leases we keep, release shards that now
+        belong to someone else, claim shards that are newly ours.
+        """
+        from utils.metrics import shard_leases_owned, shard_handoffs_total
+
+        if not redis_client.is_configured:
+            return self.owned_shards
+
+        self.members = await self._live_members()
+        desired = assign_shards(self.members, self.shards).get(self.member_id, set())
+
+        for shard in sorted(set(self._leases) - desired):
+            await self._leases.pop(shard).release()
+            shard_handoffs_total.labels(group=self.group, direction="released").inc()
+
+        for shard in sorted(set(self._leases) & desired):
+            if not await self._leases[shard].renew():
+                print(f"⚠️  Lost lease on {self.group} shard {shard}")
+                self._leases.pop(shard).acquired = False
+
+        for shard in sorted(desired - set(self._leases)):
+            # Held by the previous owner until it hands over or expires
+            lock = DistributedLock(f"shard:{self.group}:{shard}", timeout_seconds=self.lease_seconds,
+                                   fail_open=False)
+            if await lock.acquire():
+                self._leases[shard] = lock
+                shard_handoffs_total.labels(group=self.group, direction="claimed").inc()
+
+        shard_leases_owned.labels(group=self.group).set(len(self._leases))
+        return self.owned_shards
+
+    @property
+    def heartbeat_interval(self) -> float:
+        return max(self.lease_seconds / 3, 0.1)
+
+    async def wait_for_change(self, timeout: float) -> Set[int]:
+        """
+        Sleep up to `timeout`, waking as soon as the owned shards change
+        (checked every heartbeat), e.g. when a new replica is handed shards.
+        """
+        owned = self.owned_shards
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(self.heartbeat_interval, max(deadline - time.monotonic(), 0)))
+            if self.owned_shards != owned:
+                break
+        return self.owned_shards
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                print(f"Shard heartbeat error: {e}")
+
+    async def start(self) -> Set[int]:
+        """Join the group and keep heartbeating in the background"""
+        owned = await self.heartbeat()
+        self._task = asyncio.create_task(self._heartbeat_loop())
+        print(f"🧩 {self.member_id} joined '{self.group}' with {len(owned)}/{self.shards} shards")
+        return owned
+
+    async def stop(self):
+        """Leave the group and release every lease so others take over at once"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for lock in self._leases.values():
+            await lock.release()
+        self._leases.clear()
+        if redis_client.is_configured:
+            try:
+                await redis_client._execute("ZREM", self.members_key, self.member_id)
+            except Exception as e:
+                print(f"Shard group leave error: {e}")
@@ -3,10 +3,13 @@ Shopify Admin API Client
 Handles authenticated requests to Shopify Admin API for managing products, orders, etc.
 """
 
+import re
 import requests
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 
+from utils.tracing import external_call, payload_size
+
 class ShopifyAPIError(Exception):
     """Custom exception for Shopify API errors"""
     pass
@@ -59,16 +62,24 @@ class ShopifyAPIClient:
             ShopifyAPIError: If request fails
         """
         url = f"{self.base_url}{endpoint}"
+        # Ids out of the operation name keep the metric labels bounded
+        operation = f"{method} {re.sub(r'/[0-9]+', '/{id}', endpoint)}"
 
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=self.headers,
-                timeout=30,
-                **kwargs
-            )
-            response.raise_for_status()
+            with external_call("shopify", operation, quota_units=1,
+                               request_bytes=payload_size(kwargs.get("json"))) as span:
+                response = requests.request(
+                    method=method,
+                    url=url,
+                    headers=self.headers,
+                    timeout=30,
+                    **kwargs
+                )
+                span.set_attribute("http.status_code", response.status_code)
+                span.set_attribute("payload.response_bytes", len(response.content))
+                # "used/bucket size" of the REST leaky bucket
+                span.set_attribute("shopify.call_limit", response.headers.get("X-Shopify-Shop-Api-Call-Limit"))
+                response.raise_for_status()
 
             # Handle rate limiting
             if response.status_code == 429:
@@ -9,6 +9,8 @@ from dotenv import load_dotenv
 import base64
 from io import BytesIO
 
+from utils.timing import install_httpx_hooks
+
 class SupabaseClient:
     client: AsyncClient
 
@@ -133,12 +135,18 @@ class SupabaseClient:
     async def initialize(self):
         """Initialize the async Supabase client"""
         self.client = await acreate_client(self.url, self.key)
+        # Per-request Supabase time for the Server-Timing header
+        install_httpx_hooks(self.client.postgrest.session, "supabase")
         
     async def close(self):
-        """Close the async Supabase client"""
-        # Supabase AsyncClient doesn't have explicit close method
-        # Resources are cleaned up automatically
-        pass
+        """Close the async Supabase client's PostgREST connections"""
+        client = getattr(self, "client", None)
+        if client is None:
+            return
+        try:
+            await client.postgrest.aclose()
+        except Exception as e:
+            print(f"Error closing Supabase client: {e}")
 
     async def delete_pending_short(self, id: str):
         try:
@@ -147,3 +155,26 @@ class SupabaseClient:
             print(f"Error deleting pending short: {e}")
             raise e
 
+
+    async def get_known_product_images(self, company_id: str, shop_domain: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        Image URL -> {"image_hash", "pinecone_id"} for a company's synced
+        products, so a re-sync can skip images it has already embedded.
+        Fails open with an empty mapping.
+        """
+        try:
+            query = self.client.table("company_products")\
+                .select("image, image_hash, pinecone_id")\
+                .eq("company_id", company_id)\
+                .not_.is_("image_hash", "null")
+            if shop_domain:
+                query = query.eq("shop_domain", shop_domain)
+            result = await query.execute()
+            return {
+                row["image"]: {"image_hash": row["image_hash"], "pinecone_id": row["pinecone_id"]}
+                for row in result.data or []
+                if row.get("image") and row.get("pinecone_id")
+            }
+        except Exception as e:
+            print(f"Error loading known product images: {e}")
+            return {}
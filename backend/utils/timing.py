@@ -0,0 +1,94 @@
+"""
+Per-request time breakdown by backend.
+
+The request middleware opens a timing scope for each request. Code that
+talks to a backend adds its elapsed time to the scope's bucket:
+
+- "supabase": PostgREST calls (httpx hooks on the Supabase session)
+- "redis": every Redis command and pipeline
+- "external": third-party APIs (track_external_api, image downloads)
+
+The middleware then reports the buckets in a Server-Timing header.
+
+Outside a request (workers, scripts) there is no scope and add_time() does
+nothing. Time spent in concurrent calls is summed, so a bucket can exceed
+the request's total duration.
+
+Usage:
+    async with timed("redis"):
+        await transport.execute(...)
+"""
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+CATEGORIES = ("supabase", "redis", "external")
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def start_timing():
+    """Open a timing scope for the current request; returns a reset token"""
+    return _timings.set({})
+
+
+def stop_timing(token) -> Dict[str, float]:
+    """Close the scope opened by start_timing and return its buckets"""
+    timings = _timings.get() or {}
+    _timings.reset(token)
+    return timings
+
+
+def add_time(category: str, seconds: float) -> None:
+    """Add elapsed seconds to a bucket of the current request, if any"""
+    timings = _timings.get()
+    if timings is not None:
+        timings[category] = timings.get(category, 0.0) + seconds
+
+
+@asynccontextmanager
+async def timed(category: str):
+    """Time the enclosed block into a bucket of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(category, time.perf_counter() - start)
+
+
+def httpx_hooks(category: str) -> Dict[str, list]:
+    """
+    event_hooks for an httpx.AsyncClient that time each call into a bucket.
+
+    Measured from sending the request to receiving the response headers.
+    """
+    async def on_request(request):
+        request.extensions["timing_start"] = time.perf_counter()
+
+    async def on_response(response):
+        start = response.request.extensions.get("timing_start")
+        if start is not None:
+            add_time(category, time.perf_counter() - start)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def install_httpx_hooks(client, category: str) -> None:
+    """Add timing hooks to an existing httpx.AsyncClient"""
+    hooks = httpx_hooks(category)
+    client.event_hooks = {
+        name: list(client.event_hooks.get(name, [])) + hooks[name]
+        for name in ("request", "response")
+    }
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    """Format buckets (seconds) as a Server-Timing header value in ms"""
+    entries = [
+        f"{name};dur={timings[name] * 1000:.1f}"
+        for name in CATEGORIES
+        if timings.get(name)
+    ]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,262 @@
+"""
+Tracing for jobs, discovery cycles and outbound API calls.
+
+A small span API shaped like OpenTelemetry's: 128-bit trace ids, 64-bit
+span ids, W3C traceparent propagation, span kinds, attributes, events and
+an OK/ERROR status. Finished spans go to a local exporter instead of a
+collector. It keeps the last TRACE_BUFFER_SIZE spans in memory, and also
+appends them as JSON lines to TRACE_EXPORT_PATH when that is set.
+
+Parent spans are tracked in a contextvar. A span opened inside a job or a
+discovery cycle becomes its child, and so does a span in a thread started
+with asyncio.to_thread. Jobs enqueued from a traced context carry a
+traceparent kwarg, so the worker's job span joins the same trace.
+
+external_call() wraps one call to a third-party API. Besides the span it
+records:
+
+- external_api_calls_total / external_api_duration_seconds (latency)
+- external_api_errors_total by exception class
+- external_api_payload_bytes for the request and response sides
+- external_api_quota_units_total (YouTube units, tokens, inputs...)
+- the request's "external" Server-Timing bucket
+- the current tenant's usage counters (utils.usage)
+
+Usage:
+    with external_call("youtube", "search.list", quota_units=100) as span:
+        response = await _execute(request)
+        span.set_attribute("payload.response_bytes", payload_size(response))
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.timing import add_time
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2048"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+
+# Span kinds and status codes as OpenTelemetry names them
+INTERNAL, CLIENT, CONSUMER = "internal", "client", "consumer"
+UNSET, OK, ERROR = "unset", "ok", "error"
+
+
+class Span:
+    """One timed operation in a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 kind: str = INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.status = UNSET
+        self.status_description: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._start = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        """Seconds from start to end (or to now while the span is open)"""
+        end = self._end if self.end_ns is not None else time.perf_counter()
+        return end - self._start
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header for this span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes) -> None:
+        self.events.append({"name": name, "time_unix_nano": time.time_ns(), "attributes": attributes})
+
+    def set_status(self, status: str, description: Optional[str] = None) -> None:
+        self.status = status
+        self.status_description = description
+
+    def record_exception(self, error: BaseException) -> None:
+        self.set_attribute("error.type", type(error).__name__)
+        self.add_event("exception", **{
+            "exception.type": type(error).__name__,
+            "exception.message": str(error),
+        })
+        self.set_status(ERROR, str(error))
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self._end = time.perf_counter()
+            self.end_ns = time.time_ns()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """OTLP-style JSON representation"""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status, "description": self.status_description},
+        }
+
+
+class LocalExporter:
+    """Keeps finished spans in a ring buffer and optionally a JSONL file"""
+
+    def __init__(self, max_spans: int = TRACE_BUFFER_SIZE, path: Optional[str] = TRACE_EXPORT_PATH):
+        self._spans: deque = deque(maxlen=max_spans)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        record = span.to_dict()
+        with self._lock:
+            self._spans.append(record)
+        if self.path:
+            try:
+                with self._lock, open(self.path, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+            except OSError as e:
+                print(f"Trace export error: {e}")
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Buffered spans, oldest first, optionally for one trace"""
+        with self._lock:
+            spans = list(self._spans)
+        return [s for s in spans if trace_id is None or s["trace_id"] == trace_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+exporter = LocalExporter()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_traceparent() -> Optional[str]:
+    """traceparent of the active span, for propagating into enqueued jobs"""
+    span = _current_span.get()
+    return span.traceparent if span else None
+
+
+def parse_traceparent(traceparent: Optional[str]):
+    """(trace_id, parent span id) from a traceparent header, or (None, None)"""
+    parts = (traceparent or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+@contextmanager
+def start_span(name: str, kind: str = INTERNAL, attributes: Optional[Dict[str, Any]] = None,
+               traceparent: Optional[str] = None) -> Iterator[Span]:
+    """
+    Open a span as the current span for the enclosed block.
+
+    The parent is the current span, or the span named by `traceparent`
+    when one is given (a job started from another process's trace).
+    Exceptions are recorded on the span and re-raised.
+    """
+    trace_id, parent_id = parse_traceparent(traceparent)
+    if trace_id is None:
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        parent_id = parent.span_id if parent else None
+
+    span = Span(name, trace_id, parent_id, kind, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+        if span.status == UNSET:
+            span.set_status(OK)
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        exporter.export(span)
+
+
+def payload_size(payload: Any) -> int:
+    """Approximate wire size in bytes of a request or response body"""
+    if payload is None:
+        return 0
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    if isinstance(payload, str):
+        return len(payload.encode())
+    try:
+        return len(json.dumps(payload, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+@contextmanager
+def external_call(service: str, operation: str, quota_units: float = 0,
+                  request_bytes: Optional[int] = None) -> Iterator[Span]:
+    """
+    Trace and meter one outbound API call.
+
+    The span exposes what is only known afterwards: set
+    "payload.response_bytes" and, when the cost depends on the response,
+    "quota.units".
+    """
+    from utils.usage import record_usage
+    from utils.metrics import (
+        external_api_calls_total,
+        external_api_duration_seconds,
+        external_api_errors_total,
+        external_api_payload_bytes,
+        external_api_quota_units_total,
+    )
+
+    attributes = {"service": service, "operation": operation, "quota.units": quota_units}
+    if request_bytes is not None:
+        attributes["payload.request_bytes"] = request_bytes
+
+    status = "success"
+    span = None
+    try:
+        with start_span(f"{service}.{operation}", kind=CLIENT, attributes=attributes) as span:
+            yield span
+    except BaseException as e:
+        status = "error"
+        external_api_errors_total.labels(service=service, error=type(e).__name__).inc()
+        raise
+    finally:
+        if span is not None:
+            duration = span.duration
+            external_api_calls_total.labels(service=service, status=status).inc()
+            external_api_duration_seconds.labels(service=service, operation=operation).observe(duration)
+            for direction in ("request", "response"):
+                size = span.attributes.get(f"payload.{direction}_bytes")
+                if size:
+                    external_api_payload_bytes.labels(service=service, direction=direction).observe(size)
+            units = span.attributes.get("quota.units") or 0
+            if units:
+                external_api_quota_units_total.labels(service=service).inc(units)
+            add_time("external", duration)
+            record_usage(service, operation, units)
@@ -0,0 +1,276 @@
+"""
+Per-tenant external API usage and budgets.
+
+The rate limiters in utils.redis_client guard our global quota
+(ratelimit:youtube_api). This module answers a different question: how
+much did each company cost us?
+
+Every call traced with utils.tracing.external_call is charged to the
+current tenant. These include YouTube searches, video stats and channel
+lookups, Gemini analyses, Cohere embeds, Pinecone operations, Shopify
+calls and emails. The tenant is a contextvar. It is set:
+
+- per authorized API request, from the company_id query parameter
+  (tenant_middleware; the API authorizes admin requests only)
+- per ARQ job, from the job's company_id kwarg or an explicit tenant kwarg
+  (jobs.instrumentation). enqueue_job and the discovery planner pass the
+  current tenant along to the jobs they enqueue.
+- per search in the standalone discovery loop
+
+Usage is counted in-process and flushed to Redis every USAGE_FLUSH_SECONDS
+into hourly and daily hashes:
+
+    usage:{company_id}:hour:{YYYYMMDDHH}   (kept USAGE_HOURLY_TTL_HOURS)
+    usage:{company_id}:day:{YYYYMMDD}      (kept USAGE_DAILY_TTL_DAYS)
+
+with fields "{service}:units", "{service}:calls" and
+"{service}.{operation}:calls". The tenant_api_* Prometheus counters carry
+the charged totals per service only; the hashes are the per-company view.
+
+TENANT_DAILY_BUDGETS (JSON, e.g. {"youtube": 2000, "gemini": 500000}) caps
+the units a company may spend per UTC day. within_budget() and
+over_budget() check a cap, and the discovery scheduler and planner use
+them. Budgets are soft: another process's unflushed usage isn't visible
+yet.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import zip_longest
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from utils.metrics import tenant_api_calls_total, tenant_api_units_total
+from utils.redis_client import redis_client
+
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+USAGE_HOURLY_TTL_HOURS = int(os.getenv("USAGE_HOURLY_TTL_HOURS", "72"))
+USAGE_DAILY_TTL_DAYS = int(os.getenv("USAGE_DAILY_TTL_DAYS", "40"))
+
+
+def _load_budgets() -> Dict[str, float]:
+    try:
+        return {k: float(v) for k, v in json.loads(os.getenv("TENANT_DAILY_BUDGETS") or "{}").items()}
+    except (ValueError, AttributeError) as e:
+        print(f"⚠️  Ignoring invalid TENANT_DAILY_BUDGETS: {e}")
+        return {}
+
+
+TENANT_DAILY_BUDGETS = _load_budgets()
+
+_tenant: ContextVar[Optional[str]] = ContextVar("tenant", default=None)
+
+
+def current_tenant() -> Optional[str]:
+    return _tenant.get()
+
+
+@contextmanager
+def tenant_scope(company_id: Optional[str]):
+    """Charge external calls in the enclosed block to company_id"""
+    if not company_id:
+        yield
+        return
+    token = _tenant.set(str(company_id))
+    try:
+        yield
+    finally:
+        _tenant.reset(token)
+
+
+def tenant_middleware(authorize: Callable[[Any], bool]):
+    """
+    BlackSheep middleware: authorized requests with ?company_id= are charged
+    to that company. The query parameter alone proves nothing, so anything
+    else runs without a tenant rather than against someone else's budget.
+    """
+    async def middleware(request, handler):
+        company_id = request.query.get("company_id")
+        if isinstance(company_id, list):
+            company_id = company_id[0] if company_id else None
+        if company_id and not authorize(request):
+            company_id = None
+        with tenant_scope(company_id):
+            return await handler(request)
+
+    return middleware
+
+
+def usage_keys(company_id: str, now: Optional[float] = None) -> Tuple[str, str]:
+    """(hourly key, daily key) for a company at a time (UTC)"""
+    stamp = time.gmtime(now if now is not None else time.time())
+    return (
+        f"usage:{company_id}:hour:{time.strftime('%Y%m%d%H', stamp)}",
+        f"usage:{company_id}:day:{time.strftime('%Y%m%d', stamp)}",
+    )
+
+
+def _fields(flat) -> Dict[str, float]:
+    """HGETALL reply ([k1, v1, ...] or dict) -> {field: float}"""
+    if isinstance(flat, dict):
+        return {k: float(v) for k, v in flat.items()}
+    flat = flat or []
+    return {flat[i]: float(flat[i + 1]) for i in range(0, len(flat) - 1, 2)}
+
+
+class UsageRecorder:
+    """Counts usage in-process and flushes it to Redis in the background"""
+
+    def __init__(self, flush_seconds: float = USAGE_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._pending: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, company_id: str, service: str, operation: str, units: float = 0) -> None:
+        """Charge one call (thread-safe; sync code in worker threads calls this too)"""
+        hour_key, day_key = usage_keys(company_id)
+        with self._lock:
+            for key in (hour_key, day_key):
+                fields = self._pending[(company_id, key)]
+                fields[f"{service}:calls"] += 1
+                fields[f"{service}.{operation}:calls"] += 1
+                if units:
+                    fields[f"{service}:units"] += units
+        tenant_api_calls_total.labels(service=service).inc()
+        if units:
+            tenant_api_units_total.labels(service=service).inc(units)
+
+    def pending(self, company_id: str, key: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._pending.get((company_id, key), {}))
+
+    async def flush(self) -> int:
+        """Write pending counts to Redis; returns the number of fields written"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(float))
+        if not pending or not redis_client.is_configured:
+            return 0
+
+        # One entry per queued command: the increment it carries, or None for EXPIRE
+        batch = []
+        results: list = []
+        try:
+            async with redis_client.pipeline() as pipe:
+                for (company_id, key), fields in pending.items():
+                    for field, value in fields.items():
+                        pipe.command("HINCRBYFLOAT", key, field, value)
+                        batch.append((company_id, key, field, value))
+                    ttl = USAGE_HOURLY_TTL_HOURS * 3600 if ":hour:" in key else USAGE_DAILY_TTL_DAYS * 86400
+                    pipe.expire(key, ttl)
+                    batch.append(None)
+            results = pipe.results
+        except Exception as e:
+            print(f"Usage flush error: {e}")
+
+        # Failed commands come back as None; keep those counts for the next flush
+        failed = [entry for entry, result in zip_longest(batch, results) if entry and result is None]
+        if failed:
+            with self._lock:
+                for company_id, key, field, value in failed:
+                    self._pending[(company_id, key)][field] += value
+            print(f"Usage flush: {len(failed)} fields not written, retrying next flush")
+        return sum(1 for entry in batch if entry) - len(failed)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+usage_recorder = UsageRecorder()
+
+
+def record_usage(service: str, operation: str, units: float = 0) -> None:
+    """Charge a call to the current tenant (no-op outside a tenant scope)"""
+    company_id = _tenant.get()
+    if company_id:
+        usage_recorder.record(company_id, service, operation, units)
+
+
+async def get_usage(company_id: str, period: str = "day", now: Optional[float] = None) -> Dict[str, float]:
+    """A company's counters for the current hour or day, including unflushed usage"""
+    hour_key, day_key = usage_keys(company_id, now)
+    key = hour_key if period == "hour" else day_key
+    fields: Dict[str, float] = {}
+    if redis_client.is_configured:
+        fields = _fields(await redis_client._execute("HGETALL", key))
+    for field, value in usage_recorder.pending(company_id, key).items():
+        fields[field] = fields.get(field, 0.0) + value
+    return fields
+
+
+def _by_service(fields: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    """{"youtube:units": 300, "youtube.search.list:calls": 3} -> nested per service"""
+    services: Dict[str, Dict[str, Any]] = {}
+    for field, value in fields.items():
+        name, _, kind = field.rpartition(":")
+        service, _, operation = name.partition(".")
+        entry = services.setdefault(service, {"units": 0.0, "calls": 0, "operations": {}})
+        if operation:
+            entry["operations"][operation] = int(value)
+        elif kind == "units":
+            entry["units"] = value
+        else:
+            entry["calls"] = int(value)
+    return services
+
+
+async def usage_summary(company_id: str) -> Dict[str, Any]:
+    """Hourly and daily usage per service, with daily budgets and what is left"""
+    hour = _by_service(await get_usage(company_id, "hour"))
+    day = _by_service(await get_usage(company_id, "day"))
+    budgets = {
+        service: {
+            "daily_units": budget,
+            "used": day.get(service, {}).get("units", 0.0),
+            "remaining": max(budget - day.get(service, {}).get("units", 0.0), 0.0),
+        }
+        for service, budget in TENANT_DAILY_BUDGETS.items()
+    }
+    return {"company_id": company_id, "hour": hour, "day": day, "budgets": budgets}
+
+
+async def within_budget(company_id: str, service: str, units: float = 0) -> bool:
+    """False if spending `units` more would exceed the company's daily budget"""
+    budget = TENANT_DAILY_BUDGETS.get(service)
+    if budget is None or not company_id:
+        return True
+    used = (await get_usage(company_id, "day")).get(f"{service}:units", 0.0)
+    return used + units <= budget
+
+
+async def over_budget(company_ids: Iterable[str], service: str) -> Set[str]:
+    """The companies that have used up today's budget for a service (one round-trip)"""
+    budget = TENANT_DAILY_BUDGETS.get(service)
+    company_ids = [c for c in dict.fromkeys(company_ids) if c]
+    if budget is None or not company_ids:
+        return set()
+
+    used = {c: usage_recorder.pending(c, usage_keys(c)[1]).get(f"{service}:units", 0.0) for c in company_ids}
+    if redis_client.is_configured:
+        async with redis_client.pipeline() as pipe:
+            for company_id in company_ids:
+                pipe.command("HGET", usage_keys(company_id)[1], f"{service}:units")
+        for company_id, value in zip(company_ids, pipe.results or []):
+            used[company_id] += float(value or 0)
+    return {c for c, units in used.items() if units >= budget}
@@ -1,12 +1,16 @@
+import asyncio
 import cohere
 from pinecone import Pinecone
-import requests
-import base64
 import os
+import threading
 import time
-from typing import List, Dict, Any, TypedDict, Optional
+from dataclasses import dataclass
+from typing import List, Dict, Any, TypedDict, Optional, Iterator, Tuple
 
 from utils.shopify import Product
+from utils.images import ImageHashIndex, PreparedImage, prepare_image_sync, prepare_images
+from utils.lexical import BM25Index, LexicalHit, reciprocal_rank_fusion
+from utils.tracing import external_call, payload_size
 
 class ImageUrlContent(TypedDict):
     type: str
@@ -20,13 +24,59 @@ class Metadata(TypedDict):
     title: str
     vendor: str
     imageURL: str
+    imageHash: str
     price: float
 
+class KnownImage(TypedDict):
+    image_hash: str
+    pinecone_id: str
+
 class EmbeddingItem(TypedDict):
     id: str
     values: List[float]
     metadata: Metadata
 
+class CatalogItem(TypedDict, total=False):
+    id: str
+    metadata: Dict[str, Any]
+    values: List[float]
+
+class CatalogPage(TypedDict):
+    items: List[CatalogItem]
+    next_cursor: Optional[str]
+
+@dataclass
+class ScoredMatch:
+    id: str
+    score: float
+    metadata: Dict[str, Any]
+    vector_score: Optional[float] = None
+    lexical_score: Optional[float] = None
+    # Share of the query's terms the product contains (lexical hits only)
+    lexical_coverage: Optional[float] = None
+
+@dataclass
+class HybridResult:
+    matches: List[ScoredMatch]
+    mode: str  # "lexical", "vector" or "hybrid"
+
+
+# Creator video vectors share the index with products (see background_worker)
+VIDEO_ID_PREFIX = "video_"
+
+# Pinecone caps list() pages at 100 ids
+MAX_PAGE_SIZE = 100
+
+SEARCH_MODES = ("auto", "hybrid", "lexical", "vector")
+
+# Catalog syncs that run in another process (the ARQ worker) reach this
+# process's lexical index through a periodic rebuild
+LEXICAL_INDEX_MAX_AGE = int(os.getenv("LEXICAL_INDEX_MAX_AGE_SECONDS", "900"))
+
+# In auto mode, queries this short whose best lexical hit contains every
+# query term are answered from the lexical index without an embedding call
+KEYWORD_QUERY_MAX_TERMS = 4
+
 
 COHERE_KEY=os.getenv("COHERE_KEY")
 if not COHERE_KEY:
@@ -42,62 +92,149 @@ if not INDEX_NAME:
 index = pc.Index(INDEX_NAME)
 
 def imageurl_to_b64(image_url: str) -> str:
-    image = requests.get(image_url)
-    stringified_buffer = base64.b64encode(image.content).decode("utf-8")
-    content_type = image.headers["Content-Type"]
-    return f"data:{content_type};base64,{stringified_buffer}"
+    # Downscaled JPEG, see utils/images.py
+    return prepare_image_sync(image_url)
 
-def imageurl_to_input(image_url: str) -> List[ContentItem]:
-    image_base64 = imageurl_to_b64(image_url)
+def image_to_input(image_data_uri: str) -> List[ContentItem]:
     return [{
         "content": [
             {
                 "type": "image_url",
-                  "image_url": {"url": image_base64}
+                  "image_url": {"url": image_data_uri}
               }
           ],
       }]
-  
-def imageurl_to_embedding(image_url: str) -> Any:
-  return co.embed(
-      model="embed-english-v3.0",
-      input_type="image",
-      embedding_types=["float"],
-      inputs=imageurl_to_input(image_url)
-  )
 
-def text_to_embedding(text: str) -> Any:
+def imageurl_to_input(image_url: str) -> List[ContentItem]:
+    return image_to_input(imageurl_to_b64(image_url))
+
+def image_to_embedding(image_data_uri: str) -> Any:
+  with external_call("cohere", "embed", quota_units=1, request_bytes=len(image_data_uri)):
     return co.embed(
         model="embed-english-v3.0",
-        input_type="search_query",
+        input_type="image",
         embedding_types=["float"],
-        inputs=[{"content": [
-            {"type": "text", "text": text},
-        ]}]
+        inputs=image_to_input(image_data_uri)
     )
 
-def embed_products(products: List[Product]) -> List[EmbeddingItem]:
+def imageurl_to_embedding(image_url: str) -> Any:
+  return image_to_embedding(imageurl_to_b64(image_url))
+
+def text_to_embedding(text: str) -> Any:
+    with external_call("cohere", "embed", quota_units=1, request_bytes=payload_size(text)):
+        return co.embed(
+            model="embed-english-v3.0",
+            input_type="search_query",
+            embedding_types=["float"],
+            inputs=[{"content": [
+                {"type": "text", "text": text},
+            ]}]
+        )
+
+def _vector_bytes(items: List[EmbeddingItem]) -> int:
+    """float32 payload of a batch of vectors"""
+    return sum(len(item.get("values") or []) * 4 for item in items)
+
+def _fetch_known_image_embeddings(known_images: Dict[str, KnownImage]) -> Dict[str, Dict[str, Any]]:
+    """
+    Look up the stored vectors of images embedded by an earlier sync.
+
+    A vector is only reused if its metadata still carries the same imageHash,
+    so a pinecone_id that has since been reassigned to another product is
+    ignored.
+
+    Returns:
+        Mapping of image URL to {"image_hash", "values"}
+    """
+    by_id = {
+        known["pinecone_id"]: url
+        for url, known in known_images.items()
+        if known.get("pinecone_id") and known.get("image_hash")
+    }
+    ids = list(by_id)
+    reusable: Dict[str, Dict[str, Any]] = {}
+    for start in range(0, len(ids), MAX_PAGE_SIZE):
+        page = ids[start:start + MAX_PAGE_SIZE]
+        with external_call("pinecone", "fetch", quota_units=len(page)):
+            fetched = index.fetch(ids=page)
+        for vector_id, vector in fetched.vectors.items():
+            url = by_id.get(vector_id)
+            image_hash = known_images[url]["image_hash"] if url else None
+            metadata = getattr(vector, "metadata", None) or {}
+            if image_hash and metadata.get("imageHash") == image_hash and vector.values:
+                reusable[url] = {"image_hash": image_hash, "values": list(vector.values)}
+    return reusable
+
+async def embed_products(
+    products: List[Product],
+    known_images: Optional[Dict[str, KnownImage]] = None,
+) -> List[EmbeddingItem]:
+    """
+    Embed a catalog, sharing one embedding between near-duplicate images.
+
+    Args:
+        products: Products to embed (ids are their positions in this list)
+        known_images: Image URL -> {"image_hash", "pinecone_id"} from the
+            previous sync. Unchanged URLs reuse their stored vector without
+            downloading the image again.
+    """
     items: List[EmbeddingItem] = []
 
     # Flag to enable image embeddings (disabled by default to save Pinecone storage)
     use_image_embeddings = os.getenv("USE_IMAGE_EMBEDDINGS", "true").lower() == "true"
 
+    images: Dict[str, Optional[PreparedImage]] = {}
+    reused: Dict[str, Dict[str, Any]] = {}
+    seen_images = ImageHashIndex()
+    if use_image_embeddings:
+        image_urls = {p.get("image", "") for p in products}
+        if known_images:
+            known = {url: k for url, k in known_images.items() if url in image_urls}
+            try:
+                reused = await asyncio.to_thread(_fetch_known_image_embeddings, known)
+            except Exception as e:
+                print(f"⚠️  Could not fetch known image embeddings: {e}")
+            for entry in reused.values():
+                seen_images.add(entry["image_hash"], entry["values"])
+            if reused:
+                print(f"♻️  Reusing {len(reused)} unchanged image embeddings")
+
+        # Download and downscale every remaining image up front, concurrently
+        images = await prepare_images(url for url in image_urls if url not in reused)
+
     for i, product in enumerate(products):
         image_url = product.get("image", "")
+        image_data = images.get(image_url)
+        image_hash = None
+        embedding = None
 
         # Build rich text description from product data
         text = f"{product['name']} {product.get('body_html', '')}"
 
-        try:
-            # Use image embeddings if enabled and image URL exists
-            if use_image_embeddings and image_url:
-                print(f"🖼️  Using image embedding for '{product['name']}'")
-                embedding = imageurl_to_embedding(image_url).embeddings.float_[0]
-            else:
-                embedding = text_to_embedding(text).embeddings.float_[0]
-        except Exception as e:
-            print(f"⚠️  Failed to create embedding for '{product['name']}': {e}")
-            continue
+        if image_url in reused:
+            image_hash = reused[image_url]["image_hash"]
+            embedding = reused[image_url]["values"]
+        elif image_data:
+            image_hash = image_data.image_hash
+            embedding = seen_images.find(image_hash)
+            if embedding is not None:
+                print(f"♻️  '{product['name']}' shares its image with an embedded product")
+
+        if embedding is None:
+            try:
+                # Use image embeddings if enabled and the image could be prepared
+                if image_data:
+                    print(f"🖼️  Using image embedding for '{product['name']}'")
+                    response = await asyncio.to_thread(image_to_embedding, image_data.data_uri)
+                else:
+                    response = await asyncio.to_thread(text_to_embedding, text)
+                embedding = response.embeddings.float_[0]
+            except Exception as e:
+                print(f"⚠️  Failed to create embedding for '{product['name']}': {e}")
+                continue
+            if image_data:
+                seen_images.add(image_hash, embedding)
+            await asyncio.sleep(0.2)
 
         # Build metadata, filtering out None/null values (Pinecone doesn't accept them)
         metadata = {
@@ -112,25 +249,287 @@ def embed_products(products: List[Product]) -> List[EmbeddingItem]:
             metadata["vendor"] = product["vendor"]
         if image_url:
             metadata["imageURL"] = image_url
+        if image_hash:
+            metadata["imageHash"] = image_hash
 
         items.append({
             "id": str(i),
             "values": embedding,
             "metadata": metadata
         })
-        time.sleep(0.2)
     return items
 
+def image_hashes_by_id(items: List[EmbeddingItem]) -> Dict[str, str]:
+    """Embedding id -> imageHash, for storing alongside company_products rows"""
+    return {
+        item["id"]: item["metadata"]["imageHash"]
+        for item in items
+        if item["metadata"].get("imageHash")
+    }
+
 def upsert_embeddings(items: List[EmbeddingItem]) -> None:
-    index.upsert(vectors=items)
+    with external_call("pinecone", "upsert", quota_units=len(items), request_bytes=_vector_bytes(items)):
+        index.upsert(vectors=items)
+    _index_catalog_items(items)
+
+def delete_embeddings(ids: List[str]) -> None:
+    with external_call("pinecone", "delete", quota_units=len(ids)):
+        index.delete(ids=ids)
+    for vector_id in ids:
+        _write_catalog_index(vector_id, None)
 
 def query_embeddings(vector: List[float], top_k: int = 10) -> Any:
-    return index.query(
-        vector=vector,
-        top_k=top_k,
-        include_metadata=True
-    )
+    with external_call("pinecone", "query", quota_units=1, request_bytes=len(vector) * 4):
+        return index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True
+        )
 
 def query_text(text: str, top_k: int = 10) -> Any:
     text_embedding = text_to_embedding(text).embeddings.float_[0]
     return query_embeddings(text_embedding, top_k=top_k)
+
+def _is_creator_video(vector_id: str, metadata: Dict[str, Any]) -> bool:
+    return vector_id.startswith(VIDEO_ID_PREFIX) or metadata.get("type") == "creator_video"
+
+def list_catalog_page(
+    limit: int = MAX_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    prefix: Optional[str] = None,
+    include_values: bool = False,
+    include_videos: bool = False,
+) -> CatalogPage:
+    """
+    Fetch one page of the catalog using vector-id listing.
+
+    Each page costs one list call plus one fetch call, regardless of how deep
+    into the index the cursor points. Ids come back in Pinecone's
+    lexicographic order, so paging is stable between calls. Creator video
+    vectors are dropped unless include_videos is set, which means a page can
+    hold fewer than `limit` items - keep following next_cursor until it is None.
+
+    Args:
+        limit: Ids to list per page (clamped to 1-100)
+        cursor: next_cursor from the previous page, or None for the first page
+        prefix: Only list ids starting with this prefix
+        include_values: Include embedding values (for exports / re-index jobs)
+        include_videos: Keep creator video vectors in the page
+
+    Returns:
+        Dict with the page items and the cursor for the next page
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    with external_call("pinecone", "list", quota_units=1):
+        listing = index.list_paginated(prefix=prefix, limit=limit, pagination_token=cursor)
+
+    ids = [vector.id for vector in (listing.vectors or [])]
+    next_cursor = listing.pagination.next if listing.pagination else None
+
+    items: List[CatalogItem] = []
+    if ids:
+        with external_call("pinecone", "fetch", quota_units=len(ids)):
+            fetched = index.fetch(ids=ids)
+        # Preserve listing order; ids deleted between list and fetch are skipped
+        for vector_id in ids:
+            vector = fetched.vectors.get(vector_id)
+            if vector is None:
+                continue
+            metadata = dict(vector.metadata or {})
+            if not include_videos and _is_creator_video(vector_id, metadata):
+                continue
+            item: CatalogItem = {"id": vector_id, "metadata": metadata}
+            if include_values:
+                item["values"] = list(vector.values)
+            items.append(item)
+
+    return {"items": items, "next_cursor": next_cursor or None}
+
+def iter_catalog(
+    batch_size: int = MAX_PAGE_SIZE,
+    prefix: Optional[str] = None,
+    include_values: bool = False,
+    include_videos: bool = False,
+) -> Iterator[CatalogItem]:
+    """
+    Iterate over the whole catalog page by page.
+
+    Usage:
+        for item in iter_catalog(include_values=True):
+            export_file.write(json.dumps(item) + "\n")
+    """
+    cursor = None
+    while True:
+        page = list_catalog_page(
+            limit=batch_size,
+            cursor=cursor,
+            prefix=prefix,
+            include_values=include_values,
+            include_videos=include_videos,
+        )
+        yield from page["items"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+
+# ============================================================================
+# HYBRID (LEXICAL + VECTOR) SEARCH
+# ============================================================================
+
+catalog_index = BM25Index()
+_catalog_index_loaded = False
+# Walking the whole catalog takes seconds, so rebuilds run off the request path
+_catalog_rebuild: Optional[threading.Thread] = None
+_catalog_rebuild_lock = threading.Lock()
+# Incremental writes made while a rebuild walks the catalog, replayed into the
+# fresh index before it replaces the old one. None when no rebuild is running.
+_catalog_writes: Optional[List[Tuple[str, Optional[Dict[str, Any]]]]] = None
+_catalog_writes_lock = threading.Lock()
+
+def _write_catalog_index(vector_id: str, metadata: Optional[Dict[str, Any]]) -> None:
+    """Upsert (or, with metadata=None, remove) a product in the lexical index"""
+    with _catalog_writes_lock:
+        if metadata is None:
+            catalog_index.remove(vector_id)
+        else:
+            catalog_index.upsert(vector_id, metadata)
+        if _catalog_writes is not None:
+            _catalog_writes.append((vector_id, metadata))
+
+def _index_catalog_items(items: List[EmbeddingItem]) -> None:
+    """Keep the lexical index in step with vectors written by this process"""
+    for item in items:
+        metadata = dict(item.get("metadata") or {})
+        if not _is_creator_video(item["id"], metadata):
+            _write_catalog_index(item["id"], metadata)
+
+def rebuild_catalog_index() -> int:
+    """Rebuild the lexical index from the full catalog and return its size"""
+    global catalog_index, _catalog_index_loaded, _catalog_writes
+
+    with _catalog_writes_lock:
+        _catalog_writes = []
+    try:
+        fresh = BM25Index()
+        fresh.upsert_many((item["id"], item["metadata"]) for item in iter_catalog())
+        with _catalog_writes_lock:
+            # The listing may predate these writes, so they win
+            for vector_id, metadata in _catalog_writes:
+                if metadata is None:
+                    fresh.remove(vector_id)
+                else:
+                    fresh.upsert(vector_id, metadata)
+            catalog_index = fresh
+            _catalog_index_loaded = True
+    finally:
+        with _catalog_writes_lock:
+            _catalog_writes = None
+    print(f"🔤 Lexical catalog index built with {len(fresh)} products")
+    return len(fresh)
+
+def _rebuild_catalog_index_quietly() -> None:
+    global _catalog_index_loaded
+
+    try:
+        rebuild_catalog_index()
+    except Exception as e:
+        # Keep serving the incremental index; retry after max_age
+        print(f"⚠️  Failed to rebuild lexical index: {e}")
+        catalog_index.built_at = time.time()
+        _catalog_index_loaded = True
+
+def ensure_catalog_index(max_age: int = LEXICAL_INDEX_MAX_AGE) -> BM25Index:
+    """
+    Return the lexical index, rebuilding it in the background if missing or
+    stale. The current index keeps serving until the rebuild finishes; while
+    it is still empty, searches fall back to vectors only.
+    """
+    global _catalog_rebuild
+
+    if not _catalog_index_loaded or time.time() - catalog_index.built_at > max_age:
+        with _catalog_rebuild_lock:
+            if _catalog_rebuild is None or not _catalog_rebuild.is_alive():
+                _catalog_rebuild = threading.Thread(
+                    target=_rebuild_catalog_index_quietly, name="catalog-index-rebuild", daemon=True
+                )
+                _catalog_rebuild.start()
+    return catalog_index
+
+def _is_keyword_lookup(hits: List[LexicalHit]) -> bool:
+    if not hits:
+        return False
+    top = hits[0]
+    return top.query_terms <= KEYWORD_QUERY_MAX_TERMS and top.matched_terms == top.query_terms
+
+def hybrid_query(text: str, top_k: int = 10, mode: str = "auto", rrf_k: int = 60) -> HybridResult:
+    """
+    Search products with BM25 and dense vectors, fused by reciprocal rank.
+
+    Modes:
+        auto:    lexical only for short exact lookups (SKU, brand), else hybrid
+        hybrid:  always fuse the lexical and vector rankings
+        lexical: BM25 only, never calls Cohere
+        vector:  dense vectors only (the previous behaviour)
+
+    Returned matches expose .id, .score and .metadata like Pinecone matches,
+    plus the vector_score / lexical_score each retriever gave them.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(SEARCH_MODES)}")
+
+    candidates = max(top_k * 2, 20)
+    lexical = ensure_catalog_index() if mode != "vector" else None
+    lexical_hits = lexical.search(text, top_k=candidates) if lexical else []
+
+    if mode == "lexical" or (mode == "auto" and _is_keyword_lookup(lexical_hits)):
+        return HybridResult(
+            matches=[
+                ScoredMatch(
+                    hit.id,
+                    hit.score,
+                    dict(lexical.get_metadata(hit.id) or {}),
+                    lexical_score=hit.score,
+                    lexical_coverage=hit.matched_terms / hit.query_terms,
+                )
+                for hit in lexical_hits[:top_k]
+            ],
+            mode="lexical",
+        )
+
+    vector_matches = [
+        match for match in query_text(text, top_k=candidates).matches
+        if not _is_creator_video(match.id, match.metadata or {})
+    ]
+
+    if not lexical_hits:
+        return HybridResult(
+            matches=[
+                ScoredMatch(match.id, match.score, dict(match.metadata or {}), vector_score=match.score)
+                for match in vector_matches[:top_k]
+            ],
+            mode="vector",
+        )
+
+    vector_by_id = {match.id: match for match in vector_matches}
+    lexical_by_id = {hit.id: hit for hit in lexical_hits}
+    fused = reciprocal_rank_fusion(
+        [match.id for match in vector_matches],
+        [hit.id for hit in lexical_hits],
+        k=rrf_k,
+    )
+
+    matches = []
+    for doc_id, score in fused[:top_k]:
+        vector_match = vector_by_id.get(doc_id)
+        lexical_hit = lexical_by_id.get(doc_id)
+        metadata = vector_match.metadata if vector_match else lexical.get_metadata(doc_id)
+        matches.append(ScoredMatch(
+            doc_id,
+            score,
+            dict(metadata or {}),
+            vector_score=vector_match.score if vector_match else None,
+            lexical_score=lexical_hit.score if lexical_hit else None,
+            lexical_coverage=lexical_hit.matched_terms / lexical_hit.query_terms if lexical_hit else None,
+        ))
+    return HybridResult(matches=matches, mode="hybrid")
@@ -4,10 +4,40 @@ import os
 import json
 from dotenv import load_dotenv
 
+from utils.tracing import external_call, payload_size
+
 load_dotenv()
 
 client = genai.Client(api_key=os.getenv("GEMINI_KEY"))
 
+
+def _text_bytes(contents) -> int:
+    """Size of the text parts of a Gemini request (images and files aren't counted)"""
+    if isinstance(contents, str):
+        return payload_size(contents)
+    if isinstance(contents, (list, tuple)):
+        return sum(_text_bytes(part) for part in contents)
+    parts = getattr(contents, "parts", None)
+    if parts:
+        return sum(_text_bytes(part) for part in parts)
+    text = getattr(contents, "text", None)
+    return payload_size(text) if isinstance(text, str) else 0
+
+
+def generate_content(gemini_client, **kwargs):
+    """gemini_client.models.generate_content, traced as a Gemini call"""
+    with external_call("gemini", "generate_content", request_bytes=_text_bytes(kwargs.get("contents"))) as span:
+        span.set_attribute("gemini.model", kwargs.get("model"))
+        response = gemini_client.models.generate_content(**kwargs)
+        usage = getattr(response, "usage_metadata", None)
+        if getattr(usage, "total_token_count", None):
+            span.set_attribute("quota.units", usage.total_token_count)
+        try:
+            span.set_attribute("payload.response_bytes", payload_size(response.text))
+        except Exception:
+            pass  # image-only responses have no text
+    return response
+
 #video_url = "https://www.youtube.com/shorts/-yuNUX3GSl8"
 # TODO INCLUDE INFO ABOUT THE COMPANY / SHOPIFY VENDOR
 
@@ -30,7 +60,8 @@ async def parse_video(video_url: str):
             }
             return {"output": json.dumps(mock_analysis)}, 200
 
-        response = client.models.generate_content(
+        response = generate_content(
+            client,
             # model='models/gemini-2.5-flash',
             model='models/gemini-2.0-flash',
             contents=genai.types.Content(
@@ -1,5 +1,7 @@
 from __future__ import annotations
 import os
+import threading
+import httplib2
 from googleapiclient.discovery import build
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
@@ -8,9 +10,51 @@ from typing import Optional
 import asyncio
 import random
 
+from utils.tracing import external_call, payload_size
+
 load_dotenv()
 
-async def fetch_top_shorts(keyword: str, max_results: int = 10, relevance_language: Optional[list[str]] = None, region_code: str | None = None, order: str = "viewCount", published_after_days: int = 365):
+# Data API quota cost of each call we make
+QUOTA_COSTS = {"search.list": 100, "videos.list": 1, "channels.list": 1}
+
+_youtube = None
+_thread_local = threading.local()
+
+
+def get_youtube_client():
+    """
+    YouTube Data API client, built once per process.
+
+    build() parses the whole discovery document, so doing it per search
+    was most of the setup cost of every call.
+    """
+    global _youtube
+    if _youtube is None:
+        api_key = os.getenv("YOUTUBE_API_KEY")
+        if not api_key:
+            raise ValueError("YOUTUBE_API_KEY not found in environment")
+        _youtube = build("youtube", "v3", developerKey=api_key, cache_discovery=False)
+    return _youtube
+
+
+def _thread_http() -> httplib2.Http:
+    """httplib2 connections aren't thread-safe, so each executor thread keeps its own"""
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = _thread_local.http = httplib2.Http(timeout=30)
+    return http
+
+
+async def _execute(request, operation: str):
+    """Run a googleapiclient request in the default executor, traced as `operation`"""
+    loop = asyncio.get_running_loop()
+    with external_call("youtube", operation, quota_units=QUOTA_COSTS.get(operation, 1)) as span:
+        response = await loop.run_in_executor(None, lambda: request.execute(http=_thread_http()))
+        span.set_attribute("payload.response_bytes", payload_size(response))
+    return response
+
+
+async def fetch_top_shorts(keyword: str, max_results: int = 10, relevance_language: Optional[list[str]] = None, region_code: str | None = None, order: str = "viewCount", published_after_days: int = 365, youtube=None):
     # Check if mock mode is enabled
     use_mock = os.getenv("USE_MOCK_YOUTUBE", "false").lower() == "true"
 
@@ -18,12 +62,7 @@ async def fetch_top_shorts(keyword: str, max_results: int = 10, relevance_langua
         print(f"🎭 Mock mode: Generating fake YouTube results for '{keyword}'")
         return await _generate_mock_videos(keyword, max_results)
 
-    # Get API key from environment
-    api_key = os.getenv("YOUTUBE_API_KEY")
-    if not api_key:
-        raise ValueError("YOUTUBE_API_KEY not found in environment")
-
-    youtube = build("youtube", "v3", developerKey=api_key)
+    youtube = youtube or get_youtube_client()
     published_after = (datetime.now(timezone.utc) - timedelta(days=published_after_days)).strftime("%Y-%m-%dT%H:%M:%SZ")
 
     # Simplified params to reduce quota usage
@@ -43,8 +82,7 @@ async def fetch_top_shorts(keyword: str, max_results: int = 10, relevance_langua
         request_params["regionCode"] = region_code
 
     request = youtube.search().list(**request_params)
-    loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(None, request.execute)
+    response = await _execute(request, "search.list")
 
     videos = []
     video_ids = []
@@ -61,8 +99,7 @@ async def fetch_top_shorts(keyword: str, max_results: int = 10, relevance_langua
         part="statistics,contentDetails",
         id=",".join(video_ids)
     )
-    loop = asyncio.get_event_loop()
-    stats_response = await loop.run_in_executor(None, stats_request.execute)
+    stats_response = await _execute(stats_request, "videos.list")
 
     # Create a map of video_id -> stats
     stats_map = {}
@@ -87,7 +124,7 @@ async def fetch_top_shorts(keyword: str, max_results: int = 10, relevance_langua
 
         # Get channel email for this video (optional - skip if quota exceeded)
         try:
-            email = await get_channel_email(channel_id)
+            email = await get_channel_email(channel_id, youtube=youtube)
         except Exception:
             # Quota exceeded or other error - use default email
             email = os.getenv("DEFAULT_EMAIL")
@@ -110,7 +147,7 @@ async def fetch_top_shorts(keyword: str, max_results: int = 10, relevance_langua
 
     return videos
 
-async def get_channel_email(channel_id: str):
+async def get_channel_email(channel_id: str, youtube=None):
     """
     Fetches the email from a YouTube channel's description.
 
@@ -121,12 +158,12 @@ async def get_channel_email(channel_id: str):
         The first email found in the description, or None if not found.
     """
     try:
-        youtube = build("youtube", "v3")
+        youtube = youtube or get_youtube_client()
         request = youtube.channels().list(
             part="snippet",
             id=channel_id
         )
-        response = request.execute()
+        response = await _execute(request, "channels.list")
 
         if response.get("items"):
             description = response["items"][0]["snippet"]["description"]
@@ -3,7 +3,9 @@
 #
 # Supports multiple run modes via API_MODE environment variable:
 #   - api (default): Run the uvicorn API server
-#   - worker: Run the ARQ job queue worker
+#   - worker: Run the ARQ job queue worker for WORKER_LANE
+#             (interactive, outreach, bulk, or all - default all)
+#   - all: Run the API with the ARQ lane workers (and discovery cron) embedded
 #   - both: Run both API and legacy service worker (backwards compatible)
 
 set -e
@@ -16,9 +18,25 @@ echo "=========================================="
 case "${API_MODE:-api}" in
     "worker")
         echo "Starting ARQ Worker..."
-        echo "Queue: maatchaa:jobs"
+        echo "Lane: ${WORKER_LANE:-all}"
         echo "Redis: ${UPSTASH_REDIS_URL:-localhost:6379}"
-        exec arq jobs.worker.WorkerSettings
+        case "${WORKER_LANE:-all}" in
+            "interactive") exec arq jobs.worker.InteractiveWorkerSettings ;;
+            "outreach") exec arq jobs.worker.OutreachWorkerSettings ;;
+            "bulk") exec arq jobs.worker.WorkerSettings ;;
+            *)
+                # One container, one worker per lane
+                arq jobs.worker.InteractiveWorkerSettings &
+                arq jobs.worker.OutreachWorkerSettings &
+                exec arq jobs.worker.WorkerSettings
+                ;;
+        esac
+        ;;
+
+    "all")
+        echo "Starting API Server with embedded job workers..."
+        echo "Port: 8080"
+        EMBEDDED_WORKER=true exec uvicorn API:app --host 0.0.0.0 --port 8080
         ;;
 
     "both")